@@ -0,0 +1,144 @@
+"""
+Modèles de prévision SarfX (ARIMA + Prophet)
+Entraînement, prédiction et construction de la réponse /predict.
+Module importable sans effet de bord (pas de connexion DB) pour être
+utilisé par le registre de modèles et les workers d'entraînement.
+"""
+import logging
+import warnings
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.arima.model import ARIMA
+from prophet import Prophet
+
+warnings.filterwarnings("ignore")
+
+# Horizon de prévision (jours)
+FORECAST_STEPS = 7
+
+# Ordre ARIMA par défaut (p, d, q)
+ARIMA_ORDER = (5, 1, 0)
+
+# Fenêtre d'entraînement (jours calendaires d'historique)
+TRAINING_WINDOW_DAYS = 365
+
+
+def train_arima_model(df, order=ARIMA_ORDER):
+    """
+    Entraîne un modèle ARIMA sur les données historiques
+
+    ARIMA (AutoRegressive Integrated Moving Average):
+    - AR(p): régression sur p valeurs passées
+    - I(d): différenciation d'ordre d pour stationnarité
+    - MA(q): moyenne mobile sur q erreurs passées
+
+    TODO: Optimiser les hyperparamètres (p,d,q) avec auto_arima ou grid search
+    """
+    try:
+        model = ARIMA(df['Close'], order=order)
+        fitted = model.fit()
+        return fitted
+    except Exception as e:
+        logging.error(f"ARIMA training failed: {e}")
+        return None
+
+def train_prophet_model(df):
+    """
+    Entraîne un modèle Prophet (Meta/Facebook) sur les données historiques
+
+    Prophet est spécialisé dans les séries temporelles avec:
+    - Tendances non-linéaires
+    - Saisonnalité multiple (jour/semaine/année)
+    - Gestion des jours fériés
+    - Robuste aux données manquantes
+
+    TODO: Ajouter des régresseurs externes (événements économiques, news, etc.)
+    """
+    try:
+        # Prophet nécessite colonnes 'ds' (date) et 'y' (valeur)
+        prophet_df = pd.DataFrame({
+            'ds': df.index,
+            'y': df['Close']
+        })
+
+        model = Prophet(
+            daily_seasonality=True,
+            weekly_seasonality=True,
+            yearly_seasonality=False,  # Pas assez de données historiques généralement
+            changepoint_prior_scale=0.05  # Flexibilité des tendances
+        )
+        model.fit(prophet_df)
+        return model
+    except Exception as e:
+        logging.error(f"Prophet training failed: {e}")
+        return None
+
+def predict_with_arima(model, steps=FORECAST_STEPS):
+    """Prédiction ARIMA pour N jours"""
+    try:
+        forecast = model.forecast(steps=steps)
+        return forecast.tolist()
+    except Exception as e:
+        logging.error(f"ARIMA prediction failed: {e}")
+        return None
+
+def predict_with_prophet(model, steps=FORECAST_STEPS):
+    """Prédiction Prophet pour N jours"""
+    try:
+        future = model.make_future_dataframe(periods=steps)
+        forecast = model.predict(future)
+        # Retourner seulement les prédictions futures
+        return forecast['yhat'].tail(steps).tolist()
+    except Exception as e:
+        logging.error(f"Prophet prediction failed: {e}")
+        return None
+
+
+def ensemble_forecast(arima_predictions, prophet_predictions, current, steps=FORECAST_STEPS):
+    """Ensemble (moyenne des deux modèles) avec repli sur le modèle disponible"""
+    if arima_predictions and prophet_predictions:
+        logging.info("✓ Ensemble créé (moyenne ARIMA + Prophet)")
+        return [(a + p) / 2 for a, p in zip(arima_predictions, prophet_predictions)]
+    if arima_predictions:
+        logging.warning("Prophet échec, utilisation ARIMA seul")
+        return arima_predictions
+    if prophet_predictions:
+        logging.warning("ARIMA échec, utilisation Prophet seul")
+        return prophet_predictions
+    # Fallback: prédiction naïve (tendance linéaire simple)
+    logging.warning("Tous les modèles ont échoué, fallback sur tendance linéaire")
+    return np.linspace(current, current * 1.01, steps).tolist()
+
+
+def build_forecast(pair, df, arima_predictions, prophet_predictions, steps=FORECAST_STEPS):
+    """Construit la réponse /predict à partir des prédictions des deux modèles"""
+    current = float(df['Close'].iloc[-1])
+    dates = [(df.index[-1] + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(1, steps + 1)]
+    ensemble_predictions = ensemble_forecast(arima_predictions, prophet_predictions, current, steps)
+
+    # Historique récent (30 derniers jours)
+    history = df.tail(30)
+    history_data = [
+        {'Date': index.strftime('%Y-%m-%d'), 'Close': float(close)}
+        for index, close in zip(history.index, history['Close'])
+    ]
+
+    return {
+        "meta": {
+            "pair": pair,
+            "current_rate": current,
+            "prediction_days": steps,
+            "models_used": ["ARIMA", "Prophet"],
+            "timestamp": datetime.utcnow().isoformat()
+        },
+        "predictions": {
+            "dates": dates,
+            "Ensemble_Mean": ensemble_predictions,
+            "ARIMA": arima_predictions if arima_predictions else ensemble_predictions,
+            "Prophet": prophet_predictions if prophet_predictions else ensemble_predictions
+        },
+        "history": history_data,
+        "confidence": "High" if (arima_predictions and prophet_predictions) else "Medium"
+    }
@@ -0,0 +1,246 @@
+"""
+Historique OHLC journalier local de SarfX
+- Un tableau NumPy structuré par paire (HISTORY_DIR/<PAIR>.npy), lu en mémoire mappée
+- Complété de façon incrémentale : seuls les jours manquants sont téléchargés (Yahoo Finance)
+- Partagé par tous les consommateurs du backend IA (signal, entraînement, fallback de taux)
+
+L'horodatage (mtime) du fichier indique la dernière vérification auprès de Yahoo ;
+un autre worker qui complète l'historique invalide ainsi le cache mémoire des autres.
+"""
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+HISTORY_DIR = os.environ.get("HISTORY_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "history"))
+HISTORY_REFRESH_SECONDS = int(os.environ.get("HISTORY_REFRESH_SECONDS", 900))
+
+# Profondeur du premier téléchargement d'une paire
+HISTORY_INITIAL_PERIOD = os.environ.get("HISTORY_INITIAL_PERIOD", "max")
+
+# Après un échec Yahoo, délai avant un nouvel essai (secondes)
+HISTORY_RETRY_SECONDS = 60
+
+OHLC_DTYPE = np.dtype([
+    ("date", "datetime64[D]"),
+    ("open", "f8"),
+    ("high", "f8"),
+    ("low", "f8"),
+    ("close", "f8"),
+])
+
+# Colonnes du DataFrame servi (mêmes noms que yf.download)
+COLUMNS = {"open": "Open", "high": "High", "low": "Low", "close": "Close"}
+
+
+def to_ticker(pair):
+    """EURUSD, EURUSD=X -> EURUSD=X"""
+    pair = pair.upper()
+    return pair if "=" in pair else f"{pair}=X"
+
+
+class FileLock:
+    """Verrou fichier exclusif partagé entre process (Linux/macOS)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        try:
+            import fcntl
+        except ImportError:
+            return self  # Windows dev : un seul worker
+        self._file = open(self.path, "w")
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            self._file.close()
+        return False
+
+
+def _download(ticker, start=None):
+    """Barres journalières Yahoo -> tableau OHLC_DTYPE (vide si rien)"""
+    import yfinance as yf
+
+    if start is None:
+        df = yf.download(ticker, period=HISTORY_INITIAL_PERIOD, interval="1d", progress=False)
+    else:
+        df = yf.download(ticker, start=start.strftime("%Y-%m-%d"), interval="1d", progress=False)
+    if df is None or df.empty:
+        return np.empty(0, dtype=OHLC_DTYPE)
+
+    # yfinance récent : colonnes MultiIndex (champ, ticker)
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.get_level_values(0)
+    df = df.dropna(subset=["Close"])
+
+    rows = np.empty(len(df), dtype=OHLC_DTYPE)
+    rows["date"] = df.index.values.astype("datetime64[D]")
+    for field, column in COLUMNS.items():
+        rows[field] = df[column].to_numpy(dtype="float64")
+    return rows
+
+
+class HistoryStore:
+    """Historique journalier par paire : disque (mmap) + cache DataFrame en mémoire"""
+
+    def __init__(self, root=HISTORY_DIR, refresh_seconds=HISTORY_REFRESH_SECONDS):
+        self.root = root
+        self.refresh_seconds = refresh_seconds
+        self._frames = {}
+        self._retry_at = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, ticker):
+        return os.path.join(self.root, f"{ticker.replace('=', '_')}.npy")
+
+    def _pair_lock(self, ticker):
+        with self._lock:
+            return self._locks.setdefault(ticker, threading.Lock())
+
+    # =====================================================
+    # LECTURE
+    # =====================================================
+
+    def get_history(self, pair, days=None, refresh=True):
+        """
+        Historique journalier OHLC (colonnes Open/High/Low/Close, index date).
+
+        Args:
+            pair: Paire (EURUSD ou EURUSD=X)
+            days: Ne garder que les `days` derniers jours calendaires (None = tout)
+            refresh: Compléter depuis Yahoo si la dernière vérification est trop ancienne
+
+        Returns:
+            DataFrame en lecture seule (partagé entre appels : ne pas le modifier)
+        """
+        ticker = to_ticker(pair)
+        if refresh:
+            self.ensure_fresh(ticker)
+
+        df = self._frame(ticker)
+        if days is not None and not df.empty:
+            df = df.loc[df.index >= df.index[-1] - timedelta(days=days)]
+        return df
+
+    def latest_close(self, pair):
+        """Dernière clôture connue (None si aucun historique)"""
+        df = self.get_history(pair)
+        return float(df["Close"].iloc[-1]) if not df.empty else None
+
+    def _frame(self, ticker):
+        """DataFrame de la paire, reconstruit seulement si le fichier a changé"""
+        path = self._path(ticker)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return pd.DataFrame(columns=list(COLUMNS.values()), dtype="float64")
+
+        cached = self._frames.get(ticker)
+        if cached and cached["mtime"] == mtime:
+            return cached["frame"]
+
+        rows = np.load(path, mmap_mode="r")
+        df = pd.DataFrame(
+            {column: rows[field] for field, column in COLUMNS.items()},
+            index=pd.DatetimeIndex(rows["date"].astype("datetime64[ns]"), name="Date")
+        )
+        with self._lock:
+            self._frames[ticker] = {"mtime": mtime, "frame": df}
+        return df
+
+    # =====================================================
+    # COMPLÉMENT INCRÉMENTAL
+    # =====================================================
+
+    def ensure_fresh(self, pair):
+        """Complète l'historique si la dernière vérification date de plus de refresh_seconds"""
+        ticker = to_ticker(pair)
+        if not self._is_stale(ticker) or time.time() < self._retry_at.get(ticker, 0):
+            return
+
+        with self._pair_lock(ticker), FileLock(os.path.join(self.root, ".history.lock")):
+            # Un autre thread/worker a pu compléter pendant l'attente du verrou
+            if self._is_stale(ticker):
+                self.top_up(ticker)
+
+    def _is_stale(self, ticker):
+        try:
+            return time.time() - os.path.getmtime(self._path(ticker)) > self.refresh_seconds
+        except OSError:
+            return True
+
+    def top_up(self, pair):
+        """Télécharge les jours manquants (à partir de la dernière barre, qui peut être partielle)"""
+        ticker = to_ticker(pair)
+        path = self._path(ticker)
+
+        existing = np.load(path) if os.path.exists(path) else np.empty(0, dtype=OHLC_DTYPE)
+        start = existing["date"][-1].astype(datetime) if len(existing) else None
+
+        try:
+            fresh = _download(ticker, start)
+        except Exception as e:
+            logging.warning(f"Complément historique {ticker} échoué: {e}")
+            self._retry_at[ticker] = time.time() + HISTORY_RETRY_SECONDS
+            return 0
+
+        if len(fresh) == 0:
+            if len(existing) == 0:
+                logging.warning(f"Aucun historique disponible pour {ticker}")
+                self._retry_at[ticker] = time.time() + HISTORY_RETRY_SECONDS
+                return 0
+            os.utime(path)  # Vérifié : rien de nouveau
+            return 0
+
+        # Les barres téléchargées remplacent celles des mêmes jours (dernière barre du jour)
+        kept = existing[existing["date"] < fresh["date"][0]]
+        merged = np.concatenate([kept, fresh])
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, merged)
+        os.replace(tmp_path, path)
+
+        added = len(merged) - len(existing)
+        logging.info(f"📊 Historique {ticker} complété: {len(fresh)} barre(s) reçue(s), {added} nouvelle(s)")
+        return added
+
+    def status(self):
+        """Couverture de l'historique local par paire (monitoring)"""
+        status = {}
+        for name in sorted(os.listdir(self.root)):
+            if not name.endswith(".npy"):
+                continue
+            ticker = name[:-4].replace("_", "=")
+            df = self._frame(ticker)
+            status[ticker] = {
+                "bars": len(df),
+                "first": df.index[0].strftime("%Y-%m-%d") if len(df) else None,
+                "last": df.index[-1].strftime("%Y-%m-%d") if len(df) else None,
+                "checked_at": datetime.utcfromtimestamp(os.path.getmtime(self._path(ticker))).isoformat()
+            }
+        return status
+
+
+_history_store = None
+_history_store_lock = threading.Lock()
+
+
+def get_history_store():
+    """Instance partagée de l'historique (une par process)"""
+    global _history_store
+    if _history_store is None:
+        with _history_store_lock:
+            if _history_store is None:
+                _history_store = HistoryStore()
+    return _history_store
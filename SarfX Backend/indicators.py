@@ -0,0 +1,339 @@
+"""
+Moteur d'indicateurs techniques SarfX (signal IA de /smart-rate et /signals)
+- EMA 5/12/26, MACD, RSI 14, Bandes de Bollinger 20, ATR 14, z-score 20
+- Premier calcul : une seule passe NumPy sur la matrice (paires × barres) de l'historique local
+- Ensuite : état des récurrences conservé par paire, seules les nouvelles barres sont traitées
+- Résultat mis en cache par paire et par barre, rafraîchi par un thread de fond
+
+La dernière barre du jour est partielle (revue à chaque complément de l'historique) :
+l'état est figé à l'avant-dernière barre et la barre courante est recalculée depuis cet état.
+"""
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+
+import numpy as np
+from scipy.signal import lfilter
+
+from history_store import to_ticker
+
+SIGNAL_REFRESH_SECONDS = int(os.environ.get("SIGNAL_REFRESH_SECONDS", 60))
+
+# Barres utilisées pour le premier calcul (les EMA convergent bien avant)
+WINDOW = 260
+
+EMA_TREND = 5
+MACD_FAST = 12
+MACD_SLOW = 26
+MACD_SIGNAL = 9
+RSI_PERIOD = 14
+ATR_PERIOD = 14
+BAND_PERIOD = 20
+BAND_WIDTH = 2.0
+
+# Écart au-delà duquel le prix est "loin" de l'EMA 5 (règle historique du signal)
+EMA_THRESHOLD = 0.005
+
+SIGNAL_BUY = "ACHETER (Taux bas)"
+SIGNAL_WAIT = "ATTENDRE (Taux haut)"
+SIGNAL_NEUTRAL = "NEUTRE"
+
+
+def _ema_alpha(span):
+    return 2.0 / (span + 1)
+
+
+# Lissage de Wilder (RSI, ATR)
+ALPHAS = {
+    "ema_5": _ema_alpha(EMA_TREND),
+    "ema_12": _ema_alpha(MACD_FAST),
+    "ema_26": _ema_alpha(MACD_SLOW),
+    "macd_signal": _ema_alpha(MACD_SIGNAL),
+    "avg_gain": 1.0 / RSI_PERIOD,
+    "avg_loss": 1.0 / RSI_PERIOD,
+    "atr": 1.0 / ATR_PERIOD,
+}
+
+
+def ema_rows(x, alpha):
+    """EMA (adjust=False, amorcée sur la première valeur) de chaque ligne d'une matrice"""
+    zi = (1 - alpha) * x[:, :1]
+    y, _ = lfilter([alpha], [1, alpha - 1], x, axis=1, zi=zi)
+    return y
+
+
+def _true_range(high, low, prev_close):
+    return np.maximum(high - low, np.maximum(np.abs(high - prev_close), np.abs(low - prev_close)))
+
+
+def committed_state(opens, highs, lows, closes):
+    """
+    État des récurrences après la dernière colonne de matrices (paires × barres), m >= 2.
+    Calcul vectorisé sur toutes les paires et toutes les barres à la fois.
+    """
+    ema_12 = ema_rows(closes, ALPHAS["ema_12"])
+    ema_26 = ema_rows(closes, ALPHAS["ema_26"])
+
+    diff = np.diff(closes, axis=1)
+    tr = np.concatenate([
+        highs[:, :1] - lows[:, :1],
+        _true_range(highs[:, 1:], lows[:, 1:], closes[:, :-1])
+    ], axis=1)
+
+    window = closes[:, -(BAND_PERIOD - 1):]
+    if window.shape[1] < BAND_PERIOD - 1:
+        pad = np.repeat(window[:, :1], BAND_PERIOD - 1 - window.shape[1], axis=1)
+        window = np.concatenate([pad, window], axis=1)
+
+    return {
+        "ema_5": ema_rows(closes, ALPHAS["ema_5"])[:, -1],
+        "ema_12": ema_12[:, -1],
+        "ema_26": ema_26[:, -1],
+        "macd_signal": ema_rows(ema_12 - ema_26, ALPHAS["macd_signal"])[:, -1],
+        "avg_gain": ema_rows(np.maximum(diff, 0), ALPHAS["avg_gain"])[:, -1],
+        "avg_loss": ema_rows(np.maximum(-diff, 0), ALPHAS["avg_loss"])[:, -1],
+        "atr": ema_rows(tr, ALPHAS["atr"])[:, -1],
+        "prev_close": closes[:, -1],
+        "window": window,
+    }
+
+
+def advance(state, o, h, l, c):
+    """
+    Applique une barre (vecteurs d'une valeur par paire) à l'état.
+
+    Returns:
+        (nouvel état, indicateurs de la barre)
+    """
+    def smooth(name, value):
+        alpha = ALPHAS[name]
+        return alpha * value + (1 - alpha) * state[name]
+
+    ema_5 = smooth("ema_5", c)
+    ema_12 = smooth("ema_12", c)
+    ema_26 = smooth("ema_26", c)
+    macd = ema_12 - ema_26
+    macd_signal = smooth("macd_signal", macd)
+
+    diff = c - state["prev_close"]
+    avg_gain = smooth("avg_gain", np.maximum(diff, 0))
+    avg_loss = smooth("avg_loss", np.maximum(-diff, 0))
+    atr = smooth("atr", _true_range(h, l, state["prev_close"]))
+
+    window = np.concatenate([state["window"], c[:, None]], axis=1)
+    middle = window.mean(axis=1)
+    std = window.std(axis=1)
+    upper = middle + BAND_WIDTH * std
+    lower = middle - BAND_WIDTH * std
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = np.where(avg_loss > 0, 100 - 100 / (1 + avg_gain / avg_loss), 100.0)
+        percent_b = np.where(upper > lower, (c - lower) / (upper - lower), 0.5)
+        zscore = np.where(std > 0, (c - middle) / std, 0.0)
+
+    new_state = {
+        "ema_5": ema_5,
+        "ema_12": ema_12,
+        "ema_26": ema_26,
+        "macd_signal": macd_signal,
+        "avg_gain": avg_gain,
+        "avg_loss": avg_loss,
+        "atr": atr,
+        "prev_close": c,
+        "window": window[:, 1:],
+    }
+    indicators = {
+        "close": c,
+        "ema_5": ema_5,
+        "ema_12": ema_12,
+        "ema_26": ema_26,
+        "macd": macd,
+        "macd_signal": macd_signal,
+        "macd_hist": macd - macd_signal,
+        "rsi_14": rsi,
+        "bb_upper": upper,
+        "bb_middle": middle,
+        "bb_lower": lower,
+        "bb_percent_b": percent_b,
+        "atr_14": atr,
+        "zscore_20": zscore,
+    }
+    return new_state, indicators
+
+
+def classify(ind):
+    """
+    Vote des indicateurs (lecture "retour à la moyenne", comme la règle EMA historique) :
+    prix bas -> ACHETER, prix haut -> ATTENDRE.
+    """
+    close = ind["close"]
+    low_votes = int(close < ind["ema_5"] * (1 - EMA_THRESHOLD)) + int(ind["rsi_14"] < 30) + int(ind["bb_percent_b"] < 0)
+    high_votes = int(close > ind["ema_5"] * (1 + EMA_THRESHOLD)) + int(ind["rsi_14"] > 70) + int(ind["bb_percent_b"] > 1)
+    score = low_votes - high_votes
+
+    if score > 0:
+        signal = SIGNAL_BUY
+    elif score < 0:
+        signal = SIGNAL_WAIT
+    else:
+        signal = SIGNAL_NEUTRAL
+    return signal, score, "Haut" if abs(score) >= 2 else "Moyen"
+
+
+def _rows(df):
+    return [df[column].to_numpy(dtype="float64") for column in ("Open", "High", "Low", "Close")]
+
+
+def _slice_state(state, i):
+    return {name: value[i:i + 1] for name, value in state.items()}
+
+
+class SignalEngine:
+    """Indicateurs et signal par paire, recalculés seulement quand une barre change"""
+
+    def __init__(self, history, pairs=()):
+        self.history = history
+        self.pairs = [to_ticker(p) for p in pairs]
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats = {"full_passes": 0, "incremental_bars": 0, "cache_hits": 0}
+
+    # =====================================================
+    # LECTURE
+    # =====================================================
+
+    def get_signal(self, pair):
+        """Signal précalculé d'une paire (calculé à la demande si inconnue)"""
+        ticker = to_ticker(pair)
+        entry = self._entries.get(ticker)
+        if entry is None:
+            self.refresh([ticker])
+            entry = self._entries.get(ticker)
+        return entry["result"] if entry else None
+
+    def all_signals(self):
+        """Signaux de toutes les paires suivies"""
+        if any(ticker not in self._entries for ticker in self.pairs):
+            self.refresh(self.pairs)
+        return {ticker: entry["result"] for ticker, entry in self._entries.items()}
+
+    def stats(self):
+        return {**self._stats, "pairs": len(self._entries)}
+
+    # =====================================================
+    # CALCUL
+    # =====================================================
+
+    def refresh(self, pairs=None, refresh_history=True):
+        """
+        Met à jour les paires dont la barre courante a changé ; passe groupée pour les nouvelles.
+        L'historique (réseau) est lu et les indicateurs calculés hors verrou : le verrou
+        ne couvre que l'échange des entrées, les lecteurs ne bloquent jamais sur Yahoo.
+        """
+        frames = {}
+        for ticker in (pairs or self.pairs):
+            df = self.history.get_history(ticker, refresh=refresh_history)
+            if len(df) >= 3:
+                frames[ticker] = df
+
+        updates, cold = {}, {}
+        for ticker, df in frames.items():
+            entry = self._entries.get(ticker)
+            bar = (df.index[-1], float(df["Close"].iloc[-1]))
+            if entry is not None and entry["bar"] == bar:
+                self._stats["cache_hits"] += 1
+                continue
+
+            advanced = self._advance_entry(entry, df) if entry is not None else None
+            if advanced is None:
+                cold[ticker] = df
+            else:
+                updates[ticker] = advanced
+
+        if cold:
+            updates.update(self._full_pass(cold))
+        with self._lock:
+            for ticker, entry in updates.items():
+                # Un rafraîchissement concurrent a pu publier une barre plus récente
+                current = self._entries.get(ticker)
+                if current is None or current["bar"][0] <= entry["bar"][0]:
+                    self._entries[ticker] = entry
+
+    def _advance_entry(self, entry, df):
+        """Traite seulement les barres arrivées depuis le dernier calcul (None si impossible)"""
+        index = df.index
+        position = index.searchsorted(entry["committed"])
+        if position >= len(index) - 1 or index[position] != entry["committed"]:
+            return None
+
+        opens, highs, lows, closes = _rows(df)
+        state = entry["state"]
+        # Barres désormais complètes (dont l'ancienne barre courante)
+        for i in range(position + 1, len(index) - 1):
+            state, _ = advance(state, opens[i:i + 1], highs[i:i + 1], lows[i:i + 1], closes[i:i + 1])
+            self._stats["incremental_bars"] += 1
+
+        last = len(index) - 1
+        _, indicators = advance(state, opens[last:], highs[last:], lows[last:], closes[last:])
+        return self._entry(entry["result"]["pair"], index[-2], state, df, indicators, 0)
+
+    def _full_pass(self, frames):
+        """Calcul complet, vectorisé sur la matrice (paires × WINDOW barres)"""
+        tickers = list(frames)
+        matrices = np.empty((4, len(tickers), WINDOW))
+        for p, ticker in enumerate(tickers):
+            for k, values in enumerate(_rows(frames[ticker].tail(WINDOW))):
+                # Historique court : complété à gauche par la première valeur
+                matrices[k, p, :WINDOW - len(values)] = values[0]
+                matrices[k, p, WINDOW - len(values):] = values
+
+        opens, highs, lows, closes = matrices
+        state = committed_state(opens[:, :-1], highs[:, :-1], lows[:, :-1], closes[:, :-1])
+        _, indicators = advance(state, opens[:, -1], highs[:, -1], lows[:, -1], closes[:, -1])
+        self._stats["full_passes"] += 1
+
+        return {
+            ticker: self._entry(ticker, frames[ticker].index[-2], _slice_state(state, p), frames[ticker], indicators, p)
+            for p, ticker in enumerate(tickers)
+        }
+
+    @staticmethod
+    def _entry(ticker, committed, state, df, indicators, i):
+        ind = {name: float(values[i]) for name, values in indicators.items()}
+        signal, score, confidence = classify(ind)
+        return {
+            "committed": committed,
+            "state": state,
+            "bar": (df.index[-1], float(df["Close"].iloc[-1])),
+            "result": {
+                "pair": ticker,
+                "bar_date": df.index[-1].strftime("%Y-%m-%d"),
+                "signal": signal,
+                "confidence": confidence,
+                "score": score,
+                "indicators": {name: round(value, 6) for name, value in ind.items()},
+                "computed_at": datetime.utcnow().isoformat()
+            }
+        }
+
+    # =====================================================
+    # THREAD DE FOND
+    # =====================================================
+
+    def start(self, interval=SIGNAL_REFRESH_SECONDS):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="signal-engine", daemon=True)
+        self._thread.start()
+
+    def _run(self, interval):
+        while True:
+            started = time.monotonic()
+            try:
+                self.refresh(list(dict.fromkeys(self.pairs + list(self._entries))))
+            except Exception as e:
+                logging.error(f"Rafraîchissement des signaux échoué: {e}")
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
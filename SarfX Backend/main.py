@@ -1,22 +1,25 @@
 import os
+import asyncio
 import uvicorn
-import requests
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Header
 from fastapi.middleware.cors import CORSMiddleware
-import yfinance as yf
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from pymongo import MongoClient
 import warnings
-from statsmodels.tsa.arima.model import ARIMA
-from prophet import Prophet
 from sklearn.metrics import mean_absolute_error
 import logging
 
+from model_store import ModelStore, RetrainScheduler, SUPPORTED_PAIRS, normalize_pair
+from indicators import SignalEngine
+from history_store import get_history_store
+from rate_sources import RateAcquirer
+from routing import RouteEngine
+
 # --- CONFIGURATION (PROD) ---
 warnings.filterwarnings("ignore")
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -37,6 +40,8 @@ SMTP_PORT = 587
 ADMIN_EMAIL = "starkxgroup@gmail.com"
 COINAPI_KEY = os.environ.get("COINAPI_KEY", "VOTRE_API_KEY_ICI") # Placeholder
 AI_PORT = int(os.environ.get("AI_PORT", 8087))
+# Clé API des endpoints d'administration (refresh des modèles, purge du cache)
+ADMIN_API_KEY = os.environ.get("ADMIN_API_KEY")
 
 # Cache en mémoire pour les taux (évite les appels répétés)
 # TODO: Remplacer par Redis pour un vrai cache distribué en production
@@ -76,6 +81,48 @@ except Exception as e:
     rates_collection = None
     db = None
 
+# Historique OHLC journalier local (voir history_store.py)
+history_store = get_history_store()
+
+# Registre des modèles de prévision (entraînés hors requêtes, voir model_store.py)
+model_store = ModelStore()
+retrain_scheduler = RetrainScheduler(model_store)
+
+
+# Acquisition asynchrone des taux (client HTTP keep-alive partagé, voir rate_sources.py)
+rate_acquirer = RateAcquirer()
+
+
+# Moteur d'indicateurs techniques (signal IA précalculé, voir indicators.py)
+signal_engine = SignalEngine(history_store, SUPPORTED_PAIRS)
+
+
+# Meilleurs chemins multi-sauts précalculés depuis l'instantané des taux (voir routing.py)
+route_engine = RouteEngine()
+
+
+@app.on_event("startup")
+def start_model_scheduler():
+    retrain_scheduler.start()
+    signal_engine.start()
+
+
+@app.on_event("startup")
+async def start_route_engine():
+    route_engine.start(fetch_fiat_rate)
+
+
+@app.on_event("shutdown")
+async def close_rate_client():
+    route_engine.stop()
+    await rate_acquirer.aclose()
+
+
+def require_admin_key(api_key):
+    """Vérifie la clé API admin (header X-API-Key)"""
+    if not ADMIN_API_KEY or api_key != ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Admin API key required")
+
 # --- COUCHE D'ACQUISITION (INPUT LAYER) ---
 
 def get_cached_rate(cache_key):
@@ -94,12 +141,14 @@ def set_cached_rate(cache_key, rate):
         'timestamp': datetime.utcnow()
     }
 
-def fetch_fiat_rate(base, target):
+async def fetch_fiat_rate(base, target):
     """
-    Source 1 : Marché Interbancaire (Frankfurter/Yahoo)
+    Source 1 : Marché Interbancaire (Frankfurter / ExchangeRate-API / Yahoo)
+
+    Sources interrogées en parallèle hedgé, première réponse valide retenue ;
+    les requêtes concurrentes pour une même paire partagent un seul fetch (voir rate_sources.py).
 
     TODO: Ajouter support pour d'autres APIs de taux de change:
-    - ExchangeRate-API.com (gratuit, 1500 req/mois)
     - Fixer.io (freemium)
     - Open Exchange Rates
     """
@@ -108,34 +157,16 @@ def fetch_fiat_rate(base, target):
     if cached:
         return cached
 
-    try:
-        # Priorité API Rapide
-        url = f"https://api.frankfurter.app/latest?from={base}&to={target}"
-        resp = requests.get(url, timeout=2)
-        if resp.status_code == 200:
-            rate = resp.json()['rates'][target]
-            set_cached_rate(cache_key, rate)
-            logging.info(f"✓ Taux {base}/{target} récupéré: {rate} (Frankfurter)")
-            return rate
-    except Exception as e:
-        logging.warning(f"Frankfurter API échec: {e}")
+    rate, source = await rate_acquirer.fetch(base, target)
+    if rate:
+        set_cached_rate(cache_key, rate)
+        # Nouveau taux dans l'instantané : table des routes recalculée au prochain rafraîchissement
+        route_engine.update({(base, target): rate})
+        return rate
 
-    # Fallback Yahoo Finance (Plus lent mais robuste)
-    try:
-        ticker = f"{base}{target}=X"
-        df = yf.download(ticker, period="1d", interval="1m", progress=False)
-        if not df.empty:
-            rate = df['Close'].iloc[-1]
-            set_cached_rate(cache_key, rate)
-            logging.info(f"✓ Taux {base}/{target} récupéré: {rate} (Yahoo Finance)")
-            return rate
-    except Exception as e:
-        logging.error(f"Yahoo Finance échec: {e}")
-
-    logging.error(f"✗ Impossible de récupérer le taux {base}/{target}")
     return 0.0 # Echec
 
-def fetch_crypto_implied_rate(base, target):
+async def fetch_crypto_implied_rate(base, target, fiat_rate=None):
     """
     Source 2 : Marché Crypto (USDT Implied Rate)
 
@@ -147,7 +178,8 @@ def fetch_crypto_implied_rate(base, target):
     NOTE: Actuellement simule une prime crypto de +1.5% sur le taux fiat
     """
 
-    fiat_rate = fetch_fiat_rate(base, target)
+    if fiat_rate is None:
+        fiat_rate = await fetch_fiat_rate(base, target)
     if fiat_rate == 0:
         return 0.0
 
@@ -163,25 +195,29 @@ def fetch_crypto_implied_rate(base, target):
 
 # --- COUCHE DE TRAITEMENT (PROCESS LAYER) ---
 
-def calculate_best_execution(base, target, amount):
+async def calculate_best_execution(base, target, amount):
     """
     Cœur de l'Arbitrage : Trouve le meilleur chemin pour l'argent
 
+    Le taux client reste le meilleur des deux sources directes (fiat / crypto) ; le chemin
+    de 1 à 3 sauts du moteur de routage (ex: EUR->USD->MAD) est joint à titre indicatif.
+
     TODO: Améliorer l'arbitrage avec:
     - Calcul des frais réels par provider (bank, wise, western union, etc.)
     - Prise en compte des délais de livraison
     - Score de fiabilité des providers (basé sur historique)
-    - Optimisation multi-routes (ex: EUR->USD->MAD si meilleur)
     """
 
-    # 1. Acquisition
-    rate_fiat = fetch_fiat_rate(base, target)
-    rate_crypto = fetch_crypto_implied_rate(base, target)
+    # 1. Acquisition (un seul fetch fiat, réutilisé par la source crypto et le graphe)
+    rate_fiat = await fetch_fiat_rate(base, target)
+    rate_crypto = await fetch_crypto_implied_rate(base, target, fiat_rate=rate_fiat)
     rate_bank = rate_fiat * 0.975 # Les banques prennent ~2.5% de marge
 
     # 2. Arbitrage
     best_source_rate = max(rate_fiat, rate_crypto)
     source_name = "Marché Crypto (USDT)" if rate_crypto > rate_fiat else "Marché Interbancaire"
+    # Route précalculée (O(1)) : indicative, modèle de places simulé, jamais appliquée au swap
+    route = route_engine.quote(base, target)
 
     # 3. Marge SarfX (Dynamique)
     # TODO: Rendre la marge dynamique selon:
@@ -201,117 +237,34 @@ def calculate_best_execution(base, target, amount):
             "sarfx": sarfx_rate
         },
         "best_source": source_name,
+        "route": route,
         "savings": (amount * sarfx_rate) - (amount * rate_bank)
     }
 
 # --- MOTEUR IA (PREDICTION LAYER) ---
 
-def train_arima_model(df, order=(5, 1, 0)):
-    """
-    Entraîne un modèle ARIMA sur les données historiques
-
-    ARIMA (AutoRegressive Integrated Moving Average):
-    - AR(p): régression sur p valeurs passées
-    - I(d): différenciation d'ordre d pour stationnarité
-    - MA(q): moyenne mobile sur q erreurs passées
-
-    TODO: Optimiser les hyperparamètres (p,d,q) avec auto_arima ou grid search
-    """
-    try:
-        model = ARIMA(df['Close'], order=order)
-        fitted = model.fit()
-        return fitted
-    except Exception as e:
-        logging.error(f"ARIMA training failed: {e}")
-        return None
-
-def train_prophet_model(df):
-    """
-    Entraîne un modèle Prophet (Meta/Facebook) sur les données historiques
-
-    Prophet est spécialisé dans les séries temporelles avec:
-    - Tendances non-linéaires
-    - Saisonnalité multiple (jour/semaine/année)
-    - Gestion des jours fériés
-    - Robuste aux données manquantes
-
-    TODO: Ajouter des régresseurs externes (événements économiques, news, etc.)
-    """
-    try:
-        # Prophet nécessite colonnes 'ds' (date) et 'y' (valeur)
-        prophet_df = pd.DataFrame({
-            'ds': df.index,
-            'y': df['Close']
-        })
-
-        model = Prophet(
-            daily_seasonality=True,
-            weekly_seasonality=True,
-            yearly_seasonality=False,  # Pas assez de données historiques généralement
-            changepoint_prior_scale=0.05  # Flexibilité des tendances
-        )
-        model.fit(prophet_df)
-        return model
-    except Exception as e:
-        logging.error(f"Prophet training failed: {e}")
-        return None
-
-def predict_with_arima(model, steps=7):
-    """Prédiction ARIMA pour N jours"""
-    try:
-        forecast = model.forecast(steps=steps)
-        return forecast.tolist()
-    except Exception as e:
-        logging.error(f"ARIMA prediction failed: {e}")
-        return None
-
-def predict_with_prophet(model, steps=7):
-    """Prédiction Prophet pour N jours"""
-    try:
-        future = model.make_future_dataframe(periods=steps)
-        forecast = model.predict(future)
-        # Retourner seulement les prédictions futures
-        return forecast['yhat'].tail(steps).tolist()
-    except Exception as e:
-        logging.error(f"Prophet prediction failed: {e}")
-        return None
-
 def generate_ai_signal(pair):
     """
     Analyse la tendance pour donner un conseil (Timing)
 
+    Lit le signal précalculé par le moteur d'indicateurs (EMA, RSI, MACD, Bollinger,
+    ATR, z-score ; voir indicators.py).
+
     TODO: Enrichir l'analyse avec:
-    - Indicateurs techniques (RSI, MACD, Bollinger Bands)
     - Analyse de sentiment (Twitter, news financières)
     - Détection d'anomalies (spikes inhabituels)
-    - Scoring de confiance basé sur plusieurs indicateurs
+
+    Returns:
+        dict {'signal', 'confidence', 'score', 'indicators', ...}
     """
-    ticker = f"{pair}=X"
     try:
-        df = yf.download(ticker, period="1mo", interval="1d", progress=False)
-        if df.empty:
-            return "NEUTRE"
-
-        # Analyse simple : Moyenne Mobile Exponentielle (EMA)
-        short_window = 5
-        df['EMA'] = df['Close'].ewm(span=short_window, adjust=False).mean()
-
-        last_close = df['Close'].iloc[-1]
-        last_ema = df['EMA'].iloc[-1]
-
-        # Logique de signal
-        if last_close < last_ema * 0.995: # Prix significativement sous la moyenne -> Potentiel rebond
-            signal = "ACHETER (Taux bas)"
-        elif last_close > last_ema * 1.005: # Prix haut -> Attendre correction
-            signal = "ATTENDRE (Taux haut)"
-        else:
-            signal = "NEUTRE"
-
-        logging.info(f"✓ Signal IA pour {pair}: {signal}")
-        return signal
+        result = signal_engine.get_signal(pair)
+        if result is None:
+            return {"signal": "NEUTRE", "confidence": "Moyen"}
+        return result
     except Exception as e:
         logging.error(f"AI signal generation failed: {e}")
-        return "INDISPONIBLE"
+        return {"signal": "INDISPONIBLE", "confidence": "Moyen"}
 
 # --- TÂCHES DE FOND (BACKGROUND) ---
 
@@ -372,23 +325,38 @@ def health():
         "status": "operational",
         "database": db_status,
         "cache": cache_stats,
+        "models": model_store.status(),
+        "routing": route_engine.stats(),
         "features": {
             "ml_models": ["ARIMA", "Prophet"],
-            "rate_sources": ["Frankfurter", "Yahoo Finance"],
+            "rate_sources": ["Frankfurter", "ExchangeRate-API", "Yahoo Finance"],
             "arbitrage": True,
             "real_time_cache": True
         },
         "timestamp": datetime.utcnow().isoformat()
     }
 
+def _route_summary(route):
+    """Chemin retenu, lisible : devises, places et taux de chaque saut (indicatif, non appliqué)"""
+    if route is None:
+        return None
+    return {
+        "advisory": True,
+        "path": route["path"],
+        "hops": route["hops"],
+        "rate": round(route["rate"], 6),
+        "explanation": route["explanation"]
+    }
+
 @app.get("/smart-rate/{base}/{target}")
-def smart_rate_endpoint(base: str, target: str, amount: float = 1000, background_tasks: BackgroundTasks = None):
+async def smart_rate_endpoint(base: str, target: str, amount: float = 1000, background_tasks: BackgroundTasks = None):
     try:
-        # 1. Calcul Arbitrage
-        arb = calculate_best_execution(base, target, amount)
-
-        # 2. Analyse IA (Timing)
-        signal = generate_ai_signal(f"{base}{target}")
+        # 1. Calcul Arbitrage + 2. Analyse IA (Timing) en parallèle
+        # (le signal lit l'historique local, potentiellement bloquant -> thread)
+        arb, signal = await asyncio.gather(
+            calculate_best_execution(base, target, amount),
+            asyncio.to_thread(generate_ai_signal, f"{base}{target}")
+        )
 
         # 3. Archivage asynchrone
         if background_tasks:
@@ -408,117 +376,103 @@ def smart_rate_endpoint(base: str, target: str, amount: float = 1000, background
                 "bank_rate": round(arb['rates']['bank'], 4),
                 "market_rate": round(arb['rates']['market'], 4),
                 "best_liquidity_source": arb['best_source'],
+                "route": _route_summary(arb['route']),
                 "savings": round(arb['savings'], 2)
             },
             "ai_advisor": {
-                "signal": signal,
-                "confidence": "Haut" if signal != "NEUTRE" else "Moyen"
+                "signal": signal["signal"],
+                "confidence": signal["confidence"],
+                "indicators": signal.get("indicators", {})
             }
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/route/{base}/{target}")
+async def route_endpoint(base: str, target: str, amount: float = 1000):
+    """Meilleur chemin de conversion (1 à 3 sauts) depuis la table précalculée"""
+    base, target = base.upper(), target.upper()
+    route = route_engine.quote(base, target, amount)
+    if route is None:
+        # Paire hors du graphe : son taux l'y ajoute (recalcul hors de la boucle d'événements)
+        await fetch_fiat_rate(base, target)
+        await route_engine.flush()
+        route = route_engine.quote(base, target, amount)
+    if route is None:
+        raise HTTPException(status_code=404, detail=f"Aucune route {base}/{target}")
+    return {
+        "pair": f"{base}/{target}",
+        "amount": amount,
+        "final_amount": round(route["final_amount"], 2),
+        "route": _route_summary(route),
+        "engine": route_engine.stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+@app.get("/signals")
+def signals_endpoint():
+    """Signal IA et indicateurs techniques de toutes les paires suivies"""
+    return {
+        "signals": signal_engine.all_signals(),
+        "engine": signal_engine.stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
 @app.get("/predict/{pair}")
-def predict_endpoint(pair: str):
+def predict_endpoint(pair: str, refresh: bool = False, x_api_key: str = Header(None)):
     """
     Endpoint de prédiction ML avec ARIMA + Prophet
 
-    Retourne les prédictions pour les 7 prochains jours avec:
+    Sert la prévision 7 jours précalculée par le registre de modèles:
     - ARIMA: Modèle classique statistique
     - Prophet: Modèle moderne de Meta/Facebook
     - Ensemble: Moyenne des deux pour plus de robustesse
 
+    ?refresh=true (header X-API-Key admin) met la paire en file de ré-entraînement
+    au lieu de bloquer la requête.
+
     TODO: Ajouter:
     - LSTM (Deep Learning) pour captures patterns complexes
     - XGBoost avec features engineering (volumes, volatilité, etc.)
     - Intervalles de confiance (95%) pour chaque prédiction
     - Backtesting automatique pour validation
     """
-    try:
-        # Télécharger l'historique (1 an pour meilleur entraînement)
-        ticker = pair if "=" in pair else f"{pair}=X"
-        logging.info(f"📊 Téléchargement données pour {ticker}...")
-        df = yf.download(ticker, period="1y", interval="1d", progress=False)
-
-        if df.empty:
-            raise HTTPException(status_code=404, detail=f"Aucune donnée disponible pour {pair}")
-
-        current = df['Close'].iloc[-1]
-        logging.info(f"✓ Taux actuel {pair}: {current:.4f}")
-
-        # Entraîner les modèles
-        logging.info("🤖 Entraînement ARIMA...")
-        arima_model = train_arima_model(df)
-
-        logging.info("🤖 Entraînement Prophet...")
-        prophet_model = train_prophet_model(df)
-
-        # Prédictions
-        steps = 7
-        dates = [(df.index[-1] + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(1, steps + 1)]
-
-        # ARIMA
-        arima_predictions = None
-        if arima_model:
-            arima_predictions = predict_with_arima(arima_model, steps)
-            logging.info(f"✓ Prédictions ARIMA générées: {len(arima_predictions)} jours")
-
-        # Prophet
-        prophet_predictions = None
-        if prophet_model:
-            prophet_predictions = predict_with_prophet(prophet_model, steps)
-            logging.info(f"✓ Prédictions Prophet générées: {len(prophet_predictions)} jours")
-
-        # Ensemble (moyenne des deux modèles)
-        ensemble_predictions = []
-        if arima_predictions and prophet_predictions:
-            ensemble_predictions = [
-                (a + p) / 2 for a, p in zip(arima_predictions, prophet_predictions)
-            ]
-            logging.info("✓ Ensemble créé (moyenne ARIMA + Prophet)")
-        elif arima_predictions:
-            ensemble_predictions = arima_predictions
-            logging.warning("Prophet échec, utilisation ARIMA seul")
-        elif prophet_predictions:
-            ensemble_predictions = prophet_predictions
-            logging.warning("ARIMA échec, utilisation Prophet seul")
-        else:
-            # Fallback: prédiction naïve (tendance linéaire simple)
-            logging.warning("Tous les modèles ont échoué, fallback sur tendance linéaire")
-            ensemble_predictions = np.linspace(current, current * 1.01, steps).tolist()
-
-        # Historique récent (30 derniers jours)
-        history = df.tail(30).reset_index()
-        history_data = [
-            {
-                'Date': row['Date'].strftime('%Y-%m-%d'),
-                'Close': float(row['Close'])
-            }
-            for _, row in history.iterrows()
-        ]
+    pair = normalize_pair(pair)
+    if pair not in SUPPORTED_PAIRS:
+        raise HTTPException(status_code=404, detail=f"Paire non supportée: {pair}")
 
+    if refresh:
+        require_admin_key(x_api_key)
+        position = retrain_scheduler.enqueue(pair, force=True)
         return {
-            "meta": {
-                "pair": pair,
-                "current_rate": float(current),
-                "prediction_days": steps,
-                "models_used": ["ARIMA", "Prophet"],
-                "timestamp": datetime.utcnow().isoformat()
-            },
-            "predictions": {
-                "dates": dates,
-                "Ensemble_Mean": ensemble_predictions,
-                "ARIMA": arima_predictions if arima_predictions else ensemble_predictions,
-                "Prophet": prophet_predictions if prophet_predictions else ensemble_predictions
-            },
-            "history": history_data,
-            "confidence": "High" if (arima_predictions and prophet_predictions) else "Medium"
+            "status": "queued",
+            "pair": pair,
+            "queue_position": position,
+            "current_version": model_store.latest_version(pair),
+            "timestamp": datetime.utcnow().isoformat()
         }
-    except HTTPException:
-        raise
-    except Exception as e:
-        logging.error(f"Erreur prédiction pour {pair}: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+
+    forecast = model_store.get_forecast(pair)
+    if forecast is None:
+        # Jamais entraînée : on planifie, le client retombe sur son cache/fallback
+        retrain_scheduler.enqueue(pair)
+        raise HTTPException(
+            status_code=503,
+            detail=f"Prévision {pair} en cours d'entraînement",
+            headers={"Retry-After": "60"}
+        )
+    return forecast
+
+@app.get("/models/status")
+def models_status():
+    """Versions des modèles publiées et file d'entraînement"""
+    return {
+        "models": model_store.status(),
+        "history": history_store.status(),
+        "pending": retrain_scheduler.pending(),
+        "retrain_interval_hours": retrain_scheduler.interval / 3600,
+        "timestamp": datetime.utcnow().isoformat()
+    }
 
 @app.post("/cache/clear")
 def clear_cache():
@@ -567,6 +521,7 @@ def cache_statistics():
         "total_entries": len(RATE_CACHE),
         "ttl_seconds": CACHE_TTL,
         "entries": stats,
+        "acquisition": rate_acquirer.stats(),
         "timestamp": datetime.utcnow().isoformat()
     }
 
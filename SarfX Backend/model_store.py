@@ -0,0 +1,400 @@
+"""
+Registre de modèles de prévision SarfX
+- Entraîne ARIMA + Prophet hors du chemin des requêtes (thread planifié)
+- Jobs (paire × modèle) répartis sur un pool de process, timeout et plafond mémoire par job
+- Sérialise modèles + prévision 7 jours sur disque, versionnés par hash du contenu
+- Sert la dernière prévision depuis la mémoire (rechargée si un autre worker a publié)
+
+Arborescence:
+    MODEL_DIR/<PAIR>/<version>/arima.pkl
+    MODEL_DIR/<PAIR>/<version>/prophet.json
+    MODEL_DIR/<PAIR>/<version>/forecast.json
+    MODEL_DIR/<PAIR>/latest.json          -> {"version": ..., "trained_at": ...}
+"""
+import os
+import json
+import time
+import pickle
+import hashlib
+import signal
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from datetime import datetime
+
+import forecasting
+from history_store import FileLock, get_history_store
+
+MODEL_DIR = os.environ.get("MODEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models"))
+RETRAIN_INTERVAL_HOURS = float(os.environ.get("RETRAIN_INTERVAL_HOURS", 24))
+
+# Pool d'entraînement : un process par cœur, timeout et plafond mémoire par job
+TRAINING_WORKERS = int(os.environ.get("TRAINING_WORKERS", os.cpu_count() or 1))
+TRAINING_JOB_TIMEOUT = int(os.environ.get("TRAINING_JOB_TIMEOUT", 600))  # secondes
+TRAINING_MEMORY_MB = int(os.environ.get("TRAINING_MEMORY_MB", 2048))  # 0 = sans plafond
+
+# Modèles entraînés par paire -> fichier de l'artefact sérialisé
+MODEL_ARTIFACTS = {
+    "arima": "arima.pkl",
+    "prophet": "prophet.json",
+}
+
+# Paires entraînées par le planificateur (miroir de app/services/ai_service.get_supported_pairs)
+SUPPORTED_PAIRS = ["EURUSD=X", "USDMAD=X", "EURMAD=X", "GBPUSD=X", "GBPMAD=X"]
+
+
+def normalize_pair(pair):
+    """EURUSD, EURUSD=X -> EURUSD=X"""
+    pair = pair.upper()
+    return pair if "=" in pair else f"{pair}=X"
+
+
+def data_version(df):
+    """Hash du contenu des données d'entraînement + configuration des modèles"""
+    digest = hashlib.sha256()
+    digest.update(repr((forecasting.ARIMA_ORDER, forecasting.FORECAST_STEPS)).encode())
+    digest.update(df.index.astype("int64").to_numpy().tobytes())
+    digest.update(df['Close'].to_numpy(dtype="float64").tobytes())
+    return digest.hexdigest()[:16]
+
+
+def _write_atomic(path, payload):
+    """Écrit un fichier via renommage atomique (lecteurs concurrents sûrs)"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    mode = "wb" if isinstance(payload, bytes) else "w"
+    with open(tmp_path, mode) as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+
+class ModelStore:
+    """Stockage disque + cache mémoire des modèles et prévisions par paire"""
+
+    def __init__(self, root=MODEL_DIR):
+        self.root = root
+        self._forecasts = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _pair_dir(self, pair):
+        return os.path.join(self.root, pair.replace("=", "_"))
+
+    def _latest_path(self, pair):
+        return os.path.join(self._pair_dir(pair), "latest.json")
+
+    def latest_version(self, pair):
+        """Version publiée pour une paire (None si jamais entraînée)"""
+        try:
+            with open(self._latest_path(pair)) as f:
+                return json.load(f).get("version")
+        except (OSError, ValueError):
+            return None
+
+    def get_forecast(self, pair):
+        """Prévision précalculée (mémoire, rechargée depuis le disque si plus récente)"""
+        pair = normalize_pair(pair)
+        try:
+            mtime = os.path.getmtime(self._latest_path(pair))
+        except OSError:
+            return None
+
+        cached = self._forecasts.get(pair)
+        if cached and cached["mtime"] >= mtime:
+            return cached["forecast"]
+
+        version = self.latest_version(pair)
+        if not version:
+            return None
+        try:
+            with open(os.path.join(self._pair_dir(pair), version, "forecast.json")) as f:
+                forecast = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Lecture prévision {pair}@{version} impossible: {e}")
+            return None
+
+        with self._lock:
+            self._forecasts[pair] = {"mtime": mtime, "forecast": forecast}
+        return forecast
+
+    def save(self, pair, version, artifacts, forecast):
+        """
+        Écrit les modèles sérialisés + la prévision puis publie la version.
+
+        Args:
+            artifacts: {nom de modèle: bytes/str sérialisés} (voir MODEL_ARTIFACTS)
+        """
+        version_dir = os.path.join(self._pair_dir(pair), version)
+        os.makedirs(version_dir, exist_ok=True)
+
+        for model_name, payload in artifacts.items():
+            if payload is not None:
+                _write_atomic(os.path.join(version_dir, MODEL_ARTIFACTS[model_name]), payload)
+        _write_atomic(os.path.join(version_dir, "forecast.json"), json.dumps(forecast))
+
+        _write_atomic(self._latest_path(pair), json.dumps({
+            "version": version,
+            "trained_at": forecast["meta"]["trained_at"]
+        }))
+        logging.info(f"✓ Modèles {pair} publiés (version {version})")
+
+    def status(self):
+        """Versions publiées par paire (monitoring)"""
+        status = {}
+        for pair in SUPPORTED_PAIRS:
+            forecast = self.get_forecast(pair)
+            status[pair] = {
+                "version": forecast["meta"]["model_version"] if forecast else None,
+                "trained_at": forecast["meta"]["trained_at"] if forecast else None
+            }
+        return status
+
+
+def _init_training_worker(memory_mb):
+    """Initialisation d'un process d'entraînement : plafond mémoire (RLIMIT_AS)"""
+    logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+    if not memory_mb:
+        return
+    try:
+        import resource
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError) as e:
+        logging.warning(f"Plafond mémoire d'entraînement non appliqué: {e}")
+
+
+class _JobTimeout(Exception):
+    pass
+
+
+def _raise_job_timeout(signum, frame):
+    raise _JobTimeout()
+
+
+def fit_model_job(model_name, pair, df, timeout):
+    """
+    Job exécuté dans un process du pool : entraîne un modèle et prédit FORECAST_STEPS jours.
+    Le timeout est appliqué dans le process (SIGALRM) ; train_pairs garde une échéance
+    globale pour les jobs bloqués dans du code natif.
+
+    Returns:
+        {'model', 'pair', 'predictions', 'artifact', 'seconds', 'error'}
+    """
+    started = time.monotonic()
+    result = _failed_job(model_name, pair, None)
+
+    use_alarm = timeout and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_job_timeout)
+        signal.alarm(int(timeout))
+    try:
+        if model_name == "arima":
+            model = forecasting.train_arima_model(df)
+            if model is not None:
+                result["predictions"] = forecasting.predict_with_arima(model)
+                result["artifact"] = pickle.dumps(model)
+        else:
+            model = forecasting.train_prophet_model(df)
+            if model is not None:
+                from prophet.serialize import model_to_json
+                result["predictions"] = forecasting.predict_with_prophet(model)
+                result["artifact"] = model_to_json(model)
+    except _JobTimeout:
+        result["error"] = f"timeout after {timeout}s"
+    except MemoryError:
+        result["error"] = f"memory cap of {TRAINING_MEMORY_MB} MB exceeded"
+    finally:
+        if use_alarm:
+            signal.alarm(0)
+
+    result["seconds"] = round(time.monotonic() - started, 2)
+    return result
+
+
+def train_pairs(store, pairs, forced=()):
+    """
+    Entraîne plusieurs paires en parallèle : un job (paire × modèle) par process du pool.
+    L'ensemble d'une paire est construit et publié dès que ses deux modèles ont fini.
+
+    Returns:
+        {paire: prévision publiée (ou None)}
+    """
+    results = {}
+    datasets = {}
+
+    for pair in dict.fromkeys(normalize_pair(p) for p in pairs):
+        df = get_history_store().get_history(pair, days=forecasting.TRAINING_WINDOW_DAYS)
+        if df.empty:
+            logging.warning(f"Aucune donnée disponible pour {pair}, entraînement ignoré")
+            results[pair] = None
+            continue
+
+        version = data_version(df)
+        if pair not in forced and version == store.latest_version(pair):
+            logging.info(f"Données {pair} inchangées (version {version}), pas de ré-entraînement")
+            results[pair] = store.get_forecast(pair)
+            continue
+        datasets[pair] = (df, version)
+
+    if not datasets:
+        return results
+
+    jobs = [(pair, model_name) for pair in datasets for model_name in MODEL_ARTIFACTS]
+    workers = max(1, min(TRAINING_WORKERS, len(jobs)))
+    started = time.monotonic()
+    logging.info(f"🤖 Entraînement de {len(datasets)} paire(s) : {len(jobs)} jobs sur {workers} process")
+
+    finished = {pair: {} for pair in datasets}
+    # Échéance globale : vagues successives de jobs + marge de démarrage des process
+    waves = -(-len(jobs) // workers)
+    deadline = TRAINING_JOB_TIMEOUT * waves + 60 if TRAINING_JOB_TIMEOUT else None
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_training_worker,
+        initargs=(TRAINING_MEMORY_MB,)
+    )
+    try:
+        futures = {
+            executor.submit(fit_model_job, model_name, pair, datasets[pair][0], TRAINING_JOB_TIMEOUT): (pair, model_name)
+            for pair, model_name in jobs
+        }
+        try:
+            for future in as_completed(futures, timeout=deadline):
+                pair, model_name = futures[future]
+                try:
+                    job = future.result()
+                except Exception as e:
+                    # Process tué (ex: OOM) ou erreur de sérialisation
+                    job = _failed_job(model_name, pair, str(e))
+                if job["error"]:
+                    logging.error(f"Job {model_name} {pair} échoué: {job['error']}")
+                finished[pair][model_name] = job
+
+                if len(finished[pair]) == len(MODEL_ARTIFACTS):
+                    results[pair] = _publish_pair(store, pair, *datasets[pair], finished[pair])
+        except FuturesTimeout:
+            logging.error(f"Entraînement interrompu après {deadline}s, jobs restants abandonnés")
+            _terminate_workers(executor)
+            for pair, jobs_done in finished.items():
+                if len(jobs_done) == len(MODEL_ARTIFACTS):
+                    continue
+                for model_name in MODEL_ARTIFACTS:
+                    jobs_done.setdefault(model_name, _failed_job(model_name, pair, "timeout"))
+                # Un modèle fini suffit pour publier un ensemble dégradé
+                if any(job["predictions"] for job in jobs_done.values()):
+                    results[pair] = _publish_pair(store, pair, *datasets[pair], jobs_done)
+                else:
+                    results[pair] = None
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    logging.info(f"✓ Entraînement terminé en {time.monotonic() - started:.1f}s")
+    return results
+
+
+def _failed_job(model_name, pair, error):
+    return {"model": model_name, "pair": pair, "predictions": None, "artifact": None, "error": error, "seconds": None}
+
+
+def _terminate_workers(executor):
+    """Tue les process du pool encore occupés (jobs bloqués au-delà de l'échéance)"""
+    for process in list((getattr(executor, "_processes", None) or {}).values()):
+        if process.is_alive():
+            process.terminate()
+
+
+def _publish_pair(store, pair, df, version, jobs):
+    """Combine ARIMA + Prophet d'une paire en ensemble et publie la version"""
+    forecast = forecasting.build_forecast(pair, df, jobs["arima"]["predictions"], jobs["prophet"]["predictions"])
+    forecast["meta"]["model_version"] = version
+    forecast["meta"]["trained_at"] = datetime.utcnow().isoformat()
+    forecast["meta"]["training_seconds"] = {name: job["seconds"] for name, job in jobs.items()}
+
+    store.save(pair, version, {name: job["artifact"] for name, job in jobs.items()}, forecast)
+    return forecast
+
+
+def train_pair(store, pair, force=False):
+    """
+    Entraîne ARIMA + Prophet pour une paire et publie la prévision.
+    Ne ré-entraîne pas si les données n'ont pas changé (même hash), sauf force=True.
+    """
+    pair = normalize_pair(pair)
+    return train_pairs(store, [pair], forced={pair} if force else ()).get(pair)
+
+
+class RetrainScheduler:
+    """
+    Thread d'entraînement unique par process:
+    - file d'attente des demandes (refresh admin, paire jamais entraînée), limitée
+      à SUPPORTED_PAIRS : au plus une entrée par paire
+    - ré-entraînement périodique de SUPPORTED_PAIRS
+    Un verrou fichier dans MODEL_DIR sérialise l'entraînement entre workers ; le hash
+    de contenu évite ensuite de ré-entraîner ce qu'un autre worker vient de publier.
+    """
+
+    def __init__(self, store, interval_hours=RETRAIN_INTERVAL_HOURS):
+        self.store = store
+        self.interval = interval_hours * 3600
+        self._pending = []
+        self._forced = set()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        # Premier passage : entraîne ce qui n'a jamais été publié
+        for pair in SUPPORTED_PAIRS:
+            if self.store.latest_version(pair) is None:
+                self.enqueue(pair)
+        self._thread = threading.Thread(target=self._run, name="model-retrain", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, pair, force=False):
+        """
+        Ajoute une paire à la file (sans doublon). Retourne sa position,
+        None si la paire n'est pas supportée (jamais d'entraînement à la demande d'un client).
+        """
+        pair = normalize_pair(pair)
+        if pair not in SUPPORTED_PAIRS:
+            logging.warning(f"Entraînement refusé pour une paire non supportée: {pair}")
+            return None
+        with self._cond:
+            if force:
+                self._forced.add(pair)
+            if pair not in self._pending:
+                self._pending.append(pair)
+            self._cond.notify()
+            return self._pending.index(pair)
+
+    def pending(self):
+        with self._cond:
+            return list(self._pending)
+
+    def _next_batch(self, deadline):
+        with self._cond:
+            while not self._pending and time.monotonic() < deadline:
+                self._cond.wait(timeout=max(0.0, deadline - time.monotonic()))
+            batch, self._pending = self._pending, []
+            forced, self._forced = self._forced, set()
+            return batch, forced
+
+    def _run(self):
+        next_cycle = time.monotonic() + self.interval
+        while True:
+            batch, forced = self._next_batch(next_cycle)
+            if time.monotonic() >= next_cycle:
+                batch = list(dict.fromkeys(batch + SUPPORTED_PAIRS))
+                next_cycle = time.monotonic() + self.interval
+            if batch:
+                self._train_batch(batch, forced)
+
+    def _train_batch(self, pairs, forced):
+        with FileLock(os.path.join(self.store.root, ".training.lock")):
+            try:
+                train_pairs(self.store, pairs, forced)
+            except Exception as e:
+                logging.error(f"Entraînement {', '.join(pairs)} échoué: {e}")
+
@@ -0,0 +1,181 @@
+"""
+Acquisition asynchrone des taux fiat du backend IA SarfX
+- Un httpx.AsyncClient par process (connexions keep-alive réutilisées)
+- Sources interrogées en "hedged requests" : la suivante part si la précédente
+  n'a pas répondu après RATE_HEDGE_DELAY_MS (ou dès qu'elle échoue),
+  la première réponse valide gagne et les autres sont annulées
+- Coalescence : les appels concurrents pour une même paire partagent un seul fetch
+"""
+import os
+import time
+import asyncio
+import logging
+
+import httpx
+
+from history_store import get_history_store
+
+# Délai avant de lancer la source suivante (0 = toutes les sources en parallèle)
+RATE_HEDGE_DELAY_MS = int(os.environ.get("RATE_HEDGE_DELAY_MS", 300))
+# Budget total d'une acquisition (secondes)
+RATE_FETCH_TIMEOUT = float(os.environ.get("RATE_FETCH_TIMEOUT", 3))
+# Pool de connexions HTTP sortantes
+RATE_HTTP_MAX_CONNECTIONS = int(os.environ.get("RATE_HTTP_MAX_CONNECTIONS", 50))
+RATE_HTTP_MAX_KEEPALIVE = int(os.environ.get("RATE_HTTP_MAX_KEEPALIVE", 20))
+
+
+async def fetch_frankfurter(client, base, target):
+    """Taux BCE (Frankfurter)"""
+    resp = await client.get("https://api.frankfurter.app/latest", params={"from": base, "to": target})
+    resp.raise_for_status()
+    return resp.json()["rates"][target]
+
+
+async def fetch_exchangerate_api(client, base, target):
+    """ExchangeRate-API (open access, toutes les devises dont MAD)"""
+    resp = await client.get(f"https://open.er-api.com/v6/latest/{base}")
+    resp.raise_for_status()
+    data = resp.json()
+    if data.get("result") != "success":
+        raise ValueError(data.get("error-type", "unknown error"))
+    return data["rates"][target]
+
+
+async def fetch_yahoo(client, base, target):
+    """Dernière clôture Yahoo Finance de l'historique local (complément bloquant -> thread)"""
+    return await asyncio.to_thread(get_history_store().latest_close, f"{base}{target}")
+
+
+# Sources par ordre de priorité
+RATE_SOURCES = [
+    ("Frankfurter", fetch_frankfurter),
+    ("ExchangeRate-API", fetch_exchangerate_api),
+    ("Yahoo Finance", fetch_yahoo),
+]
+
+
+class RateAcquirer:
+    """Fan-out hedgé + coalescence des acquisitions de taux (une instance par process)"""
+
+    def __init__(self, sources=RATE_SOURCES, hedge_delay=RATE_HEDGE_DELAY_MS / 1000, timeout=RATE_FETCH_TIMEOUT):
+        self.sources = sources
+        self.hedge_delay = hedge_delay
+        self.timeout = timeout
+        self._client = None
+        self._inflight = {}
+        self._stats = {
+            "fetches": 0,
+            "coalesced": 0,
+            "hedges": 0,
+            "failures": 0,
+            "wins": {name: 0 for name, _ in sources},
+        }
+
+    # =====================================================
+    # CLIENT HTTP
+    # =====================================================
+
+    def client(self):
+        """Client HTTP partagé (créé dans la boucle d'événements du worker)"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 2.0)),
+                limits=httpx.Limits(
+                    max_connections=RATE_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=RATE_HTTP_MAX_KEEPALIVE
+                )
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # =====================================================
+    # API PUBLIQUE
+    # =====================================================
+
+    async def fetch(self, base, target):
+        """
+        Taux base -> target depuis la première source qui répond.
+        Les appels concurrents pour la même paire attendent le même fetch.
+
+        Returns:
+            (taux, nom de la source) ou (None, None) si toutes les sources échouent
+        """
+        key = (base, target)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._first_good(base, target))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self._stats["coalesced"] += 1
+        # shield : l'annulation d'un client n'annule pas le fetch partagé
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {**self._stats, "wins": dict(self._stats["wins"]), "inflight": len(self._inflight)}
+
+    # =====================================================
+    # INTERNES
+    # =====================================================
+
+    async def _call(self, name, fetcher, base, target):
+        started = time.perf_counter()
+        try:
+            rate = float(await fetcher(self.client(), base, target))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"{name} échec pour {base}/{target}: {e}")
+            return None
+        if not rate or rate <= 0:
+            return None
+        logging.info(f"✓ Taux {base}/{target} récupéré: {rate} ({name}, {(time.perf_counter() - started) * 1000:.0f}ms)")
+        return rate
+
+    async def _first_good(self, base, target):
+        self._stats["fetches"] += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        queue = list(self.sources)
+        running = {}
+
+        def launch():
+            name, fetcher = queue.pop(0)
+            running[asyncio.ensure_future(self._call(name, fetcher, base, target))] = name
+
+        launch()
+        try:
+            while running:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                wait = min(self.hedge_delay, remaining) if queue else remaining
+                done, _ = await asyncio.wait(running, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # Pas de réponse dans le délai : requête hedgée vers la source suivante
+                    if queue:
+                        self._stats["hedges"] += 1
+                        launch()
+                    continue
+
+                for task in done:
+                    name = running.pop(task)
+                    rate = task.result()
+                    if rate:
+                        self._stats["wins"][name] += 1
+                        return rate, name
+                    # Échec : la source suivante part sans attendre le délai de hedge
+                    if queue:
+                        launch()
+        finally:
+            for task in running:
+                task.cancel()
+
+        self._stats["failures"] += 1
+        logging.error(f"✗ Impossible de récupérer le taux {base}/{target}")
+        return None, None
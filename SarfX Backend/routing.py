@@ -0,0 +1,327 @@
+"""
+Routage multi-sauts des conversions du backend IA SarfX
+- Graphe orienté pondéré des devises construit depuis l'instantané des taux
+  (taux observés + inverses) : pour chaque paire, la meilleure place
+  (interbancaire avec spread selon la liquidité, ou USDT avec prime P2P),
+  poids -log(taux effectif) + coût fixe par saut
+- Meilleurs chemins simples de 1 à 3 sauts pour toutes les paires : relaxation de
+  Bellman-Ford bornée en sauts sur la liste des arêtes (NumPy, O(n·E)), sans revisiter
+  une devise (les poids négatifs des primes ne bouclent donc jamais en cycle d'arbitrage)
+- Recalcul groupé (une fois par rafraîchissement, hors de la boucle d'événements)
+  quand l'instantané a changé
+- Cotation : lecture O(1) de la table précalculée, chemin et places expliqués
+"""
+import os
+import time
+import math
+import asyncio
+import logging
+
+import numpy as np
+
+# Devises rafraîchies par la boucle de fond (les paires demandées s'y ajoutent)
+ROUTE_CURRENCIES = [c for c in os.environ.get("ROUTE_CURRENCIES", "USD,EUR,GBP,CHF,CAD,JPY,AED,SAR,MAD").split(",") if c]
+# Devises pivots : taux récupérés depuis chacune vers toutes les autres
+ROUTE_HUBS = [c for c in os.environ.get("ROUTE_HUBS", "USD,EUR").split(",") if c]
+ROUTE_REFRESH_SECONDS = int(os.environ.get("ROUTE_REFRESH_SECONDS", 300))
+# Au-delà, un taux observé sort du graphe
+ROUTE_RATE_MAX_AGE = int(os.environ.get("ROUTE_RATE_MAX_AGE", 1800))
+ROUTE_MAX_HOPS = min(3, int(os.environ.get("ROUTE_MAX_HOPS", 3)))
+# Taille maximale du graphe : les paires apportant une devise de plus sont ignorées
+ROUTE_MAX_CURRENCIES = int(os.environ.get("ROUTE_MAX_CURRENCIES", 60))
+
+# Spreads interbancaires : paire de devises majeures / paire avec une devise exotique
+MAJOR_CURRENCIES = {"USD", "EUR", "GBP", "CHF", "JPY", "CAD"}
+MAJOR_SPREAD = 0.0005
+EXOTIC_SPREAD = 0.008
+
+# Place crypto (USDT) : achat depuis une devise de financement, prime P2P à la revente.
+# Sortir d'une devise à prime se fait au taux parallèle (mid / prime) : pas d'aller-retour gagnant
+CRYPTO_FUNDING_CURRENCIES = {"USD", "EUR", "GBP"}
+CRYPTO_PREMIUM_CURRENCIES = {"MAD"}
+CRYPTO_PREMIUM = 1.015
+
+# Coût de chaque saut en plus (log) : à taux égal, le chemin le plus court gagne
+HOP_COST = 0.0002
+
+VENUE_MARKET = "Marché Interbancaire"
+VENUE_CRYPTO = "Marché Crypto (USDT)"
+VENUES = [VENUE_MARKET, VENUE_CRYPTO]
+
+
+def venue_rates(base, target, mid):
+    """Taux effectif de chaque place pour un saut base -> target au taux moyen `mid`"""
+    spread = MAJOR_SPREAD if base in MAJOR_CURRENCIES and target in MAJOR_CURRENCIES else EXOTIC_SPREAD
+    rates = {VENUE_MARKET: mid * (1 - spread)}
+    if base in CRYPTO_PREMIUM_CURRENCIES:
+        rates[VENUE_MARKET] /= CRYPTO_PREMIUM
+    if base in CRYPTO_FUNDING_CURRENCIES and target in CRYPTO_PREMIUM_CURRENCIES:
+        rates[VENUE_CRYPTO] = mid * CRYPTO_PREMIUM
+    return rates
+
+
+class RouteTable:
+    """Meilleurs chemins de toutes les paires pour un instantané de taux (immuable)"""
+
+    def __init__(self, mids, max_hops=ROUTE_MAX_HOPS):
+        self.currencies = sorted({c for pair in mids for c in pair})
+        index = {c: i for i, c in enumerate(self.currencies)}
+        n = len(self.currencies)
+
+        # Arête = meilleure place de la paire ; mid absent -> inverse du sens opposé
+        self.rate = np.zeros((n, n))
+        self.venue = np.zeros((n, n), dtype=np.int8)
+        for (base, target), mid in self._with_inverses(mids).items():
+            venue, rate = max(venue_rates(base, target, mid).items(), key=lambda item: item[1])
+            self.rate[index[base], index[target]] = rate
+            self.venue[index[base], index[target]] = VENUES.index(venue)
+        with np.errstate(divide="ignore"):
+            weights = np.where(self.rate > 0, -np.log(np.where(self.rate > 0, self.rate, 1)) + HOP_COST, np.inf)
+        np.fill_diagonal(weights, np.inf)
+
+        self.routes = {}
+        self._solve(weights, max_hops)
+
+    @staticmethod
+    def _with_inverses(mids):
+        edges = {}
+        for (base, target), mid in mids.items():
+            if base == target or not mid or mid <= 0:
+                continue
+            edges[(base, target)] = mid
+            edges.setdefault((target, base), 1 / mid)
+        # Un taux observé prime sur l'inverse d'un autre
+        edges.update({pair: mid for pair, mid in mids.items() if pair[0] != pair[1] and mid and mid > 0})
+        return edges
+
+    def _solve(self, weights, max_hops):
+        """
+        Bellman-Ford borné en sauts sur la liste des arêtes (graphe creux) : meilleur chemin
+        à exactement 1, 2 puis 3 sauts depuis toutes les sources à la fois, en O(n·E).
+        Chemins simples : diagonale infinie (pas de retour à la source), et le 3e saut j -> t
+        reprend le second meilleur chemin à 2 sauts vers j quand le meilleur passe par t
+        """
+        n = len(self.currencies)
+        if n < 2:
+            return
+        # Arêtes (src -> dst) groupées par cible
+        dst, src = np.nonzero(np.isfinite(weights.T))
+        if not len(dst):
+            return
+        w = weights[src, dst]
+        best, via = weights.copy(), np.full((n, n, 2), -1)
+        hops = np.where(np.isfinite(weights), 1, 0)
+
+        if max_hops >= 2:
+            # w[s, i] + w[i, t] pour chaque arête (i, t) ; i != s par la diagonale infinie
+            cost = weights[:, src] + w
+            two, middle = self._relax(cost, dst, src, n)
+            # Second meilleur, par un autre intermédiaire (une arête par couple i, t)
+            second, second_middle = self._relax(np.where(middle[:, dst] == src, np.inf, cost), dst, src, n)
+            np.fill_diagonal(two, np.inf)
+            np.fill_diagonal(second, np.inf)
+            better = two < best
+            best = np.where(better, two, best)
+            via[..., 0] = np.where(better, middle, via[..., 0])
+            hops = np.where(better, 2, hops)
+
+        if max_hops >= 3:
+            # d2[s, j] + w[j, t] ; d2 ne doit pas passer par t (sinon le second meilleur)
+            clash = middle[:, src] == dst
+            cost = np.where(clash, second[:, src], two[:, src]) + w
+            middles = np.where(clash, second_middle[:, src], middle[:, src])
+            three, edge = self._relax(cost, dst, np.arange(len(w)), n)
+            better = (three < best) & (edge >= 0)
+            rows = np.arange(n)[:, None]
+            via[..., 0] = np.where(better, middles[rows, np.maximum(edge, 0)], via[..., 0])
+            via[..., 1] = np.where(better, src[np.maximum(edge, 0)], via[..., 1])
+            best = np.where(better, three, best)
+            hops = np.where(better, 3, hops)
+
+        for s in range(n):
+            for t in range(n):
+                if s == t or not np.isfinite(best[s, t]):
+                    continue
+                path = [s] + [int(v) for v in via[s, t][:hops[s, t] - 1]] + [t]
+                self.routes[(self.currencies[s], self.currencies[t])] = self._describe(path)
+
+    @staticmethod
+    def _relax(cost, dst, labels, n):
+        """
+        Minimum par (source, cible) des coûts par arête (n x E, arêtes triées par cible)
+        et étiquette de l'arête retenue (-1 si aucune)
+        """
+        best = np.full((n, n), np.inf)
+        label = np.full((n, n), -1)
+        starts = np.flatnonzero(np.r_[True, dst[1:] != dst[:-1]])
+        best[:, dst[starts]] = np.minimum.reduceat(cost, starts, axis=1)
+        rows, edges = np.nonzero(np.isfinite(cost) & (cost == best[:, dst]))
+        label[rows, dst[edges]] = labels[edges]
+        return best, label
+
+    def _describe(self, path):
+        hops = []
+        rate = 1.0
+        for a, b in zip(path[:-1], path[1:]):
+            rate *= self.rate[a, b]
+            hops.append({
+                "from": self.currencies[a],
+                "to": self.currencies[b],
+                "venue": VENUES[self.venue[a, b]],
+                "rate": round(float(self.rate[a, b]), 6),
+            })
+        currencies = [self.currencies[i] for i in path]
+        explanation = currencies[0] + "".join(f" → {hop['to']} ({hop['venue']})" for hop in hops)
+        return {
+            "path": currencies,
+            "hops": hops,
+            "rate": float(rate),
+            "explanation": explanation,
+        }
+
+    def get(self, base, target):
+        return self.routes.get((base, target))
+
+
+class RouteEngine:
+    """Instantané des taux moyens + table des meilleurs chemins (une instance par process)"""
+
+    def __init__(self, currencies=ROUTE_CURRENCIES, hubs=ROUTE_HUBS, max_age=ROUTE_RATE_MAX_AGE,
+                 max_currencies=ROUTE_MAX_CURRENCIES):
+        self.currencies = list(currencies)
+        self.hubs = list(hubs)
+        self.max_age = max_age
+        self.max_currencies = max_currencies
+        self._mids = {}
+        self._table = RouteTable({})
+        self._task = None
+        # Instantané modifié depuis la dernière table ; reconstruction en cours (une seule)
+        self._dirty = False
+        self._rebuilding = None
+        self._stats = {"rebuilds": 0, "last_rebuild_ms": 0.0, "lookups": 0, "misses": 0, "skipped": 0}
+
+    # =====================================================
+    # INSTANTANÉ
+    # =====================================================
+
+    def update(self, rates):
+        """
+        Intègre des taux moyens {(base, target): taux} ; si l'instantané change (nouvelle
+        paire ou taux différent), la table est marquée à recalculer (voir flush)
+        """
+        now = time.time()
+        changed = False
+        known = {c for pair in self._mids for c in pair}
+        for pair, rate in rates.items():
+            if not rate or rate <= 0 or pair[0] == pair[1]:
+                continue
+            if len(known.union(pair)) > self.max_currencies:
+                self._stats["skipped"] += 1
+                continue
+            known.update(pair)
+            previous = self._mids.get(pair)
+            if previous is None or not math.isclose(previous[0], rate, rel_tol=1e-9):
+                changed = True
+            self._mids[pair] = (float(rate), now)
+
+        expired = [pair for pair, (_, seen) in self._mids.items() if now - seen > self.max_age]
+        for pair in expired:
+            del self._mids[pair]
+        if changed or expired:
+            self._dirty = True
+        return changed
+
+    def rebuild(self):
+        """Recalcul synchrone de la table (scripts, tests)"""
+        self._dirty = False
+        self._swap(*self._build(self._snapshot()))
+
+    async def flush(self):
+        """
+        Recalcule la table dans un thread si l'instantané a changé ; les appels concurrents
+        attendent la même reconstruction
+        """
+        while self._dirty or (self._rebuilding is not None and not self._rebuilding.done()):
+            if self._rebuilding is None or self._rebuilding.done():
+                self._rebuilding = asyncio.ensure_future(self._rebuild_in_executor())
+            await asyncio.shield(self._rebuilding)
+
+    async def _rebuild_in_executor(self):
+        self._dirty = False
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(None, self._build, self._snapshot())
+        except Exception:
+            self._dirty = True
+            raise
+        self._swap(*result)
+
+    def _snapshot(self):
+        return {pair: rate for pair, (rate, _) in self._mids.items()}
+
+    @staticmethod
+    def _build(mids):
+        started = time.perf_counter()
+        return RouteTable(mids), (time.perf_counter() - started) * 1000
+
+    def _swap(self, table, elapsed_ms):
+        self._table = table
+        self._stats["rebuilds"] += 1
+        self._stats["last_rebuild_ms"] = round(elapsed_ms, 2)
+
+    # =====================================================
+    # COTATION
+    # =====================================================
+
+    def quote(self, base, target, amount=None):
+        """Meilleur chemin précalculé base -> target (None si la paire est hors du graphe)"""
+        self._stats["lookups"] += 1
+        route = self._table.get(base, target)
+        if route is None:
+            self._stats["misses"] += 1
+            return None
+        result = dict(route)
+        if amount is not None:
+            result["final_amount"] = amount * route["rate"]
+        return result
+
+    def stats(self):
+        return {
+            **self._stats,
+            "currencies": len(self._table.currencies),
+            "pairs_observed": len(self._mids),
+            "routes": len(self._table.routes),
+        }
+
+    # =====================================================
+    # RAFRAÎCHISSEMENT DE FOND
+    # =====================================================
+
+    def hub_pairs(self):
+        currencies = list(dict.fromkeys(self.currencies + [c for pair in self._mids for c in pair]))
+        return [(hub, c) for hub in self.hubs for c in currencies if c != hub]
+
+    async def refresh(self, fetch):
+        """Récupère les taux pivots (fetch(base, target) -> taux, 0 si échec) et recalcule une fois"""
+        pairs = self.hub_pairs()
+        rates = await asyncio.gather(*(fetch(base, target) for base, target in pairs), return_exceptions=True)
+        self.update({pair: rate for pair, rate in zip(pairs, rates) if isinstance(rate, (int, float)) and rate > 0})
+        await self.flush()
+
+    def start(self, fetch, interval=ROUTE_REFRESH_SECONDS):
+        """Boucle de rafraîchissement dans la boucle d'événements courante"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run(fetch, interval))
+
+    async def _run(self, fetch, interval):
+        while True:
+            started = time.monotonic()
+            try:
+                await self.refresh(fetch)
+            except Exception as e:
+                logging.error(f"Rafraîchissement des routes échoué: {e}")
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
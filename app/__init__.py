@@ -213,7 +213,7 @@ def create_app():
     def inject_user():
         from flask import session
         from app.decorators import get_current_user
-        user = get_current_user()
+        user = get_current_user()  # déjà chargé par la route/le décorateur : pas de nouvelle requête
         # Add user preferences for templates
         user_theme = session.get('theme', 'light')
         user_accent_color = session.get('accent_color', 'orange')
@@ -223,18 +223,19 @@ def create_app():
             user_accent_color=user_accent_color
         )
 
+    # i18n : catalogues compilés une fois au démarrage (partagés par les workers forkés)
+    from app.services import i18n_service
+    i18n_service.load_catalogs()
+
+    @app.before_request
+    def reload_translations():
+        # Dev : les modifications des fichiers JSON sont prises en compte sans redémarrage
+        if app.debug:
+            i18n_service.reload_if_changed()
+
     # Context processor for i18n
     @app.context_processor
     def inject_i18n():
-        from app.services.i18n_service import I18nService
-        i18n = I18nService()
-        lang = i18n.get_current_language()
-        return dict(
-            t=i18n.t,
-            tn=i18n.tn,
-            current_lang=lang,
-            is_rtl=i18n.is_rtl(lang),
-            available_languages=i18n.get_available_languages()
-        )
+        return i18n_service.template_context()
 
     return app
\ No newline at end of file
@@ -15,6 +15,14 @@ class Config:
     MONGO_URI = os.environ.get("MONGO_URI")
     DB_NAME = "SarfX_Enhanced"
 
+    # Pool de connexions MongoDB (un client partagé par process worker)
+    MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", 50))
+    MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", 0))
+    MONGO_MAX_IDLE_TIME_MS = int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", 300000))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", 10000))
+
     # Gemini AI API
     GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 
@@ -25,6 +33,43 @@ class Config:
     # Cache TTL for rates (secondes)
     RATES_CACHE_TTL = int(os.environ.get("RATES_CACHE_TTL", 30))
 
+    # Ingestion des taux en arrière-plan (python worker.py)
+    # Activée (worker déployé) : les requêtes web lisent le snapshot publié et n'appellent jamais les APIs externes
+    # Désactivée par défaut : sans worker (python run.py), appels API à la demande
+    RATE_INGESTION_ENABLED = os.environ.get("RATE_INGESTION_ENABLED", "false").lower() == "true"
+    RATE_INGESTION_INTERVAL = int(os.environ.get("RATE_INGESTION_INTERVAL", 60))  # secondes
+    RATE_SNAPSHOT_MAX_AGE = int(os.environ.get("RATE_SNAPSHOT_MAX_AGE", 900))  # au-delà : snapshot ignoré
+    RATE_HISTORY_RETENTION_DAYS = int(os.environ.get("RATE_HISTORY_RETENTION_DAYS", 90))  # points intra-journaliers
+    # Vérification des alertes de taux à chaque snapshot publié par le worker
+    RATE_ALERTS_CHECK_ENABLED = os.environ.get("RATE_ALERTS_CHECK_ENABLED", "true").lower() == "true"
+
+    # Réconciliation des compteurs du dashboard admin (metrics_daily) par le worker
+    METRICS_RECONCILE_INTERVAL = int(os.environ.get("METRICS_RECONCILE_INTERVAL", 3600))  # secondes, 0 = désactivée
+
+    # Exports asynchrones (rapports, relevés) rendus par le worker dans EXPORT_DIR
+    EXPORT_DIR = os.environ.get("EXPORT_DIR", "exports")  # partagé entre web et worker
+    EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", 2))  # threads du worker, 0 = désactivé
+    EXPORT_DEDUPE_SECONDS = int(os.environ.get("EXPORT_DEDUPE_SECONDS", 600))  # demandes identiques -> même fichier
+    EXPORT_TTL_SECONDS = int(os.environ.get("EXPORT_TTL_SECONDS", 86400))  # conservation des fichiers
+    EXPORT_COMPRESSION = os.environ.get("EXPORT_COMPRESSION", "gzip")  # gzip ou zstd (si zstandard installé)
+
+    # Index spatial des ATM en mémoire (rechargé pour voir les écritures des autres process)
+    ATM_INDEX_REFRESH_SECONDS = int(os.environ.get("ATM_INDEX_REFRESH_SECONDS", 300))
+
+    # Table des fournisseurs en mémoire (cotations) : relue pour voir les écritures des autres process
+    SUPPLIER_QUOTES_TTL_SECONDS = int(os.environ.get("SUPPLIER_QUOTES_TTL_SECONDS", 60))
+
+    # Recherche globale : délai par source (au-delà, la source est ignorée)
+    SEARCH_TIMEOUT_MS = int(os.environ.get("SEARCH_TIMEOUT_MS", 400))
+
+    # Grand livre des wallets : transactions MongoDB (auto = si replica set), relances sur conflit
+    LEDGER_TRANSACTIONS = os.environ.get("LEDGER_TRANSACTIONS", "auto")  # auto, true ou false
+    LEDGER_MAX_ATTEMPTS = int(os.environ.get("LEDGER_MAX_ATTEMPTS", 5))
+    LEDGER_RETRY_BACKOFF_MS = int(os.environ.get("LEDGER_RETRY_BACKOFF_MS", 10))  # backoff exponentiel aléatoire
+    # Reconstruction des soldes depuis le journal (snapshots + corrections) par le worker
+    LEDGER_RECONCILE_INTERVAL = int(os.environ.get("LEDGER_RECONCILE_INTERVAL", 3600))  # secondes, 0 = désactivée
+    LEDGER_REBUILD_WORKERS = int(os.environ.get("LEDGER_REBUILD_WORKERS", 8))  # tranches reconstruites en parallèle
+
     # SMTP (Email)
     SMTP_EMAIL = os.environ.get("SMTP_EMAIL")
     SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD")
@@ -65,6 +110,17 @@ class Config:
     CACHE_REDIS_URL = _redis_url
     CACHE_DEFAULT_TIMEOUT = 300  # 5 minutes
 
+    # Cache des taux (L1 LRU par worker + L2 Redis partagé)
+    RATE_CACHE_MAX_ENTRIES = int(os.environ.get("RATE_CACHE_MAX_ENTRIES", 2048))
+    RATE_CACHE_STALE_TTL = int(os.environ.get("RATE_CACHE_STALE_TTL", 300))  # secondes servies "stale"
+    RATE_CACHE_REDIS_ENABLED = os.environ.get(
+        "RATE_CACHE_REDIS_ENABLED", str(CACHE_TYPE == "redis")
+    ).lower() == "true"
+
+    # Coalescence des appels sortants (un seul appel amont par clé, partagé via Redis entre workers)
+    SINGLE_FLIGHT_LEASE_MS = int(os.environ.get("SINGLE_FLIGHT_LEASE_MS", 5000))  # bail du verrou Redis
+    SINGLE_FLIGHT_RESULT_TTL = float(os.environ.get("SINGLE_FLIGHT_RESULT_TTL", 5))  # secondes
+
     # ============================================
     # RATE LIMITING
     # ============================================
@@ -1,7 +1,19 @@
+import time
 from functools import wraps
-from flask import session, redirect, url_for, flash, jsonify, request
+from flask import session, redirect, url_for, flash, jsonify, request, g
 from app.services.db_service import get_db, safe_object_id
 
+# Champs jamais chargés dans l'utilisateur courant (secrets, exposé aux templates)
+USER_PROJECTION = {
+    "password": 0,
+    "two_factor_secret": 0,
+    "two_factor_temp_secret": 0,
+    "two_factor_backup_codes": 0,
+}
+
+# Durée de validité de l'instantané d'identité en session (rôle, banque)
+IDENTITY_SNAPSHOT_TTL = 60
+
 
 def login_required(f):
     """Decorator to protect routes - requires authentication"""
@@ -22,9 +34,7 @@ def admin_required(f):
         if 'user_id' not in session:
             next_url = request.url
             return redirect(url_for('auth.login', next=next_url))
-        db = get_db()
-        user_id = safe_object_id(session['user_id'])
-        user = db.users.find_one({"_id": user_id}) if user_id else db.users.find_one({"email": session.get('email')})
+        user = get_current_user()
         if not user or user.get('role') != 'admin':
             flash("Acces non autorise", "error")
             return redirect(url_for('app.home'))
@@ -65,22 +75,84 @@ def login_required_api(f):
     return decorated_function
 
 
+def _load_user():
+    db = get_db()
+    if db is None:
+        return None
+    user_id = safe_object_id(session['user_id'])
+    if user_id:
+        return db.users.find_one({"_id": user_id}, USER_PROJECTION)
+    # Fallback par email (anciennes sessions)
+    if session.get('email'):
+        return db.users.find_one({"email": session['email']}, USER_PROJECTION)
+    return None
+
+
 def get_current_user():
-    """Get the currently logged-in user from session"""
+    """
+    Get the currently logged-in user from session
+
+    Chargé une seule fois par requête (mémorisé dans g) : décorateurs, context
+    processors et routes partagent le même document.
+    """
     if 'user_id' not in session:
         return None
-    db = get_db()
-    if db is None:
+    cached = g.get('current_user')
+    # Clé = user_id de session : une connexion en cours de requête recharge l'utilisateur
+    if cached is None or cached[0] != session['user_id']:
+        user = _load_user()
+        if user is not None:
+            remember_identity(user)
+        cached = g.current_user = (session['user_id'], user)
+    return cached[1]
+
+
+def refresh_current_user():
+    """Oublie l'utilisateur mémorisé (après une modification de son document dans la requête)"""
+    g.pop('current_user', None)
+    session.pop('identity', None)
+
+
+def remember_identity(user):
+    """Instantané signé (cookie de session) du rôle et de la banque, valable IDENTITY_SNAPSHOT_TTL secondes"""
+    identity = {
+        'uid': str(user['_id']),
+        'role': user.get('role', 'user'),
+        'bank_code': user.get('bank_code'),
+        'exp': int(time.time()) + IDENTITY_SNAPSHOT_TTL,
+    }
+    current = session.get('identity')
+    # Réécrit le cookie seulement si l'instantané change ou arrive à mi-vie
+    if (not current or current.get('uid') != identity['uid'] or current.get('role') != identity['role']
+            or current.get('bank_code') != identity['bank_code']
+            or current.get('exp', 0) - time.time() < IDENTITY_SNAPSHOT_TTL / 2):
+        session['identity'] = identity
+
+
+def get_current_identity():
+    """
+    Rôle et banque de l'utilisateur connecté, sans requête MongoDB tant que
+    l'instantané de session est valide (sinon l'utilisateur est rechargé).
+
+    Returns:
+        {'user_id', 'role', 'bank_code'} ou None si non connecté
+    """
+    if 'user_id' not in session:
         return None
-    from bson import ObjectId
-    from bson.errors import InvalidId
-    try:
-        user_id = session['user_id']
-        if isinstance(user_id, ObjectId):
-            return db.users.find_one({"_id": user_id})
-        return db.users.find_one({"_id": ObjectId(user_id)})
-    except (InvalidId, TypeError):
-        return db.users.find_one({"email": session.get('email')}) or None
+    identity = session.get('identity')
+    if (not identity or identity.get('uid') != str(session['user_id'])
+            or identity.get('exp', 0) < time.time()):
+        user = get_current_user()
+        if user is None:
+            return None
+        identity = session['identity']
+    return {'user_id': identity['uid'], 'role': identity['role'], 'bank_code': identity.get('bank_code')}
+
+
+def get_current_role():
+    """Rôle de l'utilisateur connecté (None si non connecté)"""
+    identity = get_current_identity()
+    return identity['role'] if identity else None
 
 
 def get_user_wallet(user_id):
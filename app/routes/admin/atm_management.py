@@ -1,8 +1,11 @@
-from flask import render_template, session, redirect, url_for, request, flash, jsonify, Response
+from flask import render_template, session, redirect, url_for, request, flash, jsonify
 from app.routes.admin import admin_bp
 from app.decorators import admin_required
 from app.services.db_service import get_db, log_history
 from app.services.atm_service import ATMService
+from app.services.atm_index import get_atm_index
+from app.services.pagination import contains_search, ensure_admin_indexes, paginate_request
+from app.services.export_service import EXPORT_BATCH_SIZE, csv_response, csv_stream
 from werkzeug.utils import secure_filename
 from datetime import datetime
 import csv
@@ -36,16 +39,11 @@ def atms():
     db = get_db()
     atm_service = ATMService(db)
 
-    # Pagination
-    page = int(request.args.get('page', 1))
-    per_page = 20
-    skip = (page - 1) * per_page
-
     # Filters
     bank_filter = request.args.get('bank', '')
     city_filter = request.args.get('city', '')
     status_filter = request.args.get('status', '')
-    search_query = request.args.get('q', '')
+    search = contains_search(request.args.get('q'))
 
     # Build query
     query = {}
@@ -55,17 +53,17 @@ def atms():
         query['city'] = city_filter
     if status_filter:
         query['status'] = status_filter
-    if search_query:
+    if search:
         query['$or'] = [
-            {'name': {'$regex': search_query, '$options': 'i'}},
-            {'address': {'$regex': search_query, '$options': 'i'}},
-            {'atm_id': {'$regex': search_query, '$options': 'i'}}
+            {'name': search},
+            {'address': search},
+            {'atm_id': search}
         ]
 
-    # Get ATMs
-    total_atms = db.atm_locations.count_documents(query)
-    atms_list = list(db.atm_locations.find(query).skip(skip).limit(per_page).sort("created_at", -1))
-    total_pages = (total_atms + per_page - 1) // per_page
+    # Get ATMs (pagination par curseur sur created_at)
+    ensure_admin_indexes(db)
+    page = paginate_request(db.atm_locations, query, [('created_at', -1)], request.args,
+                            default_limit=20, count=True)
 
     # Get banks for filter
     banks = atm_service.get_all_banks()
@@ -75,13 +73,12 @@ def atms():
     cities = atm_service.get_cities_with_atms()
 
     return render_template('admin/atms_2026.html',
-                         atms=atms_list,
+                         atms=page.items,
                          banks=banks,
                          banks_dict=banks_dict,
                          cities=cities,
-                         total_atms=total_atms,
-                         page=page,
-                         total_pages=total_pages,
+                         total_atms=page.total,
+                         pager=page,
                          selected_bank=bank_filter,
                          active_tab='admin_atms')
 
@@ -342,6 +339,7 @@ def toggle_atm(atm_id):
             {'atm_id': atm_id},
             {'$set': {'status': new_status, 'updated_at': datetime.now()}}
         )
+        get_atm_index().invalidate()
         log_history("ATM_TOGGLE", f"ATM {atm_id} -> {new_status}", user=session.get('email'))
         return jsonify({'success': True, 'new_status': new_status})
 
@@ -401,6 +399,7 @@ def bulk_atm_action():
     else:
         return jsonify({'success': False, 'error': 'Invalid action'}), 400
 
+    get_atm_index().invalidate()
     return jsonify({'success': True, 'count': len(atm_ids)})
 
 
@@ -419,45 +418,36 @@ def export_atms():
     if city_filter:
         query['city'] = city_filter
 
-    atms_list = list(db.atm_locations.find(query))
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-
-    writer.writerow([
+    atms_cursor = db.atm_locations.find(query, batch_size=EXPORT_BATCH_SIZE)
+
+    def rows():
+        for atm in atms_cursor:
+            coords = atm.get('location', {}).get('coordinates', [0, 0])
+            yield [
+                atm.get('atm_id', ''),
+                atm.get('bank_code', ''),
+                atm.get('name', ''),
+                atm.get('address', ''),
+                atm.get('city', ''),
+                atm.get('district', ''),
+                coords[1] if len(coords) > 1 else 0,
+                coords[0] if len(coords) > 0 else 0,
+                atm.get('location_type', ''),
+                ','.join(atm.get('services', [])),
+                atm.get('status', ''),
+                'Oui' if atm.get('available_24h') else 'Non',
+                atm.get('hours', ''),
+                'Oui' if atm.get('has_wheelchair_access') else 'Non',
+                'Oui' if atm.get('has_nfc') else 'Non',
+                atm.get('created_at', '').strftime('%d/%m/%Y') if atm.get('created_at') else ''
+            ]
+
+    headers = [
         'ATM ID', 'Banque', 'Nom', 'Adresse', 'Ville', 'District',
         'Latitude', 'Longitude', 'Type', 'Services', 'Statut',
         '24h', 'Horaires', 'Acces PMR', 'NFC', 'Date creation'
-    ])
-
-    for atm in atms_list:
-        coords = atm.get('location', {}).get('coordinates', [0, 0])
-        writer.writerow([
-            atm.get('atm_id', ''),
-            atm.get('bank_code', ''),
-            atm.get('name', ''),
-            atm.get('address', ''),
-            atm.get('city', ''),
-            atm.get('district', ''),
-            coords[1] if len(coords) > 1 else 0,
-            coords[0] if len(coords) > 0 else 0,
-            atm.get('location_type', ''),
-            ','.join(atm.get('services', [])),
-            atm.get('status', ''),
-            'Oui' if atm.get('available_24h') else 'Non',
-            atm.get('hours', ''),
-            'Oui' if atm.get('has_wheelchair_access') else 'Non',
-            'Oui' if atm.get('has_nfc') else 'Non',
-            atm.get('created_at', '').strftime('%d/%m/%Y') if atm.get('created_at') else ''
-        ])
-
-    output.seek(0)
-
-    return Response(
-        output.getvalue(),
-        mimetype='text/csv',
-        headers={'Content-Disposition': f'attachment; filename=sarfx_atms_{datetime.now().strftime("%Y%m%d")}.csv'}
-    )
+    ]
+    return csv_response(csv_stream(headers, rows()), f'sarfx_atms_{datetime.now().strftime("%Y%m%d")}.csv')
 
 
 @admin_bp.route('/atms/import', methods=['GET', 'POST'])
@@ -531,6 +521,7 @@ def import_atms():
                     'status': 'completed'
                 })
 
+                get_atm_index().invalidate()
                 log_history("ATM_IMPORT", f"{imported} ATMs importes depuis {file.filename}", user=session.get('email'))
                 flash(f"{imported} ATMs importes avec succes ({errors} erreurs)", "success")
                 return redirect(url_for('admin.atms'))
@@ -2,24 +2,49 @@ from flask import render_template, session, redirect, url_for, flash, request, j
 from app.routes.admin import admin_bp
 from app.decorators import admin_required
 from app.services.db_service import get_db, log_history
+from app.services.pagination import attach_users, contains_search, ensure_admin_indexes, paginate_request
 from bson import ObjectId
 from datetime import datetime
 
 
+def _beneficiary_filters(args):
+    """Filtres serveur : kyc, tag, user_id, q (préfixe du nom)"""
+    query = {}
+    kyc = args.get('kyc')
+    if kyc == 'none':
+        query['kyc_status'] = {"$in": [None, 'none']}
+    elif kyc:
+        query['kyc_status'] = kyc
+    if args.get('tag'):
+        query['tags'] = args['tag']
+    if args.get('user_id'):
+        query['user_id'] = args['user_id']
+    name = contains_search(args.get('q'))
+    if name:
+        query['$or'] = [{'name': name}, {'iban': name}]
+    return query
+
+
 @admin_bp.route('/beneficiaries')
 @admin_required
 def beneficiaries():
     db = get_db()
+    ensure_admin_indexes(db)
 
-    # Get all beneficiaries with user info
-    all_beneficiaries = list(db.beneficiaries.find().sort("created_at", -1)) if 'beneficiaries' in db.list_collection_names() else []
+    page = paginate_request(db.beneficiaries, _beneficiary_filters(request.args),
+                            [('created_at', -1)], request.args)
 
-    # Enrich with user email
-    for ben in all_beneficiaries:
-        user = db.users.find_one({"_id": ObjectId(ben['user_id'])}) if ben.get('user_id') else None
-        ben['owner_email'] = user['email'] if user else 'Unknown'
+    # Emails des propriétaires : une seule requête $in pour la page
+    attach_users(page.items, db, target='owner_email')
 
-    return render_template('admin/beneficiaries_2026.html', beneficiaries=all_beneficiaries, active_tab='admin_beneficiaries')
+    stats = {
+        'total': db.beneficiaries.estimated_document_count(),
+        'kyc_verified': db.beneficiaries.count_documents({'kyc_status': 'verified'}),
+        'kyc_pending': db.beneficiaries.count_documents({'kyc_status': 'pending'}),
+        'tagged': db.beneficiaries.count_documents({'tags': {'$gt': ''}}),
+    }
+    return render_template('admin/beneficiaries_2026.html', beneficiaries=page.items, pager=page, stats=stats,
+                           filters=page.args, active_tab='admin_beneficiaries')
 
 
 @admin_bp.route('/beneficiaries/<ben_id>/delete', methods=['POST'])
@@ -1,7 +1,8 @@
 from flask import render_template, session, request, jsonify
 from app.routes.admin import admin_bp
 from app.decorators import admin_required
-from app.services.db_service import get_db, log_history
+from app.services.db_service import get_db, log_history, safe_object_id
+from app.services import metrics_service
 from bson import ObjectId
 from datetime import datetime, timedelta
 
@@ -10,79 +11,55 @@ from datetime import datetime, timedelta
 @admin_required
 def dashboard():
     db = get_db()
+    metrics_service.ensure_indexes(db)
 
-    # Basic Stats
-    user_count = db.users.count_documents({})
-    supplier_count = db.suppliers.count_documents({})
-    wallet_count = db.wallets.count_documents({})
-    transaction_count = db.transactions.count_documents({})
-    beneficiary_count = db.beneficiaries.count_documents({}) if 'beneficiaries' in db.list_collection_names() else 0
-    bank_count = db.banks.count_documents({}) if 'banks' in db.list_collection_names() else 0
-    atm_count = db.atms.count_documents({}) if 'atms' in db.list_collection_names() else 0
-
-    # Today's stats
-    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    new_users_today = db.users.count_documents({"created_at": {"$gte": today}})
-    today_transactions = db.transactions.count_documents({"created_at": {"$gte": today}})
-
-    # Today's volume
-    today_volume_pipeline = [
-        {"$match": {"created_at": {"$gte": today}}},
-        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-    ]
-    today_volume_result = list(db.transactions.aggregate(today_volume_pipeline))
-    today_volume = today_volume_result[0]['total'] if today_volume_result else 0
-
-    # Calculate total volume
-    pipeline = [
-        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-    ]
-    total_volume = list(db.transactions.aggregate(pipeline))
-    volume = total_volume[0]['total'] if total_volume else 0
+    # Compteurs précalculés (metrics_daily) : totaux + 7 derniers jours
+    totals = metrics_service.get_totals(db)
+    days = metrics_service.get_daily_metrics(7, db)
+    today = days[-1]
+
+    # Collections de référence : compte depuis les métadonnées (pas de scan)
+    supplier_count = db.suppliers.estimated_document_count()
+    wallet_count = db.wallets.estimated_document_count()
+    beneficiary_count = db.beneficiaries.estimated_document_count()
+    bank_count = db.banks.estimated_document_count()
+    atm_count = db.atms.estimated_document_count()
 
     # Volume data for chart (last 7 days)
-    volume_data = []
-    volume_labels = []
-    for i in range(6, -1, -1):
-        day = today - timedelta(days=i)
-        next_day = day + timedelta(days=1)
-        day_volume = list(db.transactions.aggregate([
-            {"$match": {"created_at": {"$gte": day, "$lt": next_day}}},
-            {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-        ]))
-        volume_data.append(day_volume[0]['total'] if day_volume else 0)
-        volume_labels.append(day.strftime('%d/%m'))
+    volume_data = [day.get('volume', 0) for day in days]
+    volume_labels = [day['date'].strftime('%d/%m') for day in days]
 
     # Currency distribution
-    currency_pipeline = [
-        {"$group": {"_id": "$from_currency", "count": {"$sum": 1}}}
-    ]
-    currency_stats = list(db.transactions.aggregate(currency_pipeline))
-    currency_data = {item['_id']: item['count'] for item in currency_stats if item['_id']}
+    currency_data = totals.get('currency_counts', {})
 
     # Recent data
     recent_history = list(db.history.find().sort("timestamp", -1).limit(10))
     recent_transactions = list(db.transactions.find().sort("created_at", -1).limit(5))
     recent_users = list(db.users.find().sort("created_at", -1).limit(5))
 
-    # Enrich transactions with user email
+    # Enrich transactions with user email (une seule requête)
+    user_ids = {safe_object_id(tx['user_id']) for tx in recent_transactions if tx.get('user_id')}
+    user_ids.discard(None)
+    emails = {
+        str(user['_id']): user.get('email')
+        for user in db.users.find({"_id": {"$in": list(user_ids)}}, {"email": 1})
+    } if user_ids else {}
     for tx in recent_transactions:
-        user = db.users.find_one({"_id": ObjectId(tx['user_id'])}) if tx.get('user_id') else None
-        tx['user_email'] = user['email'] if user else 'Unknown'
+        tx['user_email'] = emails.get(str(tx.get('user_id'))) or 'Unknown'
 
     # Use the new 2026 dashboard template
     return render_template('admin/dashboard_2026.html',
-                         total_users=user_count,
+                         total_users=totals.get('users', 0),
                          supplier_count=supplier_count,
                          total_wallets=wallet_count,
-                         total_transactions=transaction_count,
+                         total_transactions=totals.get('transactions', 0),
                          beneficiary_count=beneficiary_count,
                          bank_count=bank_count,
                          atm_count=atm_count,
-                         total_volume=volume,
-                         today_volume=today_volume,
-                         new_users_today=new_users_today,
-                         today_transactions=today_transactions,
+                         total_volume=totals.get('volume', 0),
+                         today_volume=today.get('volume', 0),
+                         new_users_today=today.get('signups', 0),
+                         today_transactions=today.get('transactions', 0),
                          volume_data=volume_data,
                          volume_labels=volume_labels,
                          currency_data=currency_data,
@@ -107,22 +84,11 @@ def history():
 def api_volume_data():
     """Get volume data for chart"""
     db = get_db()
-    days = int(request.args.get('days', 7))
-
-    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-
-    volume_data = []
-    volume_labels = []
-
-    for i in range(days - 1, -1, -1):
-        day = today - timedelta(days=i)
-        next_day = day + timedelta(days=1)
-        day_volume = list(db.transactions.aggregate([
-            {"$match": {"created_at": {"$gte": day, "$lt": next_day}}},
-            {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-        ]))
-        volume_data.append(day_volume[0]['total'] if day_volume else 0)
-        volume_labels.append(day.strftime('%d/%m'))
+    days = min(max(int(request.args.get('days', 7)), 1), 366)
+
+    daily = metrics_service.get_daily_metrics(days, db)
+    volume_data = [day.get('volume', 0) for day in daily]
+    volume_labels = [day['date'].strftime('%d/%m') for day in daily]
 
     return jsonify({
         "values": volume_data,
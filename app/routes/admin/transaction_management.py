@@ -1,54 +1,67 @@
-from flask import render_template, session, redirect, url_for, request, flash, Response
+from flask import render_template, session, redirect, url_for, request, flash
 from app.routes.admin import admin_bp
 from app.decorators import admin_required
 from app.services.db_service import get_db, log_history
+from app.services.pagination import (
+    MAX_PAGE_SIZE, Page, attach_users, ensure_admin_indexes, paginate_request, prefix_search
+)
+from app.services.export_service import EXPORT_BATCH_SIZE, csv_response, csv_stream, get_export_service
 from bson import ObjectId
 from datetime import datetime
-import csv
-import io
+
+
+def _transaction_filters(db, args):
+    """
+    Filtres serveur : status, user_id, devise, q (préfixe d'ID de transaction,
+    ou préfixe d'email si la recherche contient « @ »)
+    """
+    query = {}
+    if args.get('status'):
+        query['status'] = args['status']
+    if args.get('user_id'):
+        query['user_id'] = args['user_id']
+    if args.get('currency'):
+        currency = args['currency'].upper()
+        query['$or'] = [{'from_currency': currency}, {'to_currency': currency}, {'currency': currency}]
+
+    search = (args.get('q') or '').strip()
+    if '@' in search:
+        # Utilisateurs correspondants (index email), puis leurs transactions (index user_id)
+        matching = db.users.find({'email': prefix_search(search, lower=True)}, {'_id': 1}).limit(MAX_PAGE_SIZE)
+        user_ids = [user['_id'] for user in matching]
+        if 'user_id' in query:
+            user_ids = [uid for uid in user_ids if str(uid) == query['user_id']]
+        # user_id stocké en str ou en ObjectId selon l'origine de la transaction
+        query['user_id'] = {'$in': [str(uid) for uid in user_ids] + [uid for uid in user_ids if isinstance(uid, ObjectId)]}
+    elif search:
+        query['transaction_id'] = prefix_search(search)
+    return query
 
 
 @admin_bp.route('/transactions')
 @admin_required
 def transactions():
     db = get_db()
-
-    # Verifier si la collection existe
-    if 'transactions' not in db.list_collection_names():
-        return render_template('admin/transactions_2026.html', transactions=[], active_tab='admin_transactions')
-
-    # Filtres
-    status = request.args.get('status')
-    user_id = request.args.get('user_id')
-
-    query = {}
-    if status:
-        query['status'] = status
-    if user_id:
-        query['user_id'] = user_id
+    ensure_admin_indexes(db)
 
     try:
-        all_transactions = list(db.transactions.find(query).sort("created_at", -1).limit(100))
+        page = paginate_request(db.transactions, _transaction_filters(db, request.args),
+                                [('created_at', -1)], request.args)
     except Exception as e:
         print(f"Erreur transactions: {e}")
-        all_transactions = []
-
-    # Enrichir avec les infos utilisateur
-    for tx in all_transactions:
-        try:
-            user_id_str = tx.get('user_id')
-            if user_id_str:
-                if isinstance(user_id_str, str) and len(user_id_str) == 24:
-                    user = db.users.find_one({"_id": ObjectId(user_id_str)})
-                else:
-                    user = db.users.find_one({"_id": user_id_str})
-                tx['user_email'] = user.get('email', 'Unknown') if user else 'Unknown'
-            else:
-                tx['user_email'] = 'Unknown'
-        except Exception:
-            tx['user_email'] = 'Unknown'
-
-    return render_template('admin/transactions_2026.html', transactions=all_transactions, active_tab='admin_transactions')
+        page = Page(items=[], limit=0)
+
+    # Emails des propriétaires : une seule requête $in pour la page
+    attach_users(page.items, db)
+
+    stats = {
+        'total': db.transactions.estimated_document_count(),
+        'completed': db.transactions.count_documents({'status': 'completed'}),
+        'pending': db.transactions.count_documents({'status': 'pending'}),
+        'failed': db.transactions.count_documents({'status': 'failed'}),
+    }
+    return render_template('admin/transactions_2026.html', transactions=page.items, pager=page, stats=stats,
+                           filters=page.args, active_tab='admin_transactions')
 
 
 @admin_bp.route('/transactions/<tx_id>/status', methods=['POST'])
@@ -74,48 +87,40 @@ def update_transaction_status(tx_id):
 @admin_required
 def export_users():
     db = get_db()
-    users = list(db.users.find())
-
-    output = io.StringIO()
-    writer = csv.writer(output)
+    users = db.users.find({}, {'email': 1, 'role': 1, 'is_active': 1, 'verified': 1, 'created_at': 1},
+                          batch_size=EXPORT_BATCH_SIZE)
 
-    writer.writerow(['ID', 'Email', 'Role', 'Statut', 'Verifie', 'Date Creation'])
-
-    for user in users:
-        writer.writerow([
+    rows = (
+        [
             str(user['_id']),
             user.get('email', ''),
             user.get('role', 'user'),
             'Actif' if user.get('is_active', True) else 'Inactif',
             'Oui' if user.get('verified', False) else 'Non',
             user.get('created_at', '').strftime('%d/%m/%Y %H:%M') if user.get('created_at') else ''
-        ])
-
-    output.seek(0)
-
-    return Response(
-        output.getvalue(),
-        mimetype='text/csv',
-        headers={'Content-Disposition': f'attachment; filename=sarfx_users_{datetime.now().strftime("%Y%m%d")}.csv'}
+        ]
+        for user in users
     )
+    chunks = csv_stream(['ID', 'Email', 'Role', 'Statut', 'Verifie', 'Date Creation'], rows)
+    return csv_response(chunks, f'sarfx_users_{datetime.now().strftime("%Y%m%d")}.csv')
 
 
 @admin_bp.route('/export/transactions')
 @admin_required
 def export_transactions():
-    db = get_db()
-    all_transactions = list(db.transactions.find().sort("created_at", -1))
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-
-    writer.writerow(['ID Transaction', 'Email User', 'Montant', 'Devise Source', 'Devise Cible', 'Montant Final', 'Taux', 'Statut', 'Date'])
+    export_service = get_export_service()
+    query = export_service.transaction_query(
+        user_id=request.args.get('user_id'),
+        status=request.args.get('status'),
+        currency=request.args.get('currency')
+    )
+    # Curseur projeté lu par lots, emails joints par lots ($in) : mémoire constante
+    transactions = export_service.iter_transactions(query)
 
-    for tx in all_transactions:
-        user = db.users.find_one({"_id": ObjectId(tx['user_id'])}) if tx.get('user_id') else None
-        writer.writerow([
+    rows = (
+        [
             tx.get('transaction_id', ''),
-            user['email'] if user else 'Unknown',
+            tx.get('user_email') or 'Unknown',
             tx.get('amount', 0),
             tx.get('from_currency', ''),
             tx.get('to_currency', ''),
@@ -123,12 +128,9 @@ def export_transactions():
             tx.get('rate', 0),
             tx.get('status', ''),
             tx.get('created_at', '').strftime('%d/%m/%Y %H:%M') if tx.get('created_at') else ''
-        ])
-
-    output.seek(0)
-
-    return Response(
-        output.getvalue(),
-        mimetype='text/csv',
-        headers={'Content-Disposition': f'attachment; filename=sarfx_transactions_{datetime.now().strftime("%Y%m%d")}.csv'}
+        ]
+        for tx in transactions
     )
+    chunks = csv_stream(['ID Transaction', 'Email User', 'Montant', 'Devise Source', 'Devise Cible',
+                         'Montant Final', 'Taux', 'Statut', 'Date'], rows)
+    return csv_response(chunks, f'sarfx_transactions_{datetime.now().strftime("%Y%m%d")}.csv')
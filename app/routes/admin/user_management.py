@@ -2,16 +2,47 @@ from flask import render_template, session, redirect, url_for, request, flash, j
 from app.routes.admin import admin_bp
 from app.decorators import admin_required
 from app.services.db_service import get_db, log_history, safe_object_id
+from app.services import metrics_service
+from app.services.pagination import ensure_admin_indexes, paginate_request, prefix_search
 from bson import ObjectId
 from datetime import datetime
 
 
+def _user_filters(args):
+    """Filtres serveur de la liste : q (préfixe d'email), role, kyc, tag"""
+    query = {}
+    email = prefix_search(args.get('q'), lower=True)
+    if email:
+        query['email'] = email
+    if args.get('role'):
+        query['role'] = args['role']
+    kyc = args.get('kyc')
+    if kyc == 'none':
+        query['kyc_status'] = {'$in': [None, 'none']}
+    elif kyc:
+        query['kyc_status'] = kyc
+    if args.get('tag'):
+        query['tags'] = args['tag']
+    return query
+
+
 @admin_bp.route('/users')
 @admin_required
 def users():
     db = get_db()
-    all_users = list(db.users.find().sort("email", 1))
-    return render_template('admin/users_2026.html', users=all_users, active_tab='admin_users')
+    ensure_admin_indexes(db)
+
+    page = paginate_request(db.users, _user_filters(request.args), [('email', 1)], request.args, count=True)
+
+    # Compteurs globaux : requêtes d'égalité couvertes par les index
+    stats = {
+        'total': db.users.estimated_document_count(),
+        'kyc_verified': db.users.count_documents({'kyc_status': 'verified'}),
+        'kyc_pending': db.users.count_documents({'kyc_status': 'pending'}),
+        'tagged': db.users.count_documents({'tags': {'$gt': ''}}),
+    }
+    return render_template('admin/users_2026.html', users=page.items, pager=page, stats=stats,
+                           filters=page.args, active_tab='admin_users')
 
 
 @admin_bp.route('/users/<user_id>/toggle', methods=['POST'])
@@ -65,13 +96,15 @@ def delete_user(user_id):
         wallets_deleted = db.wallets.delete_many({"user_id": user_id}).deleted_count
 
         # Delete transactions (as sender or recipient)
-        transactions_deleted = db.transactions.delete_many({
+        transactions_query = {
             "$or": [
                 {"sender_id": user_id},
                 {"recipient_id": user_id},
                 {"user_id": user_id}
             ]
-        }).deleted_count
+        }
+        deleted_transactions = list(db.transactions.find(transactions_query, metrics_service.TRANSACTION_FIELDS))
+        transactions_deleted = db.transactions.delete_many(transactions_query).deleted_count
 
         # Delete beneficiaries
         beneficiaries_deleted = db.beneficiaries.delete_many({"user_id": user_id}).deleted_count
@@ -79,6 +112,9 @@ def delete_user(user_id):
         # Delete history logs for this user
         history_deleted = db.history.delete_many({"user": email}).deleted_count
 
+        # Compteurs du dashboard : décrément ciblé (jour d'inscription, jours des transactions)
+        metrics_service.record_deletions([user], deleted_transactions, db=db)
+
         log_history("USER_CASCADE_DELETE",
                    f"Utilisateur {email} supprime avec: {wallets_deleted} wallets, "
                    f"{transactions_deleted} transactions, {beneficiaries_deleted} beneficiaires, "
@@ -222,7 +258,7 @@ def bulk_delete_users():
             return jsonify({"success": False, "message": "Vous ne pouvez pas supprimer votre propre compte"}), 403
 
     # Get user emails for history cleanup
-    users_to_delete = list(db.users.find({"_id": {"$in": object_ids}}, {"email": 1}))
+    users_to_delete = list(db.users.find({"_id": {"$in": object_ids}}, {"email": 1, "created_at": 1}))
     emails = [u.get('email') for u in users_to_delete if u.get('email')]
 
     # Delete users
@@ -232,6 +268,7 @@ def bulk_delete_users():
     total_wallets = 0
     total_transactions = 0
     total_beneficiaries = 0
+    deleted_transactions = []
 
     for oid in object_ids:
         user_id_str = str(oid)
@@ -240,13 +277,15 @@ def bulk_delete_users():
         total_wallets += db.wallets.delete_many({"user_id": user_id_str}).deleted_count
 
         # Delete transactions
-        total_transactions += db.transactions.delete_many({
+        transactions_query = {
             "$or": [
                 {"sender_id": user_id_str},
                 {"recipient_id": user_id_str},
                 {"user_id": user_id_str}
             ]
-        }).deleted_count
+        }
+        deleted_transactions.extend(db.transactions.find(transactions_query, metrics_service.TRANSACTION_FIELDS))
+        total_transactions += db.transactions.delete_many(transactions_query).deleted_count
 
         # Delete beneficiaries
         total_beneficiaries += db.beneficiaries.delete_many({"user_id": user_id_str}).deleted_count
@@ -255,6 +294,8 @@ def bulk_delete_users():
     if emails:
         db.history.delete_many({"user": {"$in": emails}})
 
+    metrics_service.record_deletions(users_to_delete, deleted_transactions, db=db)
+
     log_history("BULK_CASCADE_DELETE",
                f"{result.deleted_count} utilisateurs supprimes avec {total_wallets} wallets, "
                f"{total_transactions} transactions, {total_beneficiaries} beneficiaires",
@@ -2,6 +2,7 @@ from flask import render_template, session, redirect, url_for, request, flash
 from app.routes.admin import admin_bp
 from app.decorators import admin_required
 from app.services.db_service import get_db, log_history
+from app.services.pagination import MAX_PAGE_SIZE, attach_users, ensure_admin_indexes, paginate_request, prefix_search
 from bson import ObjectId
 from datetime import datetime
 
@@ -10,24 +11,21 @@ from datetime import datetime
 @admin_required
 def wallets():
     db = get_db()
-    all_wallets = list(db.wallets.find())
-
-    # Enrichir avec les infos utilisateur
-    for wallet in all_wallets:
-        try:
-            user_id = wallet.get('user_id')
-            if user_id:
-                if isinstance(user_id, str) and len(user_id) == 24:
-                    user = db.users.find_one({"_id": ObjectId(user_id)})
-                else:
-                    user = db.users.find_one({"_id": user_id})
-                wallet['user_email'] = user.get('email', 'Unknown') if user else 'Unknown'
-            else:
-                wallet['user_email'] = 'Unknown'
-        except Exception:
-            wallet['user_email'] = 'Unknown'
+    ensure_admin_indexes(db)
+
+    # Recherche serveur par préfixe d'email du propriétaire
+    query = {}
+    email = prefix_search(request.args.get('q'), lower=True)
+    if email:
+        owners = db.users.find({"email": email}, {"_id": 1}).limit(MAX_PAGE_SIZE)
+        query['user_id'] = {"$in": [str(user['_id']) for user in owners]}
+
+    page = paginate_request(db.wallets, query, [('_id', 1)], request.args, count=True)
+    attach_users(page.items, db)
 
-    return render_template('admin/wallets_2026.html', wallets=all_wallets, active_tab='admin_wallets')
+    return render_template('admin/wallets_2026.html', wallets=page.items, pager=page,
+                           total_wallets=db.wallets.estimated_document_count(),
+                           filters=page.args, active_tab='admin_wallets')
 
 
 @admin_bp.route('/wallets/<wallet_id>/history')
@@ -64,53 +62,21 @@ def wallet_history(wallet_id):
 @admin_bp.route('/wallets/<wallet_id>/adjust', methods=['POST'])
 @admin_required
 def adjust_wallet(wallet_id):
-    db = get_db()
     currency = request.form.get('currency', 'USD')
     amount = float(request.form.get('amount', 0))
     reason = request.form.get('reason', '')
 
-    wallet = db.wallets.find_one({"wallet_id": wallet_id})
-    if not wallet:
-        flash("Portefeuille non trouve", "error")
+    # Ajustement via le grand livre : $inc conditionnel (jamais de solde negatif, pas de mise a jour perdue)
+    from app.services.wallet_service import admin_adjust_balance
+    success, message = admin_adjust_balance(wallet_id, currency, amount, session['user_id'], reason)
+    if not success:
+        flash(f"Ajustement refuse: {message}", "error")
         return redirect(url_for('admin.wallets'))
 
-    old_balance = wallet.get('balances', {}).get(currency, 0)
-    new_balance = old_balance + amount
-
-    # Verifier si le solde est suffisant pour une soustraction
-    if amount < 0 and new_balance < 0:
-        flash(f"Solde insuffisant! Le solde actuel en {currency} est {old_balance:.2f}. Vous ne pouvez pas retirer plus de {old_balance:.2f} {currency}.", "error")
-        return redirect(url_for('admin.wallets'))
-
-    # Verifier que la devise existe dans le wallet pour une soustraction
-    if amount < 0 and old_balance <= 0:
-        flash(f"Impossible de soustraire: aucun solde en {currency} disponible.", "error")
-        return redirect(url_for('admin.wallets'))
-
-    # Record adjustment
     adjustment_type = "credit" if amount > 0 else "debit"
-    db.wallet_adjustments.insert_one({
-        "wallet_id": wallet_id,
-        "user_id": wallet['user_id'],
-        "currency": currency,
-        "old_balance": old_balance,
-        "new_balance": new_balance,
-        "difference": amount,
-        "type": adjustment_type,
-        "admin_id": session['user_id'],
-        "reason": reason,
-        "created_at": datetime.utcnow()
-    })
-
-    # Update balance
-    db.wallets.update_one(
-        {"wallet_id": wallet_id},
-        {"$set": {f"balances.{currency}": new_balance, "updated_at": datetime.utcnow()}}
-    )
-
     log_history("WALLET_ADJUST", f"Ajustement {amount:+.2f} {currency} sur wallet {wallet_id[:8]}... ({adjustment_type})",
                user=session.get('email'))
-    flash(f"Solde ajuste: {amount:+.2f} {currency} (Nouveau solde: {new_balance:.2f} {currency})", "success")
+    flash(f"Solde ajuste: {amount:+.2f} {currency} ({message})", "success")
 
     return redirect(url_for('admin.wallets'))
 
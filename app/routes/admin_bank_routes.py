@@ -1,5 +1,7 @@
 from flask import Blueprint, render_template, session, redirect, url_for, request, flash, jsonify
 from app.services.db_service import get_db
+from app.services.atm_index import get_atm_index
+from app.services.pagination import contains_search, ensure_admin_indexes, paginate_request
 from app.decorators import admin_required
 from werkzeug.utils import secure_filename
 import os
@@ -17,15 +19,27 @@ def allowed_file(filename):
 @admin_banks_bp.route('/')
 @admin_required
 def list_banks():
-    """Liste toutes les banques partenaires"""
+    """Liste paginée des banques partenaires (recherche par nom ou code)"""
     db = get_db()
-    banks = list(db.banks.find().sort("name", 1))
-
-    # Récupérer les utilisateurs vérifiés avec le rôle 'bank_respo'
-    bank_respos = list(db.users.find({
-        "role": "bank_respo",
-        "verified": True
-    }).sort("email", 1))
+    ensure_admin_indexes(db)
+
+    query = {}
+    search = contains_search(request.args.get('q'))
+    if search:
+        query['$or'] = [{'name': search}, {'code': search}]
+    if request.args.get('status') in ('active', 'inactive'):
+        query['is_active'] = request.args['status'] == 'active'
+
+    page = paginate_request(db.banks, query, [('name', 1)], request.args, default_limit=50)
+    banks = page.items
+
+    # Responsables vérifiés : seul leur nombre est affiché
+    bank_respo_count = db.users.count_documents({"role": "bank_respo", "verified": True})
+    stats = {
+        'total': db.banks.estimated_document_count(),
+        'active': db.banks.count_documents({"is_active": True}),
+        'bank_respos': bank_respo_count,
+    }
 
     # Convertir ObjectId en string pour la template
     for bank in banks:
@@ -38,10 +52,9 @@ def list_banks():
             bank['assigned_users'] = [str(uid) for uid in bank['assigned_users']]
         else:
             bank['assigned_users'] = []
-    for user in bank_respos:
-        user['_id'] = str(user['_id'])
 
-    return render_template('admin/banks_2026.html', banks=banks, users=bank_respos, active_tab='admin_banks')
+    return render_template('admin/banks_2026.html', banks=banks, pager=page, stats=stats,
+                           filters=page.args, active_tab='admin_banks')
 
 @admin_banks_bp.route('/create', methods=['GET', 'POST'])
 @admin_required
@@ -91,6 +104,7 @@ def create_bank():
             {"$set": {"bank_name": name}},
             upsert=False
         )
+        get_atm_index().invalidate()
 
         flash(f'Banque "{name}" créée avec succès!', 'success')
         return redirect(url_for('admin_banks.list_banks'))
@@ -1,10 +1,13 @@
 from flask import Blueprint, jsonify, request, session
 from app.services.db_service import get_db, safe_object_id
-from app.decorators import login_required_api
+from app.services import metrics_service
+from app.services.single_flight import single_flight
+from app.decorators import login_required_api, get_current_identity, get_current_role, get_current_user
 from app.config import Config
 from datetime import datetime
 from bson import ObjectId
 from bson.errors import InvalidId
+import math
 import uuid
 import requests
 import time
@@ -13,24 +16,9 @@ api_bp = Blueprint('api', __name__)
 
 
 # ==================== RATE CACHE ====================
-_rate_cache = {}
+# Cache partagé L1 (worker) + L2 (Redis), voir app/services/rate_cache.py
 _cache_ttl = Config.RATES_CACHE_TTL  # 30 secondes par defaut
 
-def get_cached_rate(cache_key):
-    """Recupere un taux du cache s'il est encore valide"""
-    if cache_key in _rate_cache:
-        cached = _rate_cache[cache_key]
-        if time.time() - cached['timestamp'] < _cache_ttl:
-            return cached['data']
-    return None
-
-def set_cached_rate(cache_key, data):
-    """Met en cache un taux avec timestamp"""
-    _rate_cache[cache_key] = {
-        'data': data,
-        'timestamp': time.time()
-    }
-
 
 # ==================== SEED DEMO USERS ====================
 
@@ -77,6 +65,7 @@ def seed_demo_users():
                 "created_at": datetime.utcnow()
             }
             result = db.users.insert_one(new_user)
+            metrics_service.record_signup(new_user, db)
 
             # Create wallet
             db.wallets.insert_one({
@@ -116,15 +105,29 @@ def get_smart_rate(base, target):
     Récupère le taux intelligent depuis le backend IA SarfX.
     Utilise un cache de 30s et un fallback si l'API est indisponible.
     """
+    from app.services.rate_cache import get_rate_cache
+
     amount = request.args.get('amount', 1000, type=float)
-    cache_key = f"{base}_{target}_{amount}"
+    loaded = []
+
+    def _load():
+        loaded.append(True)
+        return _fetch_smart_rate(base, target, amount)
 
-    # Check cache first
-    cached = get_cached_rate(cache_key)
-    if cached:
-        cached['from_cache'] = True
-        return jsonify(cached)
+    result = get_rate_cache().get_or_load(
+        f"smart:{base}:{target}:{amount}",
+        _load,
+        ttl=_cache_ttl
+    )
+    if result is None:
+        # Chargement en échec (exception absorbée par le cache) : taux estimés
+        return jsonify(_fallback_smart_rate(base, target, amount))
+    return jsonify({**result, 'from_cache': not loaded})
 
+
+@single_flight('ai-smart-rate')
+def _fetch_smart_rate(base, target, amount):
+    """Interroge le backend IA, avec fallback sur les taux statiques"""
     # Try AI Backend
     try:
         ai_url = f"{Config.AI_BACKEND_URL}/smart-rate/{base}/{target}"
@@ -165,16 +168,18 @@ def get_smart_rate(base, target):
                 'from_cache': False
             }
 
-            # Cache the result
-            set_cached_rate(cache_key, result)
-            return jsonify(result)
+            return result
 
     except requests.exceptions.RequestException as e:
         print(f"⚠️ AI Backend unavailable: {e}")
     except Exception as e:
         print(f"❌ Error calling AI Backend: {e}")
 
-    # Fallback to hardcoded rates
+    return _fallback_smart_rate(base, target, amount)
+
+
+def _fallback_smart_rate(base, target, amount):
+    """Fallback to hardcoded rates"""
     pair = f"{base}{target}"
     fallback_rate = FALLBACK_RATES.get(pair, 1.0)
     sarfx_rate = fallback_rate * 1.005  # SarfX gets slightly better rate
@@ -215,14 +220,15 @@ def get_smart_rate(base, target):
         'from_cache': False
     }
 
-    # Cache even fallback for consistency
-    set_cached_rate(cache_key, result)
-    return jsonify(result)
+    # Fallback is cached too, for consistency
+    return result
 
 
 @api_bp.route('/smart-rate/status')
 def smart_rate_status():
     """Vérifie le statut du backend IA"""
+    from app.services.rate_cache import get_rate_cache
+
     try:
         response = requests.get(
             f"{Config.AI_BACKEND_URL}/",
@@ -233,7 +239,7 @@ def smart_rate_status():
                 'status': 'online',
                 'backend_url': Config.AI_BACKEND_URL,
                 'cache_ttl': _cache_ttl,
-                'cached_pairs': len(_rate_cache)
+                'cache': get_rate_cache().stats()
             })
     except:
         pass
@@ -242,7 +248,21 @@ def smart_rate_status():
         'status': 'offline',
         'backend_url': Config.AI_BACKEND_URL,
         'fallback_active': True,
-        'cached_pairs': len(_rate_cache)
+        'cache': get_rate_cache().stats()
+    })
+
+
+@api_bp.route('/rates/cache/stats')
+def rate_cache_stats():
+    """Compteurs du cache de taux partagé (hits L1/L2, misses, latence) et des appels amont coalescés"""
+    from app.services.rate_cache import get_rate_cache
+    from app.services.single_flight import get_single_flight
+
+    return jsonify({
+        'success': True,
+        'cache': get_rate_cache().stats(),
+        'single_flight': get_single_flight().stats(),
+        'timestamp': datetime.utcnow().isoformat()
     })
 
 
@@ -388,15 +408,21 @@ def get_best_rates():
             ]
         })
 
-    suppliers = list(db.suppliers.find({"is_active": True}).sort("rate", -1))
+    from app.services.rate_service import calculate_best_rate
+
+    from_currency = request.args.get('from', 'USD').upper()
+    to_currency = request.args.get('to', 'MAD').upper()
+    result = calculate_best_rate(amount, from_currency, to_currency)
 
+    # Cotations triées par montant final pour ce montant (table des fournisseurs en mémoire)
     rates = []
-    for s in suppliers:
+    for quote in (result or {}).get('all', []):
         rates.append({
-            'supplier': s['name'],
-            'type': s.get('type', 'bank').capitalize(),
-            'rate': s.get('rate', 10.0),
-            'fee': s.get('fee', 0)
+            'supplier': quote['supplier'].get('name', ''),
+            'type': quote['supplier'].get('type', 'bank').capitalize(),
+            'rate': round(quote['rate'], 4),
+            'fee': quote['fee'],
+            'final_amount': quote['final_amount']
         })
 
     return jsonify({
@@ -405,6 +431,55 @@ def get_best_rates():
     })
 
 
+@api_bp.route('/rates/best/ladder')
+def get_best_rate_ladder():
+    """
+    Meilleur fournisseur pour une échelle de montants (curseurs de l'interface).
+    Query params: from, to, et amounts=100,500,1000 ou min, max, steps
+    """
+    from app.services.rate_service import calculate_rate_ladder
+    from app.services.supplier_quotes import MAX_LADDER_POINTS, MAX_QUOTE_AMOUNT
+
+    try:
+        if request.args.get('amounts'):
+            amounts = [float(a) for a in request.args['amounts'].split(',') if a.strip()]
+        else:
+            low = float(request.args.get('min', 100))
+            high = float(request.args.get('max', 10000))
+            steps = max(2, min(int(request.args.get('steps', 20)), MAX_LADDER_POINTS))
+            amounts = [round(low + (high - low) * i / (steps - 1), 2) for i in range(steps)]
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid amounts'}), 400
+
+    # float() accepte inf et nan : bornes vérifiées explicitement
+    if (not amounts or len(amounts) > MAX_LADDER_POINTS
+            or any(not math.isfinite(a) or a <= 0 or a > MAX_QUOTE_AMOUNT for a in amounts)):
+        return jsonify({'success': False, 'error': f'Between 1 and {MAX_LADDER_POINTS} positive amounts required'}), 400
+
+    from_currency = request.args.get('from', 'USD').upper()
+    to_currency = request.args.get('to', 'MAD').upper()
+
+    quotes = []
+    for point in calculate_rate_ladder(amounts, from_currency, to_currency):
+        best = point['best']
+        quotes.append({
+            'amount': point['amount'],
+            'supplier': best['supplier'].get('name', '') if best else None,
+            'supplier_id': best['supplier'].get('_id') if best else None,
+            'rate': round(best['rate'], 4) if best else None,
+            'fee': best['fee'] if best else None,
+            'final_amount': best['final_amount'] if best else None,
+            'effective_rate': best['effective_rate'] if best else None
+        })
+
+    return jsonify({
+        'success': True,
+        'from': from_currency,
+        'to': to_currency,
+        'quotes': quotes
+    })
+
+
 @api_bp.route('/rates/alerts', methods=['GET', 'POST', 'DELETE'])
 @login_required_api
 def rate_alerts():
@@ -446,6 +521,25 @@ def rate_alerts():
 
 # ==================== EXCHANGE ====================
 
+def _request_amount(data):
+    """Montant du corps JSON : None s'il n'est pas un nombre, non fini ou au-delà de MAX_AMOUNT"""
+    from app.services.money import MAX_AMOUNT
+
+    try:
+        amount = float(data.get('amount', 0))
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(amount) or amount > MAX_AMOUNT:
+        return None
+    return amount
+
+
+def _idempotency_key(data=None):
+    """Clé d'idempotence du client : en-tête Idempotency-Key ou champ idempotency_key"""
+    key = request.headers.get('Idempotency-Key') or (data or {}).get('idempotency_key')
+    return str(key)[:128] if key else None
+
+
 @api_bp.route('/exchange', methods=['POST'])
 @login_required_api
 def create_exchange():
@@ -473,74 +567,52 @@ def create_exchange():
     to_currency = data['to_currency']
     user_id = session['user_id']
 
-    # ========== VÉRIFICATION DU SOLDE ==========
-    from app.services.wallet_service import get_wallet_by_user_id, withdraw_from_wallet
-
-    wallet, wallet_error = get_wallet_by_user_id(user_id)
-    if not wallet or wallet_error:
-        error_msg = wallet_error or "Vous n'avez pas de portefeuille. Veuillez en créer un d'abord."
-        if request.form:
-            from flask import redirect, url_for, flash
-            flash(error_msg, "error")
-            return redirect(url_for('app.converter'))
-        return jsonify({"error": error_msg}), 400
-
-    # Vérifier le solde disponible
-    balances = wallet.get('balances', {})
-    current_balance = float(balances.get(from_currency, 0))
-
-    if current_balance < amount:
-        error_msg = f"Solde insuffisant! Vous avez {current_balance:.2f} {from_currency} mais vous essayez d'envoyer {amount:.2f} {from_currency}."
-        if request.form:
-            from flask import redirect, url_for, flash
-            flash(error_msg, "error")
-            return redirect(url_for('app.converter'))
-        return jsonify({"error": error_msg}), 400
+    # ========== DÉBIT DU WALLET ==========
+    # Un seul $inc conditionnel (solde >= montant) : pas de vérification séparée du solde
+    from app.services.wallet_service import debit_wallet
 
-    # ========== DÉBITER LE WALLET ==========
     recipient_name = data.get('recipient_name', 'Inconnu')
-    success, message = withdraw_from_wallet(
-        user_id=user_id,
-        currency=from_currency,
-        amount=amount,
-        destination=f"Échange vers {to_currency} - {recipient_name}"
-    )
 
-    if not success:
-        error_msg = f"Erreur lors du débit: {message}"
+    def send_transaction(balances):
+        new_balance = balances[from_currency]
+        return {
+            "transaction_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "type": "send",
+            "amount": amount,
+            "from_currency": from_currency,
+            "to_currency": to_currency,
+            "rate": rate,
+            "final_amount": final_amount,
+            "fee": amount * 0.01,  # 1% fee
+            "supplier_id": data.get('supplier_id'),
+            "recipient_name": recipient_name,
+            "recipient_account": data.get('recipient_account', ''),
+            "destination": f"Échange vers {to_currency} - {recipient_name}",
+            "status": "completed",
+            "wallet_debited": True,
+            "previous_balance": round(new_balance + amount, 4),
+            "new_balance": new_balance,
+            "created_at": datetime.utcnow()
+        }
+
+    debit, debit_error = debit_wallet(user_id, from_currency, amount, send_transaction, kind='send',
+                                      idempotency_key=_idempotency_key(data))
+    if debit_error:
+        error_msg = f"Erreur lors du débit: {debit_error}"
         if request.form:
             from flask import redirect, url_for, flash
             flash(error_msg, "error")
             return redirect(url_for('app.converter'))
         return jsonify({"error": error_msg}), 400
 
-    # Créer la transaction
-    transaction = {
-        "transaction_id": str(uuid.uuid4()),
-        "user_id": user_id,
-        "type": "send",
-        "amount": amount,
-        "from_currency": from_currency,
-        "to_currency": to_currency,
-        "rate": rate,
-        "final_amount": final_amount,
-        "fee": amount * 0.01,  # 1% fee
-        "supplier_id": data.get('supplier_id'),
-        "recipient_name": recipient_name,
-        "recipient_account": data.get('recipient_account', ''),
-        "status": "completed",
-        "wallet_debited": True,
-        "previous_balance": current_balance,
-        "new_balance": current_balance - amount,
-        "created_at": datetime.utcnow()
-    }
-
-    result = db.transactions.insert_one(transaction)
+    transaction = debit['transaction'] or {}
 
-    # Log history
-    from app.services.db_service import log_history
-    log_history("EXCHANGE", f"Échange de {amount} {from_currency} vers {final_amount} {to_currency} (wallet débité)",
-                user=session.get('email', 'Unknown'))
+    # Log history (pas pour une requête rejouée avec la même clé)
+    if not debit['replayed']:
+        from app.services.db_service import log_history
+        log_history("EXCHANGE", f"Échange de {amount} {from_currency} vers {final_amount} {to_currency} (wallet débité)",
+                    user=session.get('email', 'Unknown'))
 
     # Redirect or return JSON based on request type
     if request.form:
@@ -550,10 +622,10 @@ def create_exchange():
 
     return jsonify({
         "success": True,
-        "transaction_id": transaction['transaction_id'],
+        "transaction_id": transaction.get('transaction_id'),
         "message": f"Échange réussi: {final_amount:.2f} {to_currency}",
         "wallet_debited": amount,
-        "new_balance": current_balance - amount
+        "new_balance": debit['balance']
     })
 
 
@@ -635,11 +707,14 @@ def swap_preview():
     data = request.json or {}
     from_currency = data.get('from_currency', '').upper()
     to_currency = data.get('to_currency', '').upper()
-    amount = float(data.get('amount', 0))
+    amount = _request_amount(data)
 
     if not from_currency or not to_currency:
         return jsonify({"error": "from_currency and to_currency are required"}), 400
 
+    if amount is None:
+        return jsonify({"error": "Invalid amount"}), 400
+
     if amount <= 0:
         return jsonify({"error": "Amount must be positive"}), 400
 
@@ -663,15 +738,19 @@ def execute_wallet_swap():
     data = request.json or {}
     from_currency = data.get('from_currency', '').upper()
     to_currency = data.get('to_currency', '').upper()
-    amount = float(data.get('amount', 0))
+    amount = _request_amount(data)
 
     if not from_currency or not to_currency:
         return jsonify({"error": "from_currency and to_currency are required"}), 400
 
+    if amount is None:
+        return jsonify({"error": "Invalid amount"}), 400
+
     if amount <= 0:
         return jsonify({"error": "Amount must be positive"}), 400
 
-    result, error = execute_swap(session['user_id'], from_currency, to_currency, amount)
+    result, error = execute_swap(session['user_id'], from_currency, to_currency, amount,
+                                 idempotency_key=_idempotency_key(data))
 
     if error:
         return jsonify({"error": error}), 400
@@ -705,18 +784,20 @@ def wallet_deposit():
 
     # Check if admin or demo mode
     db = get_db()
-    user = db.users.find_one({"_id": safe_object_id(session['user_id'])}) if db is not None else None
-    is_admin = user and user.get('role') in ['admin', 'superadmin']
+    is_admin = get_current_role() in ['admin', 'superadmin']
 
     # In production, this would be triggered by payment webhook
     # For now, allow for testing
     data = request.json or {}
     currency = data.get('currency', '').upper()
-    amount = float(data.get('amount', 0))
+    amount = _request_amount(data)
 
     if not currency:
         return jsonify({"error": "Currency is required"}), 400
 
+    if amount is None:
+        return jsonify({"error": "Invalid amount"}), 400
+
     if amount <= 0:
         return jsonify({"error": "Amount must be positive"}), 400
 
@@ -724,7 +805,8 @@ def wallet_deposit():
     if not is_admin and amount > 1000:
         return jsonify({"error": "Maximum deposit amount is 1000 for non-admin users"}), 400
 
-    success, message = deposit_to_wallet(session['user_id'], currency, amount, source="api")
+    success, message = deposit_to_wallet(session['user_id'], currency, amount, source="api",
+                                         idempotency_key=_idempotency_key(data))
 
     if success:
         return jsonify({"success": True, "message": message})
@@ -855,10 +937,7 @@ def save_settings():
         return jsonify({"error": "Database unavailable"}), 500
 
     # Vérifier si admin
-    from app.services.db_service import safe_object_id
-    user_id = safe_object_id(session['user_id'])
-    user = db.users.find_one({"_id": user_id}) if user_id else db.users.find_one({"email": session.get('email')})
-    if not user or user.get('role') != 'admin':
+    if get_current_role() != 'admin':
         if request.form:
             from flask import redirect, url_for, flash
             flash("Accès non autorisé", "error")
@@ -1098,14 +1177,11 @@ def get_atms():
 @api_bp.route('/atms/nearest', methods=['POST'])
 def get_nearest_atms():
     """
-    Trouve les ATM les plus proches d'une position GPS
+    Trouve les ATM les plus proches d'une position GPS (index spatial en mémoire)
     Body: { "latitude": float, "longitude": float, "bank_code": str (optional), "max_distance_km": int (optional), "limit": int (optional) }
     """
     try:
-        from app.services.atm_service import ATMService
-        db = get_db()
-        if db is None:
-            return jsonify({"error": "Database unavailable"}), 500
+        from app.services.atm_index import get_atm_index
 
         data = request.get_json()
 
@@ -1118,12 +1194,12 @@ def get_nearest_atms():
         latitude = float(data['latitude'])
         longitude = float(data['longitude'])
         bank_code = data.get('bank_code')
-        max_distance_km = int(data.get('max_distance_km', 10))
+        max_distance_km = float(data.get('max_distance_km', 10))
         limit = int(data.get('limit', 10))
 
-        atm_service = ATMService(db)
-        atms = atm_service.get_nearest_atms(
-            latitude, longitude, bank_code, max_distance_km, limit
+        atms = get_atm_index().nearest(
+            latitude, longitude, bank_code, max_distance_km, limit,
+            status=data.get('status', 'active') or None
         )
 
         return jsonify({
@@ -1139,6 +1215,54 @@ def get_nearest_atms():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+@api_bp.route('/atms/nearest/batch', methods=['POST'])
+def get_nearest_atms_batch():
+    """
+    ATM les plus proches de plusieurs positions en une requête
+    Body: { "points": [{"latitude": float, "longitude": float, "id": any (optional)}, ...],
+            "bank_code": str (optional), "status": str (optional), "max_distance_km": int (optional), "limit": int (optional) }
+    """
+    try:
+        from app.services.atm_index import MAX_BATCH_POINTS, get_atm_index
+
+        data = request.get_json() or {}
+        points = data.get('points')
+
+        if not isinstance(points, list) or not points:
+            return jsonify({"success": False, "error": "Liste de points requise"}), 400
+        if len(points) > MAX_BATCH_POINTS:
+            return jsonify({"success": False, "error": f"{MAX_BATCH_POINTS} points maximum"}), 400
+
+        try:
+            coordinates = [(float(point['latitude']), float(point['longitude'])) for point in points]
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"success": False, "error": "Latitude et longitude requis pour chaque point"}), 400
+
+        results = get_atm_index().nearest_many(
+            coordinates,
+            bank_code=data.get('bank_code'),
+            max_distance_km=float(data.get('max_distance_km', 10)),
+            limit=int(data.get('limit', 10)),
+            status=data.get('status', 'active') or None
+        )
+
+        return jsonify({
+            "success": True,
+            "results": [
+                {
+                    "id": point.get('id'),
+                    "location": {"latitude": latitude, "longitude": longitude},
+                    "atms": atms,
+                    "total": len(atms)
+                }
+                for point, (latitude, longitude), atms in zip(points, coordinates, results)
+            ],
+            "total": len(results)
+        })
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
 @api_bp.route('/atms/search')
 def search_atms():
     """
@@ -1501,7 +1625,7 @@ def update_bank_settings():
             return jsonify({"error": "Database unavailable"}), 500
 
         user_id = session.get('user_id')
-        user = db.users.find_one({"_id": ObjectId(user_id)})
+        user = get_current_identity()
 
         if not user or user.get('role') != 'bank_respo':
             return jsonify({"success": False, "error": "Accès non autorisé"}), 403
@@ -1548,7 +1672,7 @@ def test_bank_connection():
             return jsonify({"error": "Database unavailable"}), 500
 
         user_id = session.get('user_id')
-        user = db.users.find_one({"_id": ObjectId(user_id)})
+        user = get_current_identity()
 
         if not user or user.get('role') != 'bank_respo':
             return jsonify({"success": False, "error": "Accès non autorisé"}), 403
@@ -1597,9 +1721,7 @@ def chatbot_message():
 
         if 'user_id' in session and db:
             try:
-                from app.services.db_service import safe_object_id
-                user_id = safe_object_id(session['user_id'])
-                user = db.users.find_one({"_id": user_id}) if user_id else db.users.find_one({"email": session.get('email')})
+                user = get_current_user()
                 if user:
                     user_context = {
                         'user_id': str(user['_id']),
@@ -1688,8 +1810,7 @@ def chatbot_suggestions():
 
         if 'user_id' in session and db:
             try:
-                user_id = safe_object_id(session['user_id'])
-                user = db.users.find_one({"_id": user_id}) if user_id else db.users.find_one({"email": session.get('email')})
+                user = get_current_user()
             except Exception:
                 pass
 
@@ -1786,7 +1907,7 @@ def manage_atms():
         # Liste des ATMs
         from bson import ObjectId
         user_id = session.get('user_id')
-        user = db.users.find_one({"_id": ObjectId(user_id)})
+        user = get_current_identity()
 
         # Filtrer par banque si l'utilisateur est associé à une banque
         query = {}
@@ -1803,7 +1924,7 @@ def manage_atms():
         # Ajouter un ATM
         from bson import ObjectId
         user_id = session.get('user_id')
-        user = db.users.find_one({"_id": ObjectId(user_id)})
+        user = get_current_identity()
 
         if user.get('role') not in ['admin', 'admin_sr_bank', 'admin_associate_bank', 'bank_respo']:
             return jsonify({"success": False, "error": "Non autorisé"}), 403
@@ -1834,7 +1955,7 @@ def manage_atm(atm_id):
         return jsonify({"error": "Database unavailable"}), 500
 
     user_id = session.get('user_id')
-    user = db.users.find_one({"_id": ObjectId(user_id)})
+    user = get_current_identity()
 
     if user.get('role') not in ['admin', 'admin_sr_bank', 'admin_associate_bank', 'bank_respo']:
         return jsonify({"success": False, "error": "Non autorisé"}), 403
@@ -1872,7 +1993,7 @@ def regenerate_api_keys():
         return jsonify({"error": "Database unavailable"}), 500
 
     user_id = session.get('user_id')
-    user = db.users.find_one({"_id": ObjectId(user_id)})
+    user = get_current_identity()
 
     if user.get('role') not in ['admin', 'admin_sr_bank', 'admin_associate_bank']:
         return jsonify({"success": False, "error": "Non autorisé"}), 403
@@ -1914,7 +2035,7 @@ def sync_bank_data():
         return jsonify({"error": "Database unavailable"}), 500
 
     user_id = session.get('user_id')
-    user = db.users.find_one({"_id": ObjectId(user_id)})
+    user = get_current_identity()
 
     if user.get('role') not in ['admin', 'admin_sr_bank', 'admin_associate_bank']:
         return jsonify({"success": False, "error": "Non autorisé"}), 403
@@ -1949,10 +2070,7 @@ def admin_wallet_stats():
         return jsonify({"error": "Database unavailable"}), 500
 
     # Vérifier que l'utilisateur est admin
-    user_id = session.get('user_id')
-    user = db.users.find_one({"_id": safe_object_id(user_id)})
-
-    if not user or user.get('role') != 'admin':
+    if get_current_role() != 'admin':
         return jsonify({"error": "Non autorisé"}), 403
 
     try:
@@ -1994,112 +2112,25 @@ def admin_wallet_stats():
 @api_bp.route('/search')
 @login_required_api
 def global_search():
-    """Recherche globale dans l'application"""
+    """Recherche globale dans l'application (voir search_service)"""
+    from app.services import search_service
+
     db = get_db()
     if db is None:
         return jsonify({"error": "Database unavailable", "results": []}), 500
 
     query = request.args.get('q', '').strip()
-    if len(query) < 2:
+    if len(query) < search_service.MIN_QUERY_LENGTH:
         return jsonify({"results": []})
 
-    user_id = session.get('user_id')
-    results = []
-
     try:
-        # Regex pour recherche insensible à la casse
-        import re
-        regex_pattern = re.compile(query, re.IGNORECASE)
-
-        # 1. Recherche dans les transactions de l'utilisateur
-        transactions = list(db.transactions.find({
-            "user_id": user_id,
-            "$or": [
-                {"reference": {"$regex": regex_pattern}},
-                {"from_currency": {"$regex": regex_pattern}},
-                {"to_currency": {"$regex": regex_pattern}},
-                {"type": {"$regex": regex_pattern}},
-                {"description": {"$regex": regex_pattern}}
-            ]
-        }).limit(5))
-
-        for tx in transactions:
-            results.append({
-                "type": "transaction",
-                "title": f"{tx.get('from_currency', '')} → {tx.get('to_currency', '')}",
-                "subtitle": f"Réf: {tx.get('reference', 'N/A')} | {tx.get('amount', 0)} {tx.get('from_currency', '')}",
-                "url": f"/app/transactions?highlight={str(tx.get('_id', ''))}"
-            })
-
-        # 2. Recherche dans les bénéficiaires de l'utilisateur
-        beneficiaries = list(db.beneficiaries.find({
-            "user_id": user_id,
-            "$or": [
-                {"name": {"$regex": regex_pattern}},
-                {"email": {"$regex": regex_pattern}},
-                {"iban": {"$regex": regex_pattern}},
-                {"bank_name": {"$regex": regex_pattern}}
-            ]
-        }).limit(5))
-
-        for ben in beneficiaries:
-            results.append({
-                "type": "beneficiary",
-                "title": ben.get('name', 'Sans nom'),
-                "subtitle": ben.get('email', '') or ben.get('iban', '')[:20] + '...' if ben.get('iban') else '',
-                "url": f"/app/beneficiaries?highlight={str(ben.get('_id', ''))}"
-            })
-
-        # 3. Recherche dans les ATMs
-        atms = list(db.atms.find({
-            "$or": [
-                {"name": {"$regex": regex_pattern}},
-                {"city": {"$regex": regex_pattern}},
-                {"address": {"$regex": regex_pattern}},
-                {"bank_name": {"$regex": regex_pattern}}
-            ]
-        }).limit(5))
-
-        for atm in atms:
-            results.append({
-                "type": "atm",
-                "title": atm.get('name', 'ATM'),
-                "subtitle": f"{atm.get('city', '')} - {atm.get('bank_name', '')}",
-                "url": f"/app/atms?highlight={str(atm.get('_id', ''))}"
-            })
-
-        # 4. Recherche dans les pages de navigation
-        pages = [
-            {"name": "Accueil", "url": "/app/home", "keywords": ["accueil", "home", "dashboard", "tableau de bord"]},
-            {"name": "Wallets", "url": "/app/wallets", "keywords": ["wallets", "portefeuilles", "soldes", "balances"]},
-            {"name": "Convertir", "url": "/app/converter", "keywords": ["convertir", "converter", "exchange", "change", "taux"]},
-            {"name": "Transactions", "url": "/app/transactions", "keywords": ["transactions", "historique", "history", "paiements"]},
-            {"name": "Bénéficiaires", "url": "/app/beneficiaries", "keywords": ["bénéficiaires", "beneficiaries", "contacts"]},
-            {"name": "ATMs", "url": "/app/atms", "keywords": ["atm", "distributeur", "cash", "retrait"]},
-            {"name": "Profil", "url": "/app/profile", "keywords": ["profil", "profile", "compte", "account"]},
-            {"name": "Réglages", "url": "/app/settings", "keywords": ["réglages", "settings", "paramètres", "preferences"]},
-            {"name": "FAQ", "url": "/app/faq", "keywords": ["faq", "aide", "help", "questions"]},
-            {"name": "IA Prédictions", "url": "/app/ai-forecast", "keywords": ["ia", "ai", "prédictions", "forecast", "machine learning"]}
-        ]
-
-        query_lower = query.lower()
-        for page in pages:
-            if query_lower in page["name"].lower() or any(query_lower in kw for kw in page["keywords"]):
-                results.append({
-                    "type": "page",
-                    "title": page["name"],
-                    "subtitle": "Page de navigation",
-                    "url": page["url"]
-                })
-
-        # Limiter le nombre total de résultats
-        results = results[:15]
-
+        found = search_service.global_search(db, session.get('user_id'), query)
         return jsonify({
             "success": True,
             "query": query,
-            "results": results,
-            "count": len(results)
+            "results": found['results'],
+            "count": len(found['results']),
+            "partial": bool(found['timed_out'])
         })
 
     except Exception as e:
@@ -2208,9 +2239,7 @@ def verify_kyc_document(document_id):
         return jsonify({"success": False, "error": "Database unavailable"}), 500
 
     user_id = session.get('user_id')
-    user = db.users.find_one({"_id": safe_object_id(user_id)})
-
-    if not user or user.get('role') != 'admin':
+    if get_current_role() != 'admin':
         return jsonify({"success": False, "error": "Non autorisé"}), 403
 
     data = request.get_json() or {}
@@ -2233,10 +2262,7 @@ def get_pending_kyc_documents():
     if db is None:
         return jsonify({"error": "Database unavailable"}), 500
 
-    user_id = session.get('user_id')
-    user = db.users.find_one({"_id": safe_object_id(user_id)})
-
-    if not user or user.get('role') != 'admin':
+    if get_current_role() != 'admin':
         return jsonify({"error": "Non autorisé"}), 403
 
     kyc_service = get_kyc_service()
@@ -2259,10 +2285,7 @@ def get_kyc_statistics():
     if db is None:
         return jsonify({"error": "Database unavailable"}), 500
 
-    user_id = session.get('user_id')
-    user = db.users.find_one({"_id": safe_object_id(user_id)})
-
-    if not user or user.get('role') != 'admin':
+    if get_current_role() != 'admin':
         return jsonify({"error": "Non autorisé"}), 403
 
     kyc_service = get_kyc_service()
@@ -2481,10 +2504,7 @@ def get_notification_stats():
     if db is None:
         return jsonify({"error": "Database unavailable"}), 500
 
-    user_id = session.get('user_id')
-    user = db.users.find_one({"_id": safe_object_id(user_id)})
-
-    if not user or user.get('role') != 'admin':
+    if get_current_role() != 'admin':
         return jsonify({"error": "Non autorisé"}), 403
 
     try:
@@ -2530,16 +2550,11 @@ def get_notification_stats():
 @login_required_api
 def export_transactions_csv():
     """Exporte les transactions au format CSV"""
-    from flask import Response
-    from app.services.export_service import get_export_service
+    from app.services.export_service import csv_response, get_export_service
     from datetime import timedelta
 
-    db = get_db()
-    user_id = session.get('user_id')
-    user = db.users.find_one({"_id": safe_object_id(user_id)}) if db is not None else None
-
     # Paramètres
-    is_admin = user and user.get('role') == 'admin'
+    user_id, is_admin = _export_scope()
     filter_user_id = None if is_admin else user_id
 
     # Dates optionnelles
@@ -2551,7 +2566,7 @@ def export_transactions_csv():
         start_date = end_date - timedelta(days=int(days))
 
     export_service = get_export_service()
-    csv_data = export_service.export_transactions_csv(
+    chunks = export_service.stream_transactions_csv(
         user_id=filter_user_id,
         start_date=start_date,
         end_date=end_date,
@@ -2560,11 +2575,65 @@ def export_transactions_csv():
     )
 
     filename = f"sarfx_transactions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    return csv_response(chunks, filename)
 
+
+@api_bp.route('/export/transactions.parquet')
+@login_required_api
+def export_transactions_parquet():
+    """
+    Exporte les transactions au format Parquet (mêmes filtres que le CSV)
+
+    Query params:
+        days, status, currency: filtres de l'export CSV
+        partition: 'month' pour une archive zip d'un fichier par mois (month=YYYY-MM/)
+    """
+    from app.services.export_service import get_export_service, parquet_available
+    from flask import Response, stream_with_context, send_file
+    from datetime import timedelta
+
+    if not parquet_available():
+        return jsonify({"success": False, "error": "Export Parquet indisponible (pyarrow non installé)"}), 501
+
+    user_id, is_admin = _export_scope()
+    filters = {
+        'user_id': None if is_admin else user_id,
+        'status': request.args.get('status'),
+        'currency': request.args.get('currency'),
+    }
+    days = request.args.get('days')
+    if days:
+        filters['end_date'] = datetime.utcnow()
+        filters['start_date'] = filters['end_date'] - timedelta(days=int(days))
+
+    export_service = get_export_service()
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+    if request.args.get('partition') == 'month':
+        import os
+        import tempfile
+        import zipfile
+
+        archive = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+        with tempfile.TemporaryDirectory(prefix='sarfx_parquet_') as root:
+            paths = export_service.write_transactions_parquet_dataset(root, **filters)
+            # Fichiers déjà compressés (zstd) : simple stockage dans l'archive
+            with zipfile.ZipFile(archive, 'w', zipfile.ZIP_STORED) as zf:
+                for path in paths:
+                    zf.write(path, os.path.relpath(path, root))
+        archive.seek(0)
+        return send_file(archive, mimetype='application/zip', as_attachment=True,
+                         download_name=f"sarfx_transactions_{stamp}.zip")
+
+    chunks = export_service.stream_transactions_parquet(**filters)
     return Response(
-        csv_data.getvalue(),
-        mimetype='text/csv',
-        headers={'Content-Disposition': f'attachment; filename={filename}'}
+        stream_with_context(chunks),
+        mimetype='application/vnd.apache.parquet',
+        headers={
+            'Content-Disposition': f'attachment; filename=sarfx_transactions_{stamp}.parquet',
+            'X-Accel-Buffering': 'no',
+            'Cache-Control': 'no-store',
+        }
     )
 
 
@@ -2572,135 +2641,170 @@ def export_transactions_csv():
 @login_required_api
 def export_users_csv():
     """Exporte les utilisateurs au format CSV (admin uniquement)"""
-    from flask import Response
-    from app.services.export_service import get_export_service
-
-    db = get_db()
-    user_id = session.get('user_id')
-    user = db.users.find_one({"_id": safe_object_id(user_id)}) if db is not None else None
+    from app.services.export_service import csv_response, get_export_service
 
-    if not user or user.get('role') != 'admin':
+    if get_current_role() != 'admin':
         return jsonify({"error": "Non autorisé"}), 403
 
     export_service = get_export_service()
-    csv_data = export_service.export_users_csv(
+    chunks = export_service.stream_users_csv(
         role=request.args.get('role'),
         kyc_status=request.args.get('kyc_status')
     )
 
     filename = f"sarfx_users_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-
-    return Response(
-        csv_data.getvalue(),
-        mimetype='text/csv',
-        headers={'Content-Disposition': f'attachment; filename={filename}'}
-    )
+    return csv_response(chunks, filename)
 
 
 @api_bp.route('/export/wallets.csv')
 @login_required_api
 def export_wallets_csv():
     """Exporte les wallets au format CSV"""
-    from flask import Response
-    from app.services.export_service import get_export_service
-
-    db = get_db()
-    user_id = session.get('user_id')
-    user = db.users.find_one({"_id": safe_object_id(user_id)}) if db is not None else None
+    from app.services.export_service import csv_response, get_export_service
 
-    is_admin = user and user.get('role') == 'admin'
+    user_id, is_admin = _export_scope()
     filter_user_id = None if is_admin else user_id
 
     export_service = get_export_service()
-    csv_data = export_service.export_wallets_csv(user_id=filter_user_id)
+    chunks = export_service.stream_wallets_csv(user_id=filter_user_id)
 
     filename = f"sarfx_wallets_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-
-    return Response(
-        csv_data.getvalue(),
-        mimetype='text/csv',
-        headers={'Content-Disposition': f'attachment; filename={filename}'}
-    )
+    return csv_response(chunks, filename)
 
 
 @api_bp.route('/export/beneficiaries.csv')
 @login_required_api
 def export_beneficiaries_csv():
     """Exporte les bénéficiaires au format CSV"""
-    from flask import Response
-    from app.services.export_service import get_export_service
+    from app.services.export_service import csv_response, get_export_service
 
     user_id = session.get('user_id')
 
     export_service = get_export_service()
-    csv_data = export_service.export_beneficiaries_csv(user_id=user_id)
+    chunks = export_service.stream_beneficiaries_csv(user_id=user_id)
 
     filename = f"sarfx_beneficiaries_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    return csv_response(chunks, filename)
 
-    return Response(
-        csv_data.getvalue(),
-        mimetype='text/csv',
-        headers={'Content-Disposition': f'attachment; filename={filename}'}
-    )
+
+def _export_scope():
+    """(utilisateur courant, périmètre exporté) : toutes les données pour un admin, les siennes sinon"""
+    return session.get('user_id'), get_current_role() == 'admin'
+
+
+def _export_job_page(kind, params, scope_user_id):
+    """
+    Lien direct vers un rapport : le rendu part dans la file du worker.
+    Fichier déjà prêt (demande identique récente) -> servi ; sinon page d'attente qui suit le job.
+    """
+    from flask import redirect, render_template, url_for
+    from app.services import export_jobs
+
+    try:
+        job, _ = export_jobs.enqueue(kind, params, session.get('user_id'), scope_user_id)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    if job['status'] == export_jobs.STATUS_DONE:
+        return redirect(url_for('api.download_export_job', job_id=job['_id']))
+    return render_template('export_pending.html', job=export_jobs.job_status(job),
+                           status_url=url_for('api.export_job_status', job_id=job['_id']),
+                           download_url=url_for('api.download_export_job', job_id=job['_id'])), 202
 
 
 @api_bp.route('/export/transactions.pdf')
 @login_required_api
 def export_transactions_pdf():
-    """Génère un rapport PDF des transactions (retourne HTML pour impression)"""
-    from flask import Response
-    from app.services.export_service import get_export_service
-    from datetime import timedelta
+    """Génère un rapport PDF des transactions (retourne HTML pour impression), rendu par le worker"""
+    user_id, is_admin = _export_scope()
+    return _export_job_page(
+        'transaction_report',
+        {'days': request.args.get('days', 30)},
+        None if is_admin else user_id
+    )
 
-    db = get_db()
-    user_id = session.get('user_id')
-    user = db.users.find_one({"_id": safe_object_id(user_id)}) if db is not None else None
 
-    is_admin = user and user.get('role') == 'admin'
-    filter_user_id = None if is_admin else user_id
+@api_bp.route('/export/wallet-statement.pdf')
+@login_required_api
+def export_wallet_statement():
+    """Génère un relevé de compte (retourne HTML pour impression), rendu par le worker"""
+    return _export_job_page(
+        'wallet_statement',
+        {'days': request.args.get('days', 30)},
+        session.get('user_id')
+    )
 
-    # Dates
-    start_date = None
-    end_date = None
-    days = request.args.get('days', 30)
-    if days:
-        end_date = datetime.utcnow()
-        start_date = end_date - timedelta(days=int(days))
 
-    export_service = get_export_service()
-    html_content = export_service.generate_transaction_report_html(
-        user_id=filter_user_id,
-        start_date=start_date,
-        end_date=end_date
-    )
+@api_bp.route('/export/jobs', methods=['POST'])
+@login_required_api
+def create_export_job():
+    """
+    Demande un export asynchrone.
 
-    return Response(
-        html_content,
-        mimetype='text/html',
-        headers={'Content-Type': 'text/html; charset=utf-8'}
-    )
+    Body JSON: {"kind": "transaction_report" | "wallet_statement" | "transactions_csv",
+                "days": 30, "status": "...", "currency": "..."}
+    """
+    from flask import url_for
+    from app.services import export_jobs
 
+    data = request.get_json(silent=True) or {}
+    kind = data.get('kind')
+    user_id, is_admin = _export_scope()
+    scope_user_id = None if is_admin and kind != 'wallet_statement' else user_id
 
-@api_bp.route('/export/wallet-statement.pdf')
+    try:
+        job, reused = export_jobs.enqueue(kind, data, user_id, scope_user_id)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    return jsonify({
+        "success": True,
+        "reused": reused,
+        "job": export_jobs.job_status(job),
+        "status_url": url_for('api.export_job_status', job_id=job['_id']),
+        "download_url": url_for('api.download_export_job', job_id=job['_id'])
+    }), 200 if job['status'] == export_jobs.STATUS_DONE else 202
+
+
+def _get_visible_export_job(job_id):
+    """Job demandé s'il appartient à l'utilisateur (ou à son périmètre), None sinon"""
+    from app.services import export_jobs
+
+    job = export_jobs.get_job(job_id)
+    if job is None:
+        return None
+    user_id, is_admin = _export_scope()
+    if is_admin or job.get('scope_user_id') == user_id:
+        return job
+    return None
+
+
+@api_bp.route('/export/jobs/<job_id>')
 @login_required_api
-def export_wallet_statement():
-    """Génère un relevé de compte (retourne HTML pour impression)"""
-    from flask import Response
-    from app.services.export_service import get_export_service
+def export_job_status(job_id):
+    """Progression d'un export asynchrone"""
+    from app.services import export_jobs
 
-    user_id = session.get('user_id')
-    period_days = int(request.args.get('days', 30))
+    job = _get_visible_export_job(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Export introuvable"}), 404
+    return jsonify({"success": True, "job": export_jobs.job_status(job)})
 
-    export_service = get_export_service()
-    html_content = export_service.generate_wallet_statement_html(
-        user_id=user_id,
-        period_days=period_days
-    )
 
-    return Response(
-        html_content,
-        mimetype='text/html',
-        headers={'Content-Type': 'text/html; charset=utf-8'}
+@api_bp.route('/export/jobs/<job_id>/download')
+@login_required_api
+def download_export_job(job_id):
+    """Fichier d'un export terminé (compressé si le client l'accepte, Range supporté)"""
+    from app.services import export_jobs
+
+    job = _get_visible_export_job(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Export introuvable"}), 404
+    if job['status'] != export_jobs.STATUS_DONE:
+        return jsonify({"success": False, "job": export_jobs.job_status(job)}), 409
+    return export_jobs.artifact_response(
+        job,
+        accept_encoding=request.headers.get('Accept-Encoding', ''),
+        as_attachment=request.args.get('download') == '1'
     )
 
 
@@ -2977,8 +3081,8 @@ def get_2fa_logs():
 
 def get_i18n_service():
     """Lazy import du service i18n pour éviter les imports circulaires"""
-    from app.services.i18n_service import I18nService
-    return I18nService()
+    from app.services.i18n_service import i18n
+    return i18n
 
 
 @api_bp.route('/language')
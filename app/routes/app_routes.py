@@ -3,7 +3,8 @@ from datetime import datetime
 import uuid
 from app.services.db_service import get_db
 from app.services.wallet_service import get_user_transactions, get_total_balance_in_usd
-from app.decorators import login_required, role_required, get_current_user, get_user_wallet
+from app.services.supplier_quotes import get_quote_engine
+from app.decorators import login_required, role_required, get_current_user, get_user_wallet, refresh_current_user
 
 app_bp = Blueprint('app', __name__)
 
@@ -20,15 +21,8 @@ def offline():
 
 
 def get_suppliers():
-    """Récupère tous les fournisseurs actifs"""
-    db = get_db()
-    if db is None:
-        return []
-    suppliers = list(db.suppliers.find({"is_active": True}))
-    # Convert ObjectId to string for JSON serialization
-    for s in suppliers:
-        s['_id'] = str(s['_id'])
-    return suppliers
+    """Récupère tous les fournisseurs actifs (table en mémoire du moteur de cotation, _id en chaîne)"""
+    return get_quote_engine().suppliers()
 
 def get_settings():
     """Récupère les paramètres de l'application"""
@@ -137,6 +131,7 @@ def converter():
                 }
             ]
             db.suppliers.insert_many(default_suppliers)
+            get_quote_engine().invalidate()
             suppliers = get_suppliers()
 
     # Récupérer le wallet pour afficher les soldes
@@ -149,7 +144,8 @@ def converter():
         wallet=wallet,
         initial_amount=initial_amount,
         initial_from=initial_from,
-        initial_to=initial_to
+        initial_to=initial_to,
+        idempotency_key=str(uuid.uuid4())
     )
 
 
@@ -396,7 +392,7 @@ def beneficiaries():
 @login_required
 def send_to_beneficiary(beneficiary_id):
     """Page et traitement de l'envoi d'argent à un bénéficiaire."""
-    from app.services.wallet_service import get_wallet_by_user_id, withdraw_from_wallet, VALID_CURRENCIES
+    from app.services.wallet_service import get_wallet_by_user_id, debit_wallet, VALID_CURRENCIES
     from bson import ObjectId
 
     user = get_current_user()
@@ -437,46 +433,30 @@ def send_to_beneficiary(beneficiary_id):
             flash('Le montant doit être supérieur à 0.', 'error')
             return redirect(url_for('app.send_to_beneficiary', beneficiary_id=beneficiary_id))
 
-        # Vérifier le solde disponible
-        balances = wallet.get('balances', {})
-        current_balance = float(balances.get(currency, 0))
-
-        if current_balance < amount:
-            flash(f'Solde insuffisant! Disponible: {current_balance:.2f} {currency}. Vous essayez d\'envoyer {amount:.2f} {currency}.', 'error')
-            return redirect(url_for('app.send_to_beneficiary', beneficiary_id=beneficiary_id))
-
-        # Effectuer le retrait (débit)
-        success, message = withdraw_from_wallet(
-            user_id=session['user_id'],
-            currency=currency,
-            amount=amount,
-            destination=f"beneficiary:{beneficiary_id}"
-        )
-
-        if not success:
-            flash(f'Erreur: {message}', 'error')
+        # Débit et enregistrement du transfert en une opération du grand livre
+        # (solde vérifié par le $inc conditionnel, pas de débit en double si le formulaire est renvoyé)
+        transfer_record = {
+            "transaction_id": f"TRF-{str(uuid.uuid4())[:8].upper()}",
+            "user_id": str(session['user_id']),
+            "beneficiary_id": beneficiary_id,
+            "beneficiary_name": beneficiary.get('name', 'Inconnu'),
+            "beneficiary_bank": beneficiary.get('bank', ''),
+            "beneficiary_iban": beneficiary.get('iban', ''),
+            "type": "transfer",
+            "currency": currency,
+            "amount": amount,
+            "note": note,
+            "destination": f"beneficiary:{beneficiary_id}",
+            "status": "completed",
+            "created_at": datetime.utcnow()
+        }
+        _, debit_error = debit_wallet(session['user_id'], currency, amount, transfer_record, kind='transfer',
+                                      idempotency_key=request.form.get('idempotency_key'))
+
+        if debit_error:
+            flash(f'Erreur: {debit_error}', 'error')
             return redirect(url_for('app.send_to_beneficiary', beneficiary_id=beneficiary_id))
 
-        # Enregistrer la transaction de transfert
-        try:
-            transfer_record = {
-                "transaction_id": f"TRF-{str(uuid.uuid4())[:8].upper()}",
-                "user_id": str(session['user_id']),
-                "beneficiary_id": beneficiary_id,
-                "beneficiary_name": beneficiary.get('name', 'Inconnu'),
-                "beneficiary_bank": beneficiary.get('bank', ''),
-                "beneficiary_iban": beneficiary.get('iban', ''),
-                "type": "transfer",
-                "currency": currency,
-                "amount": amount,
-                "note": note,
-                "status": "completed",
-                "created_at": datetime.utcnow()
-            }
-            db.transactions.insert_one(transfer_record)
-        except Exception as e:
-            print(f"Erreur enregistrement transaction: {e}")
-
         flash(f'✅ Transfert réussi! {amount:.2f} {currency} envoyé à {beneficiary.get("name", "Bénéficiaire")}.', 'success')
         return redirect(url_for('app.beneficiaries'))
 
@@ -486,7 +466,8 @@ def send_to_beneficiary(beneficiary_id):
         user=user,
         beneficiary=beneficiary,
         wallet=wallet,
-        currencies=VALID_CURRENCIES
+        currencies=VALID_CURRENCIES,
+        idempotency_key=str(uuid.uuid4())
     )
 
 
@@ -627,7 +608,8 @@ def wallet_swap():
             flash('Veuillez remplir tous les champs correctement.', 'error')
             return redirect(url_for('app.wallet_swap'))
 
-        result, swap_error = execute_swap(session['user_id'], from_currency, to_currency, amount)
+        result, swap_error = execute_swap(session['user_id'], from_currency, to_currency, amount,
+                                          idempotency_key=request.form.get('idempotency_key'))
 
         if swap_error:
             flash(swap_error, 'error')
@@ -646,7 +628,8 @@ def wallet_swap():
         user=user,
         wallet=wallet,
         swap_rates=swap_rates or [],
-        currencies=VALID_CURRENCIES
+        currencies=VALID_CURRENCIES,
+        idempotency_key=str(uuid.uuid4())
     )
 
 
@@ -714,7 +697,8 @@ def wallet_recharge():
             currency=currency,
             amount=amount,
             source='card',
-            reference=payment_reference
+            reference=payment_reference,
+            idempotency_key=request.form.get('idempotency_key')
         )
 
         if not success:
@@ -729,7 +713,8 @@ def wallet_recharge():
         active_tab='wallets',
         user=user,
         wallet=wallet,
-        currencies=VALID_CURRENCIES
+        currencies=VALID_CURRENCIES,
+        idempotency_key=str(uuid.uuid4())
     )
 
 
@@ -908,6 +893,7 @@ def associate_bank():
         bank_code = request.form.get('bank_code')
         if bank_code:
             db.users.update_one({"_id": user['_id']}, {"$set": {"bank_code": bank_code, "role": "bank_user"}})
+            refresh_current_user()
             flash("Association à la banque réussie !", "success")
             return redirect(url_for('app.bank_settings'))
         else:
@@ -1,5 +1,6 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app
 from app.services.db_service import get_db, log_history
+from app.services import metrics_service
 from app.services.email_service import send_verification_email, send_password_reset_email
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
@@ -117,6 +118,7 @@ def google_callback():
                 "auth_provider": "google"
             }
             result = db.users.insert_one(user_doc)
+            metrics_service.record_signup(user_doc, db)
 
             # Create wallet for new user
             from app.services.wallet_service import create_wallet
@@ -315,6 +317,7 @@ def register():
                 "auth_provider": "email"
             }
             result = db.users.insert_one(user_doc)
+            metrics_service.record_signup(user_doc, db)
 
             # Créer un wallet pour le nouvel utilisateur
             from app.services.wallet_service import create_wallet
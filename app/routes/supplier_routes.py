@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from app.decorators import login_required
 from app.services.db_service import get_db, log_history
+from app.services.supplier_quotes import get_quote_engine
 from bson.objectid import ObjectId
 
 supplier_bp = Blueprint('suppliers', __name__, url_prefix='/suppliers')
@@ -20,6 +21,7 @@ def add_supplier():
     
     db = get_db()
     db.suppliers.insert_one({"name": name, "api_url": api_url, "status": "active"})
+    get_quote_engine().invalidate()
     
     log_history("ADD_SUPPLIER", f"Added supplier {name}")
     flash("Supplier added", "success")
@@ -30,5 +32,6 @@ def add_supplier():
 def delete_supplier(id):
     db = get_db()
     db.suppliers.delete_one({"_id": ObjectId(id)})
+    get_quote_engine().invalidate()
     log_history("DELETE_SUPPLIER", f"Deleted supplier {id}")
     return redirect(url_for('suppliers.list_suppliers'))
\ No newline at end of file
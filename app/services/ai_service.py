@@ -6,9 +6,13 @@ import requests
 import logging
 from datetime import datetime, timedelta
 from app.services.db_service import get_db
+from app.services.single_flight import single_flight
 
 logger = logging.getLogger(__name__)
 
+# Durée de fraîcheur des prévisions dans le cache partagé (secondes)
+PREDICTION_CACHE_TTL = 600
+
 # URL du backend IA local uniquement (port 8087)
 DEFAULT_AI_URL = os.environ.get(
     "AI_BACKEND_URL", 
@@ -86,42 +90,28 @@ def fetch_prediction(pair='EURUSD=X', timeout=30):
     Returns:
         dict avec les prévisions ou données simulées si erreur
     """
+    from app.services.rate_cache import get_rate_cache
+
     url = get_ai_backend_url()
-    
-    try:
-        headers = {
-            'User-Agent': 'SarfX-App/1.0'
-        }
-        
-        logger.info(f"Calling AI backend: {url}")
-        response = requests.get(
-            f"{url}/predict/{pair}",
-            headers=headers,
-            timeout=timeout
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            logger.info(f"AI backend {url} responded successfully")
-            
-            # Cache the result
+    loaded = []
+
+    def _load():
+        data = _fetch_prediction_from_backend(url, pair, timeout)
+        if data is not None:
+            loaded.append(True)
+            # Cache the result (fallback durable si le backend tombe)
             cache_prediction(pair, data)
-            
-            return {
-                'success': True,
-                'data': data,
-                'cached': False,
-                'timestamp': datetime.utcnow().isoformat(),
-                'source': url
-            }
-        else:
-            logger.warning(f"AI backend {url} returned status {response.status_code}")
-    except requests.exceptions.Timeout as e:
-        logger.warning(f"Timeout connecting to {url}: {e}")
-    except requests.exceptions.ConnectionError as e:
-        logger.warning(f"Connection error to {url}: {e}")
-    except Exception as e:
-        logger.warning(f"Error with {url}: {e}")
+        return data
+
+    data = get_rate_cache().get_or_load(f"prediction:{pair}", _load, ttl=PREDICTION_CACHE_TTL)
+    if data is not None:
+        return {
+            'success': True,
+            'data': data,
+            'cached': not loaded,
+            'timestamp': datetime.utcnow().isoformat(),
+            'source': url
+        }
     
     # Backend failed, try cache
     cached = get_cached_prediction(pair)
@@ -146,6 +136,35 @@ def fetch_prediction(pair='EURUSD=X', timeout=30):
     }
 
 
+# Un seul appel /predict par backend et par paire à la fois (voir single_flight.py)
+@single_flight('ai-predict', key=lambda url, pair, timeout: f"{url}:{pair}", lease_ms=30000)
+def _fetch_prediction_from_backend(url, pair, timeout):
+    """Appelle /predict/{pair} sur le backend IA (None si indisponible)"""
+    try:
+        headers = {
+            'User-Agent': 'SarfX-App/1.0'
+        }
+        
+        logger.info(f"Calling AI backend: {url}")
+        response = requests.get(
+            f"{url}/predict/{pair}",
+            headers=headers,
+            timeout=timeout
+        )
+        
+        if response.status_code == 200:
+            logger.info(f"AI backend {url} responded successfully")
+            return response.json()
+        logger.warning(f"AI backend {url} returned status {response.status_code}")
+    except requests.exceptions.Timeout as e:
+        logger.warning(f"Timeout connecting to {url}: {e}")
+    except requests.exceptions.ConnectionError as e:
+        logger.warning(f"Connection error to {url}: {e}")
+    except Exception as e:
+        logger.warning(f"Error with {url}: {e}")
+    return None
+
+
 def cache_prediction(pair, data):
     """Cache les prévisions dans MongoDB"""
     db = get_db()
@@ -0,0 +1,246 @@
+"""
+Index en mémoire des seuils d'alertes de taux (par paire de devises)
+
+Pour chaque paire, deux listes triées de seuils :
+- "above" : déclenchée quand taux >= seuil  (above, borne haute de change_percent)
+- "below" : déclenchée quand taux <= seuil  (below, borne basse de change_percent)
+À chaque tick, une recherche dichotomique donne directement les alertes franchies :
+le travail dépend du nombre d'alertes déclenchées, pas du nombre total d'alertes.
+Les résumés quotidiens sont rangés dans un tas par date d'échéance.
+
+Synchronisation:
+- Hooks d'écriture de RateAlertService (create/update/delete) dans le process courant
+- Delta sur rate_alerts.updated_at à chaque tick pour les écritures des autres process
+"""
+import heapq
+import logging
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Chevauchement du delta de synchronisation (écritures en vol, décalage d'horloge)
+SYNC_OVERLAP = timedelta(seconds=5)
+
+# Champs conservés par alerte indexée (suffisants pour la déclencher)
+INDEX_FIELDS = {
+    "alert_id": 1, "user_id": 1, "pair": 1, "from_currency": 1, "to_currency": 1,
+    "alert_type": 1, "target_rate": 1, "current_rate_at_creation": 1, "status": 1,
+    "last_triggered": 1, "expiry_date": 1, "notification_channels": 1, "updated_at": 1
+}
+
+
+class _PairIndex:
+    """Seuils triés d'une paire : listes parallèles (seuil, _id) par côté"""
+
+    def __init__(self):
+        self.sides = {"above": ([], []), "below": ([], [])}
+        self.daily = []  # tas (échéance, _id)
+
+    def add(self, side: str, threshold: float, alert_id):
+        thresholds, ids = self.sides[side]
+        position = bisect_right(thresholds, threshold)
+        thresholds.insert(position, threshold)
+        ids.insert(position, alert_id)
+
+    def remove(self, side: str, threshold: float, alert_id):
+        thresholds, ids = self.sides[side]
+        position = bisect_left(thresholds, threshold)
+        while position < len(thresholds) and thresholds[position] == threshold:
+            if ids[position] == alert_id:
+                del thresholds[position]
+                del ids[position]
+                return
+            position += 1
+
+    def crossed(self, rate: float) -> List:
+        """_id des alertes dont le seuil est franchi au taux donné"""
+        above_thresholds, above_ids = self.sides["above"]
+        below_thresholds, below_ids = self.sides["below"]
+        return above_ids[:bisect_right(above_thresholds, rate)] + below_ids[bisect_left(below_thresholds, rate):]
+
+    def size(self) -> int:
+        return len(self.sides["above"][0]) + len(self.sides["below"][0]) + len(self.daily)
+
+
+class AlertThresholdIndex:
+    """Index des alertes actives : seuils triés par paire + échéances des résumés quotidiens"""
+
+    def __init__(self, cooldown: timedelta = timedelta(hours=1)):
+        self.cooldown = cooldown
+        self._pairs: Dict[Tuple[str, str], _PairIndex] = {}
+        self._alerts: Dict = {}
+        self._entries: Dict = {}
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._synced_until: Optional[datetime] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    # =====================================================
+    # SYNCHRONISATION
+    # =====================================================
+
+    def sync(self, db):
+        """Chargement complet au premier appel, puis delta sur updated_at"""
+        started = datetime.utcnow()
+        if not self._loaded:
+            query = {"status": "active"}
+        else:
+            query = {"updated_at": {"$gte": self._synced_until - SYNC_OVERLAP}}
+
+        count = 0
+        for alert in db.rate_alerts.find(query, projection=INDEX_FIELDS):
+            self.apply(alert)
+            count += 1
+
+        if not self._loaded:
+            logger.info(f"Alert index loaded: {len(self._alerts)} active alerts, {len(self._pairs)} pairs")
+        elif count:
+            logger.debug(f"Alert index synced: {count} changed alerts")
+        self._loaded = True
+        self._synced_until = started
+
+    def apply(self, alert: Dict):
+        """Hook d'écriture : (ré)indexe une alerte, ou la retire si elle n'est plus active"""
+        with self._lock:
+            self.remove(alert["_id"])
+            if alert.get("status") != "active":
+                return
+
+            pair = (alert.get("from_currency"), alert.get("to_currency"))
+            if not all(pair):
+                return
+
+            entries = self._index_entries(alert)
+            if not entries:
+                return
+
+            index = self._pairs.setdefault(pair, _PairIndex())
+            for side, value in entries:
+                if side == "daily":
+                    heapq.heappush(index.daily, (value, alert["_id"]))
+                else:
+                    index.add(side, value, alert["_id"])
+
+            self._alerts[alert["_id"]] = alert
+            self._entries[alert["_id"]] = (pair, entries)
+
+    def remove(self, alert_id):
+        """Retire une alerte de l'index (les entrées du tas quotidien sont purgées paresseusement)"""
+        with self._lock:
+            self._alerts.pop(alert_id, None)
+            indexed = self._entries.pop(alert_id, None)
+            if indexed is None:
+                return
+            pair, entries = indexed
+            for side, value in entries:
+                if side != "daily":
+                    self._pairs[pair].remove(side, value, alert_id)
+
+    def _index_entries(self, alert: Dict) -> List[Tuple[str, float]]:
+        alert_type = alert.get("alert_type")
+        target = float(alert.get("target_rate") or 0)
+
+        if alert_type == "above":
+            return [("above", target)]
+        if alert_type == "below":
+            return [("below", target)]
+        if alert_type == "change_percent":
+            # |taux - origine| / origine >= target%  <=>  taux hors de [bas, haut]
+            origin = alert.get("current_rate_at_creation")
+            if not origin:
+                return []
+            return [("above", origin * (1 + target / 100)), ("below", origin * (1 - target / 100))]
+        if alert_type == "daily_summary":
+            return [("daily", self._daily_due(alert.get("last_triggered")))]
+        return []
+
+    def _daily_due(self, last_triggered: Optional[datetime]) -> datetime:
+        """Prochain envoi d'un résumé quotidien : lendemain du dernier envoi"""
+        if not last_triggered:
+            return datetime.min
+        next_day = datetime.combine(last_triggered.date() + timedelta(days=1), datetime.min.time())
+        return max(next_day, last_triggered + self.cooldown)
+
+    # =====================================================
+    # TICK
+    # =====================================================
+
+    def pairs(self) -> List[Tuple[str, str]]:
+        return list(self._pairs)
+
+    def crossed(self, rate_for: Callable[[str, str], Optional[float]], now: datetime) -> List[Tuple[Dict, float]]:
+        """
+        Alertes à déclencher pour ce tick.
+
+        Args:
+            rate_for: (from, to) -> taux courant (None = paire ignorée)
+
+        Returns:
+            [(alerte, taux)]
+        """
+        triggered = []
+        with self._lock:
+            for pair, index in self._pairs.items():
+                rate = rate_for(*pair)
+                if rate is None:
+                    continue
+
+                candidates = dict.fromkeys(index.crossed(rate))
+                # Résumés quotidiens arrivés à échéance
+                while index.daily and index.daily[0][0] <= now:
+                    _, alert_id = heapq.heappop(index.daily)
+                    if alert_id in self._alerts:
+                        candidates[alert_id] = None
+
+                for alert_id in candidates:
+                    alert = self._alerts.get(alert_id)
+                    if alert is None or not self._is_due(alert, now):
+                        continue
+                    triggered.append((alert, rate))
+        return triggered
+
+    def _is_due(self, alert: Dict, now: datetime) -> bool:
+        expiry_date = alert.get("expiry_date")
+        if expiry_date and expiry_date < now:
+            self.remove(alert["_id"])
+            return False
+        last_triggered = alert.get("last_triggered")
+        return not (last_triggered and now - last_triggered < self.cooldown)
+
+    def mark_triggered(self, triggered: List[Tuple[Dict, float]], now: datetime):
+        """Met à jour l'index après déclenchement (one-time retirées, récurrentes en cooldown)"""
+        for alert, rate in triggered:
+            if alert["alert_type"] in ("above", "below"):
+                self.remove(alert["_id"])
+            else:
+                self.apply({**alert, "last_triggered": now, "last_triggered_rate": rate})
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "loaded": self._loaded,
+                "alerts": len(self._alerts),
+                "pairs": len(self._pairs),
+                "entries": sum(index.size() for index in self._pairs.values()),
+                "synced_until": self._synced_until.isoformat() if self._synced_until else None
+            }
+
+
+_alert_index = None
+_alert_index_lock = threading.Lock()
+
+
+def get_alert_index() -> AlertThresholdIndex:
+    """Index partagé du process"""
+    global _alert_index
+    if _alert_index is None:
+        with _alert_index_lock:
+            if _alert_index is None:
+                _alert_index = AlertThresholdIndex()
+    return _alert_index
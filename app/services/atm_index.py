@@ -0,0 +1,335 @@
+"""
+Index spatial en mémoire des distributeurs (collection atm_locations)
+
+Les ATM sont peu nombreux et rarement modifiés : chaque process garde une copie
+en tableaux NumPy (latitude/longitude en radians, banque, statut) rangée
+dans une grille de cellules de CELL_DEG degrés.
+- Requête de rayon : seules les cellules qui recouvrent le rayon sont lues, puis
+  haversine vectorisée sur les candidats
+- k plus proches : même chose, puis argpartition sur les distances
+Aucune requête MongoDB sur le chemin de lecture une fois l'index chargé.
+
+Synchronisation:
+- Chargement complet au premier accès du process (après le fork gunicorn)
+- Rechargement en arrière-plan toutes les ATM_INDEX_REFRESH_SECONDS (écritures
+  des autres process), ou aussitôt après une écriture du process (invalidate)
+- Chaque rechargement construit un nouvel instantané, échangé d'un bloc :
+  les lectures ne prennent jamais de verrou
+"""
+import heapq
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+
+# Côté d'une cellule de la grille (~22 km en latitude)
+CELL_DEG = 0.2
+
+# Statut par défaut des requêtes (None = tous les statuts)
+DEFAULT_STATUS = 'active'
+
+# Points acceptés par requête groupée
+MAX_BATCH_POINTS = 500
+
+# Champs de la recherche textuelle
+SEARCH_FIELDS = ('name', 'address', 'city', 'district')
+
+KM_PER_DEG = math.pi * EARTH_RADIUS_KM / 180
+
+
+def _get_db():
+    from app.services.db_service import get_db, get_pooled_db
+    try:
+        return get_db()
+    except RuntimeError:
+        # Hors contexte Flask (thread de rechargement) : client partagé du process
+        return get_pooled_db()
+
+
+def _config(name, default):
+    from app.config import Config
+    return getattr(Config, name, default)
+
+
+def _coordinates(atm: Dict) -> Optional[Tuple[float, float]]:
+    """(latitude, longitude) d'un ATM : GeoJSON location.coordinates [lon, lat], sinon latitude/longitude"""
+    coords = (atm.get('location') or {}).get('coordinates') or []
+    try:
+        if len(coords) == 2:
+            return float(coords[1]), float(coords[0])
+        if atm.get('latitude') is not None and atm.get('longitude') is not None:
+            return float(atm['latitude']), float(atm['longitude'])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Distances (km) d'un point à un ensemble de points, tous en radians"""
+    a = (np.sin((lats - lat) / 2) ** 2
+         + math.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _match_rank(value: str, term: str) -> int:
+    """0 : le champ commence par term, 1 : un mot commence par term, 2 : contient term, 3 : absent"""
+    position = value.find(term)
+    if position < 0:
+        return 3
+    if position == 0:
+        return 0
+    if not value[position - 1].isalnum() or f' {term}' in value:
+        return 1
+    return 2
+
+
+def with_travel_times(atm: Dict, distance: float) -> Dict:
+    """Copie de l'ATM avec distance et temps de trajet estimés (3 km/h à pied, 30 km/h en ville)"""
+    distance = round(float(distance), 2)
+    return {
+        **atm,
+        'distance_km': distance,
+        'walk_time_min': round(distance * 20),
+        'drive_time_min': round(distance * 2),
+    }
+
+
+class _Snapshot:
+    """Instantané immuable de l'index : tableaux parallèles + grille cellule -> positions"""
+
+    def __init__(self, atms: List[Dict]):
+        located = [(atm, _coordinates(atm)) for atm in atms]
+        located = [(atm, coords) for atm, coords in located if coords is not None]
+
+        self.atms = [atm for atm, _ in located]
+        self.unlocated = [atm for atm in atms if _coordinates(atm) is None]
+
+        degrees = np.array([coords for _, coords in located], dtype=np.float64).reshape(-1, 2)
+        self.lat = np.radians(degrees[:, 0])
+        self.lon = np.radians(degrees[:, 1])
+        self.bank = np.array([atm.get('bank_code') for atm in self.atms], dtype=object)
+        self.status = np.array([atm.get('status') for atm in self.atms], dtype=object)
+
+        cells = np.floor(degrees / CELL_DEG).astype(np.int64)
+        self.cells: Dict[Tuple[int, int], np.ndarray] = {}
+        if len(cells):
+            order = np.lexsort((cells[:, 1], cells[:, 0]))
+            keys, starts = np.unique(cells[order], axis=0, return_index=True)
+            for key, chunk in zip(keys, np.split(order, starts[1:])):
+                self.cells[(int(key[0]), int(key[1]))] = chunk
+
+    def __len__(self) -> int:
+        return len(self.atms)
+
+    def candidates(self, lat_deg: float, lon_deg: float, radius_km: Optional[float]) -> np.ndarray:
+        """Positions des ATM des cellules recouvrant le cercle (tout l'index si rayon inconnu ou très grand)"""
+        everything = np.arange(len(self.atms))
+        if radius_km is None:
+            return everything
+
+        dlat = radius_km / KM_PER_DEG
+        cos_lat = math.cos(math.radians(min(abs(lat_deg) + dlat, 89.9)))
+        dlon = radius_km / (KM_PER_DEG * cos_lat)
+        if dlon >= 180:
+            return everything
+
+        lat_range = range(math.floor((lat_deg - dlat) / CELL_DEG), math.floor((lat_deg + dlat) / CELL_DEG) + 1)
+        lon_low, lon_high = math.floor((lon_deg - dlon) / CELL_DEG), math.floor((lon_deg + dlon) / CELL_DEG)
+        if len(lat_range) * (lon_high - lon_low + 1) > len(self.cells):
+            return everything
+
+        found = [self.cells[(i, j)] for i in lat_range for j in range(lon_low, lon_high + 1) if (i, j) in self.cells]
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+
+class ATMSpatialIndex:
+    """Index des ATM du process : plus proches voisins, rayon et filtres en mémoire"""
+
+    def __init__(self, refresh_seconds: Optional[int] = None):
+        self.refresh_seconds = refresh_seconds
+        self._snapshot: Optional[_Snapshot] = None
+        self._loaded_at: Optional[float] = None
+        self._load_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._refresher_pid = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._snapshot is not None
+
+    # =====================================================
+    # CHARGEMENT
+    # =====================================================
+
+    def load(self, db=None) -> int:
+        """(Re)construit l'index depuis atm_locations"""
+        db = db if db is not None else _get_db()
+        started = time.monotonic()
+        atms = list(db.atm_locations.find({}, {'_id': 0}))
+        snapshot = _Snapshot(atms)
+        self._snapshot = snapshot
+        self._loaded_at = time.time()
+        logger.info(f"ATM index loaded: {len(snapshot)} located ATMs, {len(snapshot.cells)} cells "
+                    f"in {(time.monotonic() - started) * 1000:.0f}ms")
+        return len(snapshot)
+
+    def snapshot(self) -> _Snapshot:
+        """Instantané courant (chargement synchrone au premier accès du process)"""
+        self._ensure_refresher()
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._load_lock:
+                if self._snapshot is None:
+                    self.load()
+            snapshot = self._snapshot
+        return snapshot
+
+    def invalidate(self):
+        """Hook d'écriture : recharge en arrière-plan (les lectures servent l'ancien instantané d'ici là)"""
+        if self._snapshot is not None:
+            self._ensure_refresher()
+            self._wake.set()
+
+    def _ensure_refresher(self):
+        if self._refresher_pid == os.getpid():
+            return
+        with self._load_lock:
+            if self._refresher_pid == os.getpid():
+                return
+            # Après un fork : le thread du parent n'existe plus dans ce process
+            self._refresher_pid = os.getpid()
+            thread = threading.Thread(target=self._refresh_loop, name='atm-index-refresh', daemon=True)
+            thread.start()
+
+    def _refresh_loop(self):
+        interval = self.refresh_seconds or int(_config('ATM_INDEX_REFRESH_SECONDS', 300))
+        while True:
+            woken = self._wake.wait(interval)
+            self._wake.clear()
+            if self._snapshot is None and not woken:
+                continue
+            try:
+                with self._load_lock:
+                    self.load()
+            except Exception as e:
+                logger.warning(f"ATM index refresh failed: {e}")
+
+    # =====================================================
+    # REQUÊTES
+    # =====================================================
+
+    def _mask(self, snapshot: _Snapshot, positions: np.ndarray, bank_code: Optional[str],
+              status: Optional[str]) -> np.ndarray:
+        if bank_code:
+            positions = positions[snapshot.bank[positions] == bank_code]
+        if status:
+            positions = positions[snapshot.status[positions] == status]
+        return positions
+
+    def nearest(self, latitude: float, longitude: float, bank_code: Optional[str] = None,
+                max_distance_km: Optional[float] = 10, limit: Optional[int] = 10,
+                status: Optional[str] = DEFAULT_STATUS) -> List[Dict]:
+        """
+        ATM les plus proches d'un point, triés par distance
+
+        Args:
+            max_distance_km: Rayon de recherche (None = sans limite)
+            limit: Nombre maximum d'ATM (None = tous ceux du rayon)
+            status: Statut exigé (None = tous)
+        """
+        snapshot = self.snapshot()
+        positions = self._mask(snapshot, snapshot.candidates(latitude, longitude, max_distance_km),
+                               bank_code, status)
+        if not len(positions):
+            return []
+
+        distances = haversine_km(math.radians(latitude), math.radians(longitude),
+                                 snapshot.lat[positions], snapshot.lon[positions])
+        if max_distance_km is not None:
+            inside = distances <= max_distance_km
+            positions, distances = positions[inside], distances[inside]
+        if limit and len(distances) > limit:
+            top = np.argpartition(distances, limit - 1)[:limit]
+            positions, distances = positions[top], distances[top]
+        order = np.argsort(distances, kind='stable')
+        return [with_travel_times(snapshot.atms[positions[i]], distances[i]) for i in order]
+
+    def nearest_many(self, points: Iterable[Tuple[float, float]], **kwargs) -> List[List[Dict]]:
+        """nearest() pour plusieurs points sur le même instantané"""
+        return [self.nearest(latitude, longitude, **kwargs) for latitude, longitude in points]
+
+    def within_radius(self, latitude: float, longitude: float, radius_km: float, **kwargs) -> List[Dict]:
+        """Tous les ATM du rayon, triés par distance"""
+        return self.nearest(latitude, longitude, max_distance_km=radius_km, limit=None, **kwargs)
+
+    def filter(self, city: Optional[str] = None, bank_code: Optional[str] = None,
+               status: Optional[str] = DEFAULT_STATUS, limit: Optional[int] = None) -> List[Dict]:
+        """ATM par ville / banque / statut (ordre de la collection)"""
+        snapshot = self.snapshot()
+        results = []
+        for atm in list(snapshot.atms) + snapshot.unlocated:
+            if city and atm.get('city') != city:
+                continue
+            if bank_code and atm.get('bank_code') != bank_code:
+                continue
+            if status and atm.get('status') != status:
+                continue
+            results.append(dict(atm))
+            if limit and len(results) >= limit:
+                break
+        return results
+
+    def search(self, term: str, bank_code: Optional[str] = None, status: Optional[str] = DEFAULT_STATUS,
+               limit: int = 20, fields: Tuple[str, ...] = SEARCH_FIELDS) -> List[Dict]:
+        """
+        ATM dont un des `fields` contient `term` (insensible à la casse), les meilleures
+        correspondances d'abord : début de champ, puis début de mot, puis ailleurs
+        """
+        term = (term or '').strip().lower()
+        if not term:
+            return []
+
+        def matches():
+            snapshot = self.snapshot()
+            for position, atm in enumerate(snapshot.atms + snapshot.unlocated):
+                if bank_code and atm.get('bank_code') != bank_code:
+                    continue
+                if status and atm.get('status') != status:
+                    continue
+                rank = min((_match_rank(str(atm.get(name) or '').lower(), term) for name in fields), default=3)
+                if rank < 3:
+                    yield rank, position, atm
+
+        return [dict(atm) for _, _, atm in heapq.nsmallest(limit, matches(), key=lambda match: match[:2])]
+
+    def stats(self) -> Dict:
+        snapshot = self._snapshot
+        return {
+            'loaded': snapshot is not None,
+            'atms': len(snapshot) if snapshot else 0,
+            'unlocated': len(snapshot.unlocated) if snapshot else 0,
+            'cells': len(snapshot.cells) if snapshot else 0,
+            'loaded_at': self._loaded_at,
+        }
+
+
+_atm_index = None
+_atm_index_lock = threading.Lock()
+
+
+def get_atm_index() -> ATMSpatialIndex:
+    """Index partagé du process"""
+    global _atm_index
+    if _atm_index is None:
+        with _atm_index_lock:
+            if _atm_index is None:
+                _atm_index = ATMSpatialIndex()
+    return _atm_index
@@ -8,6 +8,10 @@ from bson import ObjectId
 import math
 from datetime import datetime
 
+from app.services.atm_index import get_atm_index
+
+_indexes_ready = False
+
 
 class ATMService:
     """Service pour gérer les ATM et calculer les distances"""
@@ -19,16 +23,19 @@ class ATMService:
         Args:
             db: Instance de la base de données MongoDB
         """
+        global _indexes_ready
         self.db = db
         self.atms = db.atm_locations
         
-        # Créer les index pour optimiser les requêtes géospatiales
-        try:
-            self.atms.create_index([("location", "2dsphere")])
-            self.atms.create_index([("bank_code", ASCENDING)])
-            self.atms.create_index([("city", ASCENDING)])
-        except Exception as e:
-            print(f"Index déjà créés ou erreur: {e}")
+        # Créer les index (une fois par process)
+        if not _indexes_ready:
+            try:
+                self.atms.create_index([("location", "2dsphere")])
+                self.atms.create_index([("bank_code", ASCENDING)])
+                self.atms.create_index([("city", ASCENDING)])
+                _indexes_ready = True
+            except Exception as e:
+                print(f"Index déjà créés ou erreur: {e}")
     
     def calculate_distance(self, lat1, lon1, lat2, lon2):
         """
@@ -173,12 +180,7 @@ class ATMService:
             list: Liste des ATM
         """
         try:
-            query = {"city": city, "status": "active"}
-            if bank_code:
-                query["bank_code"] = bank_code
-            
-            atms = list(self.atms.find(query, {"_id": 0}))
-            return atms
+            return get_atm_index().filter(city=city, bank_code=bank_code)
         except Exception as e:
             print(f"Erreur lors de la récupération des ATM par ville: {e}")
             return []
@@ -198,39 +200,8 @@ class ATMService:
             list: Liste des ATM triés par distance
         """
         try:
-            # Requête de proximité géospatiale
-            query = {
-                "location": {
-                    "$near": {
-                        "$geometry": {
-                            "type": "Point",
-                            "coordinates": [longitude, latitude]
-                        },
-                        "$maxDistance": max_distance_km * 1000  # Convertir km en mètres
-                    }
-                },
-                "status": "active"
-            }
-            
-            if bank_code:
-                query["bank_code"] = bank_code
-            
-            atms = list(self.atms.find(query, {"_id": 0}).limit(limit))
-            
-            # Calculer la distance exacte pour chaque ATM
-            for atm in atms:
-                coords = atm.get('location', {}).get('coordinates', [])
-                if len(coords) == 2:
-                    atm_lon, atm_lat = coords
-                    distance = self.calculate_distance(latitude, longitude, atm_lat, atm_lon)
-                    atm['distance_km'] = distance
-                    
-                    # Ajouter un temps de trajet estimé (3 km/h à pied, 30 km/h en ville)
-                    atm['walk_time_min'] = round(distance * 20)  # ~3 km/h
-                    atm['drive_time_min'] = round(distance * 2)  # ~30 km/h
-            
-            return atms
-            
+            # Index spatial en mémoire (atm_index.py) : pas d'aller-retour MongoDB
+            return get_atm_index().nearest(latitude, longitude, bank_code, max_distance_km, limit)
         except Exception as e:
             print(f"Erreur lors de la recherche des ATM proches: {e}")
             return []
@@ -277,6 +248,7 @@ class ATMService:
             
             result = self.atms.insert_one(atm_data)
             atm_data['_id'] = str(result.inserted_id)
+            get_atm_index().invalidate()
             
             return atm_data
         except Exception as e:
@@ -300,6 +272,7 @@ class ATMService:
                 {"atm_id": atm_id},
                 {"$set": update_data}
             )
+            get_atm_index().invalidate()
             return result.modified_count > 0
         except Exception as e:
             print(f"Erreur lors de la mise à jour de l'ATM: {e}")
@@ -320,6 +293,7 @@ class ATMService:
                 {"atm_id": atm_id},
                 {"$set": {"status": "inactive", "deleted_at": datetime.now()}}
             )
+            get_atm_index().invalidate()
             return result.modified_count > 0
         except Exception as e:
             print(f"Erreur lors de la suppression de l'ATM: {e}")
@@ -337,21 +311,7 @@ class ATMService:
             list: Liste des ATM correspondants
         """
         try:
-            query = {
-                "$or": [
-                    {"name": {"$regex": search_term, "$options": "i"}},
-                    {"address": {"$regex": search_term, "$options": "i"}},
-                    {"city": {"$regex": search_term, "$options": "i"}},
-                    {"district": {"$regex": search_term, "$options": "i"}}
-                ],
-                "status": "active"
-            }
-            
-            if bank_code:
-                query["bank_code"] = bank_code
-            
-            atms = list(self.atms.find(query, {"_id": 0}).limit(20))
-            return atms
+            return get_atm_index().search(search_term, bank_code, limit=20)
         except Exception as e:
             print(f"Erreur lors de la recherche d'ATM: {e}")
             return []
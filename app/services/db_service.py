@@ -1,43 +1,108 @@
 from pymongo import MongoClient
-from flask import current_app, g, session
+from flask import current_app, g, has_app_context, session
 from bson import ObjectId
 from bson.errors import InvalidId
 import os
+import threading
 
-def get_db():
+# ============================================================
+# REGISTRE DE CLIENTS MONGODB (POOL PAR PROCESS)
+# ============================================================
+# Un MongoClient possède déjà son propre pool de connexions : on en garde un
+# seul par (URI, options TLS) et par process. Sous gunicorn, chaque worker
+# forké repart d'un registre vide (les clients PyMongo ne survivent pas au fork).
+
+_clients = {}
+_clients_lock = threading.Lock()
+_clients_pid = os.getpid()
+
+
+def _reset_clients_after_fork():
+    """Oublie les clients hérités du process parent (sans les fermer)"""
+    global _clients, _clients_lock, _clients_pid
+    _clients = {}
+    _clients_lock = threading.Lock()
+    _clients_pid = os.getpid()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_clients_after_fork)
+
+
+def _get_config():
+    """Config Flask si disponible, sinon la classe Config (scripts, jobs)"""
+    if has_app_context():
+        return current_app.config
+    from app.config import Config
+    return {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+
+
+def get_mongo_client(mongo_uri=None):
     """
-    Récupère ou crée une connexion MongoDB.
+    Retourne le MongoClient partagé pour cette URI (créé au premier appel).
     Supporte MongoDB Atlas (avec SSL) et MongoDB local (Docker).
 
     Variables d'environnement:
         MONGO_LOCAL: "true" pour connexion locale sans SSL
         MONGO_URI: URI de connexion MongoDB
     """
-    if 'db' not in g:
-        try:
-            mongo_uri = current_app.config['MONGO_URI']
-            is_local = os.environ.get('MONGO_LOCAL', 'false').lower() == 'true'
-
-            if is_local:
-                # Connexion locale (Docker) - pas de SSL
-                client = MongoClient(
-                    mongo_uri,
-                    serverSelectionTimeoutMS=5000,
-                    connectTimeoutMS=10000
-                )
-            else:
+    config = _get_config()
+    mongo_uri = mongo_uri or os.environ.get('MONGO_URI') or config.get('MONGO_URI')
+    if not mongo_uri:
+        return None
+
+    is_local = os.environ.get('MONGO_LOCAL', 'false').lower() == 'true'
+    tls_ca_file = None
+    if not is_local:
+        import certifi
+        tls_ca_file = certifi.where()
+
+    key = (mongo_uri, tls_ca_file)
+    if _clients_pid != os.getpid():
+        _reset_clients_after_fork()
+
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            options = {
+                'maxPoolSize': config.get('MONGO_MAX_POOL_SIZE', 50),
+                'minPoolSize': config.get('MONGO_MIN_POOL_SIZE', 0),
+                'maxIdleTimeMS': config.get('MONGO_MAX_IDLE_TIME_MS', 300000),
+                'waitQueueTimeoutMS': config.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000),
+                'serverSelectionTimeoutMS': config.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000),
+                'connectTimeoutMS': config.get('MONGO_CONNECT_TIMEOUT_MS', 10000),
+            }
+            if tls_ca_file:
                 # Connexion Atlas - SSL avec certifi
-                import certifi
-                client = MongoClient(
-                    mongo_uri,
-                    tlsCAFile=certifi.where(),
-                    serverSelectionTimeoutMS=5000
-                )
-
-            g.db = client[current_app.config['DB_NAME']]
-        except Exception as e:
-            print(f"❌ CRITICAL DB ERROR: {e}")
-            g.db = None
+                options['tlsCAFile'] = tls_ca_file
+            client = MongoClient(mongo_uri, **options)
+            _clients[key] = client
+    return client
+
+
+def get_pooled_db():
+    """Base SarfX via le client partagé, utilisable hors contexte Flask"""
+    try:
+        client = get_mongo_client()
+        if client is None:
+            return None
+        return client[_get_config().get('DB_NAME', 'SarfX_Enhanced')]
+    except Exception as e:
+        print(f"❌ CRITICAL DB ERROR: {e}")
+        return None
+
+
+def get_db():
+    """
+    Récupère la base MongoDB pour la requête en cours.
+    Le client sous-jacent est partagé par tout le process (voir get_mongo_client).
+    """
+    if 'db' not in g:
+        g.db = get_pooled_db()
     return g.db
 
 def safe_object_id(id_str):
@@ -52,26 +117,13 @@ def safe_object_id(id_str):
         return None
 
 def get_current_user_from_session():
-    """Récupère l'utilisateur connecté de manière sécurisée"""
-    if 'user_id' not in session:
-        return None
-    db = get_db()
-    if db is None:
-        return None
-
-    user_id = safe_object_id(session['user_id'])
-    if user_id:
-        return db.users.find_one({"_id": user_id})
-    # Fallback par email
-    if 'email' in session:
-        return db.users.find_one({"email": session['email']})
-    return None
+    """Récupère l'utilisateur connecté de manière sécurisée (mémorisé pour la requête)"""
+    from app.decorators import get_current_user
+    return get_current_user()
 
 def close_db(e=None):
-    """Ferme la connexion proprement"""
-    db = g.pop('db', None)
-    if db is not None:
-        db.client.close()
+    """Libère la référence de requête (le pool reste ouvert pour le worker)"""
+    g.pop('db', None)
 
 def log_history(action, details, user="System"):
     """Enregistre une action dans l'historique"""
@@ -16,9 +16,11 @@ import requests
 import logging
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
-from pymongo import MongoClient, DESCENDING
+from pymongo import DESCENDING
 from pymongo.errors import PyMongoError
-import os
+
+from app.services.money import Money
+from app.services.single_flight import single_flight
 
 logger = logging.getLogger(__name__)
 
@@ -66,28 +68,20 @@ POPULAR_PAIRS = [
     ('SAR', 'MAD'), ('EUR', 'GBP'), ('USD', 'JPY'), ('EUR', 'CHF')
 ]
 
+# Durée de fraîcheur des taux live dans le cache partagé (secondes)
+LIVE_RATE_TTL = 60
+
 # ============================================================
 # MONGODB CONNECTION
 # ============================================================
 
 def get_db():
-    """Get MongoDB database connection"""
-    try:
-        mongo_uri = os.environ.get('MONGO_URI')
-        if not mongo_uri:
-            from app.config import Config
-            mongo_uri = Config.MONGO_URI
-        
-        if not mongo_uri:
-            logger.error("MONGO_URI not configured")
-            return None
-            
-        client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
-        client.admin.command('ping')
-        return client['SarfX_Enhanced']
-    except Exception as e:
-        logger.error(f"MongoDB connection error: {e}")
-        return None
+    """Get MongoDB database from the process-wide pooled client"""
+    from app.services.db_service import get_pooled_db
+    db = get_pooled_db()
+    if db is None:
+        logger.error("MONGO_URI not configured")
+    return db
 
 # ============================================================
 # CACHE MANAGEMENT
@@ -151,15 +145,19 @@ def store_rate_history(base: str, quote: str, rate: float, source: str):
     if db is None:
         return
     
+    from app.config import Config
+
     try:
         history = db['exchange_rates_history']
+        now = datetime.utcnow()
         history.insert_one({
             'base': base.upper(),
             'quote': quote.upper(),
             'rate': rate,
             'source': source,
-            'timestamp': datetime.utcnow(),
-            'date': datetime.utcnow().strftime('%Y-%m-%d')
+            'timestamp': now,
+            'date': now.strftime('%Y-%m-%d'),
+            'expires_at': now + timedelta(days=Config.RATE_HISTORY_RETENTION_DAYS)
         })
         
         # Create index for efficient queries
@@ -167,6 +165,7 @@ def store_rate_history(base: str, quote: str, rate: float, source: str):
             ('base', 1), ('quote', 1), ('timestamp', -1)
         ])
         history.create_index([('date', 1)])
+        history.create_index([('expires_at', 1)], expireAfterSeconds=0)
         
     except PyMongoError as e:
         logger.error(f"History store error: {e}")
@@ -175,6 +174,16 @@ def store_rate_history(base: str, quote: str, rate: float, source: str):
 # API FETCHERS
 # ============================================================
 
+def _pair_key(base: str, quote: str, *args, **kwargs) -> str:
+    return f"{base.upper()}:{quote.upper()}"
+
+
+def _decode_rate(value) -> Tuple[float, str]:
+    return tuple(value)
+
+
+# Appels concurrents pour la même paire : une seule requête HTTP (voir single_flight.py)
+@single_flight('frankfurter', key=_pair_key, lease_ms=10000, decode=_decode_rate)
 def fetch_from_frankfurter(base: str, quote: str) -> Optional[Tuple[float, str]]:
     """Fetch rate from Frankfurter API (BCE data, unlimited, free)"""
     try:
@@ -193,6 +202,7 @@ def fetch_from_frankfurter(base: str, quote: str) -> Optional[Tuple[float, str]]
         logger.warning(f"Frankfurter API error: {e}")
         return None
 
+@single_flight('exchangerate', key=_pair_key, lease_ms=10000, decode=_decode_rate)
 def fetch_from_exchangerate_api(base: str, quote: str) -> Optional[Tuple[float, str]]:
     """Fetch rate from ExchangeRate-API (free tier, 1500/month)"""
     try:
@@ -212,6 +222,8 @@ def fetch_from_exchangerate_api(base: str, quote: str) -> Optional[Tuple[float,
         logger.warning(f"ExchangeRate-API error: {e}")
         return None
 
+@single_flight('frankfurter-history', key=lambda base, quote, days=30: f"{_pair_key(base, quote)}:{days}",
+               lease_ms=15000)
 def fetch_historical_frankfurter(base: str, quote: str, days: int = 30) -> Optional[List[Dict]]:
     """Fetch historical rates from Frankfurter API"""
     try:
@@ -272,22 +284,77 @@ def get_live_rate(base: str, quote: str, use_cache: bool = True) -> Dict:
             'cached': False
         }
     
-    # Check cache first
-    if use_cache:
-        cached = get_cached_rate(base, quote, max_age_minutes=1)
-        if cached:
+    # Lecture à travers le cache partagé (L1 worker + L2 Redis)
+    from app.services.rate_cache import get_rate_cache
+    loaded = []
+
+    def _load():
+        result = _fetch_live_rate(base, quote)
+        if result:
+            loaded.append(True)
+        return result
+
+    live = get_rate_cache().get_or_load(
+        f"live:{base}:{quote}",
+        _load,
+        ttl=LIVE_RATE_TTL,
+        force_refresh=not use_cache
+    )
+    if live:
+        return {**live, 'cached': not loaded}
+
+    # All sources failed - try cache with longer TTL
+    cached = get_cached_rate(base, quote, max_age_minutes=60)
+    if cached:
+        return {
+            'success': True,
+            'base': base,
+            'quote': quote,
+            'rate': cached['rate'],
+            'rate_formatted': f"{cached['rate']:.4f}",
+            'source': f"{cached['source']} (stale)",
+            'timestamp': cached['timestamp'],
+            'cached': True,
+            'stale': True
+        }
+    
+    return {
+        'success': False,
+        'error': 'All exchange rate sources unavailable',
+        'base': base,
+        'quote': quote
+    }
+
+def _fetch_live_rate(base: str, quote: str) -> Optional[Dict]:
+    """
+    Taux depuis le snapshot publié par le worker d'ingestion.
+    Sans worker (RATE_INGESTION_ENABLED=false), interroge les sources par ordre de priorité.
+    """
+    from app.config import Config
+    from app.services.rate_ingestion_service import (
+        load_latest_snapshot, snapshot_age_seconds, snapshot_pair_source, snapshot_rate
+    )
+
+    snapshot = load_latest_snapshot()
+    if snapshot and snapshot_age_seconds(snapshot) <= Config.RATE_SNAPSHOT_MAX_AGE:
+        rate = snapshot_rate(snapshot, base, quote)
+        if rate:
             return {
                 'success': True,
                 'base': base,
                 'quote': quote,
-                'rate': cached['rate'],
-                'rate_formatted': f"{cached['rate']:.4f}",
-                'source': cached['source'],
-                'timestamp': cached['timestamp'],
-                'cached': True
+                'rate': rate,
+                'rate_formatted': f"{rate:.4f}",
+                'source': snapshot_pair_source(snapshot['sources'], base, quote),
+                'timestamp': snapshot['timestamp'],
+                'snapshot_version': snapshot['version'],
+                'cached': False
             }
-    
-    # Try sources in priority order
+
+    if Config.RATE_INGESTION_ENABLED:
+        # Jamais d'appel HTTP externe depuis un worker web
+        return None
+
     sources = [
         fetch_from_frankfurter,
         fetch_from_exchangerate_api
@@ -298,7 +365,7 @@ def get_live_rate(base: str, quote: str, use_cache: bool = True) -> Dict:
         if result:
             rate, source = result
             
-            # Cache and store history
+            # Persist for stale fallback and analytics
             cache_rate(base, quote, rate, source)
             store_rate_history(base, quote, rate, source)
             
@@ -312,28 +379,7 @@ def get_live_rate(base: str, quote: str, use_cache: bool = True) -> Dict:
                 'timestamp': datetime.utcnow().isoformat(),
                 'cached': False
             }
-    
-    # All sources failed - try cache with longer TTL
-    cached = get_cached_rate(base, quote, max_age_minutes=60)
-    if cached:
-        return {
-            'success': True,
-            'base': base,
-            'quote': quote,
-            'rate': cached['rate'],
-            'rate_formatted': f"{cached['rate']:.4f}",
-            'source': f"{cached['source']} (stale)",
-            'timestamp': cached['timestamp'],
-            'cached': True,
-            'stale': True
-        }
-    
-    return {
-        'success': False,
-        'error': 'All exchange rate sources unavailable',
-        'base': base,
-        'quote': quote
-    }
+    return None
 
 def convert_currency(amount: float, from_currency: str, to_currency: str) -> Dict:
     """
@@ -364,7 +410,8 @@ def convert_currency(amount: float, from_currency: str, to_currency: str) -> Dic
     if not rate or rate == 0:
         return {'success': False, 'error': 'Invalid exchange rate received'}
     
-    converted = amount * rate
+    # Conversion en virgule fixe : un seul arrondi, dans la devise cible
+    converted = Money.of(amount, from_currency.upper()).convert(rate, to_currency.upper())
     
     return {
         'success': True,
@@ -373,8 +420,8 @@ def convert_currency(amount: float, from_currency: str, to_currency: str) -> Dic
         'to': to_currency.upper(),
         'rate': rate,
         'rate_formatted': f"{rate:.4f}",
-        'result': converted,
-        'result_formatted': f"{converted:.4f}",
+        'result': float(converted),
+        'result_formatted': converted.format(4),
         'source': rate_result['source'],
         'timestamp': rate_result['timestamp'],
         'cached': rate_result.get('cached', False)
@@ -384,12 +431,15 @@ def get_rate_history(base: str, quote: str, days: int = 30) -> Dict:
     """
     Get historical rates - combines API data with MongoDB stored history.
     Prioritizes API for accuracy, MongoDB for analytics continuity.
+    Avec le worker (RATE_INGESTION_ENABLED), lit uniquement l'historique journalier qu'il ingère.
     """
+    from app.config import Config
+
     base = base.upper()
     quote = quote.upper()
     
-    # Try API historical first
-    api_history = fetch_historical_frankfurter(base, quote, days)
+    # Try API historical first (sans worker : aucun appel HTTP dans la requête sinon)
+    api_history = None if Config.RATE_INGESTION_ENABLED else fetch_historical_frankfurter(base, quote, days)
     
     if api_history and len(api_history) > 0:
         # Store in MongoDB for future analytics
@@ -402,7 +452,9 @@ def get_rate_history(base: str, quote: str, days: int = 30) -> Dict:
                         {
                             'base': base,
                             'quote': quote,
-                            'date': item['date']
+                            'date': item['date'],
+                            # Point journalier, jamais un point intra-journalier du worker (purgé par TTL)
+                            'expires_at': {'$exists': False}
                         },
                         {
                             '$set': {
@@ -444,11 +496,14 @@ def get_rate_history(base: str, quote: str, days: int = 30) -> Dict:
             history_col = db['exchange_rates_history']
             cutoff = datetime.utcnow() - timedelta(days=days)
             
-            cursor = history_col.find({
+            query = {
                 'base': base,
                 'quote': quote,
                 'timestamp': {'$gte': cutoff}
-            }).sort('timestamp', 1)
+            }
+            if Config.RATE_INGESTION_ENABLED:
+                query['expires_at'] = {'$exists': False}
+            cursor = history_col.find(query).sort('timestamp', 1)
             
             mongo_history = []
             for doc in cursor:
@@ -489,8 +544,49 @@ def get_rate_history(base: str, quote: str, days: int = 30) -> Dict:
 
 def get_all_rates(base: str = 'EUR') -> Dict:
     """Get rates for all supported currencies from a base currency"""
+    from app.services.rate_cache import get_rate_cache
+
     base = base.upper()
+    result = get_rate_cache().get_or_load(
+        f"all:{base}",
+        lambda: _fetch_all_rates(base),
+        ttl=LIVE_RATE_TTL
+    )
+    if result:
+        return result
     
+    return {
+        'success': False,
+        'error': 'Could not fetch rates'
+    }
+
+def _fetch_all_rates(base: str) -> Optional[Dict]:
+    """Every supported quote for a base, from the published snapshot or one Frankfurter call"""
+    from app.config import Config
+    from app.services.rate_ingestion_service import (
+        load_latest_snapshot, snapshot_age_seconds, snapshot_rate
+    )
+
+    snapshot = load_latest_snapshot()
+    if snapshot and snapshot_age_seconds(snapshot) <= Config.RATE_SNAPSHOT_MAX_AGE:
+        rates = {}
+        for currency in SUPPORTED_CURRENCIES:
+            rate = 1.0 if currency == base else snapshot_rate(snapshot, base, currency)
+            if rate:
+                rates[currency] = rate
+        if len(rates) > 1:
+            return {
+                'success': True,
+                'base': base,
+                'rates': rates,
+                'timestamp': snapshot['timestamp'],
+                'snapshot_version': snapshot['version'],
+                'source': 'SarfX snapshot'
+            }
+
+    if Config.RATE_INGESTION_ENABLED:
+        return None
+
     try:
         # Use Frankfurter for efficiency (single request)
         url = f"https://api.frankfurter.app/latest?from={base}"
@@ -515,11 +611,7 @@ def get_all_rates(base: str = 'EUR') -> Dict:
             }
     except Exception as e:
         logger.error(f"Error fetching all rates: {e}")
-    
-    return {
-        'success': False,
-        'error': 'Could not fetch rates'
-    }
+    return None
 
 def get_analytics_summary(base: str, quote: str, days: int = 30) -> Dict:
     """Get analytics summary for a currency pair from stored MongoDB data"""
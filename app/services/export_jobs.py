@@ -0,0 +1,464 @@
+"""
+File d'attente des exports lourds (rapports, relevés, CSV complets)
+
+- La requête web enregistre un job (collection export_jobs) et rend la main aussitôt
+- Le worker (python worker.py) réserve les jobs avec un bail renouvelé par un
+  battement de cœur pendant tout le rendu : un job dont le worker est mort est repris
+  par un autre après expiration ; l'ancien détenteur n'écrit plus rien sur le job
+- Le rendu est compressé (gzip, ou zstd si zstandard est installé) dans EXPORT_DIR
+- Deux demandes identiques (même type, même périmètre, mêmes paramètres) dans la
+  fenêtre EXPORT_DEDUPE_SECONDS partagent le même job et le même fichier
+- Téléchargement via send_file conditionnel : requêtes Range (reprise) supportées
+"""
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+try:
+    import zstandard
+except ImportError:  # Dépendance optionnelle : gzip par défaut
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+# Bail d'un job en cours (renouvelé par le battement de cœur du worker)
+JOB_LEASE = timedelta(seconds=120)
+HEARTBEAT_INTERVAL = JOB_LEASE.total_seconds() / 4
+MAX_ATTEMPTS = 3
+
+# Progression écrite au plus une fois par intervalle (secondes)
+PROGRESS_INTERVAL = 1.0
+
+_indexes_ready = False
+
+
+def _config(name, default):
+    from app.config import Config
+    return getattr(Config, name, default)
+
+
+def _get_db():
+    from app.services.db_service import get_db, get_pooled_db
+    try:
+        return get_db()
+    except RuntimeError:
+        # Hors contexte Flask (worker) : client partagé du process
+        return get_pooled_db()
+
+
+def export_dir() -> str:
+    path = os.path.abspath(_config('EXPORT_DIR', 'exports'))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def compression() -> str:
+    """Codec des artefacts : zstd seulement si demandé et disponible"""
+    if _config('EXPORT_COMPRESSION', 'gzip') == 'zstd' and zstandard is not None:
+        return 'zstd'
+    return 'gzip'
+
+
+def _open_compressed(path: str, codec: str):
+    """Flux texte compressé en écriture"""
+    if codec == 'zstd':
+        raw = open(path, 'wb')
+        writer = zstandard.ZstdCompressor(level=6).stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(writer, encoding='utf-8')
+    return gzip.open(path, 'wt', encoding='utf-8', compresslevel=6)
+
+
+def ensure_indexes(db):
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    db.export_jobs.create_index([('dedupe_key', ASCENDING)], unique=True)
+    db.export_jobs.create_index([('status', ASCENDING), ('created_at', ASCENDING)])
+    db.export_jobs.create_index([('query_hash', ASCENDING), ('created_at', ASCENDING)])
+    _indexes_ready = True
+
+
+# ============================================================
+# RENDUS
+# ============================================================
+
+def _period(params: Dict) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Période relative (days) résolue au moment du rendu"""
+    days = params.get('days')
+    if not days:
+        return None, None
+    end_date = datetime.utcnow()
+    return end_date - timedelta(days=int(days)), end_date
+
+
+def _render_transaction_report(service, job: Dict, out, progress: Callable[[int], None]):
+    start_date, end_date = _period(job['params'])
+    progress(10)
+    options = {'limit': job['params']['limit']} if job['params'].get('limit') else {}
+    html = service.generate_transaction_report_html(
+        user_id=job.get('scope_user_id'),
+        start_date=start_date,
+        end_date=end_date,
+        **options
+    )
+    progress(80)
+    out.write(html)
+
+
+def _render_wallet_statement(service, job: Dict, out, progress: Callable[[int], None]):
+    progress(10)
+    html = service.generate_wallet_statement_html(
+        user_id=job.get('scope_user_id'),
+        period_days=int(job['params'].get('days') or 30)
+    )
+    progress(80)
+    out.write(html)
+
+
+def _render_transactions_csv(service, job: Dict, out, progress: Callable[[int], None]):
+    params = job['params']
+    start_date, end_date = _period(params)
+    query = service.transaction_query(job.get('scope_user_id'), start_date, end_date,
+                                      params.get('status'), params.get('currency'))
+    total = max(service.db.transactions.count_documents(query), 1)
+
+    from app.services.export_service import CSV_CHUNK_ROWS, csv_stream
+
+    rows = (service._transaction_row(tx) for tx in service.iter_transactions(query))
+    for written, chunk in enumerate(csv_stream(service.TRANSACTION_HEADERS, rows), start=1):
+        out.write(chunk)
+        progress(min(99, written * CSV_CHUNK_ROWS * 100 // total))
+
+
+# type -> (extension, mimetype, rendu)
+JOB_KINDS = {
+    'transaction_report': ('html', 'text/html', _render_transaction_report),
+    'wallet_statement': ('html', 'text/html', _render_wallet_statement),
+    'transactions_csv': ('csv', 'text/csv', _render_transactions_csv),
+}
+
+# Paramètres retenus par type (les autres sont ignorés et n'entrent pas dans le hash)
+JOB_PARAMS = {
+    'transaction_report': ('days', 'limit'),
+    'wallet_statement': ('days',),
+    'transactions_csv': ('days', 'status', 'currency'),
+}
+
+
+# ============================================================
+# FILE D'ATTENTE (CÔTÉ WEB)
+# ============================================================
+
+def query_hash(kind: str, scope_user_id: Optional[str], params: Dict) -> str:
+    payload = json.dumps({'kind': kind, 'scope': scope_user_id, 'params': params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def normalize_params(kind: str, params: Dict) -> Dict:
+    normalized = {}
+    for name in JOB_PARAMS[kind]:
+        value = params.get(name)
+        if value in (None, ''):
+            continue
+        if name in ('days', 'limit'):
+            try:
+                normalized[name] = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"Paramètre {name} invalide: {value}")
+        else:
+            normalized[name] = str(value)
+    return normalized
+
+
+def enqueue(kind: str, params: Dict, requested_by: str, scope_user_id: Optional[str], db=None) -> Tuple[Dict, bool]:
+    """
+    Enregistre un export, ou réutilise un job identique récent.
+
+    Args:
+        scope_user_id: Utilisateur dont les données sont exportées (None = toutes, admin)
+
+    Returns:
+        (job, réutilisé)
+
+    Raises:
+        ValueError: type d'export ou paramètre invalide
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Type d'export inconnu: {kind}")
+    db = db if db is not None else _get_db()
+    ensure_indexes(db)
+
+    params = normalize_params(kind, params)
+    digest = query_hash(kind, scope_user_id, params)
+    window = max(int(_config('EXPORT_DEDUPE_SECONDS', 600)), 1)
+    now = datetime.utcnow()
+
+    existing = _reusable_job(db, digest, now - timedelta(seconds=window))
+    if existing is not None:
+        return existing, True
+
+    job = {
+        '_id': uuid.uuid4().hex,
+        'kind': kind,
+        'params': params,
+        'query_hash': digest,
+        # Un seul job par hash et par fenêtre, même sous demandes concurrentes
+        'dedupe_key': f"{digest}:{int(now.timestamp()) // window}",
+        'requested_by': requested_by,
+        'scope_user_id': scope_user_id,
+        'status': STATUS_QUEUED,
+        'progress': 0,
+        'attempts': 0,
+        'created_at': now,
+    }
+    try:
+        db.export_jobs.insert_one(job)
+    except DuplicateKeyError:
+        return db.export_jobs.find_one({'dedupe_key': job['dedupe_key']}), True
+
+    if not _config('RATE_INGESTION_ENABLED', True):
+        # Dev sans worker : rendu par un thread du process web
+        start_local_worker()
+    return job, False
+
+
+_local_worker = None
+_local_worker_lock = threading.Lock()
+
+
+def start_local_worker():
+    global _local_worker
+    with _local_worker_lock:
+        if _local_worker is None or not _local_worker.is_alive():
+            _local_worker = threading.Thread(target=run_export_worker, name='export-worker-local', daemon=True)
+            _local_worker.start()
+
+
+def _reusable_job(db, digest: str, since: datetime) -> Optional[Dict]:
+    job = db.export_jobs.find_one(
+        {'query_hash': digest, 'created_at': {'$gte': since},
+         'status': {'$in': [STATUS_QUEUED, STATUS_RUNNING, STATUS_DONE]}},
+        sort=[('created_at', -1)]
+    )
+    if job and job['status'] == STATUS_DONE and not os.path.exists(job.get('artifact', '')):
+        return None
+    return job
+
+
+def get_job(job_id: str, db=None) -> Optional[Dict]:
+    db = db if db is not None else _get_db()
+    return db.export_jobs.find_one({'_id': job_id})
+
+
+def job_status(job: Dict) -> Dict:
+    """Vue publique d'un job (endpoint de suivi)"""
+    return {
+        'job_id': job['_id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'progress': job.get('progress', 0),
+        'params': job.get('params', {}),
+        'size': job.get('size'),
+        'error': job.get('error'),
+        'created_at': job['created_at'].isoformat() if job.get('created_at') else None,
+        'finished_at': job['finished_at'].isoformat() if job.get('finished_at') else None,
+    }
+
+
+def artifact_response(job: Dict, accept_encoding: str = '', as_attachment: bool = False):
+    """
+    Réponse de téléchargement : fichier compressé servi tel quel si le client
+    accepte l'encodage (envoi direct, Range supporté), sinon décompressé à la volée.
+    """
+    from flask import Response, send_file, stream_with_context
+
+    extension, mimetype, _ = JOB_KINDS[job['kind']]
+    codec = job.get('codec', 'gzip')
+    filename = f"sarfx_{job['kind']}_{job['created_at'].strftime('%Y%m%d_%H%M%S')}.{extension}"
+    disposition = 'attachment' if as_attachment or extension == 'csv' else 'inline'
+
+    if codec in accept_encoding:
+        response = send_file(job['artifact'], mimetype=mimetype, conditional=True, max_age=0)
+        response.headers['Content-Encoding'] = codec
+        response.headers['Vary'] = 'Accept-Encoding'
+    else:
+        def chunks():
+            if codec == 'zstd':
+                with open(job['artifact'], 'rb') as raw, zstandard.ZstdDecompressor().stream_reader(raw) as f:
+                    yield from iter(lambda: f.read(64 * 1024), b'')
+            else:
+                with gzip.open(job['artifact'], 'rb') as f:
+                    yield from iter(lambda: f.read(64 * 1024), b'')
+        response = Response(stream_with_context(chunks()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'{disposition}; filename={filename}'
+    return response
+
+
+# ============================================================
+# EXÉCUTION (CÔTÉ WORKER)
+# ============================================================
+
+def claim(db, worker_id: str) -> Optional[Dict]:
+    """Réserve le plus ancien job en attente (ou dont le bail a expiré)"""
+    now = datetime.utcnow()
+    return db.export_jobs.find_one_and_update(
+        {'$or': [
+            {'status': STATUS_QUEUED},
+            {'status': STATUS_RUNNING, 'lease_until': {'$lt': now}, 'attempts': {'$lt': MAX_ATTEMPTS}},
+        ]},
+        {
+            '$set': {'status': STATUS_RUNNING, 'worker': worker_id, 'started_at': now,
+                     'lease_until': now + JOB_LEASE, 'progress': 0},
+            '$inc': {'attempts': 1}
+        },
+        sort=[('created_at', 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+class _Heartbeat:
+    """Renouvelle le bail du job pendant le rendu ; `lost` si un autre worker l'a repris"""
+
+    def __init__(self, db, job: Dict, interval: float = HEARTBEAT_INTERVAL):
+        self.db = db
+        self.job = job
+        self.interval = interval
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"export-heartbeat-{job['_id'][:8]}", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                renewed = self.db.export_jobs.update_one(
+                    {'_id': self.job['_id'], 'worker': self.job['worker'], 'status': STATUS_RUNNING},
+                    {'$set': {'lease_until': datetime.utcnow() + JOB_LEASE}}
+                )
+            except PyMongoError as e:
+                logger.warning(f"Export job {self.job['_id']} lease renewal failed: {e}")
+                continue
+            if not renewed.matched_count:
+                logger.warning(f"Export job {self.job['_id']} lease lost to another worker")
+                self.lost = True
+                return
+
+
+def run_job(job: Dict, db) -> bool:
+    """Rend un job réservé dans EXPORT_DIR (fichier temporaire propre à la tentative, puis renommage atomique)"""
+    from app.services.export_service import ExportService
+
+    extension, _, render = JOB_KINDS[job['kind']]
+    codec = compression()
+    path = os.path.join(export_dir(), f"{job['_id']}.{extension}.{'zst' if codec == 'zstd' else 'gz'}")
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    # Écritures du job réservées au détenteur du bail
+    owned = {'_id': job['_id'], 'worker': job['worker']}
+    last_write = [0.0]
+
+    def progress(percent: int):
+        now = time.monotonic()
+        if now - last_write[0] < PROGRESS_INTERVAL:
+            return
+        last_write[0] = now
+        db.export_jobs.update_one(owned, {'$set': {'progress': percent}})
+
+    started = time.monotonic()
+    try:
+        with _Heartbeat(db, job) as heartbeat:
+            with _open_compressed(tmp_path, codec) as out:
+                render(ExportService(db), job, out, progress)
+        if heartbeat.lost:
+            os.remove(tmp_path)
+            return False
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.error(f"Export job {job['_id']} ({job['kind']}) failed: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        db.export_jobs.update_one(
+            owned,
+            # dedupe_key libéré : une nouvelle demande identique relance un job
+            {'$set': {'status': STATUS_FAILED, 'error': str(e), 'finished_at': datetime.utcnow(),
+                      'dedupe_key': job['_id']}}
+        )
+        return False
+
+    done = db.export_jobs.update_one(
+        owned,
+        {'$set': {
+            'status': STATUS_DONE,
+            'progress': 100,
+            'artifact': path,
+            'codec': codec,
+            'size': os.path.getsize(path),
+            'finished_at': datetime.utcnow(),
+        }}
+    )
+    if not done.matched_count:
+        logger.warning(f"Export job {job['_id']} was reclaimed by another worker before completion")
+        return False
+    logger.info(f"Export job {job['_id']} ({job['kind']}) done in {time.monotonic() - started:.1f}s")
+    return True
+
+
+def purge_expired(db=None, ttl_seconds: Optional[int] = None) -> int:
+    """Supprime les jobs (et fichiers) plus anciens que EXPORT_TTL_SECONDS"""
+    db = db if db is not None else _get_db()
+    ttl = ttl_seconds if ttl_seconds is not None else int(_config('EXPORT_TTL_SECONDS', 86400))
+
+    # Jobs abandonnés après MAX_ATTEMPTS reprises
+    db.export_jobs.update_many(
+        {'status': STATUS_RUNNING, 'lease_until': {'$lt': datetime.utcnow()}, 'attempts': {'$gte': MAX_ATTEMPTS}},
+        {'$set': {'status': STATUS_FAILED, 'error': 'lease expired', 'finished_at': datetime.utcnow()}}
+    )
+
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+    expired = list(db.export_jobs.find({'created_at': {'$lt': cutoff}}, {'artifact': 1}))
+    for job in expired:
+        if job.get('artifact') and os.path.exists(job['artifact']):
+            os.remove(job['artifact'])
+    if expired:
+        db.export_jobs.delete_many({'_id': {'$in': [job['_id'] for job in expired]}})
+    return len(expired)
+
+
+def run_export_worker(stop: Optional[threading.Event] = None, poll_interval: float = 1.0):
+    """Boucle d'un thread d'export : réserve, rend, recommence (attente si file vide)"""
+    worker_id = f"{os.uname().nodename if hasattr(os, 'uname') else 'worker'}:{os.getpid()}:{threading.get_ident()}"
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        try:
+            db = _get_db()
+            ensure_indexes(db)
+            job = claim(db, worker_id)
+        except PyMongoError as e:
+            logger.error(f"Export queue unavailable: {e}")
+            job = None
+        if job is None:
+            stop.wait(poll_interval)
+            continue
+        run_job(job, db)
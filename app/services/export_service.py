@@ -1,24 +1,47 @@
 """
 Service d'export de rapports pour SarfX
-Gère l'export des données en PDF et CSV
+Gère l'export des données en PDF, CSV et Parquet
 """
 import io
+import os
 import csv
 import json
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, List
+from itertools import islice
+from typing import Optional, Dict, Any, Iterable, Iterator, List, Tuple
 import logging
 
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Dépendance optionnelle : export Parquet indisponible
+    pa = pq = None
+
+from app.services.money import Money, format_amount, to_units, valid_mask
+
 logger = logging.getLogger(__name__)
 
+# Documents lus par aller-retour MongoDB (et emails joints par requête $in)
+EXPORT_BATCH_SIZE = 1000
+
+# Lignes CSV regroupées par morceau envoyé au client
+CSV_CHUNK_ROWS = 500
+
+# Lignes par row group Parquet (un row group ne chevauche jamais deux mois)
+PARQUET_ROW_GROUP_ROWS = 50000
+PARQUET_COMPRESSION = 'zstd'
+
 
 def _get_db():
     """Helper pour obtenir la DB de manière sécurisée"""
+    from app.services.db_service import get_db, get_pooled_db
     try:
-        from app.services.db_service import get_db
         return get_db()
     except RuntimeError:
-        return None
+        # Hors contexte Flask : client partagé du process
+        return get_pooled_db()
 
 
 def _safe_object_id(id_str):
@@ -32,6 +55,104 @@ def _safe_object_id(id_str):
         return None
 
 
+def csv_stream(headers: List[str], rows: Iterable[List], chunk_rows: int = CSV_CHUNK_ROWS) -> Iterator[str]:
+    """Encode des lignes en CSV par morceaux de `chunk_rows` lignes (tampon réutilisé)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_MINIMAL)
+    writer.writerow(headers)
+    pending = 1
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue()
+
+
+def with_user_emails(docs: Iterable[Dict], db, batch_size: int = EXPORT_BATCH_SIZE,
+                     target: str = 'user_email') -> Iterator[Dict]:
+    """
+    Joint l'email du propriétaire (user_id) par lots : une requête $in par lot,
+    seul le lot courant est gardé en mémoire.
+    """
+    from app.services.pagination import attach_users
+
+    docs = iter(docs)
+    while True:
+        batch = list(islice(docs, batch_size))
+        if not batch:
+            return
+        yield from attach_users(batch, db, target=target, default='')
+
+
+def csv_response(chunks: Iterable[str], filename: str):
+    """Response Flask streamée : le téléchargement démarre dès le premier morceau"""
+    from flask import Response, stream_with_context
+
+    return Response(
+        stream_with_context(chunks),
+        mimetype='text/csv',
+        headers={
+            'Content-Disposition': f'attachment; filename={filename}',
+            'X-Accel-Buffering': 'no',  # nginx : pas de mise en tampon du flux
+            'Cache-Control': 'no-store',
+        }
+    )
+
+
+def parquet_available() -> bool:
+    return pa is not None
+
+
+class _ChunkSink(io.RawIOBase):
+    """Flux binaire d'écriture vidé après chaque row group (streaming Parquet)"""
+
+    def __init__(self):
+        super().__init__()
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def _month(moment: Optional[datetime]) -> str:
+    return moment.strftime('%Y-%m') if moment else 'unknown'
+
+
+def _decimal_array(values: List, decimal_type) -> 'pa.Array':
+    """
+    Montants -> colonne decimal128 construite depuis les entiers (arrondi au demi pair
+    vectorisé) : mots de 128 bits = unités int64 + extension de signe, sans passage par Decimal
+    """
+    units = to_units(values, digits=decimal_type.scale)
+    words = np.empty((len(units), 2), dtype=np.int64)
+    words[:, 0] = units
+    words[:, 1] = units >> 63
+    mask = valid_mask(values)
+    null_count = int(len(mask) - mask.sum())
+    validity = pa.py_buffer(np.packbits(mask, bitorder='little')) if null_count else None
+    return pa.Array.from_buffers(decimal_type, len(units), [validity, pa.py_buffer(words.tobytes())],
+                                 null_count=null_count)
+
+
 class ExportService:
     """Service d'export de rapports"""
 
@@ -46,36 +167,86 @@ class ExportService:
         return _get_db()
 
     # =====================================================
-    # EXPORT CSV
+    # EXPORT CSV (STREAMING)
     # =====================================================
-
-    def export_transactions_csv(
+    # Chaque export est un générateur de morceaux CSV : curseur projeté lu par lots,
+    # emails joints par lots ($in), mémoire constante quel que soit le nombre de lignes.
+    # Les routes le passent à un Response streamé (voir csv_response).
+
+    TRANSACTION_HEADERS = [
+        'ID Transaction',
+        'Date',
+        'Utilisateur',
+        'Type',
+        'Devise Source',
+        'Montant Source',
+        'Devise Destination',
+        'Montant Destination',
+        'Taux',
+        'Frais',
+        'Statut',
+        'Bénéficiaire',
+        'Référence'
+    ]
+
+    TRANSACTION_FIELDS = {
+        'user_id': 1, 'created_at': 1, 'type': 1, 'from_currency': 1, 'amount': 1,
+        'to_currency': 1, 'final_amount': 1, 'rate': 1, 'fee': 1, 'status': 1,
+        'recipient_name': 1, 'reference': 1, 'transaction_id': 1
+    }
+
+    USER_HEADERS = [
+        'ID',
+        'Email',
+        'Nom',
+        'Rôle',
+        'Statut KYC',
+        'Niveau KYC',
+        'Actif',
+        'Vérifié',
+        'Date inscription',
+        'Dernière connexion',
+        'Code Banque'
+    ]
+
+    USER_FIELDS = {
+        'email': 1, 'name': 1, 'role': 1, 'kyc_status': 1, 'kyc_level': 1, 'is_active': 1,
+        'is_verified': 1, 'created_at': 1, 'last_login': 1, 'bank_code': 1
+    }
+
+    WALLET_HEADERS = [
+        'ID Wallet',
+        'ID Utilisateur',
+        'EUR',
+        'USD',
+        'MAD',
+        'GBP',
+        'Date création',
+        'Dernière mise à jour'
+    ]
+
+    BENEFICIARY_HEADERS = [
+        'ID',
+        'Utilisateur',
+        'Nom',
+        'Banque',
+        'IBAN',
+        'Ville',
+        'Pays',
+        'Nb Transferts',
+        'Favori',
+        'Date création'
+    ]
+
+    def transaction_query(
         self,
         user_id: Optional[str] = None,
         start_date: Optional[datetime] = None,
         end_date: Optional[datetime] = None,
         status: Optional[str] = None,
-        currency: Optional[str] = None,
-        limit: int = 10000
-    ) -> io.StringIO:
-        """
-        Exporte les transactions au format CSV
-
-        Args:
-            user_id: Filtrer par utilisateur (None = toutes)
-            start_date: Date de début
-            end_date: Date de fin
-            status: Filtrer par statut (pending, completed, cancelled)
-            currency: Filtrer par devise
-            limit: Nombre max de transactions
-
-        Returns:
-            StringIO contenant le CSV
-        """
-        if self.db is None:
-            return self._create_empty_csv(['Erreur: Base de données indisponible'])
-
-        # Construction du filtre
+        currency: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Filtre MongoDB des exports de transactions"""
         query = {}
 
         if user_id:
@@ -96,70 +267,61 @@ class ExportService:
                 {'from_currency': currency},
                 {'to_currency': currency}
             ]
+        return query
 
-        # Récupération des transactions
-        transactions = list(
-            self.db.transactions.find(query)
+    def iter_transactions(self, query: Dict[str, Any], limit: Optional[int] = None,
+                          fields: Optional[Dict[str, int]] = None) -> Iterator[Dict]:
+        """Transactions filtrées (récentes d'abord), lues par lots avec user_email joint"""
+        cursor = (
+            self.db.transactions.find(query, fields or self.TRANSACTION_FIELDS, batch_size=EXPORT_BATCH_SIZE)
             .sort('created_at', -1)
-            .limit(limit)
         )
+        if limit:
+            cursor = cursor.limit(limit)
+        return with_user_emails(cursor, self.db)
 
-        # Création du CSV
-        output = io.StringIO()
-        writer = csv.writer(output, quoting=csv.QUOTE_MINIMAL)
-
-        # En-têtes
-        headers = [
-            'ID Transaction',
-            'Date',
-            'Utilisateur',
-            'Type',
-            'Devise Source',
-            'Montant Source',
-            'Devise Destination',
-            'Montant Destination',
-            'Taux',
-            'Frais',
-            'Statut',
-            'Bénéficiaire',
-            'Référence'
-        ]
-        writer.writerow(headers)
+    def stream_transactions_csv(
+        self,
+        user_id: Optional[str] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        status: Optional[str] = None,
+        currency: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> Iterator[str]:
+        """
+        Exporte les transactions au format CSV (flux)
 
-        # Données
-        for tx in transactions:
-            row = [
-                str(tx.get('_id', '')),
-                tx.get('created_at', '').strftime('%Y-%m-%d %H:%M:%S') if tx.get('created_at') else '',
-                tx.get('user_email', tx.get('user_id', '')),
-                tx.get('type', 'exchange'),
-                tx.get('from_currency', ''),
-                f"{tx.get('amount', 0):.2f}",
-                tx.get('to_currency', ''),
-                f"{tx.get('final_amount', 0):.2f}",
-                f"{tx.get('rate', 0):.4f}",
-                f"{tx.get('fee', 0):.2f}",
-                tx.get('status', 'pending'),
-                tx.get('recipient_name', ''),
-                tx.get('reference', tx.get('transaction_id', ''))
-            ]
-            writer.writerow(row)
+        Args:
+            user_id: Filtrer par utilisateur (None = toutes)
+            start_date: Date de début
+            end_date: Date de fin
+            status: Filtrer par statut (pending, completed, cancelled)
+            currency: Filtrer par devise
+            limit: Nombre max de transactions (None = toutes)
 
-        output.seek(0)
-        return output
+        Returns:
+            Générateur de morceaux CSV
+        """
+        if self.db is None:
+            return csv_stream(['Erreur: Base de données indisponible'], [])
+
+        query = self.transaction_query(user_id, start_date, end_date, status, currency)
+        rows = (self._transaction_row(tx) for tx in self.iter_transactions(query, limit))
+        return csv_stream(self.TRANSACTION_HEADERS, rows)
 
-    def export_users_csv(
+    def stream_users_csv(
         self,
         role: Optional[str] = None,
         kyc_status: Optional[str] = None,
         is_active: Optional[bool] = None,
-        limit: int = 10000
-    ) -> io.StringIO:
+        limit: Optional[int] = None
+    ) -> Iterator[str]:
         """
-        Exporte les utilisateurs au format CSV
+        Exporte les utilisateurs au format CSV (flux)
         """
         if self.db is None:
-            return self._create_empty_csv(['Erreur: Base de données indisponible'])
+            return csv_stream(['Erreur: Base de données indisponible'], [])
 
         query = {}
 
@@ -172,141 +334,281 @@ class ExportService:
         if is_active is not None:
             query['is_active'] = is_active
 
-        users = list(
-            self.db.users.find(query, {'password': 0})
-            .sort('created_at', -1)
-            .limit(limit)
-        )
+        cursor = self.db.users.find(query, self.USER_FIELDS, batch_size=EXPORT_BATCH_SIZE).sort('created_at', -1)
+        if limit:
+            cursor = cursor.limit(limit)
+        return csv_stream(self.USER_HEADERS, (self._user_row(user) for user in cursor))
 
-        output = io.StringIO()
-        writer = csv.writer(output, quoting=csv.QUOTE_MINIMAL)
-
-        headers = [
-            'ID',
-            'Email',
-            'Nom',
-            'Rôle',
-            'Statut KYC',
-            'Niveau KYC',
-            'Actif',
-            'Vérifié',
-            'Date inscription',
-            'Dernière connexion',
-            'Code Banque'
-        ]
-        writer.writerow(headers)
-
-        for user in users:
-            row = [
-                str(user.get('_id', '')),
-                user.get('email', ''),
-                user.get('name', ''),
-                user.get('role', 'user'),
-                user.get('kyc_status', 'none'),
-                user.get('kyc_level', 'none'),
-                'Oui' if user.get('is_active', True) else 'Non',
-                'Oui' if user.get('is_verified', False) else 'Non',
-                user.get('created_at', '').strftime('%Y-%m-%d %H:%M') if user.get('created_at') else '',
-                user.get('last_login', '').strftime('%Y-%m-%d %H:%M') if user.get('last_login') else '',
-                user.get('bank_code', '')
-            ]
-            writer.writerow(row)
+    def stream_wallets_csv(self, user_id: Optional[str] = None) -> Iterator[str]:
+        """
+        Exporte les wallets au format CSV (flux)
+        """
+        if self.db is None:
+            return csv_stream(['Erreur: Base de données indisponible'], [])
 
-        output.seek(0)
-        return output
+        query = {}
+        if user_id:
+            query['user_id'] = user_id
 
-    def export_wallets_csv(self, user_id: Optional[str] = None) -> io.StringIO:
+        cursor = self.db.wallets.find(
+            query,
+            {'wallet_id': 1, 'user_id': 1, 'balances': 1, 'created_at': 1, 'updated_at': 1},
+            batch_size=EXPORT_BATCH_SIZE
+        )
+        return csv_stream(self.WALLET_HEADERS, (self._wallet_row(wallet) for wallet in cursor))
+
+    def stream_beneficiaries_csv(self, user_id: Optional[str] = None) -> Iterator[str]:
         """
-        Exporte les wallets au format CSV
+        Exporte les bénéficiaires au format CSV (flux)
         """
         if self.db is None:
-            return self._create_empty_csv(['Erreur: Base de données indisponible'])
+            return csv_stream(['Erreur: Base de données indisponible'], [])
 
         query = {}
         if user_id:
             query['user_id'] = user_id
 
-        wallets = list(self.db.wallets.find(query))
+        cursor = self.db.beneficiaries.find(
+            query,
+            {'user_id': 1, 'name': 1, 'bank_name': 1, 'iban': 1, 'city': 1, 'country': 1,
+             'transfer_count': 1, 'is_favorite': 1, 'created_at': 1},
+            batch_size=EXPORT_BATCH_SIZE
+        )
+        return csv_stream(self.BENEFICIARY_HEADERS, (self._beneficiary_row(ben) for ben in cursor))
 
-        output = io.StringIO()
-        writer = csv.writer(output, quoting=csv.QUOTE_MINIMAL)
-
-        headers = [
-            'ID Wallet',
-            'ID Utilisateur',
-            'EUR',
-            'USD',
-            'MAD',
-            'GBP',
-            'Date création',
-            'Dernière mise à jour'
-        ]
-        writer.writerow(headers)
-
-        for wallet in wallets:
-            balances = wallet.get('balances', {})
-            row = [
-                str(wallet.get('_id', wallet.get('wallet_id', ''))),
-                wallet.get('user_id', ''),
-                f"{balances.get('EUR', 0):.2f}",
-                f"{balances.get('USD', 0):.2f}",
-                f"{balances.get('MAD', 0):.2f}",
-                f"{balances.get('GBP', 0):.2f}",
-                wallet.get('created_at', '').strftime('%Y-%m-%d %H:%M') if wallet.get('created_at') else '',
-                wallet.get('updated_at', '').strftime('%Y-%m-%d %H:%M') if wallet.get('updated_at') else ''
-            ]
-            writer.writerow(row)
+    # Versions en mémoire (petits exports, pièces jointes)
 
-        output.seek(0)
-        return output
+    def export_transactions_csv(self, *args, limit: int = 10000, **kwargs) -> io.StringIO:
+        return io.StringIO(''.join(self.stream_transactions_csv(*args, limit=limit, **kwargs)))
+
+    def export_users_csv(self, *args, limit: int = 10000, **kwargs) -> io.StringIO:
+        return io.StringIO(''.join(self.stream_users_csv(*args, limit=limit, **kwargs)))
+
+    def export_wallets_csv(self, user_id: Optional[str] = None) -> io.StringIO:
+        return io.StringIO(''.join(self.stream_wallets_csv(user_id)))
 
     def export_beneficiaries_csv(self, user_id: Optional[str] = None) -> io.StringIO:
+        return io.StringIO(''.join(self.stream_beneficiaries_csv(user_id)))
+
+    # =====================================================
+    # EXPORT PARQUET (COLONNAIRE)
+    # =====================================================
+    # Mêmes filtres que l'export CSV. Colonnes typées : horodatage UTC, montants en
+    # décimal à échelle fixe, devises/types/statuts en dictionnaire. Le curseur est
+    # lu par row groups (PARQUET_ROW_GROUP_ROWS lignes au plus, jamais à cheval sur
+    # deux mois) : mémoire bornée, et lecture par mois via les statistiques du fichier.
+
+    # Colonne -> (champ MongoDB, type Arrow)
+    PARQUET_COLUMNS = [
+        ('transaction_id', '_id', 'string'),
+        ('reference', 'reference', 'string'),
+        ('created_at', 'created_at', 'timestamp'),
+        ('user_id', 'user_id', 'string'),
+        ('user_email', 'user_email', 'string'),
+        ('type', 'type', 'category'),
+        ('status', 'status', 'category'),
+        ('from_currency', 'from_currency', 'category'),
+        ('amount', 'amount', 'amount'),
+        ('to_currency', 'to_currency', 'category'),
+        ('final_amount', 'final_amount', 'amount'),
+        ('rate', 'rate', 'rate'),
+        ('fee', 'fee', 'amount'),
+        ('recipient_name', 'recipient_name', 'string'),
+    ]
+
+    @classmethod
+    def transaction_parquet_schema(cls):
+        """Schéma Arrow des transactions exportées"""
+        types = {
+            'string': pa.string(),
+            'timestamp': pa.timestamp('ms', tz='UTC'),
+            'category': pa.dictionary(pa.int32(), pa.string()),
+            'amount': pa.decimal128(20, 4),
+            'rate': pa.decimal128(20, 8),
+        }
+        return pa.schema([pa.field(name, types[kind]) for name, _, kind in cls.PARQUET_COLUMNS])
+
+    def _transaction_batches(self, query: Dict[str, Any], limit: Optional[int] = None,
+                             rows: int = PARQUET_ROW_GROUP_ROWS) -> Iterator[Tuple[str, List[Dict]]]:
+        """(mois, lot de transactions) : lot coupé à `rows` lignes ou au changement de mois"""
+        month, batch = None, []
+        for tx in self.iter_transactions(query, limit):
+            tx_month = _month(tx.get('created_at'))
+            if batch and (tx_month != month or len(batch) >= rows):
+                yield month, batch
+                batch = []
+            month = tx_month
+            batch.append(tx)
+        if batch:
+            yield month, batch
+
+    @classmethod
+    def _parquet_batch(cls, transactions: List[Dict], schema):
+        """Lot de transactions -> RecordBatch (conversions vectorisées par colonne)"""
+        arrays = []
+        for (name, source, kind), field in zip(cls.PARQUET_COLUMNS, schema):
+            values = [tx.get(source) for tx in transactions]
+            if kind in ('amount', 'rate'):
+                arrays.append(_decimal_array(values, field.type))
+            elif kind == 'timestamp':
+                arrays.append(pa.array([v if isinstance(v, datetime) else None for v in values], field.type))
+            elif kind == 'category':
+                arrays.append(pa.array([str(v) if v else None for v in values], pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array([str(v) if v is not None else None for v in values], pa.string()))
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    def stream_transactions_parquet(
+        self,
+        user_id: Optional[str] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        status: Optional[str] = None,
+        currency: Optional[str] = None,
+        limit: Optional[int] = None,
+        row_group_rows: int = PARQUET_ROW_GROUP_ROWS
+    ) -> Iterator[bytes]:
         """
-        Exporte les bénéficiaires au format CSV
+        Exporte les transactions au format Parquet (flux)
+
+        Un row group est écrit puis envoyé par lot lu ; le pied de fichier
+        (métadonnées) termine le flux.
+
+        Returns:
+            Générateur de morceaux binaires
+
+        Raises:
+            RuntimeError: pyarrow non installé
         """
+        if not parquet_available():
+            raise RuntimeError("Export Parquet indisponible : pyarrow n'est pas installé")
         if self.db is None:
-            return self._create_empty_csv(['Erreur: Base de données indisponible'])
+            raise RuntimeError("Base de données indisponible")
 
-        query = {}
-        if user_id:
-            query['user_id'] = user_id
+        query = self.transaction_query(user_id, start_date, end_date, status, currency)
+        schema = self.transaction_parquet_schema()
 
-        beneficiaries = list(self.db.beneficiaries.find(query))
+        def chunks():
+            sink = _ChunkSink()
+            with pq.ParquetWriter(sink, schema, compression=PARQUET_COMPRESSION) as writer:
+                for _, batch in self._transaction_batches(query, limit, row_group_rows):
+                    writer.write_batch(self._parquet_batch(batch, schema))
+                    yield sink.drain()
+            yield sink.drain()
 
-        output = io.StringIO()
-        writer = csv.writer(output, quoting=csv.QUOTE_MINIMAL)
-
-        headers = [
-            'ID',
-            'Utilisateur',
-            'Nom',
-            'Banque',
-            'IBAN',
-            'Ville',
-            'Pays',
-            'Nb Transferts',
-            'Favori',
-            'Date création'
+        return chunks()
+
+    def write_transactions_parquet_dataset(
+        self,
+        root: str,
+        user_id: Optional[str] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        status: Optional[str] = None,
+        currency: Optional[str] = None,
+        limit: Optional[int] = None,
+        row_group_rows: int = PARQUET_ROW_GROUP_ROWS
+    ) -> List[str]:
+        """
+        Exporte les transactions en dataset Parquet partitionné par mois
+        (root/month=YYYY-MM/transactions.parquet, lisible par pyarrow.dataset, pandas, DuckDB...)
+
+        Les transactions arrivent triées par date : un seul fichier ouvert à la fois.
+
+        Returns:
+            Chemins des fichiers écrits
+        """
+        if not parquet_available():
+            raise RuntimeError("Export Parquet indisponible : pyarrow n'est pas installé")
+        if self.db is None:
+            raise RuntimeError("Base de données indisponible")
+
+        query = self.transaction_query(user_id, start_date, end_date, status, currency)
+        schema = self.transaction_parquet_schema()
+        paths, writer, current = [], None, None
+        try:
+            for month, batch in self._transaction_batches(query, limit, row_group_rows):
+                if month != current:
+                    if writer is not None:
+                        writer.close()
+                    directory = os.path.join(root, f'month={month}')
+                    os.makedirs(directory, exist_ok=True)
+                    paths.append(os.path.join(directory, 'transactions.parquet'))
+                    writer = pq.ParquetWriter(paths[-1], schema, compression=PARQUET_COMPRESSION)
+                    current = month
+                writer.write_batch(self._parquet_batch(batch, schema))
+        finally:
+            if writer is not None:
+                writer.close()
+        return paths
+
+    def export_transactions_parquet(self, *args, limit: int = 10000, **kwargs) -> io.BytesIO:
+        return io.BytesIO(b''.join(self.stream_transactions_parquet(*args, limit=limit, **kwargs)))
+
+    # Lignes CSV
+
+    @staticmethod
+    def _transaction_row(tx: Dict) -> List:
+        return [
+            str(tx.get('_id', '')),
+            tx.get('created_at', '').strftime('%Y-%m-%d %H:%M:%S') if tx.get('created_at') else '',
+            tx.get('user_email') or tx.get('user_id', ''),
+            tx.get('type', 'exchange'),
+            tx.get('from_currency', ''),
+            format_amount(tx.get('amount'), tx.get('from_currency'), digits=2),
+            tx.get('to_currency', ''),
+            format_amount(tx.get('final_amount'), tx.get('to_currency'), digits=2),
+            format_amount(tx.get('rate'), digits=4),
+            format_amount(tx.get('fee'), tx.get('from_currency'), digits=2),
+            tx.get('status', 'pending'),
+            tx.get('recipient_name', ''),
+            tx.get('reference', tx.get('transaction_id', ''))
         ]
-        writer.writerow(headers)
-
-        for ben in beneficiaries:
-            row = [
-                str(ben.get('_id', '')),
-                ben.get('user_id', ''),
-                ben.get('name', ''),
-                ben.get('bank_name', ''),
-                ben.get('iban', '')[:8] + '****' if ben.get('iban') else '',  # Masquer IBAN
-                ben.get('city', ''),
-                ben.get('country', ''),
-                ben.get('transfer_count', 0),
-                'Oui' if ben.get('is_favorite') else 'Non',
-                ben.get('created_at', '').strftime('%Y-%m-%d') if ben.get('created_at') else ''
-            ]
-            writer.writerow(row)
 
-        output.seek(0)
-        return output
+    @staticmethod
+    def _user_row(user: Dict) -> List:
+        return [
+            str(user.get('_id', '')),
+            user.get('email', ''),
+            user.get('name', ''),
+            user.get('role', 'user'),
+            user.get('kyc_status', 'none'),
+            user.get('kyc_level', 'none'),
+            'Oui' if user.get('is_active', True) else 'Non',
+            'Oui' if user.get('is_verified', False) else 'Non',
+            user.get('created_at', '').strftime('%Y-%m-%d %H:%M') if user.get('created_at') else '',
+            user.get('last_login', '').strftime('%Y-%m-%d %H:%M') if user.get('last_login') else '',
+            user.get('bank_code', '')
+        ]
+
+    @staticmethod
+    def _wallet_row(wallet: Dict) -> List:
+        balances = wallet.get('balances', {})
+        return [
+            str(wallet.get('_id', wallet.get('wallet_id', ''))),
+            wallet.get('user_id', ''),
+            format_amount(balances.get('EUR'), 'EUR', digits=2),
+            format_amount(balances.get('USD'), 'USD', digits=2),
+            format_amount(balances.get('MAD'), 'MAD', digits=2),
+            format_amount(balances.get('GBP'), 'GBP', digits=2),
+            wallet.get('created_at', '').strftime('%Y-%m-%d %H:%M') if wallet.get('created_at') else '',
+            wallet.get('updated_at', '').strftime('%Y-%m-%d %H:%M') if wallet.get('updated_at') else ''
+        ]
+
+    @staticmethod
+    def _beneficiary_row(ben: Dict) -> List:
+        return [
+            str(ben.get('_id', '')),
+            ben.get('user_id', ''),
+            ben.get('name', ''),
+            ben.get('bank_name', ''),
+            ben.get('iban', '')[:8] + '****' if ben.get('iban') else '',  # Masquer IBAN
+            ben.get('city', ''),
+            ben.get('country', ''),
+            ben.get('transfer_count', 0),
+            'Oui' if ben.get('is_favorite') else 'Non',
+            ben.get('created_at', '').strftime('%Y-%m-%d') if ben.get('created_at') else ''
+        ]
 
     # =====================================================
     # EXPORT PDF (HTML to PDF)
@@ -342,8 +644,9 @@ class ExportService:
         )
 
         # Calculer les statistiques
-        total_amount = sum(tx.get('amount', 0) for tx in transactions)
-        total_fees = sum(tx.get('fee', 0) for tx in transactions)
+        # Sommes exactes en unités entières
+        total_amount = Money(int(to_units([tx.get('amount') for tx in transactions]).sum()), 'EUR')
+        total_fees = Money(int(to_units([tx.get('fee') for tx in transactions]).sum()), 'EUR')
         completed = len([tx for tx in transactions if tx.get('status') == 'completed'])
 
         # Générer le HTML
@@ -471,11 +774,11 @@ class ExportService:
             <div class="stat-label">Transactions</div>
         </div>
         <div class="stat-card">
-            <div class="stat-value">{total_amount:,.2f} €</div>
+            <div class="stat-value">{total_amount.format(grouping=True)} €</div>
             <div class="stat-label">Volume Total</div>
         </div>
         <div class="stat-card">
-            <div class="stat-value">{total_fees:,.2f} €</div>
+            <div class="stat-value">{total_fees.format(grouping=True)} €</div>
             <div class="stat-label">Frais Collectés</div>
         </div>
         <div class="stat-card">
@@ -509,10 +812,10 @@ class ExportService:
                 <td>{tx.get('created_at', '').strftime('%d/%m/%Y %H:%M') if tx.get('created_at') else '-'}</td>
                 <td>{tx.get('reference', tx.get('transaction_id', '-'))[:12]}...</td>
                 <td>{tx.get('type', 'exchange').capitalize()}</td>
-                <td class="amount">{tx.get('amount', 0):,.2f} {tx.get('from_currency', '')}</td>
-                <td class="amount">{tx.get('final_amount', 0):,.2f} {tx.get('to_currency', '')}</td>
-                <td>{tx.get('rate', 0):.4f}</td>
-                <td>{tx.get('fee', 0):.2f} €</td>
+                <td class="amount">{format_amount(tx.get('amount'), tx.get('from_currency'), digits=2, grouping=True)} {tx.get('from_currency', '')}</td>
+                <td class="amount">{format_amount(tx.get('final_amount'), tx.get('to_currency'), digits=2, grouping=True)} {tx.get('to_currency', '')}</td>
+                <td>{format_amount(tx.get('rate'), digits=4)}</td>
+                <td>{format_amount(tx.get('fee'), tx.get('from_currency'), digits=2)} €</td>
                 <td><span class="status {status_class}">{tx.get('status', 'pending')}</span></td>
             </tr>
 """
@@ -656,19 +959,19 @@ class ExportService:
         <div class="balance-grid">
             <div class="balance-item">
                 <div class="balance-currency">EUR</div>
-                <div class="balance-amount">{balances.get('EUR', 0):,.2f}</div>
+                <div class="balance-amount">{format_amount(balances.get('EUR'), 'EUR', digits=2, grouping=True)}</div>
             </div>
             <div class="balance-item">
                 <div class="balance-currency">USD</div>
-                <div class="balance-amount">{balances.get('USD', 0):,.2f}</div>
+                <div class="balance-amount">{format_amount(balances.get('USD'), 'USD', digits=2, grouping=True)}</div>
             </div>
             <div class="balance-item">
                 <div class="balance-currency">MAD</div>
-                <div class="balance-amount">{balances.get('MAD', 0):,.2f}</div>
+                <div class="balance-amount">{format_amount(balances.get('MAD'), 'MAD', digits=2, grouping=True)}</div>
             </div>
             <div class="balance-item">
                 <div class="balance-currency">GBP</div>
-                <div class="balance-amount">{balances.get('GBP', 0):,.2f}</div>
+                <div class="balance-amount">{format_amount(balances.get('GBP'), 'GBP', digits=2, grouping=True)}</div>
             </div>
         </div>
     </div>
@@ -688,8 +991,8 @@ class ExportService:
 
         for tx in transactions:
             is_debit = tx.get('type') in ['send', 'exchange', 'withdraw']
-            debit = f"{tx.get('amount', 0):,.2f} {tx.get('from_currency', '')}" if is_debit else "-"
-            credit = f"{tx.get('final_amount', 0):,.2f} {tx.get('to_currency', '')}" if not is_debit else "-"
+            debit = f"{format_amount(tx.get('amount'), tx.get('from_currency'), digits=2, grouping=True)} {tx.get('from_currency', '')}" if is_debit else "-"
+            credit = f"{format_amount(tx.get('final_amount'), tx.get('to_currency'), digits=2, grouping=True)} {tx.get('to_currency', '')}" if not is_debit else "-"
 
             html += f"""
             <tr>
@@ -4,8 +4,12 @@ Gère les traductions multi-langues FR/EN/AR
 """
 import json
 import os
-from functools import wraps
-from flask import session, request, g
+import sys
+import threading
+import time
+from string import Formatter
+from typing import Dict, Optional
+from flask import session, request, g, has_request_context
 import logging
 
 logger = logging.getLogger(__name__)
@@ -37,8 +41,130 @@ SUPPORTED_LANGUAGES = {
 
 DEFAULT_LANGUAGE = 'fr'
 
-# Cache des traductions
-_translations_cache = {}
+# Formes plurielles reconnues dans les catalogues ({"one": ..., "other": ...})
+PLURAL_FORMS = ('zero', 'one', 'two', 'few', 'many', 'other')
+
+# Intervalle minimal entre deux vérifications des fichiers (rechargement en dev)
+RELOAD_CHECK_INTERVAL = 1.0
+
+
+def _plural_ar(count: int) -> str:
+    """Règles de pluriel arabe"""
+    if count == 0:
+        return 'zero'
+    if count == 1:
+        return 'one'
+    if count == 2:
+        return 'two'
+    if 3 <= count <= 10:
+        return 'few'
+    if 11 <= count <= 99:
+        return 'many'
+    return 'other'
+
+
+def _plural_default(count: int) -> str:
+    """Règles de pluriel simples (FR, EN)"""
+    return 'one' if count == 1 else 'other'
+
+
+PLURAL_RULES = {'ar': _plural_ar}
+
+
+class _Template:
+    """Texte à variables {name} découpé une fois : le rendu est une simple concaténation"""
+
+    __slots__ = ('text', 'parts')
+
+    def __init__(self, text: str):
+        self.text = text
+        try:
+            parts = list(Formatter().parse(text))
+        except ValueError:
+            parts = None
+        # Spécificateurs de format, conversions ou accès indexés : str.format au rendu
+        if parts is not None and any(name is not None and (spec or conversion or not name.isidentifier())
+                                     for _, name, spec, conversion in parts):
+            parts = None
+        self.parts = tuple((literal, name) for literal, name, _, _ in parts) if parts is not None else None
+
+    def render(self, values: dict) -> str:
+        if self.parts is None:
+            try:
+                return self.text.format(**values)
+            except (KeyError, IndexError, ValueError):
+                return self.text
+        chunks = []
+        for literal, name in self.parts:
+            chunks.append(literal)
+            if name is not None:
+                if name not in values:
+                    return self.text
+                chunks.append(str(values[name]))
+        return ''.join(chunks)
+
+
+class Catalog:
+    """
+    Catalogue compilé d'une langue :
+    - messages : clé pointée -> texte (clés et textes internés), langue par défaut fusionnée
+    - templates : textes à interpoler, pré-découpés
+    - plurals : clé -> {forme: texte} pour tn()
+    - raw : JSON d'origine (exposé au JavaScript)
+    """
+
+    __slots__ = ('lang', 'messages', 'templates', 'plurals', 'plural_rule', 'raw')
+
+    def __init__(self, lang: str, raw: dict, fallback: Optional['Catalog'] = None):
+        self.lang = lang
+        self.raw = raw
+        self.plural_rule = PLURAL_RULES.get(lang, _plural_default)
+
+        messages = dict(fallback.messages) if fallback else {}
+        _flatten(raw, '', messages)
+        self.messages = messages
+        self.templates = {key: _Template(text) for key, text in messages.items() if '{' in text}
+
+        plurals = {}
+        for key, text in messages.items():
+            base, _, form = key.rpartition('.')
+            if base and form in PLURAL_FORMS:
+                plurals.setdefault(sys.intern(base), {})[form] = text
+        self.plurals = plurals
+
+    def translate(self, key: str, values: Optional[dict] = None) -> str:
+        text = self.messages.get(key)
+        if text is None:
+            return key
+        if values:
+            template = self.templates.get(key)
+            if template is not None:
+                return template.render(values)
+        return text
+
+    def translate_plural(self, key: str, count: int, values: dict) -> str:
+        forms = self.plurals.get(key)
+        form = self.plural_rule(count)
+        if not forms or (form not in forms and 'other' not in forms):
+            return f"{key}.other"
+        full_key = f"{key}.{form}" if form in forms else f"{key}.other"
+        return self.translate(full_key, {'count': count, **values})
+
+
+def _flatten(tree: dict, prefix: str, into: dict):
+    for name, value in tree.items():
+        key = f"{prefix}{name}"
+        if isinstance(value, dict):
+            _flatten(value, f"{key}.", into)
+        elif isinstance(value, str):
+            into[sys.intern(key)] = sys.intern(value)
+
+
+# Catalogues compilés, partagés par tous les workers forkés (gunicorn --preload)
+_catalogs: Dict[str, Catalog] = {}
+_catalogs_lock = threading.Lock()
+_mtimes: Dict[str, float] = {}
+_last_reload_check = 0.0
 
 
 def get_translations_dir():
@@ -47,52 +173,103 @@ def get_translations_dir():
     return os.path.join(base_dir, 'translations')
 
 
-def load_translations(lang: str) -> dict:
-    """Charge les traductions pour une langue donnée"""
-    if lang in _translations_cache:
-        return _translations_cache[lang]
-
-    translations_dir = get_translations_dir()
-    file_path = os.path.join(translations_dir, f'{lang}.json')
-
+def _read_catalog(lang: str) -> dict:
+    file_path = os.path.join(get_translations_dir(), f'{lang}.json')
     try:
         if os.path.exists(file_path):
+            _mtimes[lang] = os.path.getmtime(file_path)
             with open(file_path, 'r', encoding='utf-8') as f:
-                translations = json.load(f)
-                _translations_cache[lang] = translations
-                return translations
+                return json.load(f)
     except Exception as e:
         logger.error(f"Error loading translations for {lang}: {e}")
-
     return {}
 
 
+def load_catalogs() -> Dict[str, Catalog]:
+    """Compile les catalogues de toutes les langues (au démarrage, avant le fork des workers)"""
+    global _catalogs
+    with _catalogs_lock:
+        default = Catalog(DEFAULT_LANGUAGE, _read_catalog(DEFAULT_LANGUAGE))
+        catalogs = {DEFAULT_LANGUAGE: default}
+        for lang in SUPPORTED_LANGUAGES:
+            if lang != DEFAULT_LANGUAGE:
+                catalogs[lang] = Catalog(lang, _read_catalog(lang), fallback=default)
+        _catalogs = catalogs
+    logger.info(f"Translation catalogs compiled: "
+                + ', '.join(f"{lang}={len(catalog.messages)}" for lang, catalog in catalogs.items()))
+    return catalogs
+
+
+def get_catalog(lang: Optional[str] = None) -> Catalog:
+    """Catalogue compilé d'une langue (langue par défaut si inconnue)"""
+    catalogs = _catalogs or load_catalogs()
+    return catalogs.get(lang) or catalogs[DEFAULT_LANGUAGE]
+
+
+def reload_if_changed() -> bool:
+    """Recompile les catalogues si un fichier JSON a changé (mode debug, au plus une vérification par seconde)"""
+    global _last_reload_check
+    now = time.monotonic()
+    if now - _last_reload_check < RELOAD_CHECK_INTERVAL:
+        return False
+    _last_reload_check = now
+
+    for lang in SUPPORTED_LANGUAGES:
+        file_path = os.path.join(get_translations_dir(), f'{lang}.json')
+        try:
+            mtime = os.path.getmtime(file_path)
+        except OSError:
+            continue
+        if mtime != _mtimes.get(lang):
+            logger.info(f"Translations changed ({lang}.json), recompiling catalogs")
+            load_catalogs()
+            return True
+    return False
+
+
+def load_translations(lang: str) -> dict:
+    """Traductions d'une langue telles que dans le fichier JSON (arborescence)"""
+    if lang not in SUPPORTED_LANGUAGES:
+        return {}
+    return get_catalog(lang).raw
+
+
 def clear_translations_cache():
-    """Vide le cache des traductions"""
-    global _translations_cache
-    _translations_cache = {}
+    """Vide le cache des traductions (recompilées au prochain accès)"""
+    global _catalogs
+    _catalogs = {}
 
 
-def get_current_language() -> str:
-    """Récupère la langue courante"""
+def _detect_language() -> str:
     # 1. Check session
     if 'language' in session:
         return session['language']
 
     # 2. Check Accept-Language header
-    if request:
-        accept_lang = request.accept_languages.best_match(SUPPORTED_LANGUAGES.keys())
-        if accept_lang:
-            return accept_lang
+    accept_lang = request.accept_languages.best_match(SUPPORTED_LANGUAGES.keys())
+    if accept_lang:
+        return accept_lang
 
     # 3. Default
     return DEFAULT_LANGUAGE
 
 
+def get_current_language() -> str:
+    """Récupère la langue courante (déterminée une fois par requête, gardée dans g)"""
+    if not has_request_context():
+        return DEFAULT_LANGUAGE
+    lang = g.get('lang')
+    if lang is None:
+        lang = g.lang = _detect_language()
+    return lang
+
+
 def set_language(lang: str) -> bool:
     """Définit la langue pour la session"""
     if lang in SUPPORTED_LANGUAGES:
         session['language'] = lang
+        g.lang = lang
+        g.pop('i18n_context', None)
         return True
     return False
 
@@ -112,39 +289,9 @@ def t(key: str, **kwargs) -> str:
         **kwargs: Variables pour interpolation
 
     Returns:
-        Texte traduit ou clé si non trouvé
+        Texte traduit (langue par défaut si absent) ou clé si non trouvé
     """
-    lang = get_current_language()
-    translations = load_translations(lang)
-
-    # Navigation dans les clés imbriquées
-    keys = key.split('.')
-    value = translations
-
-    for k in keys:
-        if isinstance(value, dict) and k in value:
-            value = value[k]
-        else:
-            # Fallback vers la langue par défaut
-            if lang != DEFAULT_LANGUAGE:
-                default_translations = load_translations(DEFAULT_LANGUAGE)
-                value = default_translations
-                for k2 in keys:
-                    if isinstance(value, dict) and k2 in value:
-                        value = value[k2]
-                    else:
-                        return key  # Retourne la clé si non trouvé
-            else:
-                return key
-
-    # Interpolation des variables
-    if isinstance(value, str) and kwargs:
-        try:
-            value = value.format(**kwargs)
-        except KeyError:
-            pass
-
-    return value if isinstance(value, str) else key
+    return get_catalog(get_current_language()).translate(key, kwargs)
 
 
 def tn(key: str, count: int, **kwargs) -> str:
@@ -156,35 +303,22 @@ def tn(key: str, count: int, **kwargs) -> str:
         count: Nombre pour déterminer la forme plurielle
         **kwargs: Variables pour interpolation
     """
-    lang = get_current_language()
+    return get_catalog(get_current_language()).translate_plural(key, count, kwargs)
 
-    # Déterminer la forme plurielle
-    if lang == 'ar':
-        # Règles de pluriel arabe
-        if count == 0:
-            plural_key = 'zero'
-        elif count == 1:
-            plural_key = 'one'
-        elif count == 2:
-            plural_key = 'two'
-        elif 3 <= count <= 10:
-            plural_key = 'few'
-        elif 11 <= count <= 99:
-            plural_key = 'many'
-        else:
-            plural_key = 'other'
-    else:
-        # Règles de pluriel simples (FR, EN)
-        plural_key = 'one' if count == 1 else 'other'
-
-    full_key = f"{key}.{plural_key}"
-    translated = t(full_key, count=count, **kwargs)
-
-    # Si la clé plurielle n'existe pas, essayer 'other'
-    if translated == full_key:
-        translated = t(f"{key}.other", count=count, **kwargs)
-
-    return translated
+
+def template_context() -> dict:
+    """Variables i18n des templates, calculées une fois par requête"""
+    context = g.get('i18n_context')
+    if context is None:
+        lang = get_current_language()
+        context = g.i18n_context = dict(
+            t=I18nService.t,
+            tn=I18nService.tn,
+            current_lang=lang,
+            is_rtl=SUPPORTED_LANGUAGES.get(lang, {}).get('rtl', False),
+            available_languages=SUPPORTED_LANGUAGES
+        )
+    return context
 
 
 def get_language_info(lang: str = None) -> dict:
@@ -237,21 +371,7 @@ class I18nService:
     def t(key: str, lang: str = None, **kwargs) -> str:
         """Fonction de traduction avec langue optionnelle"""
         if lang:
-            # Temporairement charger la langue spécifique
-            translations = load_translations(lang)
-            keys = key.split('.')
-            value = translations
-            for k in keys:
-                if isinstance(value, dict) and k in value:
-                    value = value[k]
-                else:
-                    return key
-            if isinstance(value, str) and kwargs:
-                try:
-                    value = value.format(**kwargs)
-                except KeyError:
-                    pass
-            return value if isinstance(value, str) else key
+            return get_catalog(lang).translate(key, kwargs)
         return t(key, **kwargs)
 
     @staticmethod
@@ -10,7 +10,7 @@ from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List, Tuple
 from bson import ObjectId
 
-from app.services.db_service import get_db, safe_object_id
+from app.services.db_service import get_db, get_pooled_db, safe_object_id
 from app.services.email_service import send_email
 
 logger = logging.getLogger(__name__)
@@ -46,7 +46,11 @@ class KYCService:
         """Obtient une connexion DB fraîche à chaque accès"""
         if self._db is not None:
             return self._db
-        return get_db()
+        try:
+            return get_db()
+        except RuntimeError:
+            # Hors contexte Flask : client partagé du process
+            return get_pooled_db()
 
     def get_user_kyc_status(self, user_id: str) -> Dict[str, Any]:
         """Récupère le statut KYC complet d'un utilisateur"""
@@ -0,0 +1,262 @@
+"""
+Projection des soldes des wallets depuis le grand livre (ledger_entries)
+
+ledger_entries est la source de vérité ; wallets.balances en est la projection,
+tenue à jour à chaque opération par l'update conditionnel de ledger_service. Ce module :
+
+- reconstruit un wallet : dernier snapshot (wallet_snapshots) + écritures de seq
+  supérieur, jusqu'au ledger_seq lu dans le wallet (lecture cohérente du document) ;
+- compare le résultat (somme exacte des montants en unités mineures) à
+  wallets.balances_minor et corrige la projection si demandé
+  (mise à jour conditionnée au même ledger_seq : jamais d'écrasement d'une
+  opération concurrente) ;
+- enregistre un nouveau snapshot quand le journal est complet, pour que la
+  prochaine reconstruction ne relise que les écritures suivantes ;
+- reconstruit tous les wallets en parallèle, par tranches de user_id.
+
+Un wallet dont une opération n'a pas toutes ses écritures (journal en cours
+d'écriture, ou échec après mise à jour du wallet sans transactions, y compris
+au milieu d'un insert_many) est signalé "incomplete" et n'est ni corrigé ni snapshoté.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from app.services.ledger_service import ensure_indexes, units_of
+from app.services.money import Money
+
+logger = logging.getLogger(__name__)
+
+# Tranches de user_id reconstruites en parallèle (bornes de chaînes : couvrent tous les ids)
+PARTITION_BOUNDS = list('123456789abcdef')
+
+STATUS_OK = 'ok'
+STATUS_DRIFT = 'drift'
+STATUS_FIXED = 'fixed'
+STATUS_INCOMPLETE = 'incomplete'
+STATUS_UNOPENED = 'unopened'
+STATUS_MISSING = 'missing'
+
+
+def _get_db():
+    from app.services.db_service import get_db, get_pooled_db
+    try:
+        return get_db()
+    except RuntimeError:
+        # Hors contexte Flask (worker) : client partagé du process
+        return get_pooled_db()
+
+
+def _config(name, default):
+    from app.config import Config
+    return getattr(Config, name, default)
+
+
+def _projected_units(wallet: Dict) -> Dict[str, int]:
+    return {currency: units_of(wallet, currency) for currency in wallet.get('balances') or {}}
+
+
+def _entry_units(entry: Dict) -> int:
+    if entry.get('amount_minor') is not None:
+        return int(entry['amount_minor'])
+    return Money.of(entry.get('amount') or 0, entry['currency']).units
+
+
+def _as_floats(units: Dict[str, int]) -> Dict[str, float]:
+    return {currency: float(Money(value, currency)) for currency, value in units.items()}
+
+
+def _differences(wallet: Dict, projected: Dict[str, int], rebuilt: Dict[str, int]) -> Dict[str, Tuple[float, float]]:
+    """
+    Devise -> (projection, journal) pour les soldes qui ne concordent pas (absent = 0) :
+    comparaison exacte des unités, et solde affiché (balances) dérivé de ces unités
+    """
+    displayed = wallet.get('balances') or {}
+    differences = {}
+    for currency in set(projected) | set(rebuilt):
+        current, expected = projected.get(currency, 0), rebuilt.get(currency, 0)
+        expected_display = float(Money(expected, currency))
+        if current != expected or displayed.get(currency, 0) != expected_display:
+            differences[currency] = (displayed.get(currency, float(Money(current, currency))), expected_display)
+    return differences
+
+
+def get_snapshot(db, user_id: str) -> Optional[Dict]:
+    return db.wallet_snapshots.find_one({'_id': str(user_id)})
+
+
+def save_snapshot(db, user_id: str, seq: int, units: Dict[str, int]) -> bool:
+    """Snapshot au seq donné, seulement s'il est plus récent que celui enregistré"""
+    try:
+        db.wallet_snapshots.update_one(
+            {'_id': str(user_id), 'seq': {'$lt': seq}},
+            {'$set': {
+                'seq': seq,
+                'balances_minor': {currency: Money(value, currency).to_bson() for currency, value in units.items()},
+                'balances': _as_floats(units),
+                'created_at': datetime.utcnow()
+            }},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        # Snapshot plus récent déjà écrit par une autre reconstruction
+        return False
+
+
+def replay(db, user_id: str, upto_seq: int, snapshot: Optional[Dict] = None) -> Tuple[Dict[str, int], bool]:
+    """
+    Soldes exacts (unités mineures) au seq upto_seq : snapshot + écritures (snapshot.seq, upto_seq].
+
+    Returns:
+        (devise -> unités, journal complet : pour chaque seq de 1 à upto_seq, toutes les
+        écritures de son opération (leg_count ; au moins une pour les écritures antérieures))
+    """
+    base_seq, units = -1, {}
+    if snapshot and snapshot.get('seq', -1) <= upto_seq:
+        base_seq, units = snapshot['seq'], _projected_units(snapshot)
+
+    # seq -> [écritures lues, écritures attendues]
+    counts: Dict[int, List[int]] = {}
+    cursor = db.ledger_entries.find(
+        {'user_id': str(user_id), 'seq': {'$gt': base_seq, '$lte': upto_seq}},
+        {'_id': 0, 'seq': 1, 'currency': 1, 'amount': 1, 'amount_minor': 1, 'leg_count': 1}
+    ).sort([('seq', ASCENDING)])
+    for entry in cursor:
+        units[entry['currency']] = units.get(entry['currency'], 0) + _entry_units(entry)
+        count = counts.setdefault(entry['seq'], [0, 1])
+        count[0] += 1
+        count[1] = max(count[1], entry.get('leg_count') or 1)
+
+    # seq 0 (soldes d'ouverture) n'a pas d'écriture pour un wallet vide
+    expected = upto_seq - max(base_seq, 0)
+    complete = (len(set(counts) - {0}) == expected
+                and all(seen >= legs for seen, legs in counts.values()))
+    return units, complete
+
+
+def rebuild_wallet(db, user_id: str, fix: bool = False, snapshot: Optional[Dict] = None,
+                   wallet: Optional[Dict] = None) -> Dict:
+    """
+    Reconstruit les soldes d'un wallet depuis le journal et les compare à la projection.
+
+    Args:
+        fix: corrige wallets.balances en cas d'écart
+        snapshot, wallet: documents déjà lus (reconstruction en masse)
+
+    Returns:
+        {'user_id', 'status', 'seq', 'balances', 'differences'}
+    """
+    user_id = str(user_id)
+    if wallet is None:
+        wallet = db.wallets.find_one({'user_id': user_id}, {'balances': 1, 'balances_minor': 1, 'ledger_seq': 1})
+    if wallet is None:
+        return {'user_id': user_id, 'status': STATUS_MISSING, 'seq': None, 'balances': {}, 'differences': {}}
+
+    seq = wallet.get('ledger_seq')
+    projected = _projected_units(wallet)
+    if seq is None:
+        # Aucun mouvement depuis l'ouverture du grand livre : la projection fait foi
+        return {'user_id': user_id, 'status': STATUS_UNOPENED, 'seq': None, 'balances': _as_floats(projected),
+                'differences': {}}
+
+    if snapshot is None:
+        snapshot = get_snapshot(db, user_id)
+    rebuilt, complete = replay(db, user_id, seq, snapshot)
+    result = {'user_id': user_id, 'seq': seq, 'balances': _as_floats(rebuilt), 'differences': {}}
+    if not complete:
+        result['status'] = STATUS_INCOMPLETE
+        return result
+
+    if not snapshot or snapshot.get('seq', -1) < seq:
+        save_snapshot(db, user_id, seq, rebuilt)
+
+    differences = _differences(wallet, projected, rebuilt)
+    result['differences'] = differences
+    if not differences:
+        result['status'] = STATUS_OK
+        return result
+
+    logger.warning(f"Wallet projection drift for user {user_id} at seq {seq}: {differences}")
+    result['status'] = STATUS_DRIFT
+    if fix:
+        fixes = {'updated_at': datetime.utcnow()}
+        for currency in differences:
+            expected = Money(rebuilt.get(currency, 0), currency)
+            fixes[f'balances_minor.{currency}'] = expected.to_bson()
+            fixes[f'balances.{currency}'] = float(expected)
+        updated = db.wallets.update_one({'user_id': user_id, 'ledger_seq': seq}, {'$set': fixes})
+        # Opération concurrente entre-temps : la prochaine reconstruction reprendra
+        if updated.modified_count:
+            result['status'] = STATUS_FIXED
+    return result
+
+
+def _partitions() -> List[Tuple[Optional[str], Optional[str]]]:
+    bounds = [None] + PARTITION_BOUNDS + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _rebuild_partition(db, lower: Optional[str], upper: Optional[str], fix: bool) -> Dict[str, int]:
+    """Wallets dont user_id est dans [lower, upper) : snapshots lus en une requête, puis un wallet à la fois"""
+    id_range = {}
+    if lower is not None:
+        id_range['$gte'] = lower
+    if upper is not None:
+        id_range['$lt'] = upper
+    wallet_query = {'user_id': id_range} if id_range else {}
+    snapshot_query = {'_id': id_range} if id_range else {}
+
+    snapshots = {snapshot['_id']: snapshot for snapshot in db.wallet_snapshots.find(snapshot_query)}
+    counts: Dict[str, int] = {}
+    for wallet in db.wallets.find(wallet_query, {'user_id': 1, 'balances': 1, 'balances_minor': 1, 'ledger_seq': 1}):
+        if not isinstance(wallet.get('user_id'), str):
+            continue
+        try:
+            status = rebuild_wallet(db, wallet['user_id'], fix=fix,
+                                    snapshot=snapshots.get(wallet['user_id']), wallet=wallet)['status']
+        except PyMongoError as e:
+            logger.warning(f"Wallet rebuild failed for user {wallet['user_id']}: {e}")
+            status = 'error'
+        counts[status] = counts.get(status, 0) + 1
+    return counts
+
+
+def rebuild_all(db=None, fix: bool = False, workers: Optional[int] = None) -> Dict:
+    """
+    Reconstruit tous les wallets en parallèle (une tranche de user_id par tâche).
+
+    Returns:
+        {'wallets': nombre, 'by_status': {statut: nombre}, 'took_s': durée}
+    """
+    db = db if db is not None else _get_db()
+    if db is None:
+        return {'wallets': 0, 'by_status': {}, 'took_s': 0}
+    ensure_indexes(db)
+    started = time.monotonic()
+    workers = workers or int(_config('LEDGER_REBUILD_WORKERS', 8))
+
+    by_status: Dict[str, int] = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ledger-rebuild') as executor:
+        futures = [executor.submit(_rebuild_partition, db, lower, upper, fix) for lower, upper in _partitions()]
+        for future in futures:
+            for status, count in future.result().items():
+                by_status[status] = by_status.get(status, 0) + count
+
+    summary = {
+        'wallets': sum(by_status.values()),
+        'by_status': by_status,
+        'took_s': round(time.monotonic() - started, 1),
+    }
+    logger.info(f"Wallet projections rebuilt: {summary}")
+    return summary
+
+
+def reconcile_wallets() -> Dict:
+    """Job périodique (worker) : corrige les projections et rafraîchit les snapshots"""
+    return rebuild_all(fix=True)
@@ -0,0 +1,397 @@
+"""
+Grand livre des wallets : mouvements de soldes atomiques et idempotents
+
+Chaque opération (swap, dépôt, retrait, envoi, ajustement admin) est appliquée
+au wallet par un seul find_one_and_update conditionnel :
+
+    filtre  {user_id, balances_minor.<débit>: {$gte: montant}, balances.<crédit>: {$exists}}
+    update  balances_minor.<devise> += delta ; balances.<devise> = balances_minor / 10^échelle
+
+Les montants sont des Money (money.py) : soldes exacts en Int64 d'unités mineures
+dans balances_minor, balances restant le flottant lu par l'affichage. Un wallet
+antérieur (sans balances_minor) est converti au premier mouvement, dans le même
+update (pipeline).
+
+Aucune lecture préalable du solde : deux requêtes concurrentes ne peuvent ni
+perdre une mise à jour ni rendre un solde négatif, et il n'y a rien à rejouer
+en cas de concurrence (pas de boucle lecture / écriture optimiste).
+
+Collections :
+- ledger_operations : une par opération ; _id = "<user_id>:<clé d'idempotence>"
+  (ou un uuid sans clé). Une requête rejouée avec la même clé renvoie le
+  résultat enregistré au lieu de débiter une seconde fois.
+- ledger_entries    : journal append-only, source de vérité des soldes : une
+  écriture par devise mouvementée (montant signé et solde après, en flottant et
+  en unités mineures Int64, nombre d'écritures de l'opération), numérotée par
+  wallet (seq = wallets.ledger_seq après l'opération). Le premier mouvement d'un
+  wallet antérieur au grand livre écrit d'abord ses soldes d'ouverture (seq 0).
+
+wallets.balances est la projection de ces écritures, maintenue par le même $inc ;
+ledger_projection.py la reconstruit (dernier snapshot + écritures suivantes).
+
+Avec un replica set (ou mongos), opération, wallet, écritures et transaction
+métier sont écrits dans une même transaction multi-documents, rejouée quelques
+fois avec backoff sur conflit transitoire. Sur un MongoDB autonome (sans
+transactions), l'opération est d'abord enregistrée "pending" (verrou
+d'idempotence), puis le wallet, puis le journal : un échec après le débit
+laisse l'opération "pending" avec ses montants, pour réconciliation.
+"""
+import hashlib
+import json
+import logging
+import random
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, Optional, Union
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
+
+from app.services.money import Money
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = 'pending'
+STATUS_COMPLETED = 'completed'
+
+KIND_OPENING = 'opening'
+
+_indexes_ready = False
+_transactions_supported = {}
+
+
+class LedgerError(Exception):
+    """Opération refusée (le wallet n'a pas été modifié)"""
+
+
+class WalletNotFound(LedgerError):
+    pass
+
+
+class CurrencyNotInWallet(LedgerError):
+    def __init__(self, currency: str):
+        super().__init__(f"Currency {currency} not in wallet.")
+        self.currency = currency
+
+
+class InsufficientFunds(LedgerError):
+    def __init__(self, currency: str, available: float):
+        super().__init__(f"Insufficient {currency} balance. Available: {available:.2f}")
+        self.currency = currency
+        self.available = available
+
+
+class IdempotencyConflict(LedgerError):
+    """Clé d'idempotence déjà utilisée pour une autre opération, ou encore en cours"""
+
+
+def _config(name, default):
+    from app.config import Config
+    return getattr(Config, name, default)
+
+
+def ensure_indexes(db):
+    """Index du journal (créés une fois par process)"""
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    try:
+        db.wallets.create_index([('user_id', ASCENDING)])
+        db.ledger_entries.create_index([('user_id', ASCENDING), ('seq', ASCENDING)])
+        db.ledger_entries.create_index([('user_id', ASCENDING), ('created_at', -1)])
+        db.ledger_entries.create_index([('operation_id', ASCENDING)])
+        db.ledger_operations.create_index([('status', ASCENDING), ('created_at', ASCENDING)])
+        _indexes_ready = True
+    except PyMongoError as e:
+        logger.warning(f"Ledger indexes not created: {e}")
+
+
+def supports_transactions(db) -> bool:
+    """Transactions multi-documents disponibles (replica set ou mongos) ; LEDGER_TRANSACTIONS force le mode"""
+    mode = str(_config('LEDGER_TRANSACTIONS', 'auto')).lower()
+    if mode in ('true', 'false'):
+        return mode == 'true'
+    client = db.client
+    supported = _transactions_supported.get(id(client))
+    if supported is None:
+        try:
+            hello = client.admin.command('hello')
+            supported = 'setName' in hello or hello.get('msg') == 'isdbgrid'
+        except PyMongoError as e:
+            logger.warning(f"Could not detect transaction support: {e}")
+            supported = False
+        _transactions_supported[id(client)] = supported
+    return supported
+
+
+def _fingerprint(kind: str, request: Dict) -> str:
+    payload = json.dumps({'kind': kind, 'request': request}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def _replay(db, operation_id: str, fingerprint: str) -> Dict:
+    """Résultat d'une opération déjà enregistrée sous la même clé"""
+    operation = db.ledger_operations.find_one({'_id': operation_id})
+    if operation is None:
+        raise IdempotencyConflict("Operation is being processed, please retry.")
+    if operation.get('fingerprint') != fingerprint:
+        raise IdempotencyConflict("Idempotency key already used for a different operation.")
+    if operation.get('status') != STATUS_COMPLETED:
+        raise IdempotencyConflict("Operation is being processed, please retry.")
+    return {
+        'operation_id': operation_id,
+        'balances': operation.get('balances', {}),
+        'transaction': operation.get('transaction'),
+        'replayed': True,
+    }
+
+
+def units_of(wallet: Dict, currency: str) -> int:
+    """Solde exact d'une devise (balances_minor, sinon conversion du flottant d'un wallet antérieur)"""
+    exact = (wallet.get('balances_minor') or {}).get(currency)
+    if exact is not None:
+        return int(exact)
+    return Money.of((wallet.get('balances') or {}).get(currency) or 0, currency).units
+
+
+def _apply_to_wallet(db, user_id: str, legs: Dict[str, Money], session=None) -> Dict:
+    """
+    Update conditionnel : tous les débits couverts et toutes les devises présentes, sinon rien.
+
+    Returns:
+        {'seq': numéro de l'opération dans le wallet, 'balances': soldes après opération
+         des devises mouvementées (Money), 'opening': soldes avant le premier mouvement
+         journalisé (wallet antérieur au grand livre) ou None}
+    """
+    query, covered = {'user_id': user_id}, []
+    for currency, amount in legs.items():
+        if amount.units < 0:
+            # Solde exact, ou solde flottant d'un wallet pas encore converti
+            covered.append({'$or': [
+                {f'balances_minor.{currency}': {'$gte': (-amount).to_bson()}},
+                {f'balances_minor.{currency}': {'$exists': False}, f'balances.{currency}': {'$gte': float(-amount)}},
+            ]})
+        else:
+            query[f'balances.{currency}'] = {'$exists': True}
+    if covered:
+        query['$and'] = covered
+
+    exact, display = {}, {}
+    for currency, amount in legs.items():
+        factor = 10 ** amount.scale
+        current = {'$ifNull': [f'$balances_minor.{currency}', {'$toLong': {'$round': [
+            {'$multiply': [{'$ifNull': [f'$balances.{currency}', 0]}, factor]}, 0
+        ]}}]}
+        exact[f'balances_minor.{currency}'] = {'$add': [current, amount.to_bson()]}
+        display[f'balances.{currency}'] = {'$divide': [f'$balances_minor.{currency}', factor]}
+    exact['ledger_seq'] = {'$add': [{'$ifNull': ['$ledger_seq', 0]}, 1]}
+    exact['updated_at'] = datetime.utcnow()
+
+    # Document AVANT l'update : soldes d'ouverture exacts si ledger_seq n'existait pas encore
+    before = db.wallets.find_one_and_update(
+        query,
+        [{'$set': exact}, {'$set': display}],
+        projection={'balances': 1, 'balances_minor': 1, 'ledger_seq': 1},
+        return_document=ReturnDocument.BEFORE,
+        session=session
+    )
+    if before is None:
+        _raise_rejection(db, user_id, legs, session)
+    opening = None
+    if before.get('ledger_seq') is None:
+        opening = {}
+        for currency in before.get('balances') or {}:
+            units = units_of(before, currency)
+            if units:
+                opening[currency] = Money(units, currency)
+    return {
+        'seq': (before.get('ledger_seq') or 0) + 1,
+        'balances': {currency: Money(units_of(before, currency) + amount.units, currency)
+                     for currency, amount in legs.items()},
+        'opening': opening,
+    }
+
+
+def _raise_rejection(db, user_id: str, legs: Dict[str, Money], session=None):
+    """Cause du refus (lecture uniquement après échec, pour le message)"""
+    wallet = db.wallets.find_one({'user_id': user_id}, {'balances': 1, 'balances_minor': 1}, session=session)
+    if wallet is None:
+        raise WalletNotFound("Wallet not found.")
+    balances = wallet.get('balances', {})
+    for currency in legs:
+        if currency not in balances:
+            raise CurrencyNotInWallet(currency)
+    for currency, amount in legs.items():
+        available = Money(units_of(wallet, currency), currency)
+        if amount.units < 0 and available.units < -amount.units:
+            raise InsufficientFunds(currency, float(available))
+    # Solde modifié entre l'update et la lecture : refus conservateur
+    debits = [currency for currency, amount in legs.items() if amount.units < 0]
+    if not debits:
+        raise LedgerError("Wallet update failed.")
+    raise InsufficientFunds(debits[0], float(Money(units_of(wallet, debits[0]), debits[0])))
+
+
+def _entry(operation_id: str, user_id: str, seq: int, kind: str, amount: Money, balance_after: Money,
+           created_at: datetime, leg_count: int) -> Dict:
+    return {
+        'entry_id': str(uuid.uuid4()),
+        'operation_id': operation_id,
+        'user_id': user_id,
+        'seq': seq,
+        'leg_count': leg_count,
+        'kind': kind,
+        'currency': amount.currency,
+        'amount': float(amount),
+        'amount_minor': amount.to_bson(),
+        'balance_after': float(balance_after),
+        'balance_after_minor': balance_after.to_bson(),
+        'scale': amount.scale,
+        'created_at': created_at,
+    }
+
+
+def _entries(operation_id: str, user_id: str, kind: str, legs: Dict[str, Money], applied: Dict,
+             created_at: datetime, meta: Optional[Dict] = None):
+    entries = []
+    opening = applied['opening'] or {}
+    for amount in opening.values():
+        entries.append(_entry(f"{user_id}:{KIND_OPENING}", user_id, 0, KIND_OPENING, amount, amount, created_at,
+                              len(opening)))
+    for currency, amount in legs.items():
+        entry = _entry(operation_id, user_id, applied['seq'], kind, amount, applied['balances'][currency], created_at,
+                       len(legs))
+        if meta:
+            entry['meta'] = meta
+        entries.append(entry)
+    return entries
+
+
+def _backoff(attempt: int):
+    """Attente aléatoire croissante entre deux tentatives (évite les relances synchronisées)"""
+    base = _config('LEDGER_RETRY_BACKOFF_MS', 10) / 1000
+    time.sleep(random.uniform(0, base * (2 ** attempt)))
+
+
+def post(db, user_id, legs: Dict[str, Union[Money, float]], kind: str, idempotency_key: Optional[str] = None,
+         transaction: Union[Dict, Callable[[Dict[str, float]], Dict], None] = None,
+         request: Optional[Dict] = None, meta: Optional[Dict] = None) -> Dict:
+    """
+    Applique une opération au wallet de l'utilisateur.
+
+    Args:
+        legs: devise -> montant signé (Money ou nombre ; négatif = débit), ex. {'EUR': -100, 'MAD': 1077.2}
+        kind: type d'opération (swap, deposit, withdrawal, send, adjustment)
+        idempotency_key: clé fournie par le client ; la même clé renvoie le même résultat
+        transaction: document de la collection transactions écrit avec l'opération,
+                     ou fonction (soldes après opération, en float) -> document
+        request: paramètres de la demande comparés lors d'un rejeu de la clé (par défaut
+                 les montants ; à fournir quand ils dépendent d'un taux qui peut changer)
+        meta: informations jointes à l'opération et à ses écritures (admin, motif)
+
+    Returns:
+        {'operation_id', 'balances': soldes après opération des devises mouvementées,
+         'transaction', 'replayed'}
+
+    Raises:
+        LedgerError (WalletNotFound, CurrencyNotInWallet, InsufficientFunds, IdempotencyConflict)
+        PyMongoError si la base est indisponible
+    """
+    user_id = str(user_id)
+    legs = {currency: Money.of(amount, currency) for currency, amount in legs.items()}
+    legs = {currency: amount for currency, amount in legs.items() if amount}
+    if not legs:
+        raise LedgerError("Nothing to post.")
+    ensure_indexes(db)
+
+    fingerprint = _fingerprint(kind, request if request is not None else {c: str(a) for c, a in legs.items()})
+    operation_id = f"{user_id}:{idempotency_key}" if idempotency_key else str(uuid.uuid4())
+    if idempotency_key and db.ledger_operations.find_one({'_id': operation_id}, {'_id': 1}):
+        return _replay(db, operation_id, fingerprint)
+
+    created_at = datetime.utcnow()
+    operation = {
+        '_id': operation_id,
+        'user_id': user_id,
+        'kind': kind,
+        'legs': {currency: float(amount) for currency, amount in legs.items()},
+        'legs_minor': {currency: amount.to_bson() for currency, amount in legs.items()},
+        'fingerprint': fingerprint,
+        'idempotency_key': idempotency_key,
+        'status': STATUS_PENDING,
+        'created_at': created_at,
+    }
+    if meta:
+        operation['meta'] = meta
+
+    def journal(applied, session=None):
+        balances = {currency: float(amount) for currency, amount in applied['balances'].items()}
+        document = transaction(balances) if callable(transaction) else transaction
+        if document is not None:
+            document = dict(document, ledger_operation_id=operation_id)
+            db.transactions.insert_one(document, session=session)
+            document.pop('_id', None)
+        db.ledger_entries.insert_many(_entries(operation_id, user_id, kind, legs, applied, created_at, meta),
+                                      session=session)
+        db.ledger_operations.update_one(
+            {'_id': operation_id},
+            {'$set': {'status': STATUS_COMPLETED, 'seq': applied['seq'], 'balances': balances,
+                      'transaction': document, 'completed_at': datetime.utcnow()}},
+            session=session
+        )
+        return {'operation_id': operation_id, 'balances': balances, 'transaction': document, 'replayed': False}
+
+    try:
+        if supports_transactions(db):
+            return _post_in_transaction(db, user_id, legs, operation, journal)
+        return _post_sequential(db, user_id, legs, operation, journal)
+    except DuplicateKeyError:
+        # Même clé reçue en parallèle : l'autre requête a gagné
+        return _replay(db, operation_id, fingerprint)
+
+
+def _post_in_transaction(db, user_id, legs, operation, journal) -> Dict:
+    """Opération, wallet et journal dans une transaction, rejouée sur conflit transitoire"""
+    max_attempts = max(1, int(_config('LEDGER_MAX_ATTEMPTS', 5)))
+    for attempt in range(1, max_attempts + 1):
+        with db.client.start_session() as session:
+            try:
+                with session.start_transaction():
+                    db.ledger_operations.insert_one(dict(operation), session=session)
+                    applied = _apply_to_wallet(db, user_id, legs, session)
+                    result = journal(applied, session)
+                return result
+            except OperationFailure as e:
+                # Conflit d'écriture avec une opération concurrente sur le même wallet.
+                # Un commit au résultat incertain est rejoué sans risque : la clé
+                # (l'_id de l'opération) le transforme en relecture du résultat.
+                retryable = (e.has_error_label('TransientTransactionError')
+                             or e.has_error_label('UnknownTransactionCommitResult'))
+                if not retryable or attempt == max_attempts:
+                    raise
+        logger.debug(f"Ledger transaction conflict on {operation['_id']}, attempt {attempt}")
+        _backoff(attempt)
+
+
+def _post_sequential(db, user_id, legs, operation, journal) -> Dict:
+    """Sans transactions : opération "pending" (verrou d'idempotence), puis wallet, puis journal"""
+    db.ledger_operations.insert_one(dict(operation))
+    try:
+        applied = _apply_to_wallet(db, user_id, legs)
+    except BaseException:
+        # Wallet inchangé : la clé redevient utilisable
+        db.ledger_operations.delete_one({'_id': operation['_id'], 'status': STATUS_PENDING})
+        raise
+    try:
+        return journal(applied)
+    except PyMongoError as e:
+        # Soldes déjà mis à jour : l'opération reste "pending" avec ses montants et son seq
+        # (la reconstruction signale le wallet comme incomplet tant que le journal manque)
+        logger.error(f"Ledger journal write failed after wallet update ({operation['_id']}): {e}")
+        try:
+            db.ledger_operations.update_one({'_id': operation['_id']}, {'$set': {'seq': applied['seq']}})
+        except PyMongoError:
+            pass
+        balances = {currency: float(amount) for currency, amount in applied['balances'].items()}
+        return {'operation_id': operation['_id'], 'balances': balances, 'transaction': None, 'replayed': False}
@@ -0,0 +1,314 @@
+"""
+Métriques agrégées du dashboard admin (collection metrics_daily)
+
+Documents:
+- {_id: "YYYY-MM-DD"} : compteurs du jour (transactions, volume, volume par devise,
+  inscriptions) + ventilation horaire dans hours.HH
+- {_id: "totals"}     : compteurs cumulés (utilisateurs, transactions, volume, devises)
+
+Mis à jour par $inc à chaque écriture (record_transaction / record_signup), décrémentés
+lors des suppressions admin (record_deletions) et recalculés périodiquement par
+reconcile_metrics (worker) pour corriger toute dérive (écritures concurrentes au
+recalcul, données historiques).
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import ReplaceOne
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+TOTALS_ID = 'totals'
+
+# Jours recalculés à chaque réconciliation périodique
+RECONCILE_DAYS = 2
+
+# Jours reconstruits à la première initialisation (graphiques jusqu'à un an)
+BACKFILL_DAYS = 366
+
+# Champs d'une transaction lus pour la décrémenter (record_deletions)
+TRANSACTION_FIELDS = {'created_at': 1, 'amount': 1, 'from_currency': 1, 'currency': 1}
+
+_indexes_ready = False
+
+
+def _get_db():
+    from app.services.db_service import get_db, get_pooled_db
+    try:
+        return get_db()
+    except RuntimeError:
+        # Hors contexte Flask (worker) : client partagé du process
+        return get_pooled_db()
+
+
+def _day_id(moment: datetime) -> str:
+    return moment.strftime('%Y-%m-%d')
+
+
+def _transaction_currency(transaction: Dict) -> Optional[str]:
+    """Devise du volume : from_currency (swap, envoi) ou currency (dépôt, retrait, virement)"""
+    return transaction.get('from_currency') or transaction.get('currency')
+
+
+def ensure_indexes(db):
+    """Index des lectures du dashboard (créés une fois par process)"""
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    db.transactions.create_index([('created_at', -1)])
+    db.users.create_index([('created_at', -1)])
+    db.history.create_index([('timestamp', -1)])
+    _indexes_ready = True
+
+
+# ============================================================
+# MISE À JOUR INCRÉMENTALE (À L'ÉCRITURE)
+# ============================================================
+
+def _increment_day(db, moment: datetime, inc: Dict):
+    """Applique les compteurs au jour de `moment` et à son heure"""
+    hour = moment.strftime('%H')
+    day_inc = dict(inc)
+    for field, value in inc.items():
+        if '.' not in field:
+            day_inc[f'hours.{hour}.{field}'] = value
+
+    db.metrics_daily.update_one(
+        {'_id': _day_id(moment)},
+        {
+            '$inc': day_inc,
+            '$set': {'updated_at': datetime.utcnow()},
+            '$setOnInsert': {'date': datetime.combine(moment.date(), datetime.min.time())}
+        },
+        upsert=True
+    )
+
+
+def _increment(db, moment: datetime, inc: Dict):
+    """Applique les mêmes compteurs au jour (et à son heure) et aux totaux"""
+    _increment_day(db, moment, inc)
+    db.metrics_daily.update_one({'_id': TOTALS_ID}, {'$inc': inc}, upsert=True)
+
+
+def _transaction_inc(transaction: Dict) -> Dict:
+    """Compteurs d'une transaction"""
+    amount = float(transaction.get('amount') or 0)
+    inc = {'transactions': 1, 'volume': amount}
+    currency = _transaction_currency(transaction)
+    if currency:
+        inc[f'volume_by_currency.{currency}'] = amount
+    if transaction.get('from_currency'):
+        inc[f'currency_counts.{transaction["from_currency"]}'] = 1
+    return inc
+
+
+def record_transaction(transaction: Dict, db=None):
+    """Compte une transaction insérée (ne fait jamais échouer l'écriture appelante)"""
+    db = db if db is not None else _get_db()
+    if db is None:
+        return
+    try:
+        _increment(db, transaction.get('created_at') or datetime.utcnow(), _transaction_inc(transaction))
+    except (PyMongoError, TypeError, ValueError) as e:
+        logger.warning(f"Metrics update failed for transaction: {e}")
+
+
+def record_signup(user: Dict, db=None):
+    """Compte une inscription"""
+    db = db if db is not None else _get_db()
+    if db is None:
+        return
+    try:
+        _increment(db, user.get('created_at') or datetime.utcnow(), {'users': 1, 'signups': 1})
+    except PyMongoError as e:
+        logger.warning(f"Metrics update failed for signup: {e}")
+
+
+def record_deletions(users: Iterable[Dict], transactions: Iterable[Dict], db=None):
+    """
+    Retire des compteurs des utilisateurs et des transactions supprimés (suppression admin) :
+    un $inc négatif par heure touchée, un seul pour les totaux.
+
+    Args:
+        users: Utilisateurs supprimés (created_at)
+        transactions: Transactions supprimées (created_at, amount, from_currency, currency)
+    """
+    db = db if db is not None else _get_db()
+    if db is None:
+        return
+
+    by_hour: Dict[datetime, Dict] = {}
+    totals: Dict[str, float] = {}
+
+    def _subtract(moment: Optional[datetime], day_inc: Dict, totals_inc: Dict):
+        if moment:
+            bucket = by_hour.setdefault(moment.replace(minute=0, second=0, microsecond=0), {})
+            for field, value in day_inc.items():
+                bucket[field] = bucket.get(field, 0) - value
+        for field, value in totals_inc.items():
+            totals[field] = totals.get(field, 0) - value
+
+    for user in users:
+        # Mêmes champs que reconcile_metrics : inscriptions par jour, utilisateurs au total
+        _subtract(user.get('created_at'), {'signups': 1}, {'users': 1})
+    for transaction in transactions:
+        try:
+            inc = _transaction_inc(transaction)
+            _subtract(transaction.get('created_at'), inc, inc)
+        except (TypeError, ValueError) as e:
+            # Montant illisible : la réconciliation périodique corrigera
+            logger.warning(f"Metrics decrement skipped for transaction {transaction.get('_id')}: {e}")
+
+    try:
+        for moment, inc in by_hour.items():
+            _increment_day(db, moment, inc)
+        if totals:
+            db.metrics_daily.update_one({'_id': TOTALS_ID}, {'$inc': totals}, upsert=True)
+    except PyMongoError as e:
+        logger.warning(f"Metrics update failed for deletions: {e}")
+
+
+# ============================================================
+# RÉCONCILIATION (JOB PÉRIODIQUE)
+# ============================================================
+
+def _empty_day(day: datetime) -> Dict:
+    return {
+        '_id': _day_id(day),
+        'date': day,
+        'transactions': 0,
+        'volume': 0,
+        'signups': 0,
+        'volume_by_currency': {},
+        'currency_counts': {},
+        'hours': {},
+    }
+
+
+def reconcile_metrics(days: int = RECONCILE_DAYS, db=None) -> Dict:
+    """
+    Recalcule les totaux et les `days` derniers jours depuis les collections sources.
+
+    Returns:
+        {'days': nombre de jours réécrits, 'totals': totaux recalculés}
+    """
+    db = db if db is not None else _get_db()
+    if db is None:
+        return {}
+
+    ensure_indexes(db)
+    now = datetime.utcnow()
+    today = datetime.combine(now.date(), datetime.min.time())
+    start = today - timedelta(days=days - 1)
+
+    docs = {}
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        docs[_day_id(day)] = _empty_day(day)
+
+    tx_rows = db.transactions.aggregate([
+        {'$match': {'created_at': {'$gte': start}}},
+        {'$group': {
+            '_id': {
+                'day': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$created_at'}},
+                'hour': {'$dateToString': {'format': '%H', 'date': '$created_at'}},
+                'from_currency': '$from_currency',
+                'currency': {'$ifNull': ['$from_currency', '$currency']},
+            },
+            'count': {'$sum': 1},
+            'volume': {'$sum': '$amount'}
+        }}
+    ])
+    for row in tx_rows:
+        key = row['_id']
+        doc = docs.get(key['day'])
+        if doc is None:
+            continue
+        hour = doc['hours'].setdefault(key['hour'], {})
+        hour['transactions'] = hour.get('transactions', 0) + row['count']
+        hour['volume'] = hour.get('volume', 0) + row['volume']
+        doc['transactions'] += row['count']
+        doc['volume'] += row['volume']
+        if key.get('currency'):
+            doc['volume_by_currency'][key['currency']] = doc['volume_by_currency'].get(key['currency'], 0) + row['volume']
+        if key.get('from_currency'):
+            doc['currency_counts'][key['from_currency']] = doc['currency_counts'].get(key['from_currency'], 0) + row['count']
+
+    signup_rows = db.users.aggregate([
+        {'$match': {'created_at': {'$gte': start}}},
+        {'$group': {
+            '_id': {
+                'day': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$created_at'}},
+                'hour': {'$dateToString': {'format': '%H', 'date': '$created_at'}},
+            },
+            'count': {'$sum': 1}
+        }}
+    ])
+    for row in signup_rows:
+        doc = docs.get(row['_id']['day'])
+        if doc is None:
+            continue
+        doc['signups'] += row['count']
+        hour = doc['hours'].setdefault(row['_id']['hour'], {})
+        hour['signups'] = hour.get('signups', 0) + row['count']
+
+    # Totaux : une seule passe $facet sur les transactions
+    facets = list(db.transactions.aggregate([
+        {'$facet': {
+            'all': [{'$group': {'_id': None, 'count': {'$sum': 1}, 'volume': {'$sum': '$amount'}}}],
+            'volume_by_currency': [
+                {'$group': {'_id': {'$ifNull': ['$from_currency', '$currency']}, 'volume': {'$sum': '$amount'}}}
+            ],
+            'currency_counts': [{'$group': {'_id': '$from_currency', 'count': {'$sum': 1}}}],
+        }}
+    ]))
+    facet = facets[0] if facets else {'all': [], 'volume_by_currency': [], 'currency_counts': []}
+    overall = facet['all'][0] if facet['all'] else {'count': 0, 'volume': 0}
+
+    totals = {
+        '_id': TOTALS_ID,
+        'users': db.users.count_documents({}),
+        'transactions': overall['count'],
+        'volume': overall['volume'],
+        'volume_by_currency': {row['_id']: row['volume'] for row in facet['volume_by_currency'] if row['_id']},
+        'currency_counts': {row['_id']: row['count'] for row in facet['currency_counts'] if row['_id']},
+        'reconciled_at': now,
+    }
+
+    now_written = datetime.utcnow()
+    operations = [ReplaceOne({'_id': doc_id}, {**doc, 'updated_at': now_written}, upsert=True) for doc_id, doc in docs.items()]
+    operations.append(ReplaceOne({'_id': TOTALS_ID}, totals, upsert=True))
+    db.metrics_daily.bulk_write(operations, ordered=False)
+
+    logger.info(f"Metrics reconciled: {len(docs)} days, {totals['transactions']} transactions, {totals['users']} users")
+    return {'days': len(docs), 'totals': totals}
+
+
+# ============================================================
+# LECTURE (DASHBOARD)
+# ============================================================
+
+def get_daily_metrics(days: int = 7, db=None) -> List[Dict]:
+    """Documents des `days` derniers jours (jours sans activité inclus), du plus ancien au plus récent"""
+    db = db if db is not None else _get_db()
+    today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    day_list = [today - timedelta(days=i) for i in range(days - 1, -1, -1)]
+
+    found = {}
+    if db is not None:
+        found = {doc['_id']: doc for doc in db.metrics_daily.find({'_id': {'$in': [_day_id(d) for d in day_list]}})}
+    return [found.get(_day_id(day)) or _empty_day(day) for day in day_list]
+
+
+def get_totals(db=None) -> Dict:
+    """Totaux cumulés (réconciliés à la volée au premier accès)"""
+    db = db if db is not None else _get_db()
+    if db is None:
+        return {}
+    totals = db.metrics_daily.find_one({'_id': TOTALS_ID})
+    if totals is None or 'reconciled_at' not in totals:
+        # Premier déploiement : initialise les compteurs depuis les collections sources
+        totals = reconcile_metrics(days=BACKFILL_DAYS, db=db).get('totals', {})
+    return totals
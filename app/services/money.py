@@ -0,0 +1,276 @@
+"""
+Montants en virgule fixe : entier d'unités mineures par devise
+
+Un montant est un entier (units) à l'échelle de sa devise : décimales de la
+devise (ISO 4217) + EXTRA_DIGITS de précision interne pour les frais et les
+conversions. 12.3456 EUR = Money(123456, 'EUR') (échelle 4).
+
+- Arithmétique exacte sur entiers ; un seul arrondi (au demi pair) à la
+  création depuis un décimal et à la multiplication par un taux.
+- Stocké en Int64 dans MongoDB (balances_minor, amount_minor), sans perte.
+- Formatage par arithmétique entière : pas de passage par un float.
+- to_units / from_units / format_units : conversions vectorisées (NumPy) pour
+  les traitements en masse (exports, reconstructions).
+"""
+from decimal import ROUND_HALF_EVEN, Decimal, InvalidOperation
+from typing import Iterable, List, Optional
+
+import numpy as np
+from bson.decimal128 import Decimal128
+from bson.int64 import Int64
+
+# Décimales des devises (ISO 4217)
+MINOR_UNITS = {
+    'USD': 2, 'EUR': 2, 'MAD': 2, 'GBP': 2, 'CHF': 2, 'CAD': 2, 'AED': 2, 'SAR': 2,
+    'JPY': 0, 'KWD': 3, 'BHD': 3, 'TND': 3,
+}
+DEFAULT_MINOR_UNITS = 2
+
+# Précision interne au-delà de l'unité mineure (frais en pourcentage, conversions)
+EXTRA_DIGITS = 2
+
+_FACTORS = [10 ** digits for digits in range(19)]
+
+# Plus grand montant accepté d'une opération : reste loin de la limite Int64 (~9.2e18
+# unités) à toutes les échelles, frais et conversions compris
+MAX_AMOUNT = 1e12
+
+
+def minor_units(currency: str) -> int:
+    """Décimales affichées de la devise"""
+    return MINOR_UNITS.get(currency, DEFAULT_MINOR_UNITS)
+
+
+def scale(currency: str) -> int:
+    """Décimales conservées pour la devise"""
+    return minor_units(currency) + EXTRA_DIGITS
+
+
+def _to_decimal(value) -> Decimal:
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, Decimal128):
+        return value.to_decimal()
+    if isinstance(value, float):
+        # repr le plus court : 0.1 -> Decimal('0.1'), pas l'approximation binaire
+        return Decimal(repr(value))
+    return Decimal(value if isinstance(value, (int, str)) else str(value))
+
+
+def _round_units(units: int, from_scale: int, to_scale: int) -> int:
+    """Change d'échelle un entier (arrondi au demi pair en réduisant)"""
+    if to_scale >= from_scale:
+        return units * _FACTORS[to_scale - from_scale]
+    quotient, remainder = divmod(units, _FACTORS[from_scale - to_scale])
+    half = _FACTORS[from_scale - to_scale] // 2
+    if remainder > half or (remainder == half and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+class Money:
+    """Montant d'une devise en unités mineures entières (immuable)"""
+
+    __slots__ = ('units', 'currency')
+
+    def __init__(self, units: int, currency: str):
+        object.__setattr__(self, 'units', int(units))
+        object.__setattr__(self, 'currency', currency)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Money is immutable")
+
+    @classmethod
+    def of(cls, value, currency: str) -> 'Money':
+        """Depuis un nombre (int, float, Decimal, Decimal128, chaîne) en unités de la devise"""
+        if isinstance(value, Money):
+            if value.currency != currency:
+                raise ValueError(f"Currency mismatch: {value.currency} != {currency}")
+            return value
+        if value is None or value == '':
+            return cls(0, currency)
+        try:
+            units = _to_decimal(value).scaleb(scale(currency)).to_integral_value(ROUND_HALF_EVEN)
+        except (InvalidOperation, ValueError) as e:
+            raise ValueError(f"Invalid amount: {value!r}") from e
+        if not units.is_finite():
+            raise ValueError(f"Invalid amount: {value!r}")
+        return cls(int(units), currency)
+
+    @classmethod
+    def zero(cls, currency: str) -> 'Money':
+        return cls(0, currency)
+
+    @property
+    def scale(self) -> int:
+        return scale(self.currency)
+
+    def to_decimal(self) -> Decimal:
+        return Decimal(self.units).scaleb(-self.scale)
+
+    def __float__(self) -> float:
+        # Division entière correctement arrondie : le double le plus proche du décimal exact
+        return self.units / _FACTORS[self.scale]
+
+    def to_bson(self) -> Int64:
+        return Int64(self.units)
+
+    # Arithmétique
+
+    def _check(self, other: 'Money'):
+        if not isinstance(other, Money):
+            return NotImplemented
+        if other.currency != self.currency:
+            raise ValueError(f"Currency mismatch: {self.currency} != {other.currency}")
+        return other
+
+    def __add__(self, other):
+        if self._check(other) is NotImplemented:
+            return NotImplemented
+        return Money(self.units + other.units, self.currency)
+
+    def __sub__(self, other):
+        if self._check(other) is NotImplemented:
+            return NotImplemented
+        return Money(self.units - other.units, self.currency)
+
+    def __neg__(self):
+        return Money(-self.units, self.currency)
+
+    def __abs__(self):
+        return Money(abs(self.units), self.currency)
+
+    def __bool__(self):
+        return self.units != 0
+
+    def multiply(self, factor) -> 'Money':
+        """Montant x facteur (pourcentage de frais...), arrondi une fois à l'échelle de la devise"""
+        units = (Decimal(self.units) * _to_decimal(factor)).to_integral_value(ROUND_HALF_EVEN)
+        return Money(int(units), self.currency)
+
+    def convert(self, rate, to_currency: str) -> 'Money':
+        """Conversion au taux donné (unités de to_currency pour 1 unité de la devise)"""
+        value = Decimal(self.units) * _to_decimal(rate)
+        units = value.scaleb(scale(to_currency) - self.scale).to_integral_value(ROUND_HALF_EVEN)
+        return Money(int(units), to_currency)
+
+    # Comparaisons (même devise)
+
+    def __eq__(self, other):
+        return isinstance(other, Money) and self.units == other.units and self.currency == other.currency
+
+    def __hash__(self):
+        return hash((self.units, self.currency))
+
+    def __lt__(self, other):
+        return self._check(other) is not NotImplemented and self.units < other.units
+
+    def __le__(self, other):
+        return self._check(other) is not NotImplemented and self.units <= other.units
+
+    def __gt__(self, other):
+        return self._check(other) is not NotImplemented and self.units > other.units
+
+    def __ge__(self, other):
+        return self._check(other) is not NotImplemented and self.units >= other.units
+
+    # Représentation
+
+    def format(self, digits: Optional[int] = None, grouping: bool = False) -> str:
+        """Chaîne à `digits` décimales (par défaut celles de la devise), arrondie au demi pair"""
+        return _format(self.units, self.scale, minor_units(self.currency) if digits is None else digits, grouping)
+
+    def __str__(self):
+        return _format(self.units, self.scale, self.scale, False)
+
+    def __repr__(self):
+        return f"Money('{self}', '{self.currency}')"
+
+
+def _format(units: int, from_scale: int, digits: int, grouping: bool) -> str:
+    units = _round_units(units, from_scale, digits)
+    sign = '-' if units < 0 else ''
+    whole, fraction = divmod(abs(units), _FACTORS[digits])
+    whole_text = f"{whole:,}" if grouping else str(whole)
+    return f"{sign}{whole_text}.{fraction:0{digits}d}" if digits else f"{sign}{whole_text}"
+
+
+def format_amount(value, currency: Optional[str] = None, digits: Optional[int] = None,
+                  grouping: bool = False) -> str:
+    """
+    Formate un montant stocké (float, Decimal128, Int64, Money...) sans arrondi binaire :
+    le décimal exact est arrondi une seule fois, directement à `digits` décimales
+    """
+    if isinstance(value, Money):
+        return value.format(digits, grouping)
+    digits = minor_units(currency or '') if digits is None else digits
+    if value is None or value == '':
+        value = 0
+    try:
+        units = _to_decimal(value).scaleb(digits).to_integral_value(ROUND_HALF_EVEN)
+    except (InvalidOperation, ValueError) as e:
+        raise ValueError(f"Invalid amount: {value!r}") from e
+    return _format(int(units), digits, digits, grouping)
+
+
+# ============================================================
+# CONVERSIONS VECTORISÉES (TRAITEMENTS EN MASSE)
+# ============================================================
+
+def to_units(values: Iterable, currency: Optional[str] = None, digits: Optional[int] = None) -> np.ndarray:
+    """
+    Montants -> entiers int64 à l'échelle de la devise (ou à `digits` décimales).
+    Les valeurs absentes ou illisibles donnent 0 (voir le masque de valid_mask).
+    """
+    factor = float(_FACTORS[scale(currency) if digits is None else digits])
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'f':
+        numbers = values
+    else:
+        numbers = np.asarray(_as_floats(values), dtype=np.float64)
+    return np.rint(np.nan_to_num(numbers) * factor).astype(np.int64)
+
+
+def valid_mask(values: Iterable) -> np.ndarray:
+    """Vrai pour les montants présents et lisibles"""
+    return ~np.isnan(np.asarray(_as_floats(values), dtype=np.float64))
+
+
+def from_units(units: np.ndarray, currency: Optional[str] = None, digits: Optional[int] = None) -> np.ndarray:
+    """Entiers -> float64 (affichage, graphiques)"""
+    factor = _FACTORS[scale(currency) if digits is None else digits]
+    return np.asarray(units, dtype=np.int64) / factor
+
+
+def format_units(units: np.ndarray, currency: str, digits: Optional[int] = None,
+                 grouping: bool = False, from_digits: Optional[int] = None) -> List[str]:
+    """
+    Entiers exacts (unités d'un Money) -> chaînes à `digits` décimales (arrondi au demi
+    pair vectorisé, puis formatage entier). Pour des montants flottants, passer par
+    to_units(values, digits=digits) puis format_units(..., digits=digits, from_digits=digits) :
+    un seul arrondi, pas deux.
+    """
+    from_scale = scale(currency) if from_digits is None else from_digits
+    digits = minor_units(currency) if digits is None else digits
+    units = np.asarray(units, dtype=np.int64)
+    if digits < from_scale:
+        step = _FACTORS[from_scale - digits]
+        quotient, remainder = np.divmod(units, step)
+        half = step // 2
+        quotient += (remainder > half) | ((remainder == half) & (quotient % 2 == 1))
+        units = quotient
+    elif digits > from_scale:
+        units = units * _FACTORS[digits - from_scale]
+    return [_format(value, digits, digits, grouping) for value in units.tolist()]
+
+
+def _as_floats(values: Iterable) -> List[float]:
+    result = []
+    for value in values:
+        if value is None or value == '':
+            result.append(np.nan)
+            continue
+        try:
+            result.append(float(value.to_decimal()) if isinstance(value, Decimal128) else float(value))
+        except (TypeError, ValueError):
+            result.append(np.nan)
+    return result
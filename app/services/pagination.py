@@ -0,0 +1,291 @@
+"""
+Pagination par clé (keyset) des listes de l'admin
+
+Au lieu de skip/limit (coût proportionnel au numéro de page) ou de tout charger,
+chaque page reprend après la clé de tri du dernier élément affiché :
+    {created_at < c} OU {created_at = c ET _id < id}
+La requête suit l'index (champ de tri, _id) et ne lit que `limit + 1` documents,
+quelle que soit la taille de la collection ou la profondeur de navigation.
+
+Les curseurs sont opaques pour le client : clé de tri sérialisée (Extended JSON
+pour ObjectId/datetime) puis encodée en base64 URL-safe.
+"""
+import base64
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId, json_util
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 200
+
+# Index des listes paginées : (champ de tri, _id) + filtres d'égalité courants
+ADMIN_INDEXES = {
+    'users': [
+        [('email', ASCENDING), ('_id', ASCENDING)],
+        [('role', ASCENDING), ('email', ASCENDING), ('_id', ASCENDING)],
+        [('kyc_status', ASCENDING), ('email', ASCENDING), ('_id', ASCENDING)],
+        [('tags', ASCENDING), ('email', ASCENDING), ('_id', ASCENDING)],
+    ],
+    'transactions': [
+        [('created_at', DESCENDING), ('_id', DESCENDING)],
+        [('status', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+        [('user_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+        [('transaction_id', ASCENDING)],
+    ],
+    'wallets': [
+        [('user_id', ASCENDING)],
+    ],
+    'beneficiaries': [
+        [('created_at', DESCENDING), ('_id', DESCENDING)],
+        [('user_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+        [('kyc_status', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+        [('tags', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+    ],
+    'atm_locations': [
+        [('created_at', DESCENDING), ('_id', DESCENDING)],
+        [('bank_code', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+        [('city', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+    ],
+    'banks': [
+        [('name', ASCENDING), ('_id', ASCENDING)],
+    ],
+}
+
+_indexes_ready = False
+
+
+class InvalidCursor(ValueError):
+    """Curseur illisible ou ne correspondant pas au tri demandé"""
+
+
+@dataclass
+class Page:
+    """Une page de résultats et les curseurs des pages voisines"""
+    items: List[Dict]
+    limit: int
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+    total: Optional[int] = None
+    args: Dict = field(default_factory=dict)
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self) -> bool:
+        return self.prev_cursor is not None
+
+    def to_dict(self) -> Dict:
+        """Métadonnées de pagination pour les réponses JSON"""
+        return {
+            'limit': self.limit,
+            'next_cursor': self.next_cursor,
+            'prev_cursor': self.prev_cursor,
+            'total': self.total,
+        }
+
+
+def ensure_admin_indexes(db):
+    """Crée les index des listes admin (une fois par process)"""
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    try:
+        for collection, indexes in ADMIN_INDEXES.items():
+            for keys in indexes:
+                db[collection].create_index(keys)
+        _indexes_ready = True
+    except PyMongoError as e:
+        logger.warning(f"Admin list indexes not created: {e}")
+
+
+# ============================================================
+# CURSEURS
+# ============================================================
+
+def encode_cursor(values: List) -> str:
+    raw = json_util.dumps(values).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str, size: int) -> List:
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json_util.loads(raw.decode('utf-8'))
+    except (ValueError, TypeError, UnicodeDecodeError) as e:
+        raise InvalidCursor(str(e))
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor("cursor does not match sort")
+    return values
+
+
+def _sort_key(doc: Dict, sort: List[Tuple[str, int]]) -> List:
+    values = []
+    for name, _ in sort:
+        value = doc
+        for part in name.split('.'):
+            value = value.get(part) if isinstance(value, dict) else None
+        values.append(value)
+    return values
+
+
+def _after(name: str, value, direction: int) -> Optional[Dict]:
+    """Condition « strictement après value » sur un champ (null trié en premier par MongoDB)"""
+    if value is None:
+        # Ascendant : tout ce qui n'est pas null vient après ; descendant : rien
+        return {name: {'$ne': None}} if direction == ASCENDING else None
+    if direction == ASCENDING:
+        return {name: {'$gt': value}}
+    return {'$or': [{name: {'$lt': value}}, {name: None}]}
+
+
+def keyset_filter(sort: List[Tuple[str, int]], values: List) -> Dict:
+    """
+    Filtre des documents situés après la clé `values` dans l'ordre `sort` :
+    OU sur chaque préfixe (égalité sur les champs précédents, strictement après sur le suivant)
+    """
+    branches = []
+    for i, (name, direction) in enumerate(sort):
+        after = _after(name, values[i], direction)
+        if after is None:
+            continue
+        equal = {sort[j][0]: values[j] for j in range(i)}
+        if not equal:
+            branches.append(after)
+        elif '$or' in after:
+            branches.append({'$and': [equal, after]})
+        else:
+            branches.append({**equal, **after})
+    if not branches:
+        return {'_id': {'$exists': False}}
+    return branches[0] if len(branches) == 1 else {'$or': branches}
+
+
+# ============================================================
+# PAGINATION
+# ============================================================
+
+def page_size(value, default: int = DEFAULT_PAGE_SIZE) -> int:
+    """Taille de page demandée, bornée à [1, MAX_PAGE_SIZE]"""
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return default
+
+
+def paginate(collection, query: Dict, sort: List[Tuple[str, int]], limit: int = DEFAULT_PAGE_SIZE,
+             after: Optional[str] = None, before: Optional[str] = None,
+             projection: Optional[Dict] = None, count: bool = False) -> Page:
+    """
+    Une page de `collection` selon `query`, triée par `sort`.
+
+    Args:
+        sort: Clé de tri ; `_id` est ajouté en dernier pour la rendre unique
+        after: Curseur de la page suivante (next_cursor d'une page précédente)
+        before: Curseur de la page précédente (prev_cursor)
+        count: Calculer aussi le total des documents filtrés (count_documents)
+
+    Raises:
+        InvalidCursor: curseur illisible (à traiter comme une première page)
+    """
+    sort = list(sort)
+    if sort[-1][0] != '_id':
+        sort.append(('_id', sort[-1][1]))
+
+    backward = before is not None and after is None
+    cursor = before if backward else after
+    query_sort = [(name, -direction) for name, direction in sort] if backward else sort
+
+    page_query = query or {}
+    if cursor:
+        keyset = keyset_filter(query_sort, decode_cursor(cursor, len(sort)))
+        page_query = {'$and': [page_query, keyset]} if page_query else keyset
+
+    docs = list(collection.find(page_query, projection).sort(query_sort).limit(limit + 1))
+    more = len(docs) > limit
+    docs = docs[:limit]
+    if backward:
+        docs.reverse()
+
+    page = Page(items=docs, limit=limit)
+    if docs:
+        first_key = encode_cursor(_sort_key(docs[0], sort))
+        last_key = encode_cursor(_sort_key(docs[-1], sort))
+        if backward:
+            page.prev_cursor = first_key if more else None
+            page.next_cursor = last_key
+        else:
+            page.next_cursor = last_key if more else None
+            page.prev_cursor = first_key if cursor else None
+    if count:
+        page.total = collection.count_documents(query or {})
+    return page
+
+
+def paginate_request(collection, query: Dict, sort: List[Tuple[str, int]], args,
+                     default_limit: int = DEFAULT_PAGE_SIZE, **kwargs) -> Page:
+    """paginate() avec limit/after/before lus dans request.args (curseur invalide = première page)"""
+    limit = page_size(args.get('limit'), default_limit)
+    try:
+        page = paginate(collection, query, sort, limit, after=args.get('after') or None,
+                        before=args.get('before') or None, **kwargs)
+    except InvalidCursor:
+        page = paginate(collection, query, sort, limit, **kwargs)
+    page.args = {key: value for key, value in args.items() if key not in ('after', 'before') and value}
+    return page
+
+
+# ============================================================
+# FILTRES ET JOINTURES
+# ============================================================
+
+def prefix_search(value: Optional[str], lower: bool = False) -> Optional[Dict]:
+    """Recherche par préfixe ancré (^...) : utilise l'index du champ, contrairement à une regex libre"""
+    value = (value or '').strip()
+    if not value:
+        return None
+    if lower:
+        value = value.lower()
+    return {'$regex': '^' + re.escape(value)}
+
+
+def contains_search(value: Optional[str]) -> Optional[Dict]:
+    """Recherche « contient » insensible à la casse (champs libres : nom, adresse)"""
+    value = (value or '').strip()
+    if not value:
+        return None
+    return {'$regex': re.escape(value), '$options': 'i'}
+
+
+def attach_users(items: Iterable[Dict], db, source: str = 'user_id', target: str = 'user_email',
+                 default: str = 'Unknown') -> List[Dict]:
+    """
+    Ajoute l'email du propriétaire à chaque élément en une seule requête $in
+    (user_id stocké en str ou en ObjectId selon les collections).
+    """
+    items = list(items)
+    ids = {}
+    for item in items:
+        raw = item.get(source)
+        if raw is None:
+            continue
+        oid = raw if isinstance(raw, ObjectId) else ObjectId(raw) if ObjectId.is_valid(str(raw)) else None
+        if oid is not None:
+            ids[str(raw)] = oid
+
+    emails = {}
+    if ids:
+        users = db.users.find({'_id': {'$in': list(set(ids.values()))}}, {'email': 1})
+        emails = {str(user['_id']): user.get('email', default) for user in users}
+
+    for item in items:
+        item[target] = emails.get(str(item.get(source)), default)
+    return items
@@ -3,14 +3,30 @@ SarfX Rate Alert Service
 Service pour la gestion des alertes de taux de change
 """
 
+from collections import defaultdict
 from datetime import datetime, timedelta
+from itertools import groupby, islice
 from typing import Optional, Dict, List, Any
 from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+import numpy as np
 import uuid
 import logging
 
+from app.services.alert_index import INDEX_FIELDS, get_alert_index
+
 logger = logging.getLogger(__name__)
 
+_EPOCH = datetime(1970, 1, 1)
+
+# Index du parcours des alertes actives (créés au premier check du process)
+_alert_indexes_ready = False
+
+
+def _epoch_seconds(value: datetime) -> float:
+    """Datetime UTC naïf -> secondes depuis l'epoch"""
+    return (value - _EPOCH).total_seconds()
+
 
 class RateAlertService:
     """Service de gestion des alertes de taux de change"""
@@ -44,14 +60,32 @@ class RateAlertService:
         ('SAR', 'MAD')
     ]
 
+    # Minimum entre deux déclenchements d'une même alerte
+    TRIGGER_COOLDOWN = timedelta(hours=1)
+
+    # Alertes évaluées par bloc (même paire) et déclenchements écrits par lot
+    EVALUATION_CHUNK = 10000
+    TRIGGER_BATCH_SIZE = 1000
+
+    # Champs lus par check_alerts
+    EVALUATION_FIELDS = {
+        "alert_id": 1, "user_id": 1, "pair": 1, "from_currency": 1, "to_currency": 1,
+        "alert_type": 1, "target_rate": 1, "current_rate_at_creation": 1,
+        "last_triggered": 1, "notification_channels": 1
+    }
+
     def __init__(self):
         pass
 
     @property
     def db(self):
         """Obtient une connexion DB fraîche à chaque accès"""
-        from app.services.db_service import get_db
-        return get_db()
+        from app.services.db_service import get_db, get_pooled_db
+        try:
+            return get_db()
+        except RuntimeError:
+            # Hors contexte Flask (job de vérification) : client partagé du process
+            return get_pooled_db()
 
     # ==================== CRUD Operations ====================
 
@@ -150,6 +184,7 @@ class RateAlertService:
         }
 
         db.rate_alerts.insert_one(alert)
+        self._sync_index(alert)
 
         logger.info(f"Rate alert created: {alert_id} for user {user_id} - {from_currency}/{to_currency}")
 
@@ -245,12 +280,15 @@ class RateAlertService:
 
         safe_updates['updated_at'] = datetime.utcnow()
 
-        result = db.rate_alerts.update_one(
+        alert = db.rate_alerts.find_one_and_update(
             {"alert_id": alert_id, "user_id": user_id, "status": {"$ne": "deleted"}},
-            {"$set": safe_updates}
+            {"$set": safe_updates},
+            projection=INDEX_FIELDS,
+            return_document=ReturnDocument.AFTER
         )
 
-        if result.modified_count > 0:
+        if alert:
+            self._sync_index(alert)
             return {
                 "success": True,
                 "message": "Alerte mise à jour avec succès"
@@ -264,12 +302,16 @@ class RateAlertService:
         if db is None:
             return {"success": False, "error": "Database unavailable"}
 
-        result = db.rate_alerts.update_one(
+        now = datetime.utcnow()
+        alert = db.rate_alerts.find_one_and_update(
             {"alert_id": alert_id, "user_id": user_id},
-            {"$set": {"status": "deleted", "deleted_at": datetime.utcnow()}}
+            {"$set": {"status": "deleted", "deleted_at": now, "updated_at": now}},
+            projection=INDEX_FIELDS,
+            return_document=ReturnDocument.AFTER
         )
 
-        if result.modified_count > 0:
+        if alert:
+            self._sync_index(alert)
             return {"success": True, "message": "Alerte supprimée"}
 
         return {"success": False, "error": "Alerte non trouvée"}
@@ -284,206 +326,333 @@ class RateAlertService:
 
     # ==================== Alert Checking ====================
 
-    def check_alerts(self) -> Dict[str, Any]:
+    def _sync_index(self, alert: Dict):
+        """Hook d'écriture : répercute l'alerte dans l'index de seuils s'il est chargé dans ce process"""
+        index = get_alert_index()
+        if index.loaded:
+            index.apply(alert)
+
+    def check_alerts(self, snapshot: Dict = None, use_index: bool = True) -> Dict[str, Any]:
         """
         Vérifie toutes les alertes actives et déclenche celles qui correspondent
-        Cette méthode devrait être appelée périodiquement (ex: toutes les 5 minutes)
+        Appelée à chaque cycle du worker de taux (python worker.py)
+
+        Par défaut, l'index de seuils (alert_index.py) donne directement les alertes franchies.
+        use_index=False : parcours complet en flux (curseur trié par paire), un seul taux
+        par paire, évaluation vectorisée par groupe.
+        Dans les deux cas, écritures groupées (bulk_write / insert_many).
+
+        Args:
+            snapshot: Snapshot de taux publié (évite une lecture par paire)
+            use_index: Utiliser l'index de seuils plutôt que le parcours complet
         """
         db = self.db
         if db is None:
             return {"success": False, "error": "Database unavailable"}
 
         now = datetime.utcnow()
+        self._ensure_alert_indexes(db)
+
+        # Expirations : une seule requête ensembliste
+        expired_count = db.rate_alerts.update_many(
+            {"status": "active", "expiry_date": {"$ne": None, "$lt": now}},
+            {"$set": {"status": "expired"}}
+        ).modified_count
+
+        if use_index:
+            return self._check_indexed_alerts(db, snapshot, now, expired_count)
+
+        checked_count = 0
+        triggered = []
         triggered_count = 0
-        expired_count = 0
-
-        # Récupérer toutes les alertes actives
-        active_alerts = list(db.rate_alerts.find({"status": "active"}))
-
-        for alert in active_alerts:
-            # Vérifier expiration
-            if alert.get('expiry_date') and alert['expiry_date'] < now:
-                db.rate_alerts.update_one(
-                    {"_id": alert["_id"]},
-                    {"$set": {"status": "expired"}}
-                )
-                expired_count += 1
-                continue
 
-            # Récupérer le taux actuel
-            current_rate = self._get_current_rate(
-                alert['from_currency'],
-                alert['to_currency']
-            )
+        cursor = db.rate_alerts.find(
+            {"status": "active"},
+            projection=self.EVALUATION_FIELDS,
+            batch_size=self.EVALUATION_CHUNK
+        ).sort("pair", 1)
 
-            if current_rate is None:
-                continue
+        for _, group in groupby(cursor, key=lambda a: a.get('pair')):
+            first_chunk = True
+            while True:
+                chunk = list(islice(group, self.EVALUATION_CHUNK))
+                if not chunk:
+                    break
+                checked_count += len(chunk)
 
-            # Vérifier si l'alerte doit être déclenchée
-            should_trigger = self._should_trigger_alert(alert, current_rate)
+                # Un seul taux par paire
+                if first_chunk:
+                    current_rate = self._get_pair_rate(chunk[0].get('from_currency'), chunk[0].get('to_currency'), snapshot)
+                    first_chunk = False
+                if current_rate is None:
+                    continue
 
-            if should_trigger:
-                self._trigger_alert(alert, current_rate)
-                triggered_count += 1
+                for index in self._evaluate_alerts(chunk, current_rate, now):
+                    triggered.append((chunk[index], current_rate))
 
-        logger.info(f"Alert check completed: {triggered_count} triggered, {expired_count} expired")
+                if len(triggered) >= self.TRIGGER_BATCH_SIZE:
+                    triggered_count += self._trigger_alerts(triggered, now)
+                    triggered = []
+
+        if triggered:
+            triggered_count += self._trigger_alerts(triggered, now)
+
+        logger.info(f"Alert check completed: {checked_count} checked, {triggered_count} triggered, {expired_count} expired")
 
         return {
             "success": True,
-            "checked": len(active_alerts),
+            "checked": checked_count,
             "triggered": triggered_count,
             "expired": expired_count
         }
 
-    def _should_trigger_alert(self, alert: Dict, current_rate: float) -> bool:
-        """Détermine si une alerte doit être déclenchée"""
-        alert_type = alert['alert_type']
-        target = alert['target_rate']
-
-        # Éviter les déclenchements multiples dans un court laps de temps
-        if alert.get('last_triggered'):
-            cooldown = timedelta(hours=1)  # Minimum 1h entre deux déclenchements
-            if datetime.utcnow() - alert['last_triggered'] < cooldown:
-                return False
-
-        if alert_type == 'above':
-            return current_rate >= target
-
-        elif alert_type == 'below':
-            return current_rate <= target
-
-        elif alert_type == 'change_percent':
-            # Calculer le changement par rapport au taux de création
-            original_rate = alert.get('current_rate_at_creation', current_rate)
-            if original_rate == 0:
-                return False
-
-            change_percent = abs((current_rate - original_rate) / original_rate) * 100
-            return change_percent >= target
-
-        elif alert_type == 'daily_summary':
-            # Vérifier si le résumé quotidien n'a pas déjà été envoyé aujourd'hui
-            if alert.get('last_triggered'):
-                last = alert['last_triggered']
-                today = datetime.utcnow().date()
-                if last.date() == today:
-                    return False
-            return True
-
-        return False
-
-    def _trigger_alert(self, alert: Dict, current_rate: float):
-        """Déclenche une alerte et envoie les notifications"""
-        db = self.db
-        if db is None:
-            return
+    def _check_indexed_alerts(self, db, snapshot: Optional[Dict], now: datetime, expired_count: int) -> Dict[str, Any]:
+        """Tick via l'index de seuils : seules les alertes franchies sont lues et écrites"""
+        index = get_alert_index()
+        index.sync(db)
 
-        now = datetime.utcnow()
+        rates = {}
 
-        # Créer un enregistrement de déclenchement
-        trigger_record = {
-            "alert_id": alert['alert_id'],
-            "user_id": alert['user_id'],
-            "pair": alert['pair'],
-            "target_rate": alert['target_rate'],
-            "triggered_rate": current_rate,
-            "alert_type": alert['alert_type'],
-            "triggered_at": now
-        }
+        def rate_for(from_currency, to_currency):
+            if (from_currency, to_currency) not in rates:
+                rates[(from_currency, to_currency)] = self._get_pair_rate(from_currency, to_currency, snapshot)
+            return rates[(from_currency, to_currency)]
 
-        db.rate_alert_triggers.insert_one(trigger_record)
+        triggered = index.crossed(rate_for, now)
 
-        # Mettre à jour l'alerte
-        update_data = {
-            "trigger_count": alert.get('trigger_count', 0) + 1,
-            "last_triggered": now,
-            "last_triggered_rate": current_rate
+        triggered_count = 0
+        for start in range(0, len(triggered), self.TRIGGER_BATCH_SIZE):
+            batch = triggered[start:start + self.TRIGGER_BATCH_SIZE]
+            triggered_count += self._trigger_alerts(batch, now)
+            index.mark_triggered(batch, now)
+
+        logger.info(f"Alert check completed (index): {len(rates)} pairs, {triggered_count} triggered, {expired_count} expired")
+
+        return {
+            "success": True,
+            "checked": index.stats()["alerts"],
+            "triggered": triggered_count,
+            "expired": expired_count
         }
 
-        # Pour les alertes one-time (above/below), marquer comme triggered
-        if alert['alert_type'] in ['above', 'below']:
-            update_data['status'] = 'triggered'
+    def _ensure_alert_indexes(self, db):
+        """Index du parcours trié par paire (créé une fois par process)"""
+        global _alert_indexes_ready
+        if _alert_indexes_ready:
+            return
+        db.rate_alerts.create_index([("status", 1), ("pair", 1)])
+        db.rate_alerts.create_index([("status", 1), ("expiry_date", 1)])
+        db.rate_alerts.create_index([("updated_at", 1)])
+        _alert_indexes_ready = True
+
+    def _get_pair_rate(self, from_currency: str, to_currency: str, snapshot: Optional[Dict]) -> Optional[float]:
+        """Taux d'une paire : snapshot du cycle si fourni, sinon exchange_service"""
+        if not from_currency or not to_currency:
+            return None
 
-        db.rate_alerts.update_one(
-            {"_id": alert["_id"]},
-            {"$set": update_data}
-        )
+        if snapshot:
+            from app.services.rate_ingestion_service import snapshot_rate
+            rate = snapshot_rate(snapshot, from_currency, to_currency)
+            if rate is not None:
+                return rate
+        return self._get_current_rate(from_currency, to_currency)
 
-        # Envoyer les notifications
-        self._send_alert_notifications(alert, current_rate)
+    def _evaluate_alerts(self, alerts: List[Dict], current_rate: float, now: datetime) -> np.ndarray:
+        """
+        Indices des alertes d'une même paire à déclencher (évaluation vectorisée)
 
-        logger.info(f"Alert triggered: {alert['alert_id']} - {alert['pair']} at {current_rate}")
+        Règles: above/below sur target_rate, change_percent depuis le taux de création,
+        daily_summary une fois par jour, 1h minimum entre deux déclenchements.
+        """
+        alert_types = np.array([a.get('alert_type') for a in alerts])
+        targets = np.array([a.get('target_rate') or 0.0 for a in alerts], dtype=float)
+        origins = np.array([a.get('current_rate_at_creation') or current_rate for a in alerts], dtype=float)
+        last_triggered = np.array([
+            _epoch_seconds(a['last_triggered']) if a.get('last_triggered') else np.nan
+            for a in alerts
+        ])
+
+        now_seconds = _epoch_seconds(now)
+        today_seconds = _epoch_seconds(datetime.combine(now.date(), datetime.min.time()))
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # Éviter les déclenchements multiples dans un court laps de temps
+            cooling_down = now_seconds - last_triggered < self.TRIGGER_COOLDOWN.total_seconds()
+            change_percent = np.abs((current_rate - origins) / origins) * 100
+
+            should_trigger = (
+                ((alert_types == 'above') & (current_rate >= targets))
+                | ((alert_types == 'below') & (current_rate <= targets))
+                | ((alert_types == 'change_percent') & (origins != 0) & (change_percent >= targets))
+                # Résumé quotidien pas encore envoyé aujourd'hui
+                | ((alert_types == 'daily_summary') & ~(last_triggered >= today_seconds))
+            )
+
+        return np.flatnonzero(should_trigger & ~cooling_down)
 
-    def _send_alert_notifications(self, alert: Dict, current_rate: float):
-        """Envoie les notifications pour une alerte déclenchée"""
+    def _claim_filter(self, alert: Dict, now: datetime) -> Dict:
+        """
+        Alerte encore active et hors cooldown (résumé quotidien : pas encore envoyé aujourd'hui) ;
+        un seul cycle parmi des vérifications concurrentes (worker, web) la fait passer
+        """
+        triggered_before = now - self.TRIGGER_COOLDOWN
+        if alert['alert_type'] == 'daily_summary':
+            triggered_before = min(triggered_before, datetime.combine(now.date(), datetime.min.time()))
+        return {
+            "_id": alert["_id"],
+            "status": "active",
+            "$or": [{"last_triggered": None}, {"last_triggered": {"$lt": triggered_before}}]
+        }
+
+    def _trigger_alerts(self, triggered: List[tuple], now: datetime) -> int:
+        """
+        Déclenche un lot d'alertes : mises à jour, historique et notifications groupés.
+        Seules les alertes réclamées par ce cycle (update conditionnel portant son jeton)
+        sont historisées et notifiées
+        """
         db = self.db
         if db is None:
-            return
+            return 0
+
+        token = uuid.uuid4().hex
+        updates = []
+        for alert, current_rate in triggered:
+            update_data = {
+                "last_triggered": now,
+                "last_triggered_rate": current_rate,
+                "trigger_token": token
+            }
+            # Pour les alertes one-time (above/below), marquer comme triggered
+            if alert['alert_type'] in ['above', 'below']:
+                update_data['status'] = 'triggered'
+
+            updates.append(UpdateOne(
+                self._claim_filter(alert, now),
+                {"$set": update_data, "$inc": {"trigger_count": 1}}
+            ))
+
+        db.rate_alerts.bulk_write(updates, ordered=False)
+        claimed = {
+            doc["_id"]
+            for doc in db.rate_alerts.find(
+                {"_id": {"$in": [alert["_id"] for alert, _ in triggered]}, "trigger_token": token},
+                {"_id": 1}
+            )
+        }
+        triggered = [(alert, current_rate) for alert, current_rate in triggered if alert["_id"] in claimed]
+        if not triggered:
+            return 0
 
-        user = db.users.find_one({"_id": ObjectId(alert['user_id'])})
-        if not user:
-            return
+        trigger_records = []
+        for alert, current_rate in triggered:
+            trigger_records.append({
+                "alert_id": alert['alert_id'],
+                "user_id": alert['user_id'],
+                "pair": alert['pair'],
+                "target_rate": alert['target_rate'],
+                "triggered_rate": current_rate,
+                "alert_type": alert['alert_type'],
+                "triggered_at": now
+            })
 
-        channels = alert.get('notification_channels', ['email', 'push'])
+        db.rate_alert_triggers.insert_many(trigger_records, ordered=False)
 
-        # Préparer le message
-        alert_type_label = self.ALERT_TYPES.get(alert['alert_type'], alert['alert_type'])
+        self._send_alert_notifications(triggered, now)
 
+        logger.info(f"Alerts triggered: {len(triggered)}")
+        return len(triggered)
+
+    def _alert_message(self, alert: Dict, current_rate: float) -> str:
         if alert['alert_type'] == 'above':
-            message = f"🔔 Le taux {alert['pair']} a atteint {current_rate:.4f} (cible: {alert['target_rate']:.4f})"
+            return f"🔔 Le taux {alert['pair']} a atteint {current_rate:.4f} (cible: {alert['target_rate']:.4f})"
         elif alert['alert_type'] == 'below':
-            message = f"🔔 Le taux {alert['pair']} est descendu à {current_rate:.4f} (cible: {alert['target_rate']:.4f})"
+            return f"🔔 Le taux {alert['pair']} est descendu à {current_rate:.4f} (cible: {alert['target_rate']:.4f})"
         elif alert['alert_type'] == 'change_percent':
-            message = f"🔔 Le taux {alert['pair']} a varié de plus de {alert['target_rate']}% - Taux actuel: {current_rate:.4f}"
-        else:
-            message = f"📊 Résumé quotidien - {alert['pair']}: {current_rate:.4f}"
-
-        # Créer une notification interne
-        notification = {
-            "user_id": alert['user_id'],
-            "type": "rate_alert",
-            "title": f"Alerte taux {alert['pair']}",
-            "message": message,
-            "data": {
-                "alert_id": alert['alert_id'],
-                "pair": alert['pair'],
-                "current_rate": current_rate,
-                "target_rate": alert['target_rate']
-            },
-            "is_read": False,
-            "created_at": datetime.utcnow()
+            return f"🔔 Le taux {alert['pair']} a varié de plus de {alert['target_rate']}% - Taux actuel: {current_rate:.4f}"
+        return f"📊 Résumé quotidien - {alert['pair']}: {current_rate:.4f}"
+
+    def _send_alert_notifications(self, triggered: List[tuple], now: datetime):
+        """Notifications d'un lot d'alertes (utilisateurs et abonnements push lus en une requête)"""
+        db = self.db
+        if db is None:
+            return
+
+        user_ids = {alert['user_id'] for alert, _ in triggered}
+        users = {
+            str(user['_id']): user
+            for user in db.users.find(
+                {"_id": {"$in": [ObjectId(uid) for uid in user_ids if ObjectId.is_valid(uid)]}},
+                {"email": 1, "name": 1, "notification_preferences": 1}
+            )
         }
 
-        db.notifications.insert_one(notification)
+        notifications = []
+        emails = []
+        push_messages = []
+        for alert, current_rate in triggered:
+            user = users.get(alert['user_id'])
+            if not user:
+                continue
 
-        # Email
-        if 'email' in channels and user.get('email'):
-            try:
-                from app.services.notification_service import NotificationService
-                notif_service = NotificationService()
-                notif_service.send_rate_alert_email(
-                    user['email'],
-                    user.get('name', 'Utilisateur'),
-                    alert['pair'],
-                    current_rate,
-                    alert['target_rate'],
-                    alert['alert_type']
-                )
-            except Exception as e:
-                logger.error(f"Failed to send email notification: {e}")
+            message = self._alert_message(alert, current_rate)
+            notifications.append({
+                "user_id": alert['user_id'],
+                "type": "rate_alert",
+                "title": f"Alerte taux {alert['pair']}",
+                "message": message,
+                "data": {
+                    "alert_id": alert['alert_id'],
+                    "pair": alert['pair'],
+                    "current_rate": current_rate,
+                    "target_rate": alert['target_rate']
+                },
+                "is_read": False,
+                "created_at": now
+            })
+
+            channels = alert.get('notification_channels', ['email', 'push'])
+            if 'push' in channels:
+                push_messages.append((alert['user_id'], f"Alerte {alert['pair']}", message))
+            if 'email' in channels and user.get('email') \
+                    and user.get('notification_preferences', {}).get('email_notifications', True):
+                emails.append((user['email'], f"SarfX - Alerte taux {alert['pair']}", message))
+
+        if notifications:
+            db.notifications.insert_many(notifications, ordered=False)
+
+        # Push : mis en file pour l'envoi batch (voir NotificationService._send_push_notification)
+        if push_messages:
+            subscriptions = defaultdict(list)
+            for sub in db.push_subscriptions.find({"user_id": {"$in": list({uid for uid, _, _ in push_messages})}}):
+                subscriptions[sub['user_id']].append(sub.get('subscription'))
 
-        # Push notification
-        if 'push' in channels:
+            queue = [
+                {
+                    "subscription": subscription,
+                    "payload": {
+                        "title": title,
+                        "body": message,
+                        "icon": "/static/images/icons/bell.png",
+                        "badge": "/static/images/badge.png",
+                        "data": {"url": "/app/rate-alerts", "type": "rate_alert"}
+                    },
+                    "created_at": now,
+                    "sent": False
+                }
+                for user_id, title, message in push_messages
+                for subscription in subscriptions.get(user_id, [])
+            ]
+            if queue:
+                db.push_queue.insert_many(queue, ordered=False)
+
+        # Email : un envoi SMTP par destinataire
+        if emails:
             try:
-                from app.services.notification_service import NotificationService
-                notif_service = NotificationService()
-                notif_service.send_push_notification(
-                    alert['user_id'],
-                    f"Alerte {alert['pair']}",
-                    message
-                )
+                from app.services.email_service import send_email
+                for email, subject, message in emails:
+                    send_email(email, subject, message)
             except Exception as e:
-                logger.error(f"Failed to send push notification: {e}")
+                logger.error(f"Failed to send email notification: {e}")
 
     # ==================== Statistics ====================
 
@@ -577,7 +746,7 @@ class RateAlertService:
     # ==================== Helper Methods ====================
 
     def _get_current_rate(self, from_currency: str, to_currency: str) -> Optional[float]:
-        """Récupère le taux de change actuel via exchange_service"""
+        """Récupère le taux de change actuel via exchange_service (cache de taux partagé)"""
         try:
             from app.services.exchange_service import get_live_rate
             rate_data = get_live_rate(from_currency, to_currency)
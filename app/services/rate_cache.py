@@ -0,0 +1,319 @@
+"""
+Cache partagé des taux de change pour SarfX
+Deux niveaux:
+1. L1 - LRU en mémoire du worker (borné, TTL par entrée)
+2. L2 - Redis (Config.CACHE_REDIS_URL), partagé entre tous les workers gunicorn
+
+Sémantique stale-while-revalidate : une entrée expirée mais encore dans sa
+fenêtre "stale" est servie immédiatement pendant qu'un thread la rafraîchit.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Préfixe des clés Redis (isole le cache de taux des autres usages de Redis)
+REDIS_KEY_PREFIX = "sarfx:rates:"
+
+
+class RateCache:
+    """Cache de taux à deux niveaux (LRU process + Redis)"""
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        default_ttl: float = 30,
+        stale_ttl: float = 300,
+        redis_url: Optional[str] = None
+    ):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.stale_ttl = stale_ttl
+        self.redis_url = redis_url
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._redis = None
+        self._redis_pid = None
+        self._redis_retry_at = 0.0
+
+        self._stats = {
+            "l1_hits": 0,
+            "l2_hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "loads": 0,
+            "load_errors": 0,
+            "load_time_ms": 0.0,
+            "refreshes": 0,
+        }
+
+    # =====================================================
+    # REDIS (L2)
+    # =====================================================
+
+    def _get_redis(self):
+        """Client Redis du process courant (None si indisponible)"""
+        if not self.redis_url:
+            return None
+        if self._redis is not None and self._redis_pid == os.getpid():
+            return self._redis
+        if time.time() < self._redis_retry_at:
+            return None
+
+        try:
+            import redis
+            client = redis.Redis.from_url(
+                self.redis_url,
+                socket_timeout=0.25,
+                socket_connect_timeout=0.25
+            )
+            client.ping()
+            self._redis = client
+            self._redis_pid = os.getpid()
+            return client
+        except Exception as e:
+            # Pas de Redis (dev/Windows) : on reste en L1 seul, nouvel essai dans 60s
+            logger.warning(f"Rate cache L2 (Redis) unavailable: {e}")
+            self._redis = None
+            self._redis_retry_at = time.time() + 60
+            return None
+
+    def _l2_get(self, key: str) -> Optional[Dict]:
+        client = self._get_redis()
+        if client is None:
+            return None
+        try:
+            raw = client.get(REDIS_KEY_PREFIX + key)
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            logger.warning(f"Rate cache L2 read error for {key}: {e}")
+            return None
+
+    def _l2_set(self, key: str, entry: Dict):
+        client = self._get_redis()
+        if client is None:
+            return
+        try:
+            expire = max(1, int(entry["stale_until"] - time.time()))
+            client.set(REDIS_KEY_PREFIX + key, json.dumps(entry, default=str), ex=expire)
+        except Exception as e:
+            logger.warning(f"Rate cache L2 write error for {key}: {e}")
+
+    def _l2_delete(self, key: str):
+        client = self._get_redis()
+        if client is None:
+            return
+        try:
+            client.delete(REDIS_KEY_PREFIX + key)
+        except Exception as e:
+            logger.warning(f"Rate cache L2 delete error for {key}: {e}")
+
+    # =====================================================
+    # LRU (L1)
+    # =====================================================
+
+    def _l1_get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry["stale_until"] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _l1_set(self, key: str, entry: Dict):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # =====================================================
+    # API PUBLIQUE
+    # =====================================================
+
+    def get(self, key: str, allow_stale: bool = False) -> Optional[Any]:
+        """Lit une valeur (fraîche, ou stale si allow_stale) sans la charger"""
+        entry = self._lookup(key)
+        if entry is None:
+            return None
+        if entry["fresh_until"] > time.time() or allow_stale:
+            return entry["value"]
+        return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, stale_ttl: Optional[float] = None):
+        """Écrit une valeur dans les deux niveaux"""
+        ttl = self.default_ttl if ttl is None else ttl
+        stale_ttl = self.stale_ttl if stale_ttl is None else stale_ttl
+        now = time.time()
+        entry = {
+            "value": value,
+            "stored_at": now,
+            "fresh_until": now + ttl,
+            "stale_until": now + ttl + stale_ttl,
+        }
+        self._l1_set(key, entry)
+        self._l2_set(key, entry)
+
+    def delete(self, key: str):
+        """Invalide une clé dans les deux niveaux"""
+        with self._lock:
+            self._entries.pop(key, None)
+        self._l2_delete(key)
+
+    def clear(self):
+        """Vide le L1 du worker courant (le L2 expire de lui-même)"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Any],
+        ttl: Optional[float] = None,
+        stale_ttl: Optional[float] = None,
+        force_refresh: bool = False
+    ) -> Optional[Any]:
+        """
+        Lecture à travers le cache.
+
+        Args:
+            key: Clé du cache (ex: "live:EUR:MAD")
+            loader: Fonction sans argument qui produit la valeur (None = non cachée)
+            ttl: Durée de fraîcheur en secondes
+            stale_ttl: Durée supplémentaire pendant laquelle la valeur peut être servie
+            force_refresh: Ignore le cache et recharge
+
+        Returns:
+            La valeur cachée ou chargée, None si le loader n'a rien produit
+        """
+        if not force_refresh:
+            entry = self._lookup(key)
+            if entry is not None:
+                if entry["fresh_until"] > time.time():
+                    return entry["value"]
+                # Stale : on sert l'ancienne valeur et on rafraîchit en arrière-plan
+                self._incr("stale_hits")
+                self._refresh_async(key, loader, ttl, stale_ttl)
+                return entry["value"]
+            self._incr("misses")
+
+        return self._load(key, loader, ttl, stale_ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        """Compteurs hit/miss/latence pour le monitoring"""
+        with self._lock:
+            stats = dict(self._stats)
+            entries = len(self._entries)
+
+        lookups = stats["l1_hits"] + stats["l2_hits"] + stats["stale_hits"] + stats["misses"]
+        hits = lookups - stats["misses"]
+        stats["entries"] = entries
+        stats["max_entries"] = self.max_entries
+        stats["hit_rate"] = round(hits / lookups * 100, 2) if lookups else 0
+        stats["avg_load_ms"] = round(stats["load_time_ms"] / stats["loads"], 2) if stats["loads"] else 0
+        stats["load_time_ms"] = round(stats["load_time_ms"], 2)
+        stats["l2_enabled"] = self._get_redis() is not None
+        return stats
+
+    # =====================================================
+    # INTERNES
+    # =====================================================
+
+    def _incr(self, counter: str, value: float = 1):
+        with self._lock:
+            self._stats[counter] += value
+
+    def _lookup(self, key: str) -> Optional[Dict]:
+        entry = self._l1_get(key)
+        if entry is not None:
+            if entry["fresh_until"] > time.time():
+                self._incr("l1_hits")
+            return entry
+
+        entry = self._l2_get(key)
+        if entry is None or entry.get("stale_until", 0) <= time.time():
+            return None
+        self._l1_set(key, entry)
+        if entry["fresh_until"] > time.time():
+            self._incr("l2_hits")
+        return entry
+
+    def _load(self, key, loader, ttl, stale_ttl):
+        started = time.perf_counter()
+        try:
+            value = loader()
+        except Exception as e:
+            self._incr("load_errors")
+            logger.error(f"Rate cache loader failed for {key}: {e}")
+            return None
+        finally:
+            self._incr("loads")
+            self._incr("load_time_ms", (time.perf_counter() - started) * 1000)
+
+        if value is not None:
+            self.set(key, value, ttl, stale_ttl)
+        return value
+
+    def _refresh_async(self, key, loader, ttl, stale_ttl):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        app = _current_app_object()
+
+        def _run():
+            try:
+                if app is not None:
+                    with app.app_context():
+                        self._load(key, loader, ttl, stale_ttl)
+                else:
+                    self._load(key, loader, ttl, stale_ttl)
+                self._incr("refreshes")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=_run, name=f"rate-cache-refresh:{key}", daemon=True).start()
+
+
+def _current_app_object():
+    """Application Flask courante (pour rafraîchir dans un app context)"""
+    try:
+        from flask import current_app, has_app_context
+        if has_app_context():
+            return current_app._get_current_object()
+    except ImportError:
+        pass
+    return None
+
+
+_rate_cache = None
+_rate_cache_lock = threading.Lock()
+
+
+def get_rate_cache() -> RateCache:
+    """Instance partagée du cache de taux (une par process)"""
+    global _rate_cache
+    if _rate_cache is None:
+        with _rate_cache_lock:
+            if _rate_cache is None:
+                from app.config import Config
+                redis_url = Config.CACHE_REDIS_URL if Config.RATE_CACHE_REDIS_ENABLED else None
+                _rate_cache = RateCache(
+                    max_entries=Config.RATE_CACHE_MAX_ENTRIES,
+                    default_ttl=Config.RATES_CACHE_TTL,
+                    stale_ttl=Config.RATE_CACHE_STALE_TTL,
+                    redis_url=redis_url
+                )
+    return _rate_cache
@@ -0,0 +1,394 @@
+"""
+Service d'ingestion des taux de change (hors requêtes web)
+Interroge chaque source amont une seule fois par cycle, dérive toutes les paires
+SUPPORTED_CURRENCIES par triangulation et publie un snapshot versionné:
+- cache de taux partagé (clé "snapshot:latest")
+- collection exchange_rates_snapshots (document "latest")
+- collection exchange_rates_history (un seul insert_many par cycle, paires dont le
+  taux a changé depuis le snapshot précédent ; purge par index TTL sur expires_at)
+Ingère aussi l'historique journalier (Frankfurter, une série par jour, un seul
+bulk_write, points conservés) lu par get_rate_history quand le worker est déployé.
+
+Lancement: python worker.py (voir docker-compose.yml, service rate-worker)
+"""
+import math
+import time
+import logging
+import requests
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import PyMongoError
+
+from app.services.exchange_service import SUPPORTED_CURRENCIES, get_db
+
+logger = logging.getLogger(__name__)
+
+# Devise pivot du snapshot : toutes les paires sont dérivées de anchor[quote] / anchor[base]
+ANCHOR_CURRENCY = 'EUR'
+
+SNAPSHOT_CACHE_KEY = 'snapshot:latest'
+
+# Durée de fraîcheur du snapshot dans le cache partagé (secondes)
+SNAPSHOT_CACHE_TTL = 10
+
+# Historique journalier : profondeur (max de /api/rates/history) et série temporelle de la source
+HISTORY_DAYS = 365
+HISTORY_SOURCE = 'Frankfurter (BCE)'
+HISTORY_URL = 'https://api.frankfurter.app/{start}..{end}?from={base}'
+
+# Sources amont, par ordre de priorité (la première qui cote une devise gagne)
+UPSTREAMS = [
+    {
+        'name': 'Frankfurter (BCE)',
+        'base': 'EUR',
+        'url': 'https://api.frankfurter.app/latest?from={base}',
+    },
+    {
+        'name': 'ExchangeRate-API',
+        'base': 'USD',
+        'url': 'https://open.er-api.com/v6/latest/{base}',
+    },
+]
+
+
+class RateIngestionService:
+    """Récupère, triangule et publie les taux de toutes les paires supportées"""
+
+    def __init__(self, db=None, timeout: int = 10):
+        self._db = db
+        self.timeout = timeout
+        self._indexes_ready = False
+        # Dernier jour d'historique ingéré (une série par jour)
+        self._history_date = None
+
+    @property
+    def db(self):
+        """Client partagé du process (le worker tourne hors contexte Flask)"""
+        if self._db is not None:
+            return self._db
+        return get_db()
+
+    # =====================================================
+    # ACQUISITION
+    # =====================================================
+
+    def fetch_upstream(self, upstream: Dict) -> Optional[Dict[str, float]]:
+        """Un seul appel HTTP par source : toutes les cotations de sa devise de base"""
+        try:
+            response = requests.get(upstream['url'].format(base=upstream['base']), timeout=self.timeout)
+            if response.status_code != 200:
+                logger.warning(f"{upstream['name']} returned {response.status_code}")
+                return None
+
+            data = response.json()
+            if data.get('result', 'success') != 'success':
+                return None
+            rates = dict(data.get('rates') or {})
+            rates[upstream['base']] = 1.0
+            return rates
+        except Exception as e:
+            logger.warning(f"{upstream['name']} error: {e}")
+            return None
+
+    def fetch_anchor_rates(self) -> Optional[Dict]:
+        """
+        Fusionne les sources en un vecteur de taux exprimés depuis ANCHOR_CURRENCY.
+
+        Returns:
+            {'rates': {devise: taux}, 'sources': {devise: nom source}} ou None
+        """
+        anchor_rates = {}
+        sources = {}
+
+        for upstream in UPSTREAMS:
+            rates = self.fetch_upstream(upstream)
+            if not rates or ANCHOR_CURRENCY not in rates:
+                continue
+
+            # Ramène la base de la source sur la devise pivot
+            to_anchor = rates[ANCHOR_CURRENCY]
+            for currency in SUPPORTED_CURRENCIES:
+                if currency in anchor_rates or not rates.get(currency):
+                    continue
+                anchor_rates[currency] = rates[currency] / to_anchor
+                sources[currency] = upstream['name']
+
+            if len(anchor_rates) == len(SUPPORTED_CURRENCIES):
+                break
+
+        if ANCHOR_CURRENCY not in anchor_rates:
+            return None
+        return {'rates': anchor_rates, 'sources': sources}
+
+    @staticmethod
+    def triangulate(anchor_rates: Dict[str, float]) -> Dict[str, Dict[str, float]]:
+        """Toutes les paires croisées base -> quote à partir du vecteur pivot"""
+        return {
+            base: {
+                quote: anchor_rates[quote] / anchor_rates[base]
+                for quote in anchor_rates
+                if quote != base
+            }
+            for base in anchor_rates
+        }
+
+    # =====================================================
+    # PUBLICATION
+    # =====================================================
+
+    def _ensure_indexes(self, db):
+        if self._indexes_ready:
+            return
+        history = db['exchange_rates_history']
+        history.create_index([('base', 1), ('quote', 1), ('timestamp', -1)])
+        history.create_index([('date', 1)])
+        # Seuls les points du worker portent expires_at (l'historique journalier est conservé)
+        history.create_index([('expires_at', 1)], expireAfterSeconds=0)
+        self._indexes_ready = True
+
+    def publish(self, fetched: Dict) -> Optional[Dict]:
+        """Publie un nouveau snapshot versionné (Mongo + cache partagé)"""
+        from app.services.rate_cache import get_rate_cache
+
+        db = self.db
+        if db is None:
+            return None
+
+        now = datetime.utcnow()
+        anchor_rates = fetched['rates']
+        sources = fetched['sources']
+        pairs = self.triangulate(anchor_rates)
+
+        try:
+            self._ensure_indexes(db)
+
+            previous = db['exchange_rates_snapshots'].find_one_and_update(
+                {'_id': 'latest'},
+                {
+                    '$inc': {'version': 1},
+                    '$set': {
+                        'anchor': ANCHOR_CURRENCY,
+                        'rates': anchor_rates,
+                        'sources': sources,
+                        'timestamp': now
+                    }
+                },
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
+            snapshot = {
+                'version': (previous or {}).get('version', 0) + 1,
+                'anchor': ANCHOR_CURRENCY,
+                'rates': anchor_rates,
+                'sources': sources,
+                'timestamp': now
+            }
+            version = snapshot['version']
+            previous_rates = (previous or {}).get('rates') or {}
+            expires_at = now + timedelta(days=_config('RATE_HISTORY_RETENTION_DAYS', 90))
+
+            history_docs = []
+            cache_ops = []
+            for base, quotes in pairs.items():
+                for quote, rate in quotes.items():
+                    source = snapshot_pair_source(sources, base, quote)
+                    if _pair_changed(previous_rates, base, quote, rate):
+                        history_docs.append({
+                            'base': base,
+                            'quote': quote,
+                            'rate': rate,
+                            'source': source,
+                            'snapshot_version': version,
+                            'timestamp': now,
+                            'date': now.strftime('%Y-%m-%d'),
+                            'expires_at': expires_at
+                        })
+                    # Alimente aussi le fallback "stale" de exchange_service
+                    cache_ops.append(UpdateOne(
+                        {'base': base, 'quote': quote},
+                        {'$set': {'rate': rate, 'source': source, 'timestamp': now}},
+                        upsert=True
+                    ))
+
+            if history_docs:
+                db['exchange_rates_history'].insert_many(history_docs, ordered=False)
+            db['exchange_rates_cache'].bulk_write(cache_ops, ordered=False)
+        except PyMongoError as e:
+            logger.error(f"Snapshot publish error: {e}")
+            return None
+
+        published = serialize_snapshot(snapshot)
+        get_rate_cache().set(SNAPSHOT_CACHE_KEY, published, ttl=SNAPSHOT_CACHE_TTL)
+
+        logger.info(f"Published rate snapshot v{version}: {len(cache_ops)} pairs, "
+                    f"{len(history_docs)} changed")
+        return published
+
+    # =====================================================
+    # HISTORIQUE JOURNALIER
+    # =====================================================
+
+    def fetch_daily_history(self, start: str, end: str) -> Optional[Dict[str, Dict[str, float]]]:
+        """Un seul appel : taux journaliers de toutes les devises depuis ANCHOR_CURRENCY, par date"""
+        try:
+            url = HISTORY_URL.format(start=start, end=end, base=ANCHOR_CURRENCY)
+            response = requests.get(url, timeout=self.timeout)
+            if response.status_code != 200:
+                logger.warning(f"{HISTORY_SOURCE} history returned {response.status_code}")
+                return None
+            history = {}
+            for date, rates in (response.json().get('rates') or {}).items():
+                anchor_rates = {c: rates[c] for c in SUPPORTED_CURRENCIES if rates.get(c)}
+                anchor_rates[ANCHOR_CURRENCY] = 1.0
+                history[date] = anchor_rates
+            return history
+        except Exception as e:
+            logger.warning(f"{HISTORY_SOURCE} history error: {e}")
+            return None
+
+    def ingest_daily_history(self, days: int = HISTORY_DAYS) -> int:
+        """
+        Points journaliers de toutes les paires depuis le dernier jour stocké (au plus `days`
+        jours), une fois par jour ; upsert des seuls points journaliers (sans expires_at)
+
+        Returns:
+            Nombre de points écrits
+        """
+        db = self.db
+        today = datetime.utcnow().strftime('%Y-%m-%d')
+        if db is None or self._history_date == today:
+            return 0
+
+        history_col = db['exchange_rates_history']
+        try:
+            self._ensure_indexes(db)
+            start = (datetime.utcnow() - timedelta(days=days)).strftime('%Y-%m-%d')
+            latest = history_col.find_one(
+                {'source': HISTORY_SOURCE, 'expires_at': {'$exists': False}, 'date': {'$gte': start}},
+                {'date': 1}, sort=[('date', -1)]
+            )
+            if latest:
+                # Dernier jour stocké relu : la BCE publie en fin de journée
+                start = latest['date']
+
+            history = self.fetch_daily_history(start, today)
+            if history is None:
+                return 0
+
+            ops = []
+            for date, anchor_rates in history.items():
+                timestamp = datetime.strptime(date, '%Y-%m-%d')
+                for base, quotes in self.triangulate(anchor_rates).items():
+                    for quote, rate in quotes.items():
+                        ops.append(UpdateOne(
+                            {'base': base, 'quote': quote, 'date': date, 'expires_at': {'$exists': False}},
+                            {'$set': {'rate': rate, 'source': HISTORY_SOURCE, 'timestamp': timestamp}},
+                            upsert=True
+                        ))
+            if ops:
+                history_col.bulk_write(ops, ordered=False)
+        except PyMongoError as e:
+            logger.error(f"Daily history ingestion error: {e}")
+            return 0
+
+        self._history_date = today
+        logger.info(f"Ingested daily rate history since {start}: {len(ops)} points")
+        return len(ops)
+
+    def run_once(self) -> Optional[Dict]:
+        """Un cycle complet d'ingestion"""
+        self.ingest_daily_history()
+        fetched = self.fetch_anchor_rates()
+        if not fetched:
+            logger.error("All upstream rate sources unavailable, snapshot not published")
+            return None
+        return self.publish(fetched)
+
+    def run_forever(self, interval: int, on_publish: Optional[Callable[[Dict], None]] = None):
+        """
+        Boucle du worker : un cycle toutes les `interval` secondes
+
+        Args:
+            on_publish: Appelé avec chaque snapshot publié (ex: vérification des alertes)
+        """
+        logger.info(f"Rate ingestion worker started (interval {interval}s)")
+        while True:
+            started = time.monotonic()
+            try:
+                snapshot = self.run_once()
+                if snapshot and on_publish:
+                    on_publish(snapshot)
+            except Exception as e:
+                logger.error(f"Rate ingestion cycle failed: {e}")
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+
+def _config(name, default):
+    from app.config import Config
+    return getattr(Config, name, default)
+
+
+def _pair_changed(previous_rates: Dict[str, float], base: str, quote: str, rate: float) -> bool:
+    """Taux de la paire différent de celui du snapshot précédent (ou paire nouvelle)"""
+    if not previous_rates.get(base) or not previous_rates.get(quote):
+        return True
+    return not math.isclose(previous_rates[quote] / previous_rates[base], rate, rel_tol=1e-9)
+
+
+def snapshot_pair_source(sources: Dict[str, str], base: str, quote: str) -> str:
+    """Nom de source d'une paire croisée"""
+    base_source = sources.get(base, '')
+    quote_source = sources.get(quote, '')
+    if base_source == quote_source:
+        return base_source
+    return f"{base_source} / {quote_source}"
+
+
+def serialize_snapshot(doc: Dict) -> Dict:
+    """Document Mongo -> dict JSON-sérialisable pour le cache"""
+    timestamp = doc.get('timestamp')
+    return {
+        'version': doc.get('version'),
+        'anchor': doc.get('anchor', ANCHOR_CURRENCY),
+        'rates': doc.get('rates', {}),
+        'sources': doc.get('sources', {}),
+        'timestamp': timestamp.isoformat() if isinstance(timestamp, datetime) else timestamp
+    }
+
+
+def load_latest_snapshot() -> Optional[Dict]:
+    """Snapshot publié le plus récent (cache partagé, puis Mongo)"""
+    from app.services.rate_cache import get_rate_cache
+
+    def _load():
+        db = get_db()
+        if db is None:
+            return None
+        try:
+            doc = db['exchange_rates_snapshots'].find_one({'_id': 'latest'})
+        except PyMongoError as e:
+            logger.error(f"Snapshot read error: {e}")
+            return None
+        return serialize_snapshot(doc) if doc else None
+
+    return get_rate_cache().get_or_load(SNAPSHOT_CACHE_KEY, _load, ttl=SNAPSHOT_CACHE_TTL)
+
+
+def snapshot_age_seconds(snapshot: Dict) -> float:
+    """Âge du snapshot en secondes"""
+    try:
+        published = datetime.fromisoformat(snapshot['timestamp'])
+    except (KeyError, TypeError, ValueError):
+        return float('inf')
+    return (datetime.utcnow() - published).total_seconds()
+
+
+def snapshot_rate(snapshot: Dict, base: str, quote: str) -> Optional[float]:
+    """Taux base -> quote dérivé du snapshot (None si une devise manque)"""
+    rates = snapshot.get('rates', {})
+    if not rates.get(base) or not rates.get(quote):
+        return None
+    return rates[quote] / rates[base]
+
@@ -1,19 +1,22 @@
 """
 Service de gestion des taux de change
 """
+import math
 from app.services.db_service import get_db
+from app.services.supplier_quotes import get_quote_engine
 from datetime import datetime
-import random
 
 
 def get_all_suppliers(active_only=True):
     """Récupère tous les fournisseurs"""
+    if active_only:
+        return get_quote_engine().suppliers()
+    
     db = get_db()
     if db is None:
         return []
     
-    query = {"is_active": True} if active_only else {}
-    suppliers = list(db.suppliers.find(query))
+    suppliers = list(db.suppliers.find({}))
     
     # Convert ObjectId to string
     for s in suppliers:
@@ -41,47 +44,27 @@ def get_supplier_by_id(supplier_id):
 def calculate_best_rate(amount, from_currency='USD', to_currency='MAD'):
     """
     Calcule le meilleur taux parmi tous les fournisseurs
+    (table des fournisseurs en mémoire, cotation vectorisée : voir supplier_quotes.py)
     
     Returns:
         dict avec le meilleur fournisseur et les details
     """
     # Validation du montant
-    if amount is None or not isinstance(amount, (int, float)) or amount <= 0:
+    if amount is None or not isinstance(amount, (int, float)) or not math.isfinite(amount) or amount <= 0:
         return {'error': 'Invalid amount: must be a positive number'}
     
-    suppliers = get_all_suppliers(active_only=True)
-    if not suppliers:
-        return None
-    
-    results = []
-    for supplier in suppliers:
-        # Simuler une petite variation du taux (réaliste)
-        base_rate = supplier.get('rate', 10.0)
-        variation = random.uniform(-0.02, 0.02)
-        current_rate = base_rate * (1 + variation)
-        
-        fee = supplier.get('fee', 0)
-        
-        # Calcul du montant final avec protection
-        net_amount = amount - fee
-        if net_amount <= 0:
-            continue  # Skip si le montant net est négatif ou nul
-        final_amount = net_amount * current_rate
-        
-        results.append({
-            'supplier': supplier,
-            'rate': current_rate,
-            'fee': fee,
-            'final_amount': final_amount
-        })
-    
-    # Trier par montant final décroissant (meilleur deal)
-    results.sort(key=lambda x: x['final_amount'], reverse=True)
+    return get_quote_engine().best(amount, from_currency, to_currency)
+
+
+def calculate_rate_ladder(amounts, from_currency='USD', to_currency='MAD'):
+    """
+    Meilleur fournisseur pour chaque montant d'une échelle (curseurs de l'interface)
     
-    return {
-        'best': results[0],
-        'all': results
-    }
+    Returns:
+        liste de {'amount', 'best'} dans l'ordre des montants
+    """
+    amounts = [a for a in amounts if isinstance(a, (int, float)) and math.isfinite(a) and a > 0]
+    return get_quote_engine().ladder(amounts, from_currency, to_currency)
 
 
 def create_supplier(name, supplier_type, rate, fee=0, logo='', is_active=True):
@@ -103,6 +86,7 @@ def create_supplier(name, supplier_type, rate, fee=0, logo='', is_active=True):
     
     result = db.suppliers.insert_one(supplier)
     supplier['_id'] = str(result.inserted_id)
+    get_quote_engine().invalidate()
     
     return supplier
 
@@ -123,6 +107,7 @@ def update_supplier(supplier_id, **kwargs):
             {"_id": ObjectId(supplier_id)},
             {"$set": update_data}
         )
+        get_quote_engine().invalidate()
         return result.modified_count > 0
     except:
         return False
@@ -138,6 +123,7 @@ def delete_supplier(supplier_id):
     
     try:
         result = db.suppliers.delete_one({"_id": ObjectId(supplier_id)})
+        get_quote_engine().invalidate()
         return result.deleted_count > 0
     except:
         return False
@@ -186,6 +172,7 @@ def update_rate(supplier_id, new_rate):
                 }
             }
         )
+        get_quote_engine().invalidate()
         
         return True
     except:
@@ -266,4 +253,5 @@ def seed_default_suppliers():
     ]
     
     db.suppliers.insert_many(default_suppliers)
+    get_quote_engine().invalidate()
     return True
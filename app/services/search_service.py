@@ -0,0 +1,263 @@
+"""
+Recherche globale de l'application (/api/search)
+
+Sources interrogées en parallèle, chacune bornée par SEARCH_TIMEOUT_MS :
+- Transactions et bénéficiaires de l'utilisateur : index texte MongoDB composé
+  (user_id en préfixe, donc limité aux documents de l'utilisateur) pour choisir
+  les candidats, triés par score $text. Le dernier mot, souvent incomplet pendant
+  la frappe, est complété par une recherche par préfixe (regex ancrée et échappée)
+  sur les mêmes champs, toujours restreinte à l'utilisateur.
+- ATM : index en mémoire (atm_index.py), sans requête MongoDB
+- Pages de navigation : liste statique
+
+Tous les candidats sont ensuite notés avec la même règle (champ égal, commençant
+par, mot commençant par, contenant la requête ; pondéré par champ) puis classés
+ensemble. Une source qui dépasse le délai est ignorée : la réponse part avec
+les résultats déjà disponibles.
+"""
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import ExecutionTimeout, OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+MIN_QUERY_LENGTH = 2
+MAX_QUERY_LENGTH = 100
+
+# Résultats par source et au total
+SOURCE_LIMIT = 5
+MAX_RESULTS = 15
+
+# Champ -> poids (index texte MongoDB et notation des résultats)
+TRANSACTION_FIELDS = {
+    'reference': 10, 'transaction_id': 10, 'description': 4,
+    'type': 2, 'from_currency': 2, 'to_currency': 2,
+}
+BENEFICIARY_FIELDS = {'name': 10, 'email': 6, 'bank_name': 4, 'iban': 4}
+ATM_FIELDS = {'name': 6, 'city': 4, 'bank_name': 4, 'address': 2}
+PAGE_FIELDS = {'name': 6, 'keywords': 3}
+
+NAV_PAGES = [
+    {"name": "Accueil", "url": "/app/home", "keywords": ["accueil", "home", "dashboard", "tableau de bord"]},
+    {"name": "Wallets", "url": "/app/wallets", "keywords": ["wallets", "portefeuilles", "soldes", "balances"]},
+    {"name": "Convertir", "url": "/app/converter", "keywords": ["convertir", "converter", "exchange", "change", "taux"]},
+    {"name": "Transactions", "url": "/app/transactions", "keywords": ["transactions", "historique", "history", "paiements"]},
+    {"name": "Bénéficiaires", "url": "/app/beneficiaries", "keywords": ["bénéficiaires", "beneficiaries", "contacts"]},
+    {"name": "ATMs", "url": "/app/atms", "keywords": ["atm", "distributeur", "cash", "retrait"]},
+    {"name": "Profil", "url": "/app/profile", "keywords": ["profil", "profile", "compte", "account"]},
+    {"name": "Réglages", "url": "/app/settings", "keywords": ["réglages", "settings", "paramètres", "preferences"]},
+    {"name": "FAQ", "url": "/app/faq", "keywords": ["faq", "aide", "help", "questions"]},
+    {"name": "IA Prédictions", "url": "/app/ai-forecast", "keywords": ["ia", "ai", "prédictions", "forecast", "machine learning"]}
+]
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='search')
+_indexes_ready = False
+
+
+def _config(name, default):
+    from app.config import Config
+    return getattr(Config, name, default)
+
+
+def ensure_indexes(db):
+    """Index texte composés (user_id, champs recherchés) : un seul index texte par collection"""
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    try:
+        db.transactions.create_index(
+            [('user_id', ASCENDING)] + [(name, TEXT) for name in TRANSACTION_FIELDS],
+            name='search_text', weights=TRANSACTION_FIELDS, default_language='none'
+        )
+        db.beneficiaries.create_index(
+            [('user_id', ASCENDING)] + [(name, TEXT) for name in BENEFICIARY_FIELDS],
+            name='search_text', weights=BENEFICIARY_FIELDS, default_language='none'
+        )
+        # Recherche par préfixe : documents de l'utilisateur lus par cet index
+        db.transactions.create_index([('user_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)])
+        db.beneficiaries.create_index([('user_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)])
+        _indexes_ready = True
+    except PyMongoError as e:
+        logger.warning(f"Search indexes not created: {e}")
+
+
+# ============================================================
+# NOTATION
+# ============================================================
+
+def tokenize(query: str) -> List[str]:
+    return [token for token in re.split(r'[\s,;]+', query.lower()) if token]
+
+
+def _field_score(value, query: str, tokens: List[str]) -> float:
+    """Qualité de la correspondance d'un champ (0 = aucune)"""
+    if isinstance(value, (list, tuple)):
+        return max((_field_score(item, query, tokens) for item in value), default=0.0)
+    text = str(value or '').lower()
+    if not text:
+        return 0.0
+    if text == query:
+        return 4.0
+    if text.startswith(query):
+        return 3.0
+    words = re.split(r'[^\w]+', text)
+    if any(word.startswith(query) for word in words):
+        return 2.0
+    if query in text:
+        return 1.0
+    # Requête à plusieurs mots : part des mots retrouvés
+    found = sum(1 for token in tokens if any(word.startswith(token) for word in words))
+    return found / len(tokens) if len(tokens) > 1 else 0.0
+
+
+def score(doc: Dict, weights: Dict[str, int], query: str, tokens: List[str]) -> float:
+    return sum(weight * _field_score(doc.get(name), query, tokens) for name, weight in weights.items())
+
+
+# ============================================================
+# SOURCES
+# ============================================================
+
+def _prefix_query(fields, token: str) -> Dict:
+    pattern = {'$regex': '^' + re.escape(token), '$options': 'i'}
+    return {'$or': [{name: pattern} for name in fields]}
+
+
+def _user_candidates(collection, user_id: str, fields: Dict[str, int], query: str,
+                     tokens: List[str], timeout_ms: int) -> List[Dict]:
+    """Candidats d'une collection de l'utilisateur : index texte, puis préfixe du dernier mot"""
+    candidates = {}
+    try:
+        cursor = collection.find(
+            {'user_id': user_id, '$text': {'$search': ' '.join(tokens)}},
+            {'text_score': {'$meta': 'textScore'}}
+        ).sort([('text_score', {'$meta': 'textScore'})]).limit(SOURCE_LIMIT * 2).max_time_ms(timeout_ms)
+        for doc in cursor:
+            candidates[doc['_id']] = doc
+    except ExecutionTimeout:
+        raise
+    except OperationFailure as e:
+        # Index texte absent ou en construction : la recherche par préfixe suffit
+        logger.debug(f"Text search unavailable on {collection.name}: {e}")
+
+    if len(candidates) < SOURCE_LIMIT:
+        cursor = collection.find(
+            {'user_id': user_id, **_prefix_query(fields, tokens[-1])}
+        ).sort([('created_at', DESCENDING)]).limit(SOURCE_LIMIT * 2).max_time_ms(timeout_ms)
+        for doc in cursor:
+            candidates.setdefault(doc['_id'], doc)
+    return list(candidates.values())
+
+
+def search_transactions(db, user_id: str, query: str, tokens: List[str], timeout_ms: int) -> List[Tuple[float, Dict]]:
+    results = []
+    for tx in _user_candidates(db.transactions, user_id, TRANSACTION_FIELDS, query, tokens, timeout_ms):
+        results.append((score(tx, TRANSACTION_FIELDS, query, tokens), {
+            "type": "transaction",
+            "title": f"{tx.get('from_currency', '')} → {tx.get('to_currency', '')}",
+            "subtitle": f"Réf: {tx.get('reference', 'N/A')} | {tx.get('amount', 0)} {tx.get('from_currency', '')}",
+            "url": f"/app/transactions?highlight={str(tx.get('_id', ''))}"
+        }))
+    return results
+
+
+def search_beneficiaries(db, user_id: str, query: str, tokens: List[str], timeout_ms: int) -> List[Tuple[float, Dict]]:
+    results = []
+    for ben in _user_candidates(db.beneficiaries, user_id, BENEFICIARY_FIELDS, query, tokens, timeout_ms):
+        iban = ben.get('iban') or ''
+        results.append((score(ben, BENEFICIARY_FIELDS, query, tokens), {
+            "type": "beneficiary",
+            "title": ben.get('name', 'Sans nom'),
+            "subtitle": ben.get('email') or (iban[:20] + '...' if iban else ''),
+            "url": f"/app/beneficiaries?highlight={str(ben.get('_id', ''))}"
+        }))
+    return results
+
+
+def search_atms(query: str, tokens: List[str]) -> List[Tuple[float, Dict]]:
+    from app.services.atm_index import get_atm_index
+
+    results = []
+    for atm in get_atm_index().search(query, limit=SOURCE_LIMIT * 2, fields=tuple(ATM_FIELDS)):
+        results.append((score(atm, ATM_FIELDS, query, tokens), {
+            "type": "atm",
+            "title": atm.get('name', 'ATM'),
+            "subtitle": f"{atm.get('city', '')} - {atm.get('bank_name', '')}",
+            "url": f"/app/atms?highlight={atm.get('atm_id', '')}"
+        }))
+    return results
+
+
+def search_pages(query: str, tokens: List[str]) -> List[Tuple[float, Dict]]:
+    results = []
+    for page in NAV_PAGES:
+        page_score = score(page, PAGE_FIELDS, query, tokens)
+        if page_score:
+            results.append((page_score, {
+                "type": "page",
+                "title": page["name"],
+                "subtitle": "Page de navigation",
+                "url": page["url"]
+            }))
+    return results
+
+
+# ============================================================
+# RECHERCHE
+# ============================================================
+
+def global_search(db, user_id: Optional[str], query: str, timeout_ms: Optional[int] = None) -> Dict:
+    """
+    Recherche dans les transactions et bénéficiaires de l'utilisateur, les ATM et les pages.
+
+    Returns:
+        {'results': [...], 'timed_out': [sources ignorées], 'took_ms': durée}
+    """
+    started = time.monotonic()
+    query = (query or '').strip()[:MAX_QUERY_LENGTH].lower()
+    tokens = tokenize(query)
+    if len(query) < MIN_QUERY_LENGTH or not tokens:
+        return {'results': [], 'timed_out': [], 'took_ms': 0}
+
+    timeout_ms = timeout_ms or int(_config('SEARCH_TIMEOUT_MS', 400))
+    sources: Dict[str, Callable[[], List[Tuple[float, Dict]]]] = {
+        'atms': lambda: search_atms(query, tokens),
+    }
+    if db is not None and user_id:
+        ensure_indexes(db)
+        sources['transactions'] = lambda: search_transactions(db, user_id, query, tokens, timeout_ms)
+        sources['beneficiaries'] = lambda: search_beneficiaries(db, user_id, query, tokens, timeout_ms)
+
+    futures = {_executor.submit(source): name for name, source in sources.items()}
+    # Pendant ce temps, les pages (liste statique) dans le thread de la requête
+    scored = search_pages(query, tokens)
+    done, pending = wait(futures, timeout=timeout_ms / 1000)
+
+    timed_out = sorted(futures[future] for future in pending)
+    for future, name in futures.items():
+        if future not in done:
+            continue
+        try:
+            hits = future.result()
+        except ExecutionTimeout:
+            timed_out.append(name)
+            continue
+        except Exception as e:
+            logger.warning(f"Search source {name} failed: {e}")
+            continue
+        scored.extend(sorted(hits, key=lambda hit: -hit[0])[:SOURCE_LIMIT])
+    if timed_out:
+        logger.info(f"Search sources over {timeout_ms}ms ignored: {', '.join(timed_out)}")
+
+    # Classement commun (tri stable : à score égal, pages puis ATM, transactions, bénéficiaires)
+    scored.sort(key=lambda hit: -hit[0])
+    return {
+        'results': [result for _, result in scored[:MAX_RESULTS]],
+        'timed_out': timed_out,
+        'took_ms': round((time.monotonic() - started) * 1000),
+    }
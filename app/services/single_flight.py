@@ -0,0 +1,252 @@
+"""
+Coalescence des appels sortants (single-flight) pour SarfX
+
+Quand le cache d'une paire expire, toutes les requêtes concurrentes la rechargent
+en même temps (Frankfurter, ExchangeRate-API, backend IA). Ici, un seul appel
+part par clé de requête amont, et tous ceux qui l'attendent partagent son résultat :
+1. Dans le process - le premier thread (leader) appelle l'amont, les autres
+   attendent son résultat (Event)
+2. Entre les workers gunicorn - le leader prend un verrou Redis à bail court
+   (SET NX PX) ; les leaders des autres process attendent le résultat publié
+   dans Redis pendant la durée du bail, puis appellent eux-mêmes si rien n'arrive
+   (leader mort ou trop lent : jamais de blocage au-delà du bail)
+
+Sans Redis (dev/Windows), seule la coalescence dans le process s'applique.
+Les résultats partagés entre process passent par JSON (decode pour les tuples).
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import functools
+import threading
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Préfixes des clés Redis (verrou du leader, résultat publié)
+REDIS_LOCK_PREFIX = "sarfx:flight:lock:"
+REDIS_RESULT_PREFIX = "sarfx:flight:result:"
+
+# Intervalle de lecture du résultat publié par un autre process
+POLL_INTERVAL = 0.02
+
+# Libère le verrou seulement s'il appartient encore à ce leader
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class _Call:
+    """Appel en cours dans le process : résultat partagé par les threads en attente"""
+
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Un appel amont par clé à la fois (threads du process + workers via Redis)"""
+
+    def __init__(self, redis_url: Optional[str] = None, lease_ms: int = 5000, result_ttl: float = 5):
+        self.redis_url = redis_url
+        self.lease_ms = lease_ms
+        self.result_ttl = result_ttl
+
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self._redis = None
+        self._redis_pid = None
+        self._redis_retry_at = 0.0
+
+        self._stats = {
+            "calls": 0,
+            "shared_in_process": 0,
+            "shared_cross_process": 0,
+            "lease_timeouts": 0,
+        }
+
+    # =====================================================
+    # REDIS
+    # =====================================================
+
+    def _get_redis(self):
+        """Client Redis du process courant (None si indisponible)"""
+        if not self.redis_url:
+            return None
+        if self._redis is not None and self._redis_pid == os.getpid():
+            return self._redis
+        if time.time() < self._redis_retry_at:
+            return None
+
+        try:
+            import redis
+            client = redis.Redis.from_url(
+                self.redis_url,
+                socket_timeout=0.25,
+                socket_connect_timeout=0.25
+            )
+            client.ping()
+            self._redis = client
+            self._redis_pid = os.getpid()
+            return client
+        except Exception as e:
+            # Pas de Redis : coalescence limitée au process, nouvel essai dans 60s
+            logger.warning(f"Single-flight Redis unavailable: {e}")
+            self._redis = None
+            self._redis_retry_at = time.time() + 60
+            return None
+
+    # =====================================================
+    # API PUBLIQUE
+    # =====================================================
+
+    def do(self, key: str, func: Callable[[], Any], lease_ms: Optional[int] = None,
+           decode: Optional[Callable[[Any], Any]] = None) -> Any:
+        """
+        Exécute func une seule fois pour tous les appelants concurrents de `key`.
+
+        Args:
+            key: Clé de la requête amont (ex: "frankfurter:EUR:MAD")
+            func: Appel amont sans argument
+            lease_ms: Bail du verrou Redis (durée max d'attente d'un autre process)
+            decode: Reconstruit la valeur lue dans Redis (JSON -> type d'origine)
+
+        Returns:
+            Le résultat de func (ou celui de l'appel déjà en cours)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            self._incr("shared_in_process")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = self._lead(key, func, lease_ms or self.lease_ms, decode)
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["inflight"] = len(self._calls)
+        stats["redis_enabled"] = self._get_redis() is not None
+        return stats
+
+    # =====================================================
+    # INTERNES
+    # =====================================================
+
+    def _incr(self, counter: str):
+        with self._lock:
+            self._stats[counter] += 1
+
+    def _lead(self, key, func, lease_ms, decode):
+        """Leader du process : verrou Redis, ou attente du résultat d'un autre process"""
+        client = self._get_redis()
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + lease_ms / 1000
+        while client is not None:
+            try:
+                raw = client.get(REDIS_RESULT_PREFIX + key)
+                if raw is not None:
+                    # Résultat publié il y a moins de result_ttl par un autre process
+                    self._incr("shared_cross_process")
+                    value = json.loads(raw)["value"]
+                    return decode(value) if decode and value is not None else value
+                if client.set(REDIS_LOCK_PREFIX + key, token, nx=True, px=lease_ms):
+                    break
+            except Exception as e:
+                logger.warning(f"Single-flight Redis error for {key}: {e}")
+                client = None
+                break
+            if time.monotonic() >= deadline:
+                # Bail expiré sans résultat : on appelle nous-mêmes
+                self._incr("lease_timeouts")
+                client = None
+                break
+            time.sleep(POLL_INTERVAL)
+
+        self._incr("calls")
+        try:
+            value = func()
+            if client is not None:
+                # Publié avant la libération du verrou : aucun process ne relance l'appel entre les deux
+                self._publish(client, key, value)
+            return value
+        finally:
+            if client is not None:
+                self._release(client, key, token)
+
+    def _publish(self, client, key, value):
+        try:
+            client.set(REDIS_RESULT_PREFIX + key, json.dumps({"value": value}, default=str),
+                       px=int(self.result_ttl * 1000))
+        except Exception as e:
+            logger.warning(f"Single-flight result publish failed for {key}: {e}")
+
+    @staticmethod
+    def _release(client, key, token):
+        try:
+            client.eval(_RELEASE_SCRIPT, 1, REDIS_LOCK_PREFIX + key, token)
+        except Exception as e:
+            logger.warning(f"Single-flight lock release failed for {key}: {e}")
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """Instance partagée (une par process)"""
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                from app.config import Config
+                redis_url = Config.CACHE_REDIS_URL if Config.RATE_CACHE_REDIS_ENABLED else None
+                _single_flight = SingleFlight(
+                    redis_url=redis_url,
+                    lease_ms=Config.SINGLE_FLIGHT_LEASE_MS,
+                    result_ttl=Config.SINGLE_FLIGHT_RESULT_TTL
+                )
+    return _single_flight
+
+
+def single_flight(namespace: str, key: Optional[Callable[..., str]] = None, lease_ms: Optional[int] = None,
+                  decode: Optional[Callable[[Any], Any]] = None):
+    """
+    Décorateur : les appels concurrents avec la même clé partagent une seule exécution.
+
+    Args:
+        namespace: Préfixe de la clé (nom de l'amont)
+        key: Clé à partir des arguments (par défaut : arguments positionnels joints par ":")
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            suffix = key(*args, **kwargs) if key else ":".join(str(arg) for arg in args)
+            return get_single_flight().do(f"{namespace}:{suffix}", lambda: func(*args, **kwargs),
+                                          lease_ms=lease_ms, decode=decode)
+        return wrapper
+    return decorator
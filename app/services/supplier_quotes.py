@@ -0,0 +1,239 @@
+"""
+Moteur de cotation des fournisseurs (collection suppliers)
+
+La table des fournisseurs actifs est petite et rarement modifiée : chaque process
+en garde une copie en tableaux NumPy parallèles (taux, frais fixes) à côté des
+documents fournisseurs. Mêmes règles que le calcul historique : montant final =
+(montant - frais) x taux, fournisseur écarté si le montant net n'est pas positif.
+- Cotation : montants finaux de tous les fournisseurs pour un ou plusieurs
+  montants demandés en une seule passe vectorisée (matrice montants x fournisseurs),
+  en unités entières de money.py (arrondi au demi pair)
+- Échelle de montants (curseurs de l'interface) : meilleur fournisseur par montant,
+  même tirage de taux pour toute l'échelle
+
+Synchronisation:
+- Chargement au premier accès du process
+- invalidate() après chaque écriture du process (create/update/delete, update_rate) :
+  la lecture suivante recharge la table
+- Rechargement au-delà de SUPPLIER_QUOTES_TTL_SECONDS (écritures des autres process)
+- Chaque chargement construit une nouvelle table, échangée d'un bloc : les
+  cotations ne prennent jamais de verrou
+"""
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from app.services.money import from_units, scale, to_units
+
+logger = logging.getLogger(__name__)
+
+# Variation simulée des taux à chaque cotation (+/- 2 %)
+RATE_JITTER = 0.02
+
+# Taux par défaut d'un fournisseur sans taux renseigné
+DEFAULT_RATE = 10.0
+
+# Montants acceptés par échelle
+MAX_LADDER_POINTS = 200
+
+# Montant maximal coté (les unités entières restent loin de la limite int64)
+MAX_QUOTE_AMOUNT = 1e12
+
+
+def _get_db():
+    from app.services.db_service import get_db, get_pooled_db
+    try:
+        return get_db()
+    except RuntimeError:
+        # Hors contexte Flask (worker) : client partagé du process
+        return get_pooled_db()
+
+
+def _config(name, default):
+    from app.config import Config
+    return getattr(Config, name, default)
+
+
+def _numbers(suppliers: List[Dict], field: str, default: float) -> np.ndarray:
+    """Champ numérique de chaque fournisseur (défaut si absent ou illisible)"""
+    values = []
+    for supplier in suppliers:
+        try:
+            value = supplier.get(field)
+            values.append(float(value) if value not in (None, '') else default)
+        except (TypeError, ValueError):
+            values.append(default)
+    return np.array(values, dtype=np.float64).reshape(-1)
+
+
+class _SupplierTable:
+    """Table immuable des fournisseurs actifs : documents + tableaux parallèles"""
+
+    def __init__(self, suppliers: List[Dict]):
+        for supplier in suppliers:
+            supplier['_id'] = str(supplier['_id'])
+        self.suppliers = suppliers
+        self.rate = _numbers(suppliers, 'rate', DEFAULT_RATE)
+        self.fee = _numbers(suppliers, 'fee', 0.0)
+
+    def __len__(self) -> int:
+        return len(self.suppliers)
+
+
+class SupplierQuoteEngine:
+    """Cotations des fournisseurs du process : meilleur taux et échelles de montants en mémoire"""
+
+    def __init__(self, ttl_seconds: Optional[int] = None):
+        self.ttl_seconds = ttl_seconds
+        self._table: Optional[_SupplierTable] = None
+        self._loaded_at: Optional[float] = None
+        self._load_lock = threading.Lock()
+
+    # =====================================================
+    # CHARGEMENT
+    # =====================================================
+
+    def load(self, db=None) -> int:
+        """(Re)construit la table depuis les fournisseurs actifs"""
+        db = db if db is not None else _get_db()
+        if db is None:
+            return 0
+        table = _SupplierTable(list(db.suppliers.find({"is_active": True})))
+        self._table = table
+        self._loaded_at = time.monotonic()
+        logger.debug(f"Supplier quote table loaded: {len(table)} active suppliers")
+        return len(table)
+
+    def table(self) -> Optional[_SupplierTable]:
+        """Table courante (rechargée au premier accès, après invalidate() ou au-delà du TTL)"""
+        ttl = self.ttl_seconds if self.ttl_seconds is not None else int(_config('SUPPLIER_QUOTES_TTL_SECONDS', 60))
+        table = self._table
+        if table is None or time.monotonic() - self._loaded_at > ttl:
+            with self._load_lock:
+                if self._table is table:
+                    self.load()
+            table = self._table
+        return table
+
+    def invalidate(self):
+        """Hook d'écriture : la prochaine cotation relit la collection"""
+        self._table = None
+
+    def suppliers(self) -> List[Dict]:
+        """Fournisseurs actifs (copies, _id en chaîne)"""
+        table = self.table()
+        return [dict(supplier) for supplier in table.suppliers] if table else []
+
+    # =====================================================
+    # COTATION
+    # =====================================================
+
+    @staticmethod
+    def _rates(table: _SupplierTable, jitter: float) -> np.ndarray:
+        if not jitter:
+            return table.rate
+        return table.rate * (1 + np.random.uniform(-jitter, jitter, len(table)))
+
+    @staticmethod
+    def _quote_matrix(table: _SupplierTable, amounts: np.ndarray, rates: np.ndarray,
+                      from_currency: str, to_currency: str):
+        """
+        Montants x fournisseurs en une passe : frais et montants finaux en unités entières.
+
+        Returns:
+            (frais, montants finaux, cotation possible) : matrices (montants, fournisseurs)
+        """
+        sent = to_units(amounts, from_currency)
+        fees = np.broadcast_to(to_units(table.fee, from_currency)[None, :], (len(amounts), len(table)))
+        net = sent[:, None] - fees
+        eligible = net > 0
+        shift = 10.0 ** (scale(to_currency) - scale(from_currency))
+        final = np.rint(np.maximum(net, 0) * (rates * shift)[None, :]).astype(np.int64)
+        return fees, final, eligible
+
+    @staticmethod
+    def _quote(table: _SupplierTable, position: int, rate: float, fee: int, final: int,
+               from_currency: str, to_currency: str) -> Dict:
+        return {
+            'supplier': dict(table.suppliers[position]),
+            'rate': float(rate),
+            'fee': float(from_units(fee, from_currency)),
+            'final_amount': float(from_units(final, to_currency)),
+            'final_amount_minor': int(final),
+        }
+
+    def best(self, amount: float, from_currency: str = 'USD', to_currency: str = 'MAD',
+             jitter: float = RATE_JITTER) -> Optional[Dict]:
+        """
+        Cotations de tous les fournisseurs pour un montant, la meilleure d'abord
+
+        Returns:
+            {'best': cotation, 'all': cotations triées} ou None (aucun fournisseur possible)
+        """
+        table = self.table()
+        if not table:
+            return None
+        rates = self._rates(table, jitter)
+        fees, final, eligible = self._quote_matrix(table, np.array([amount], dtype=np.float64), rates,
+                                                   from_currency, to_currency)
+        positions = np.flatnonzero(eligible[0])
+        if not len(positions):
+            return None
+        # Montant final décroissant (comparaison entière exacte)
+        positions = positions[np.argsort(-final[0, positions], kind='stable')]
+        quotes = [self._quote(table, i, rates[i], fees[0, i], final[0, i], from_currency, to_currency)
+                  for i in positions]
+        return {'best': quotes[0], 'all': quotes}
+
+    def ladder(self, amounts: Iterable[float], from_currency: str = 'USD', to_currency: str = 'MAD',
+               jitter: float = RATE_JITTER) -> List[Dict]:
+        """
+        Meilleure cotation pour chaque montant (ordre des montants conservé)
+
+        Returns:
+            [{'amount', 'best': cotation ou None}]
+        """
+        amounts = np.asarray(list(amounts), dtype=np.float64)[:MAX_LADDER_POINTS]
+        table = self.table()
+        if not table or not len(amounts):
+            return [{'amount': float(amount), 'best': None} for amount in amounts]
+
+        rates = self._rates(table, jitter)
+        fees, final, eligible = self._quote_matrix(table, amounts, rates, from_currency, to_currency)
+        ranked = np.where(eligible, final, -1)
+        winners = ranked.argmax(axis=1)
+        found = eligible[np.arange(len(amounts)), winners]
+
+        ladder = []
+        for row, (amount, position) in enumerate(zip(amounts.tolist(), winners.tolist())):
+            best = None
+            if found[row]:
+                best = self._quote(table, position, rates[position], fees[row, position],
+                                   final[row, position], from_currency, to_currency)
+                best['effective_rate'] = round(best['final_amount'] / amount, 6)
+            ladder.append({'amount': amount, 'best': best})
+        return ladder
+
+    def stats(self) -> Dict:
+        table = self._table
+        return {
+            'loaded': table is not None,
+            'suppliers': len(table) if table else 0,
+        }
+
+
+_quote_engine = None
+_quote_engine_lock = threading.Lock()
+
+
+def get_quote_engine() -> SupplierQuoteEngine:
+    """Moteur partagé du process"""
+    global _quote_engine
+    if _quote_engine is None:
+        with _quote_engine_lock:
+            if _quote_engine is None:
+                _quote_engine = SupplierQuoteEngine()
+    return _quote_engine
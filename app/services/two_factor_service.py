@@ -25,11 +25,12 @@ TWO_FACTOR_CONFIG = {
 
 def _get_db():
     """Helper pour obtenir la DB de manière sécurisée"""
+    from app.services.db_service import get_db, get_pooled_db
     try:
-        from app.services.db_service import get_db
         return get_db()
     except RuntimeError:
-        return None
+        # Hors contexte Flask : client partagé du process
+        return get_pooled_db()
 
 
 def _safe_object_id(id_str):
@@ -3,10 +3,15 @@ Service layer for wallet management.
 Handles all business logic related to user wallets, balances, and transactions.
 """
 from datetime import datetime
+import math
 import uuid
 import requests
 from flask import current_app
 from app.services.db_service import get_db
+from app.services import ledger_service
+from app.services.money import MAX_AMOUNT, Money
+from app.services.single_flight import single_flight
+from app.services.metrics_service import record_transaction
 
 # Liste centralisée des devises valides
 VALID_CURRENCIES = ['USD', 'EUR', 'MAD', 'GBP', 'CHF', 'CAD', 'AED', 'SAR']
@@ -81,6 +86,12 @@ def _create_wallet(user_id, db):
                 "EUR": 0.0,
                 "MAD": 0.0,
             },
+            # Soldes exacts en unités mineures (voir money.py), tenus par le grand livre
+            "balances_minor": {
+                "USD": Money.zero("USD").to_bson(),
+                "EUR": Money.zero("EUR").to_bson(),
+                "MAD": Money.zero("MAD").to_bson(),
+            },
             "is_active": True,
             "created_at": datetime.utcnow(),
             "updated_at": datetime.utcnow()
@@ -117,6 +128,7 @@ def add_currency_to_wallet(user_id, currency):
             {
                 "$set": {
                     f"balances.{currency}": 0.0,
+                    f"balances_minor.{currency}": Money.zero(currency).to_bson(),
                     "updated_at": datetime.utcnow()
                 }
             }
@@ -146,14 +158,14 @@ def remove_currency_from_wallet(user_id, currency):
     if currency not in balances:
         return False, f"Currency {currency} not found in the wallet."
 
-    if balances[currency] != 0:
+    if ledger_service.units_of(wallet, currency) != 0:
         return False, "Cannot remove currency with a non-zero balance."
 
     try:
         db.wallets.update_one(
             {"user_id": str(user_id)},
             {
-                "$unset": {f"balances.{currency}": ""},
+                "$unset": {f"balances.{currency}": "", f"balances_minor.{currency}": ""},
                 "$set": {"updated_at": datetime.utcnow()}
             }
         )
@@ -269,17 +281,11 @@ def set_primary_currency(user_id, currency):
 # SWAP / EXCHANGE FUNCTIONS
 # ============================================================
 
-def get_swap_rate(from_currency, to_currency):
-    """
-    Gets the exchange rate for swapping between currencies.
-    Tries the AI backend first, then falls back to static rates.
-    """
+@single_flight('ai-swap-rate')
+def _fetch_ai_swap_rate(from_currency, to_currency):
+    """Fetches the SarfX offer rate from the AI backend (None if unavailable)."""
     from app.config import Config
 
-    if from_currency == to_currency:
-        return 1.0, 'same_currency'
-
-    # Try AI Backend first
     try:
         ai_url = getattr(Config, 'AI_BACKEND_URL', 'http://localhost:8087')
         timeout = getattr(Config, 'AI_BACKEND_TIMEOUT', 5)
@@ -292,12 +298,32 @@ def get_swap_rate(from_currency, to_currency):
         if response.status_code == 200:
             data = response.json()
             if data.get('success') and data.get('sarfx_offer', {}).get('rate'):
-                return data['sarfx_offer']['rate'], 'ai_backend'
+                return data['sarfx_offer']['rate']
     except requests.RequestException as e:
         current_app.logger.warning(f"AI Backend unavailable for swap rate: {e}")
     except Exception as e:
         current_app.logger.warning(f"Error fetching AI rate: {e}")
 
+    return None
+
+
+def get_swap_rate(from_currency, to_currency):
+    """
+    Gets the exchange rate for swapping between currencies.
+    Tries the AI backend first, then falls back to static rates.
+    """
+    if from_currency == to_currency:
+        return 1.0, 'same_currency'
+
+    # Try AI Backend first (through the shared rate cache)
+    from app.services.rate_cache import get_rate_cache
+    ai_rate = get_rate_cache().get_or_load(
+        f"swap:{from_currency}:{to_currency}",
+        lambda: _fetch_ai_swap_rate(from_currency, to_currency)
+    )
+    if ai_rate:
+        return ai_rate, 'ai_backend'
+
     # Fallback to static rates
     key = f"{from_currency}_{to_currency}"
     if key in FALLBACK_RATES:
@@ -311,6 +337,15 @@ def get_swap_rate(from_currency, to_currency):
     return None, 'rate_not_found'
 
 
+def _valid_amount(amount):
+    """Montant fini et sous MAX_AMOUNT (NaN, infini ou 1e300 refusés avant Money.of)"""
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        return False
+    return math.isfinite(amount) and abs(amount) <= MAX_AMOUNT
+
+
 def calculate_swap_preview(from_currency, to_currency, amount):
     """
     Calculates a preview of a swap operation without executing it.
@@ -319,6 +354,8 @@ def calculate_swap_preview(from_currency, to_currency, amount):
     if from_currency not in VALID_CURRENCIES or to_currency not in VALID_CURRENCIES:
         return None, "Invalid currency."
 
+    if not _valid_amount(amount):
+        return None, "Invalid amount."
     if amount <= 0:
         return None, "Amount must be positive."
 
@@ -326,12 +363,13 @@ def calculate_swap_preview(from_currency, to_currency, amount):
     if rate is None:
         return None, f"Exchange rate not available for {from_currency}/{to_currency}."
 
-    # Calculate fee
-    fee_amount = amount * SWAP_FEE_PERCENTAGE
-    net_amount = amount - fee_amount
+    # Calculate fee (exact, in minor units)
+    sent = Money.of(amount, from_currency)
+    fee_amount = sent.multiply(SWAP_FEE_PERCENTAGE)
+    net_amount = sent - fee_amount
 
-    # Calculate received amount
-    received_amount = net_amount * rate
+    # Calculate received amount (rounded once, in the target currency)
+    received_amount = net_amount.convert(rate, to_currency)
 
     return {
         'from_currency': from_currency,
@@ -340,17 +378,18 @@ def calculate_swap_preview(from_currency, to_currency, amount):
         'rate': rate,
         'rate_source': source,
         'fee_percentage': SWAP_FEE_PERCENTAGE * 100,
-        'fee_amount': round(fee_amount, 4),
-        'net_amount': round(net_amount, 4),
-        'received_amount': round(received_amount, 4),
-        'effective_rate': round(received_amount / amount, 6) if amount > 0 else 0
+        'fee_amount': float(fee_amount),
+        'net_amount': float(net_amount),
+        'received_amount': float(received_amount),
+        'effective_rate': round(float(received_amount) / amount, 6) if amount > 0 else 0
     }, None
 
 
-def execute_swap(user_id, from_currency, to_currency, amount):
+def execute_swap(user_id, from_currency, to_currency, amount, idempotency_key=None):
     """
     Executes a swap between two currencies in the user's wallet.
-    Deducts from one currency and adds to another.
+    Deducts from one currency and adds to another in a single ledger operation
+    (see ledger_service): no lost update under concurrent swaps.
     """
     if from_currency not in VALID_CURRENCIES or to_currency not in VALID_CURRENCIES:
         return None, "Invalid currency."
@@ -358,6 +397,8 @@ def execute_swap(user_id, from_currency, to_currency, amount):
     if from_currency == to_currency:
         return None, "Cannot swap same currency."
 
+    if not _valid_amount(amount):
+        return None, "Invalid amount."
     if amount <= 0:
         return None, "Amount must be positive."
 
@@ -365,92 +406,72 @@ def execute_swap(user_id, from_currency, to_currency, amount):
     if db is None:
         return None, "Database connection failed."
 
-    # Get user's wallet
-    wallet, error = get_wallet_by_user_id(user_id)
-    if error:
-        return None, error
-
-    balances = wallet.get('balances', {})
-
-    # Check if user has both currencies
-    if from_currency not in balances:
-        return None, f"You don't have a {from_currency} wallet."
-
-    if to_currency not in balances:
-        return None, f"You don't have a {to_currency} wallet. Please add it first."
-
-    # Check sufficient balance
-    current_balance = float(balances.get(from_currency, 0))
-    if current_balance < amount:
-        return None, f"Insufficient {from_currency} balance. Available: {current_balance:.2f}"
-
     # Calculate swap
     preview, preview_error = calculate_swap_preview(from_currency, to_currency, amount)
     if preview_error:
         return None, preview_error
 
-    # Execute the swap atomically
-    try:
-        new_from_balance = current_balance - amount
-        new_to_balance = float(balances.get(to_currency, 0)) + preview['received_amount']
+    now = datetime.utcnow()
+    transaction = {
+        "transaction_id": f"SWAP-{str(uuid.uuid4())[:8].upper()}",
+        "user_id": str(user_id),
+        "sender_id": str(user_id),
+        "recipient_id": str(user_id),
+        "type": "swap",
+        "from_currency": from_currency,
+        "to_currency": to_currency,
+        "amount": amount,
+        "rate": preview['rate'],
+        "fee": preview['fee_amount'],
+        "final_amount": preview['received_amount'],
+        "status": "completed",
+        "rate_source": preview['rate_source'],
+        "created_at": now,
+        "updated_at": now
+    }
 
-        # Update wallet
-        result = db.wallets.update_one(
-            {"user_id": str(user_id)},
-            {
-                "$set": {
-                    f"balances.{from_currency}": round(new_from_balance, 4),
-                    f"balances.{to_currency}": round(new_to_balance, 4),
-                    "updated_at": datetime.utcnow()
-                }
-            }
+    try:
+        result = ledger_service.post(
+            db, user_id,
+            {from_currency: -amount, to_currency: preview['received_amount']},
+            kind='swap',
+            idempotency_key=idempotency_key,
+            transaction=transaction,
+            # Rejeu : même demande même si le taux a changé entre-temps
+            request={'from': from_currency, 'to': to_currency, 'amount': amount}
         )
+    except ledger_service.CurrencyNotInWallet as e:
+        if e.currency == to_currency:
+            return None, f"You don't have a {to_currency} wallet. Please add it first."
+        return None, f"You don't have a {from_currency} wallet."
+    except ledger_service.WalletNotFound:
+        return None, f"You don't have a {from_currency} wallet."
+    except ledger_service.LedgerError as e:
+        return None, str(e)
+    except Exception as e:
+        current_app.logger.error(f"Swap execution failed for user {user_id}: {e}")
+        return None, "Swap execution failed. Please try again."
 
-        if result.modified_count == 0:
-            return None, "Failed to update wallet."
-
-        # Create transaction record
-        transaction = {
-            "transaction_id": f"SWAP-{str(uuid.uuid4())[:8].upper()}",
-            "user_id": str(user_id),
-            "sender_id": str(user_id),
-            "recipient_id": str(user_id),
-            "type": "swap",
-            "from_currency": from_currency,
-            "to_currency": to_currency,
-            "amount": amount,
-            "rate": preview['rate'],
-            "fee": preview['fee_amount'],
-            "final_amount": preview['received_amount'],
-            "status": "completed",
-            "rate_source": preview['rate_source'],
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
-        }
-
-        db.transactions.insert_one(transaction)
-
+    transaction = result['transaction'] or transaction
+    if not result['replayed']:
+        record_transaction(transaction, db)
         current_app.logger.info(
-            f"Swap executed: {amount} {from_currency} → {preview['received_amount']} {to_currency} "
+            f"Swap executed: {amount} {from_currency} → {transaction['final_amount']} {to_currency} "
             f"for user {user_id}"
         )
 
-        return {
-            "success": True,
-            "transaction_id": transaction['transaction_id'],
-            "from_currency": from_currency,
-            "to_currency": to_currency,
-            "amount_sent": amount,
-            "amount_received": preview['received_amount'],
-            "rate": preview['rate'],
-            "fee": preview['fee_amount'],
-            "new_balance_from": round(new_from_balance, 4),
-            "new_balance_to": round(new_to_balance, 4)
-        }, None
-
-    except Exception as e:
-        current_app.logger.error(f"Swap execution failed for user {user_id}: {e}")
-        return None, "Swap execution failed. Please try again."
+    return {
+        "success": True,
+        "transaction_id": transaction['transaction_id'],
+        "from_currency": from_currency,
+        "to_currency": to_currency,
+        "amount_sent": amount,
+        "amount_received": transaction['final_amount'],
+        "rate": transaction['rate'],
+        "fee": transaction['fee'],
+        "new_balance_from": result['balances'].get(from_currency),
+        "new_balance_to": result['balances'].get(to_currency)
+    }, None
 
 
 def get_wallet_swap_rates(user_id):
@@ -481,7 +502,7 @@ def get_wallet_swap_rates(user_id):
     return swap_rates, None
 
 
-def deposit_to_wallet(user_id, currency, amount, source="manual", reference=None):
+def deposit_to_wallet(user_id, currency, amount, source="manual", reference=None, idempotency_key=None):
     """
     Deposits funds to a user's wallet.
     Used by admin or payment systems.
@@ -492,10 +513,13 @@ def deposit_to_wallet(user_id, currency, amount, source="manual", reference=None
         amount: Amount to deposit
         source: Source of deposit (manual, card, bank, etc.)
         reference: Payment reference/transaction ID
+        idempotency_key: Client key; a replayed request does not credit twice
     """
     if currency not in VALID_CURRENCIES:
         return False, f"Invalid currency: {currency}."
 
+    if not _valid_amount(amount):
+        return False, "Invalid amount."
     if amount <= 0:
         return False, "Amount must be positive."
 
@@ -503,106 +527,104 @@ def deposit_to_wallet(user_id, currency, amount, source="manual", reference=None
     if db is None:
         return False, "Database connection failed."
 
-    wallet, error = get_wallet_by_user_id(user_id)
-    if error:
-        return False, error
-
-    balances = wallet.get('balances', {})
-    if currency not in balances:
-        return False, f"Currency {currency} not in wallet. Add it first."
+    transaction = {
+        "transaction_id": f"DEP-{str(uuid.uuid4())[:8].upper()}",
+        "user_id": str(user_id),
+        "recipient_id": str(user_id),
+        "type": "deposit",
+        "currency": currency,
+        "amount": amount,
+        "status": "completed",
+        "source": source,
+        "reference": reference,
+        "created_at": datetime.utcnow()
+    }
 
     try:
-        current_balance = float(balances.get(currency, 0))
-        new_balance = current_balance + amount
-
-        db.wallets.update_one(
-            {"user_id": str(user_id)},
-            {
-                "$set": {
-                    f"balances.{currency}": round(new_balance, 4),
-                    "updated_at": datetime.utcnow()
-                }
-            }
-        )
-
-        # Record transaction
-        transaction = {
-            "transaction_id": f"DEP-{str(uuid.uuid4())[:8].upper()}",
-            "user_id": str(user_id),
-            "recipient_id": str(user_id),
-            "type": "deposit",
-            "currency": currency,
-            "amount": amount,
-            "status": "completed",
-            "source": source,
-            "reference": reference,
-            "created_at": datetime.utcnow()
-        }
-        db.transactions.insert_one(transaction)
-
-        return True, f"Deposited {amount} {currency} successfully."
-
+        result = ledger_service.post(db, user_id, {currency: amount}, kind='deposit',
+                                     idempotency_key=idempotency_key, transaction=transaction)
+    except (ledger_service.CurrencyNotInWallet, ledger_service.WalletNotFound):
+        return False, f"Currency {currency} not in wallet. Add it first."
+    except ledger_service.LedgerError as e:
+        return False, str(e)
     except Exception as e:
         current_app.logger.error(f"Deposit failed for user {user_id}: {e}")
         return False, "Deposit failed."
 
+    if not result['replayed']:
+        record_transaction(result['transaction'] or transaction, db)
+
+    return True, f"Deposited {amount} {currency} successfully."
 
-def withdraw_from_wallet(user_id, currency, amount, destination="manual"):
+
+def debit_wallet(user_id, currency, amount, transaction, kind="withdrawal", idempotency_key=None):
     """
-    Withdraws funds from a user's wallet.
+    Debits a user's wallet and records the business transaction with the debit.
+
+    Args:
+        transaction: Transaction document, or function (balances after debit) -> document
+        kind: Ledger operation type (withdrawal, send, transfer)
+        idempotency_key: Client key; a replayed request does not debit twice
+
+    Returns:
+        tuple: ({'transaction', 'balance', 'replayed'}, error_message)
     """
     if currency not in VALID_CURRENCIES:
-        return False, f"Invalid currency: {currency}."
+        return None, f"Invalid currency: {currency}."
 
+    if not _valid_amount(amount):
+        return None, "Invalid amount."
     if amount <= 0:
-        return False, "Amount must be positive."
+        return None, "Amount must be positive."
 
     db = get_db()
     if db is None:
-        return False, "Database connection failed."
-
-    wallet, error = get_wallet_by_user_id(user_id)
-    if error:
-        return False, error
-
-    balances = wallet.get('balances', {})
-    current_balance = float(balances.get(currency, 0))
-
-    if current_balance < amount:
-        return False, f"Insufficient balance. Available: {current_balance:.2f} {currency}"
+        return None, "Database connection failed."
 
     try:
-        new_balance = current_balance - amount
+        result = ledger_service.post(db, user_id, {currency: -amount}, kind=kind,
+                                     idempotency_key=idempotency_key, transaction=transaction)
+    except ledger_service.InsufficientFunds as e:
+        return None, f"Insufficient balance. Available: {e.available:.2f} {currency}"
+    except (ledger_service.CurrencyNotInWallet, ledger_service.WalletNotFound):
+        return None, f"Insufficient balance. Available: 0.00 {currency}"
+    except ledger_service.LedgerError as e:
+        return None, str(e)
+    except Exception as e:
+        current_app.logger.error(f"Debit failed for user {user_id}: {e}")
+        return None, "Withdrawal failed."
 
-        db.wallets.update_one(
-            {"user_id": str(user_id)},
-            {
-                "$set": {
-                    f"balances.{currency}": round(new_balance, 4),
-                    "updated_at": datetime.utcnow()
-                }
-            }
-        )
+    if not result['replayed'] and result['transaction']:
+        record_transaction(result['transaction'], db)
 
-        # Record transaction
-        transaction = {
-            "transaction_id": f"WDR-{str(uuid.uuid4())[:8].upper()}",
-            "user_id": str(user_id),
-            "sender_id": str(user_id),
-            "type": "withdrawal",
-            "currency": currency,
-            "amount": amount,
-            "status": "completed",
-            "destination": destination,
-            "created_at": datetime.utcnow()
-        }
-        db.transactions.insert_one(transaction)
+    return {
+        "transaction": result['transaction'],
+        "balance": result['balances'].get(currency),
+        "replayed": result['replayed']
+    }, None
 
-        return True, f"Withdrawn {amount} {currency} successfully."
 
-    except Exception as e:
-        current_app.logger.error(f"Withdrawal failed for user {user_id}: {e}")
-        return False, "Withdrawal failed."
+def withdraw_from_wallet(user_id, currency, amount, destination="manual", idempotency_key=None):
+    """
+    Withdraws funds from a user's wallet.
+    """
+    transaction = {
+        "transaction_id": f"WDR-{str(uuid.uuid4())[:8].upper()}",
+        "user_id": str(user_id),
+        "sender_id": str(user_id),
+        "type": "withdrawal",
+        "currency": currency,
+        "amount": amount,
+        "status": "completed",
+        "destination": destination,
+        "created_at": datetime.utcnow()
+    }
+
+    _, error = debit_wallet(user_id, currency, amount, transaction, idempotency_key=idempotency_key)
+    if error:
+        return False, error
+
+    return True, f"Withdrawn {amount} {currency} successfully."
 
 
 # ============================================================
@@ -611,67 +633,106 @@ def withdraw_from_wallet(user_id, currency, amount, destination="manual"):
 
 def get_wallet_history(wallet_id, limit=100):
     """
-    Gets the adjustment history for a specific wallet.
+    Gets the balance history for a specific wallet.
     Used by admin to track balance changes.
+
+    Reads the ledger (every operation, most recent first); adjustments recorded
+    before the ledger existed are still listed from wallet_adjustments.
     """
     db = get_db()
     if db is None:
         return []
 
     try:
-        history = list(
+        wallet = db.wallets.find_one({"wallet_id": wallet_id}, {"user_id": 1})
+        if not wallet:
+            return []
+
+        history = []
+        entries = (
+            db.ledger_entries
+            .find({"user_id": str(wallet['user_id'])})
+            .sort([("seq", -1), ("_id", -1)])
+            .limit(limit)
+        )
+        for entry in entries:
+            meta = entry.get('meta') or {}
+            history.append({
+                '_id': entry['entry_id'],
+                'operation_id': entry['operation_id'],
+                'seq': entry['seq'],
+                'kind': entry['kind'],
+                'type': "credit" if entry['amount'] >= 0 else "debit",
+                'currency': entry['currency'],
+                'old_balance': _balance_before(entry),
+                'new_balance': entry['balance_after'],
+                'difference': entry['amount'],
+                'admin_id': meta.get('admin_id'),
+                'reason': meta.get('reason', ''),
+                'created_at': entry['created_at']
+            })
+
+        legacy = (
             db.wallet_adjustments
-            .find({"wallet_id": wallet_id})
+            .find({"wallet_id": wallet_id, "ledger_operation_id": {"$exists": False}})
             .sort("created_at", -1)
             .limit(limit)
         )
-
-        # Convert ObjectId to string for JSON serialization
-        for item in history:
+        for item in legacy:
+            # Convert ObjectId to string for JSON serialization
             item['_id'] = str(item['_id'])
+            history.append(item)
 
-        return history
+        history.sort(key=lambda item: item['created_at'], reverse=True)
+        return history[:limit]
     except Exception as e:
         current_app.logger.error(f"Failed to get wallet history: {e}")
         return []
 
 
+def _balance_before(entry):
+    """Solde avant une écriture du grand livre (exact si l'écriture a ses unités mineures)"""
+    if entry.get('amount_minor') is not None:
+        units = int(entry['balance_after_minor']) - int(entry['amount_minor'])
+        return float(Money(units, entry['currency']))
+    return float(Money.of(entry['balance_after'], entry['currency']) - Money.of(entry['amount'], entry['currency']))
+
+
 def get_all_wallets_summary():
     """
     Gets a summary of all wallets for admin dashboard.
+    Balances are the ledger projections (wallets.balances at ledger_seq).
     """
     db = get_db()
     if db is None:
         return []
 
     try:
-        wallets = list(db.wallets.find())
+        from bson import ObjectId
+
+        wallets = list(db.wallets.find({}, {
+            "wallet_id": 1, "user_id": 1, "balances": 1, "ledger_seq": 1,
+            "is_active": 1, "created_at": 1, "updated_at": 1
+        }))
+
+        # User emails in one query
+        user_ids = [wallet['user_id'] for wallet in wallets if wallet.get('user_id')]
+        object_ids = [ObjectId(uid) for uid in user_ids if isinstance(uid, str) and ObjectId.is_valid(uid)]
+        emails = {
+            str(user['_id']): user.get('email', 'Unknown')
+            for user in db.users.find({"_id": {"$in": object_ids}}, {"email": 1})
+        }
 
         summary = []
         for wallet in wallets:
-            # Get user info
-            user_id = wallet.get('user_id')
-            user = None
-            if user_id:
-                try:
-                    from bson import ObjectId
-                    if isinstance(user_id, str) and len(user_id) == 24:
-                        user = db.users.find_one({"_id": ObjectId(user_id)})
-                    else:
-                        user = db.users.find_one({"_id": user_id})
-                except Exception:
-                    pass
-
-            # Calculate total balance in USD
-            total_usd = 0
             balances = wallet.get('balances', {})
-
             summary.append({
                 'wallet_id': wallet.get('wallet_id'),
-                'user_id': user_id,
-                'user_email': user.get('email', 'Unknown') if user else 'Unknown',
+                'user_id': wallet.get('user_id'),
+                'user_email': emails.get(str(wallet.get('user_id')), 'Unknown'),
                 'balances': balances,
                 'currency_count': len(balances),
+                'ledger_seq': wallet.get('ledger_seq'),
                 'is_active': wallet.get('is_active', True),
                 'created_at': wallet.get('created_at'),
                 'updated_at': wallet.get('updated_at')
@@ -686,7 +747,9 @@ def get_all_wallets_summary():
 def admin_adjust_balance(wallet_id, currency, amount, admin_id, reason=""):
     """
     Admin function to adjust a wallet balance.
-    Records the adjustment in wallet_adjustments collection.
+    Applied through the ledger (entry carrying admin and reason); old/new balances
+    come from the projection updated by the ledger, and the adjustment is also
+    recorded in wallet_adjustments.
     """
     if currency not in VALID_CURRENCIES:
         return False, f"Invalid currency: {currency}."
@@ -695,17 +758,22 @@ def admin_adjust_balance(wallet_id, currency, amount, admin_id, reason=""):
     if db is None:
         return False, "Database connection failed."
 
-    wallet = db.wallets.find_one({"wallet_id": wallet_id})
+    wallet = db.wallets.find_one({"wallet_id": wallet_id}, {"user_id": 1, "balances": 1})
     if not wallet:
         return False, "Wallet not found."
 
     try:
-        old_balance = float(wallet.get('balances', {}).get(currency, 0))
-        new_balance = old_balance + amount
-
-        # Don't allow negative balances
-        if new_balance < 0:
-            return False, f"Adjustment would result in negative balance ({new_balance:.2f})"
+        if currency not in wallet.get('balances', {}):
+            db.wallets.update_one(
+                {"wallet_id": wallet_id, f"balances.{currency}": {"$exists": False}},
+                {"$set": {f"balances.{currency}": 0.0, f"balances_minor.{currency}": Money.zero(currency).to_bson()}}
+            )
+
+        # Don't allow negative balances (conditional update in the ledger)
+        result = ledger_service.post(db, wallet['user_id'], {currency: amount}, kind='adjustment',
+                                     meta={'admin_id': str(admin_id), 'reason': reason})
+        new_balance = result['balances'][currency]
+        old_balance = float(Money.of(new_balance, currency) - Money.of(amount, currency))
 
         # Record adjustment
         adjustment = {
@@ -715,29 +783,25 @@ def admin_adjust_balance(wallet_id, currency, amount, admin_id, reason=""):
             "old_balance": old_balance,
             "new_balance": new_balance,
             "difference": amount,
+            "type": "credit" if amount > 0 else "debit",
             "admin_id": str(admin_id),
             "reason": reason,
+            "ledger_operation_id": result['operation_id'],
             "created_at": datetime.utcnow()
         }
         db.wallet_adjustments.insert_one(adjustment)
 
-        # Update wallet
-        db.wallets.update_one(
-            {"wallet_id": wallet_id},
-            {
-                "$set": {
-                    f"balances.{currency}": round(new_balance, 4),
-                    "updated_at": datetime.utcnow()
-                }
-            }
-        )
-
         current_app.logger.info(
             f"Admin {admin_id} adjusted wallet {wallet_id}: {amount:+.2f} {currency}"
         )
 
-        return True, f"Balance adjusted: {old_balance:.2f} → {new_balance:.2f} {currency}"
+        return True, (f"Balance adjusted: {Money.of(old_balance, currency).format()} → "
+                      f"{Money.of(new_balance, currency).format()} {currency}")
 
+    except ledger_service.InsufficientFunds as e:
+        return False, f"Adjustment would result in negative balance ({e.available + amount:.2f})"
+    except ledger_service.LedgerError as e:
+        return False, str(e)
     except Exception as e:
         current_app.logger.error(f"Admin balance adjustment failed: {e}")
         return False, "Adjustment failed."
@@ -0,0 +1,79 @@
+"""
+SarfX Unit Tests - Service-level fixtures
+=========================================
+
+Tests des services sans navigateur ni serveur : base MongoDB jetable.
+
+- TEST_MONGO_URI défini (ex: replica set de docker-compose) : vraie base,
+  transactions multi-documents selon le serveur, supprimée après chaque test
+- Sinon : mongomock (pip install mongomock), mode séquentiel du grand livre
+
+Usage:
+    pytest tests/unit -v
+    TEST_MONGO_URI=mongodb://localhost:27017 pytest tests/unit -v
+"""
+
+import os
+import uuid
+
+import pytest
+
+from app.config import Config
+from app.services import ledger_service
+
+TEST_MONGO_URI = os.getenv("TEST_MONGO_URI")
+
+
+def _mongomock_client():
+    mongomock = pytest.importorskip("mongomock")
+    import mongomock.aggregate as aggregate
+
+    # $round (pipeline de _apply_to_wallet) n'est pas implémenté par mongomock
+    if '$round' not in aggregate.arithmetic_operators:
+        aggregate.arithmetic_operators.add('$round')
+        handle = aggregate._Parser._handle_arithmetic_operator
+
+        def _handle(self, operator, values):
+            if operator == '$round':
+                number, places = self.parse_many(values)
+                return None if number is None else round(number, places)
+            return handle(self, operator, values)
+
+        aggregate._Parser._handle_arithmetic_operator = _handle
+    return mongomock.MongoClient()
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """Base vide par test (index du grand livre recréés)"""
+    monkeypatch.setattr(ledger_service, '_indexes_ready', False)
+    if TEST_MONGO_URI:
+        from pymongo import MongoClient
+
+        client = MongoClient(TEST_MONGO_URI)
+        name = f"sarfx_test_{uuid.uuid4().hex[:8]}"
+        yield client[name]
+        client.drop_database(name)
+        client.close()
+        return
+
+    # mongomock ne connaît ni 'hello' ni les transactions
+    monkeypatch.setattr(Config, 'LEDGER_TRANSACTIONS', 'false')
+    yield _mongomock_client()['sarfx_test']
+
+
+@pytest.fixture
+def make_wallet(db):
+    """Crée un wallet ; legacy=True : soldes flottants seuls (antérieur au grand livre)"""
+    from app.services.money import Money
+
+    def _make(user_id, balances, legacy=False):
+        wallet = {'user_id': user_id, 'wallet_id': str(uuid.uuid4()), 'balances': dict(balances)}
+        if not legacy:
+            wallet['balances_minor'] = {
+                currency: Money.of(amount, currency).to_bson() for currency, amount in balances.items()
+            }
+        db.wallets.insert_one(wallet)
+        return wallet
+
+    return _make
@@ -0,0 +1,210 @@
+"""
+SarfX Unit Tests - Reconstruction des soldes (ledger_projection)
+================================================================
+
+Soldes reconstruits depuis le journal (dernier snapshot + écritures suivantes),
+détection des journaux incomplets, correction des projections en dérive.
+
+Run with:
+    pytest tests/unit/test_ledger_projection.py -v
+"""
+
+import pytest
+from bson.int64 import Int64
+
+from app.services import ledger_projection, ledger_service
+from app.services.money import Money
+
+USER = "0a1b2c"
+
+
+def _post_history(db, user_id=USER):
+    ledger_service.post(db, user_id, {'EUR': 100.1}, 'deposit')
+    ledger_service.post(db, user_id, {'EUR': -40.05, 'MAD': 432.9}, 'swap')
+    ledger_service.post(db, user_id, {'MAD': -0.9}, 'withdrawal')
+
+
+@pytest.mark.unit
+class TestReplay:
+    """Soldes exacts au seq demandé"""
+
+    def test_replay_matches_projection(self, db, make_wallet):
+        make_wallet(USER, {'EUR': 0.0, 'MAD': 0.0})
+        _post_history(db)
+
+        units, complete = ledger_projection.replay(db, USER, 3)
+
+        assert complete is True
+        assert units == {'EUR': Money.of('60.05', 'EUR').units, 'MAD': Money.of('432', 'MAD').units}
+
+    def test_replay_up_to_earlier_seq(self, db, make_wallet):
+        make_wallet(USER, {'EUR': 0.0, 'MAD': 0.0})
+        _post_history(db)
+
+        units, complete = ledger_projection.replay(db, USER, 1)
+
+        assert complete is True
+        assert units == {'EUR': Money.of('100.1', 'EUR').units}
+
+    def test_missing_entry_is_incomplete(self, db, make_wallet):
+        make_wallet(USER, {'EUR': 0.0, 'MAD': 0.0})
+        _post_history(db)
+        db.ledger_entries.delete_many({'user_id': USER, 'seq': 2})
+
+        _, complete = ledger_projection.replay(db, USER, 3)
+
+        assert complete is False
+
+    def test_partial_legs_are_incomplete(self, db, make_wallet):
+        """Swap journalisé sur une seule de ses deux jambes (insert_many interrompu)"""
+        make_wallet(USER, {'EUR': 0.0, 'MAD': 0.0})
+        _post_history(db)
+        db.ledger_entries.delete_many({'user_id': USER, 'seq': 2, 'currency': 'MAD'})
+
+        _, complete = ledger_projection.replay(db, USER, 3)
+
+        assert complete is False
+
+    def test_entries_without_leg_count_still_replay(self, db, make_wallet):
+        """Écritures antérieures au champ leg_count : une écriture par seq suffit"""
+        make_wallet(USER, {'EUR': 0.0, 'MAD': 0.0})
+        _post_history(db)
+        db.ledger_entries.update_many({'user_id': USER}, {'$unset': {'leg_count': ''}})
+
+        units, complete = ledger_projection.replay(db, USER, 3)
+
+        assert complete is True
+        assert units['MAD'] == Money.of('432', 'MAD').units
+
+    def test_opening_balances_count_without_seq_gap(self, db, make_wallet):
+        """Wallet antérieur : soldes d'ouverture (seq 0) inclus dans la reconstruction"""
+        make_wallet(USER, {'EUR': 12.5}, legacy=True)
+        ledger_service.post(db, USER, {'EUR': -2.5}, 'withdrawal')
+
+        units, complete = ledger_projection.replay(db, USER, 1)
+
+        assert complete is True
+        assert units == {'EUR': Money.of(10, 'EUR').units}
+
+    def test_replay_from_snapshot_reads_later_entries_only(self, db, make_wallet):
+        make_wallet(USER, {'EUR': 0.0, 'MAD': 0.0})
+        _post_history(db)
+        ledger_projection.rebuild_wallet(db, USER)
+        snapshot = ledger_projection.get_snapshot(db, USER)
+        assert snapshot['seq'] == 3
+
+        ledger_service.post(db, USER, {'EUR': 0.95}, 'deposit')
+        # Écritures couvertes par le snapshot supprimées : la reconstruction ne les relit pas
+        db.ledger_entries.delete_many({'user_id': USER, 'seq': {'$lte': 3}})
+
+        units, complete = ledger_projection.replay(db, USER, 4, snapshot)
+
+        assert complete is True
+        assert units['EUR'] == Money.of(61, 'EUR').units
+        assert units['MAD'] == Money.of(432, 'MAD').units
+
+
+@pytest.mark.unit
+class TestRebuildWallet:
+    """Comparaison journal / projection et correction"""
+
+    def test_consistent_wallet_is_ok_and_snapshotted(self, db, make_wallet):
+        make_wallet(USER, {'EUR': 0.0, 'MAD': 0.0})
+        _post_history(db)
+
+        result = ledger_projection.rebuild_wallet(db, USER)
+
+        assert result['status'] == ledger_projection.STATUS_OK
+        assert result['balances'] == {'EUR': 60.05, 'MAD': 432.0}
+        snapshot = ledger_projection.get_snapshot(db, USER)
+        assert snapshot['seq'] == 3
+        assert snapshot['balances_minor']['EUR'] == Money.of('60.05', 'EUR').units
+
+    def test_drift_detected_then_fixed(self, db, make_wallet):
+        make_wallet(USER, {'EUR': 0.0, 'MAD': 0.0})
+        _post_history(db)
+        db.wallets.update_one({'user_id': USER}, {'$set': {'balances_minor.EUR': Int64(1), 'balances.EUR': 0.0001}})
+
+        drift = ledger_projection.rebuild_wallet(db, USER)
+        assert drift['status'] == ledger_projection.STATUS_DRIFT
+        assert drift['differences'] == {'EUR': (0.0001, 60.05)}
+
+        fixed = ledger_projection.rebuild_wallet(db, USER, fix=True)
+        assert fixed['status'] == ledger_projection.STATUS_FIXED
+        wallet = db.wallets.find_one({'user_id': USER})
+        assert wallet['balances_minor']['EUR'] == Money.of('60.05', 'EUR').units
+        assert wallet['balances']['EUR'] == 60.05
+        assert ledger_projection.rebuild_wallet(db, USER)['status'] == ledger_projection.STATUS_OK
+
+    def test_display_balance_drift_detected(self, db, make_wallet):
+        """Unités exactes justes mais solde affiché faux : signalé aussi"""
+        make_wallet(USER, {'EUR': 0.0, 'MAD': 0.0})
+        _post_history(db)
+        db.wallets.update_one({'user_id': USER}, {'$set': {'balances.MAD': 431.99}})
+
+        result = ledger_projection.rebuild_wallet(db, USER)
+
+        assert result['status'] == ledger_projection.STATUS_DRIFT
+        assert result['differences'] == {'MAD': (431.99, 432.0)}
+
+    def test_incomplete_journal_is_not_fixed(self, db, make_wallet):
+        make_wallet(USER, {'EUR': 0.0, 'MAD': 0.0})
+        _post_history(db)
+        db.ledger_entries.delete_many({'user_id': USER, 'seq': 3})
+        db.wallets.update_one({'user_id': USER}, {'$set': {'balances_minor.EUR': Int64(1)}})
+
+        result = ledger_projection.rebuild_wallet(db, USER, fix=True)
+
+        assert result['status'] == ledger_projection.STATUS_INCOMPLETE
+        assert db.wallets.find_one({'user_id': USER})['balances_minor']['EUR'] == 1
+        assert ledger_projection.get_snapshot(db, USER) is None
+
+    def test_partial_legs_never_fixed_nor_snapshotted(self, db, make_wallet):
+        make_wallet(USER, {'EUR': 0.0, 'MAD': 0.0})
+        ledger_service.post(db, USER, {'EUR': 100.1}, 'deposit')
+        ledger_service.post(db, USER, {'EUR': -40.05, 'MAD': 432.9}, 'swap')
+        db.ledger_entries.delete_many({'user_id': USER, 'seq': 2, 'currency': 'MAD'})
+
+        result = ledger_projection.rebuild_wallet(db, USER, fix=True)
+
+        assert result['status'] == ledger_projection.STATUS_INCOMPLETE
+        assert db.wallets.find_one({'user_id': USER})['balances']['MAD'] == 432.9
+        assert ledger_projection.get_snapshot(db, USER) is None
+
+    def test_unopened_and_missing_wallets(self, db, make_wallet):
+        make_wallet(USER, {'EUR': 5.0})
+
+        assert ledger_projection.rebuild_wallet(db, USER)['status'] == ledger_projection.STATUS_UNOPENED
+        assert ledger_projection.rebuild_wallet(db, 'ffffff')['status'] == ledger_projection.STATUS_MISSING
+
+    def test_older_snapshot_never_overwrites_newer(self, db, make_wallet):
+        make_wallet(USER, {'EUR': 0.0, 'MAD': 0.0})
+        _post_history(db)
+        ledger_projection.rebuild_wallet(db, USER)
+
+        saved = ledger_projection.save_snapshot(db, USER, 1, {'EUR': 1})
+
+        assert saved is False
+        assert ledger_projection.get_snapshot(db, USER)['seq'] == 3
+
+
+@pytest.mark.unit
+class TestRebuildAll:
+    """Reconstruction de tous les wallets par tranches de user_id"""
+
+    def test_counts_by_status(self, db, make_wallet):
+        for user_id in ('0a', '5f', 'c3'):
+            make_wallet(user_id, {'EUR': 0.0, 'MAD': 0.0})
+            _post_history(db, user_id)
+        make_wallet('e9', {'EUR': 1.0})
+        db.wallets.update_one({'user_id': '5f'}, {'$set': {'balances_minor.EUR': Int64(7)}})
+
+        summary = ledger_projection.rebuild_all(db, fix=True, workers=4)
+
+        assert summary['wallets'] == 4
+        assert summary['by_status'] == {
+            ledger_projection.STATUS_OK: 2,
+            ledger_projection.STATUS_FIXED: 1,
+            ledger_projection.STATUS_UNOPENED: 1,
+        }
+        assert db.wallets.find_one({'user_id': '5f'})['balances']['EUR'] == 60.05
@@ -0,0 +1,239 @@
+"""
+SarfX Unit Tests - Grand livre des wallets (ledger_service)
+===========================================================
+
+Opérations atomiques et idempotentes : débit conditionnel, rejeu d'une clé,
+journal des écritures, repli séquentiel sans transactions.
+
+Run with:
+    pytest tests/unit/test_ledger_service.py -v
+"""
+
+import threading
+
+import pytest
+from pymongo.errors import PyMongoError
+
+from app.services import ledger_service
+from app.services.ledger_service import (
+    CurrencyNotInWallet, IdempotencyConflict, InsufficientFunds, LedgerError, WalletNotFound
+)
+from app.services.money import Money
+
+USER = "u1"
+
+
+def _wallet(db, user_id=USER):
+    return db.wallets.find_one({'user_id': user_id})
+
+
+@pytest.mark.unit
+class TestPost:
+    """Application d'une opération au wallet"""
+
+    def test_swap_moves_exact_units(self, db, make_wallet):
+        """Débit et crédit appliqués en unités exactes, soldes affichés dérivés"""
+        make_wallet(USER, {'EUR': 100.0, 'MAD': 0.0})
+
+        result = ledger_service.post(db, USER, {'EUR': -10.1, 'MAD': 109.27}, 'swap')
+
+        wallet = _wallet(db)
+        assert wallet['balances_minor']['EUR'] == Money.of('89.9', 'EUR').units
+        assert wallet['balances_minor']['MAD'] == Money.of('109.27', 'MAD').units
+        assert wallet['balances'] == {'EUR': 89.9, 'MAD': 109.27}
+        assert wallet['ledger_seq'] == 1
+        assert result['balances'] == {'EUR': 89.9, 'MAD': 109.27}
+        assert result['replayed'] is False
+
+    def test_repeated_decimal_deposits_do_not_drift(self, db, make_wallet):
+        """0.1 + 0.2 = 0.3 exactement (pas d'accumulation d'erreurs binaires)"""
+        make_wallet(USER, {'USD': 0.0})
+
+        ledger_service.post(db, USER, {'USD': 0.1}, 'deposit')
+        ledger_service.post(db, USER, {'USD': 0.2}, 'deposit')
+
+        wallet = _wallet(db)
+        assert wallet['balances_minor']['USD'] == Money.of('0.3', 'USD').units
+        assert wallet['balances']['USD'] == 0.3
+
+    def test_journal_entries_and_transaction(self, db, make_wallet):
+        """Une écriture par devise (seq du wallet), transaction métier liée à l'opération"""
+        make_wallet(USER, {'EUR': 50.0, 'USD': 0.0})
+
+        result = ledger_service.post(
+            db, USER, {'EUR': -20, 'USD': 21.5}, 'swap',
+            transaction=lambda balances: {'user_id': USER, 'type': 'swap', 'balance_after': balances['EUR']}
+        )
+
+        entries = list(db.ledger_entries.find({'operation_id': result['operation_id']}))
+        assert sorted((e['currency'], e['amount'], e['seq']) for e in entries) == [('EUR', -20.0, 1), ('USD', 21.5, 1)]
+        eur = next(e for e in entries if e['currency'] == 'EUR')
+        assert eur['balance_after_minor'] == Money.of(30, 'EUR').units
+
+        transaction = db.transactions.find_one({'ledger_operation_id': result['operation_id']})
+        assert transaction['balance_after'] == 30.0
+        operation = db.ledger_operations.find_one({'_id': result['operation_id']})
+        assert operation['status'] == ledger_service.STATUS_COMPLETED
+        assert operation['seq'] == 1
+
+    def test_legacy_wallet_gets_opening_entries(self, db, make_wallet):
+        """Wallet antérieur au grand livre : soldes d'ouverture (seq 0) puis conversion en unités"""
+        make_wallet(USER, {'EUR': 12.34, 'MAD': 0.0}, legacy=True)
+
+        ledger_service.post(db, USER, {'EUR': -2.34}, 'withdrawal')
+
+        opening = list(db.ledger_entries.find({'user_id': USER, 'seq': 0}))
+        assert [(e['currency'], e['amount']) for e in opening] == [('EUR', 12.34)]
+        wallet = _wallet(db)
+        assert wallet['balances_minor']['EUR'] == Money.of(10, 'EUR').units
+        assert wallet['balances']['EUR'] == 10.0
+
+    def test_zero_legs_rejected(self, db, make_wallet):
+        make_wallet(USER, {'EUR': 10.0})
+        with pytest.raises(LedgerError):
+            ledger_service.post(db, USER, {'EUR': 0}, 'deposit')
+
+
+@pytest.mark.unit
+class TestConditionalDebit:
+    """Refus sans modification du wallet"""
+
+    def test_insufficient_funds(self, db, make_wallet):
+        make_wallet(USER, {'EUR': 10.0, 'MAD': 0.0})
+
+        with pytest.raises(InsufficientFunds) as error:
+            ledger_service.post(db, USER, {'EUR': -10.01, 'MAD': 100}, 'swap', idempotency_key='k1')
+
+        assert error.value.currency == 'EUR'
+        assert error.value.available == 10.0
+        wallet = _wallet(db)
+        assert wallet['balances'] == {'EUR': 10.0, 'MAD': 0.0}
+        assert 'ledger_seq' not in wallet
+        assert db.ledger_entries.count_documents({}) == 0
+        # Wallet inchangé : la clé redevient utilisable
+        assert db.ledger_operations.count_documents({}) == 0
+        ledger_service.post(db, USER, {'EUR': -10}, 'withdrawal', idempotency_key='k1')
+        assert _wallet(db)['balances']['EUR'] == 0.0
+
+    def test_exact_balance_can_be_spent(self, db, make_wallet):
+        make_wallet(USER, {'EUR': 10.01})
+        ledger_service.post(db, USER, {'EUR': -10.01}, 'withdrawal')
+        assert _wallet(db)['balances_minor']['EUR'] == 0
+
+    def test_currency_not_in_wallet(self, db, make_wallet):
+        make_wallet(USER, {'EUR': 10.0})
+        with pytest.raises(CurrencyNotInWallet):
+            ledger_service.post(db, USER, {'EUR': -1, 'GBP': 0.85}, 'swap')
+        assert _wallet(db)['balances'] == {'EUR': 10.0}
+
+    def test_wallet_not_found(self, db):
+        with pytest.raises(WalletNotFound):
+            ledger_service.post(db, 'nobody', {'EUR': 5}, 'deposit')
+
+    def test_concurrent_debits_never_overdraw(self, db, make_wallet):
+        """20 débits concurrents de 10 sur un solde de 100 : 10 acceptés, solde nul"""
+        make_wallet(USER, {'EUR': 100.0})
+        outcomes = []
+
+        def debit():
+            try:
+                ledger_service.post(db, USER, {'EUR': -10}, 'withdrawal')
+                outcomes.append('ok')
+            except InsufficientFunds:
+                outcomes.append('refused')
+
+        threads = [threading.Thread(target=debit) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert outcomes.count('ok') == 10
+        wallet = _wallet(db)
+        assert wallet['balances_minor']['EUR'] == 0
+        assert wallet['ledger_seq'] == 10
+
+
+@pytest.mark.unit
+class TestIdempotency:
+    """Rejeu d'une clé d'idempotence"""
+
+    def test_same_key_replays_result(self, db, make_wallet):
+        make_wallet(USER, {'EUR': 100.0})
+
+        first = ledger_service.post(db, USER, {'EUR': -30}, 'withdrawal', idempotency_key='retry-1',
+                                    transaction={'user_id': USER, 'type': 'withdrawal'})
+        second = ledger_service.post(db, USER, {'EUR': -30}, 'withdrawal', idempotency_key='retry-1',
+                                     transaction={'user_id': USER, 'type': 'withdrawal'})
+
+        assert second['replayed'] is True
+        assert second['operation_id'] == first['operation_id']
+        assert second['balances'] == first['balances'] == {'EUR': 70.0}
+        assert _wallet(db)['balances']['EUR'] == 70.0
+        assert db.transactions.count_documents({}) == 1
+        assert db.ledger_entries.count_documents({'operation_id': first['operation_id']}) == 1
+
+    def test_same_key_other_operation_conflicts(self, db, make_wallet):
+        make_wallet(USER, {'EUR': 100.0})
+        ledger_service.post(db, USER, {'EUR': -30}, 'withdrawal', idempotency_key='k')
+
+        with pytest.raises(IdempotencyConflict):
+            ledger_service.post(db, USER, {'EUR': -40}, 'withdrawal', idempotency_key='k')
+        assert _wallet(db)['balances']['EUR'] == 70.0
+
+    def test_keys_are_scoped_per_user(self, db, make_wallet):
+        make_wallet('u1', {'EUR': 100.0})
+        make_wallet('u2', {'EUR': 100.0})
+
+        ledger_service.post(db, 'u1', {'EUR': -30}, 'withdrawal', idempotency_key='k')
+        result = ledger_service.post(db, 'u2', {'EUR': -30}, 'withdrawal', idempotency_key='k')
+
+        assert result['replayed'] is False
+        assert _wallet(db, 'u2')['balances']['EUR'] == 70.0
+
+    def test_pending_operation_conflicts(self, db, make_wallet):
+        """Même clé pendant qu'une opération est en cours : refus, pas de second débit"""
+        make_wallet(USER, {'EUR': 100.0})
+        db.ledger_operations.insert_one({'_id': f'{USER}:k', 'status': ledger_service.STATUS_PENDING,
+                                         'fingerprint': 'x'})
+
+        with pytest.raises(IdempotencyConflict):
+            ledger_service.post(db, USER, {'EUR': -30}, 'withdrawal', idempotency_key='k')
+        assert _wallet(db)['balances']['EUR'] == 100.0
+
+
+@pytest.mark.unit
+class TestSequentialFallback:
+    """Sans transactions : opération pending, wallet, puis journal"""
+
+    def test_journal_failure_leaves_operation_pending(self, db, make_wallet, monkeypatch):
+        make_wallet(USER, {'EUR': 100.0})
+        monkeypatch.setattr(ledger_service, 'supports_transactions', lambda db: False)
+        collection = type(db.ledger_entries)
+        insert_many = collection.insert_many
+
+        def fail(*args, **kwargs):
+            raise PyMongoError("journal unavailable")
+
+        monkeypatch.setattr(collection, 'insert_many', fail)
+
+        result = ledger_service.post(db, USER, {'EUR': -25}, 'withdrawal', idempotency_key='k')
+
+        # Débit appliqué, opération conservée "pending" avec son seq pour réconciliation
+        assert result['balances'] == {'EUR': 75.0}
+        assert result['transaction'] is None
+        operation = db.ledger_operations.find_one({'_id': f'{USER}:k'})
+        assert operation['status'] == ledger_service.STATUS_PENDING
+        assert operation['seq'] == 1
+        assert operation['legs'] == {'EUR': -25.0}
+        # Un rejeu de la clé ne débite pas une seconde fois
+        monkeypatch.setattr(collection, 'insert_many', insert_many)
+        with pytest.raises(IdempotencyConflict):
+            ledger_service.post(db, USER, {'EUR': -25}, 'withdrawal', idempotency_key='k')
+        assert _wallet(db)['balances']['EUR'] == 75.0
+
+    def test_transaction_mode_flag(self, db, monkeypatch):
+        monkeypatch.setattr(ledger_service, '_config', lambda name, default: 'false')
+        assert ledger_service.supports_transactions(db) is False
+        monkeypatch.setattr(ledger_service, '_config', lambda name, default: 'true')
+        assert ledger_service.supports_transactions(db) is True
@@ -0,0 +1,113 @@
+"""
+SarfX Unit Tests - Montants en virgule fixe (money)
+===================================================
+
+Arrondi unique au demi pair, formatage sans passage par un float.
+
+Run with:
+    pytest tests/unit/test_money.py -v
+"""
+
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from bson.decimal128 import Decimal128
+
+from app.services.money import Money, format_amount, format_units, from_units, to_units
+
+
+@pytest.mark.unit
+class TestMoney:
+    """Arithmétique exacte en unités mineures"""
+
+    def test_of_uses_shortest_decimal(self):
+        assert Money.of(0.1, 'EUR').units == 1000
+        assert Money.of(0.1, 'EUR') + Money.of(0.2, 'EUR') == Money.of('0.3', 'EUR')
+
+    def test_of_rounds_half_even_to_scale(self):
+        # Échelle EUR : 2 décimales + 2 de précision interne
+        assert Money.of('1.00005', 'EUR').units == 10000
+        assert Money.of('1.00015', 'EUR').units == 10002
+        assert Money.of('-1.00015', 'EUR').units == -10002
+
+    def test_scale_follows_currency(self):
+        assert Money.of(1, 'JPY').units == 100
+        assert Money.of(1, 'KWD').units == 100000
+
+    def test_convert_rounds_once(self):
+        converted = Money.of('100', 'EUR').convert('10.77345', 'MAD')
+        assert converted == Money.of('1077.345', 'MAD')
+        assert converted.format() == '1077.34'
+
+    def test_multiply_fee(self):
+        assert Money.of('250', 'EUR').multiply('0.015') == Money.of('3.75', 'EUR')
+
+    def test_non_finite_rejected(self):
+        for value in (float('nan'), float('inf'), '-inf', 'NaN'):
+            with pytest.raises(ValueError):
+                Money.of(value, 'EUR')
+
+    def test_currency_mismatch(self):
+        with pytest.raises(ValueError):
+            Money.of(1, 'EUR') + Money.of(1, 'USD')
+
+    def test_float_and_bson(self):
+        money = Money.of('12.34', 'EUR')
+        assert float(money) == 12.34
+        assert money.to_bson() == 123400
+
+    def test_format_half_even(self):
+        assert Money.of('1.005', 'EUR').format() == '1.00'
+        assert Money.of('1.015', 'EUR').format() == '1.02'
+        assert Money.of('1234567.5', 'MAD').format(grouping=True) == '1,234,567.50'
+
+
+@pytest.mark.unit
+class TestFormatAmount:
+    """Montants stockés formatés avec un seul arrondi"""
+
+    def test_rounds_exact_value_once(self):
+        """1.01499 -> 1.01 (pas 1.0150 puis 1.02)"""
+        assert format_amount(1.01499, 'EUR', digits=2) == '1.01'
+        assert format_amount(1.01499, 'EUR', digits=2) == f"{1.01499:.2f}"
+        assert format_amount(-1.01499, 'EUR', digits=2) == '-1.01'
+
+    def test_rate_digits_beyond_currency_scale(self):
+        assert format_amount(10.773449, digits=4) == '10.7734'
+        assert format_amount(0.00004999, digits=4) == '0.0000'
+
+    def test_defaults_and_types(self):
+        assert format_amount(None, 'EUR') == '0.00'
+        assert format_amount('', 'JPY') == '0'
+        assert format_amount(Decimal128('2.345'), 'EUR') == '2.34'
+        assert format_amount(Money.of('2.345', 'EUR'), 'EUR') == '2.34'
+        assert format_amount(1234567.891, 'MAD', digits=2, grouping=True) == '1,234,567.89'
+
+    def test_invalid_amount(self):
+        with pytest.raises(ValueError):
+            format_amount('abc', 'EUR')
+
+
+@pytest.mark.unit
+class TestVectorized:
+    """Conversions en masse (exports, cotations)"""
+
+    def test_to_units_and_back(self):
+        units = to_units([1.5, None, 'x', Decimal128('2.25')], 'EUR')
+        assert units.tolist() == [15000, 0, 0, 22500]
+        assert from_units(units, 'EUR').tolist() == [1.5, 0.0, 0.0, 2.25]
+
+    def test_format_units_matches_money(self):
+        values = ['1.005', '1.015', '-2.345', '1234.5']
+        units = np.array([Money.of(value, 'EUR').units for value in values])
+        assert format_units(units, 'EUR') == [Money.of(value, 'EUR').format() for value in values]
+
+    def test_format_units_from_display_digits_rounds_once(self):
+        units = to_units(np.array([1.01499]), digits=2)
+        assert format_units(units, 'EUR', digits=2, from_digits=2) == ['1.01']
+
+    def test_format_units_matches_format_amount(self):
+        values = [Decimal('0.125'), Decimal('0.135'), Decimal('-7.005')]
+        units = np.array([Money.of(value, 'USD').units for value in values])
+        assert format_units(units, 'USD') == [format_amount(value, 'USD') for value in values]
@@ -0,0 +1,30 @@
+"""
+SarfX Unit Tests - Validation des montants du wallet (wallet_service)
+=====================================================================
+
+Montants non finis ou démesurés refusés avant toute conversion en unités.
+
+Run with:
+    pytest tests/unit/test_wallet_amounts.py -v
+"""
+
+import pytest
+
+from app.services import wallet_service
+from app.services.money import MAX_AMOUNT
+
+
+@pytest.mark.unit
+class TestAmountValidation:
+    """Refus propre (message d'erreur), jamais d'exception"""
+
+    @pytest.mark.parametrize('amount', [float('nan'), float('inf'), float('-inf'), 1e300, MAX_AMOUNT * 10, 'abc', None])
+    def test_invalid_amounts(self, amount):
+        assert wallet_service._valid_amount(amount) is False
+        assert wallet_service.calculate_swap_preview('EUR', 'MAD', amount) == (None, "Invalid amount.")
+        assert wallet_service.deposit_to_wallet('u1', 'EUR', amount) == (False, "Invalid amount.")
+
+    def test_valid_amounts(self):
+        assert wallet_service._valid_amount(100) is True
+        assert wallet_service._valid_amount('12.5') is True
+        assert wallet_service._valid_amount(MAX_AMOUNT) is True
@@ -0,0 +1,100 @@
+import time
+import argparse
+import logging
+import threading
+from flask import Flask
+from app.config import Config
+from app.services.rate_ingestion_service import RateIngestionService
+
+
+def build_alert_checker():
+    """Vérification des alertes après chaque snapshot (contexte Flask minimal pour SMTP)"""
+    from app.services.rate_alert_service import RateAlertService
+
+    app = Flask('sarfx-worker')
+    app.config.from_object(Config)
+    alert_service = RateAlertService()
+
+    def check(snapshot):
+        with app.app_context():
+            alert_service.check_alerts(snapshot=snapshot)
+
+    return check
+
+
+def run_metrics_reconciler(interval):
+    """Recalcule périodiquement les compteurs du dashboard admin (metrics_daily)"""
+    from app.services.metrics_service import reconcile_metrics
+
+    while True:
+        try:
+            reconcile_metrics()
+        except Exception as e:
+            logging.error(f"Metrics reconciliation failed: {e}")
+        time.sleep(interval)
+
+
+def run_wallet_reconciler(interval):
+    """Reconstruit périodiquement les soldes depuis le grand livre (snapshots, corrections)"""
+    from app.services.ledger_projection import reconcile_wallets
+
+    while True:
+        try:
+            reconcile_wallets()
+        except Exception as e:
+            logging.error(f"Wallet reconciliation failed: {e}")
+        time.sleep(interval)
+
+
+def start_export_workers(count):
+    """Threads de rendu des exports asynchrones (file export_jobs)"""
+    from app.services.export_jobs import purge_expired, run_export_worker
+
+    for i in range(count):
+        threading.Thread(target=run_export_worker, name=f'export-worker-{i}', daemon=True).start()
+
+    def purge_loop():
+        while True:
+            try:
+                purge_expired()
+            except Exception as e:
+                logging.error(f"Export purge failed: {e}")
+            time.sleep(3600)
+
+    threading.Thread(target=purge_loop, name='export-purge', daemon=True).start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run SarfX background rate ingestion worker')
+    parser.add_argument('--interval', '-i', type=int, default=Config.RATE_INGESTION_INTERVAL, help='Polling interval in seconds')
+    parser.add_argument('--once', action='store_true', help='Run a single ingestion cycle and exit')
+    parser.add_argument('--no-alerts', action='store_true', help='Do not check rate alerts after each cycle')
+    parser.add_argument('--export-workers', type=int, default=Config.EXPORT_WORKERS, help='Export job threads (0 = disabled)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    service = RateIngestionService()
+    on_publish = build_alert_checker() if Config.RATE_ALERTS_CHECK_ENABLED and not args.no_alerts else None
+
+    if args.once:
+        snapshot = service.run_once()
+        if snapshot and on_publish:
+            on_publish(snapshot)
+    else:
+        if Config.METRICS_RECONCILE_INTERVAL > 0:
+            threading.Thread(
+                target=run_metrics_reconciler,
+                args=(Config.METRICS_RECONCILE_INTERVAL,),
+                name='metrics-reconciler',
+                daemon=True
+            ).start()
+        if Config.LEDGER_RECONCILE_INTERVAL > 0:
+            threading.Thread(
+                target=run_wallet_reconciler,
+                args=(Config.LEDGER_RECONCILE_INTERVAL,),
+                name='wallet-reconciler',
+                daemon=True
+            ).start()
+        if args.export_workers > 0:
+            start_export_workers(args.export_workers)
+        service.run_forever(args.interval, on_publish=on_publish)